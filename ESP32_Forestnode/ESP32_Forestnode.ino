@@ -15,14 +15,25 @@ DHT dht(DHTPIN, DHTTYPE);
 #define MOSI 23
 #define LORA_SYNC_WORD 0xF3
 
+// Binary frame (16 bytes) instead of the ~64-byte text payload
+#define USE_BINARY_FRAME 1
+#define NODE_ID 1
+#define FRAME_MAGIC 0xA1  // 0xA0 | frame version 1
+#define FRAME_SIZE 16
+
 
 #define MOISTURE_SENSOR 36
 #define LDR_SENSOR 32
 #define PH_SENSOR 33
 #define PUMP_RELAY 15
 
-const int moistureThreshold = 400;
+const int moistureThreshold = 400;     // pump on above this (drier)
+const int moistureOffThreshold = 350;  // and off again below this
+// The relay holds each state at least this long (no chatter around the threshold)
+const unsigned long pumpMinOnMs = 300000;
+const unsigned long pumpMinOffMs = 600000;
 const float pHCalibrationOffset = 0.0;
+uint16_t frameSeq = 0;
 
 struct SensorData {
   float humidity;
@@ -30,12 +41,16 @@ struct SensorData {
   int moisture;
   float pH;
   String light;
+  bool dhtOk;
 };
 
 SensorData readSensors();
 bool controlPump(int moisture);
 String createPayload(const SensorData& data);
+size_t createFrame(const SensorData& data, uint8_t* frame);
+uint16_t crc16(const uint8_t* data, size_t len);
 void sendLoRaData(String payload);
+void sendLoRaFrame(const uint8_t* frame, size_t len);
 float readpH(int raw);
 
 void setup() {
@@ -68,8 +83,13 @@ void setup() {
 void loop() {
   SensorData data = readSensors();
   bool pumpState = controlPump(data.moisture);
+#if USE_BINARY_FRAME
+  uint8_t frame[FRAME_SIZE];
+  sendLoRaFrame(frame, createFrame(data, frame));
+#else
   String payload = createPayload(data);
   sendLoRaData(payload);
+#endif
   delay(15000);
 }
 
@@ -77,7 +97,8 @@ SensorData readSensors() {
   SensorData data;
   data.humidity = dht.readHumidity();
   data.temperature = dht.readTemperature();
-  if (isnan(data.humidity) || isnan(data.temperature)) {
+  data.dhtOk = !(isnan(data.humidity) || isnan(data.temperature));
+  if (!data.dhtOk) {
     data.humidity = 0;
     data.temperature = 0;
   }
@@ -88,8 +109,20 @@ SensorData readSensors() {
 }
 
 bool controlPump(int moisture) {
-  bool state = (moisture > moistureThreshold);
-  digitalWrite(PUMP_RELAY, state ? HIGH : LOW);
+  static bool state = false;
+  static unsigned long switchedAt = 0;
+  unsigned long held = millis() - switchedAt;
+  bool next = state;
+  if (state && held >= pumpMinOnMs && moisture < moistureOffThreshold) {
+    next = false;
+  } else if (!state && (held >= pumpMinOffMs || switchedAt == 0) && moisture > moistureThreshold) {
+    next = true;
+  }
+  if (next != state) {
+    state = next;
+    switchedAt = millis();
+    digitalWrite(PUMP_RELAY, state ? HIGH : LOW);
+  }
   return state;
 }
 
@@ -103,6 +136,49 @@ String createPayload(const SensorData& data) {
     ",light:" + data.light;
 }
 
+// Frame layout (little-endian), decoded by lora_frame.py:
+// magic u8 | node u16 | seq u16 | humidity*10 u16 | temperature*10 i16 |
+// moisture u16 | pH*100 u16 | flags u8 | CRC-16/CCITT-FALSE u16
+size_t createFrame(const SensorData& data, uint8_t* frame) {
+  uint16_t humidity = data.dhtOk ? (uint16_t)lroundf(data.humidity * 10) : 0xFFFF;
+  int16_t temperature = data.dhtOk ? (int16_t)lroundf(data.temperature * 10) : 0x7FFF;
+  uint16_t pH = (uint16_t)constrain(lroundf(data.pH * 100), 0, 0xFFFF);
+  uint16_t seq = frameSeq++;
+  uint16_t node = NODE_ID;
+
+  frame[0] = FRAME_MAGIC;
+  frame[1] = node & 0xFF;         frame[2] = node >> 8;
+  frame[3] = seq & 0xFF;          frame[4] = seq >> 8;
+  frame[5] = humidity & 0xFF;     frame[6] = humidity >> 8;
+  frame[7] = (uint16_t)temperature & 0xFF;
+  frame[8] = (uint16_t)temperature >> 8;
+  frame[9] = data.moisture & 0xFF; frame[10] = data.moisture >> 8;
+  frame[11] = pH & 0xFF;          frame[12] = pH >> 8;
+  frame[13] = (data.light == "Sunny") ? 0x01 : 0x00;
+  uint16_t crc = crc16(frame, FRAME_SIZE - 2);
+  frame[14] = crc & 0xFF;         frame[15] = crc >> 8;
+  return FRAME_SIZE;
+}
+
+// CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF)
+uint16_t crc16(const uint8_t* data, size_t len) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+void sendLoRaFrame(const uint8_t* frame, size_t len) {
+  LoRa.beginPacket();
+  LoRa.write(frame, len);
+  LoRa.endPacket();
+  Serial.printf("Sent frame #%u (%u bytes)\n", frame[3] | (frame[4] << 8), (unsigned)len);
+}
+
 void sendLoRaData(String payload) {
   LoRa.beginPacket();
   LoRa.print(payload);
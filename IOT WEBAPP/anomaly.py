@@ -0,0 +1,324 @@
+"""
+Streaming anomaly and stuck-sensor detection ahead of scoring.
+
+Every node keeps, per sensor channel (soil, temperature, humidity, pH), an
+exponentially weighted mean and variance, the last value and two run
+counters. Each reading is checked against its node's state in O(1):
+
+    sensor_fault  temperature and humidity both exactly 0, which is what the
+                  ground node sends when the DHT read fails (binary frames
+                  leave them out and build_request() fills in 0)
+    spike         more than ANOMALY_SPIKE_SIGMAS deviations from the node's
+                  mean (with a per-channel floor on the deviation). A jump
+                  that persists for SHIFT_AFTER readings, such as soil after
+                  irrigation, is taken as the new level instead
+    stuck         the same value ANOMALY_STUCK_AFTER readings in a row
+                  (channel-specific multiples of it)
+
+Faulty values and spikes do not update the statistics. ANOMALY_POLICY says
+what happens per kind: "flag" passes the reading on with the anomaly listed,
+"impute" replaces the value by the node's mean (or drops a faulty reading /
+flags the others while the node is still warming up), "drop" rejects the
+reading. The state lives in one NumPy array with a slot per node, so a batch
+is checked with vectorized rounds (one per reading of the busiest node).
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+ANOMALY_DETECTION = os.environ.get("ANOMALY_DETECTION", "1").lower() in ("1", "true", "yes")
+ANOMALY_POLICY = os.environ.get("ANOMALY_POLICY", "sensor_fault=impute,spike=flag,stuck=flag")
+ANOMALY_MAX_NODES = int(os.environ.get("ANOMALY_MAX_NODES", 4096))
+ANOMALY_SPIKE_SIGMAS = float(os.environ.get("ANOMALY_SPIKE_SIGMAS", 6.0))
+# Identical readings in a row before a soil value counts as stuck (30 minutes at 15 s)
+ANOMALY_STUCK_AFTER = int(os.environ.get("ANOMALY_STUCK_AFTER", 120))
+
+CHANNELS = ("soil", "temperature", "humidity", "pH")
+KINDS = ("sensor_fault", "spike", "stuck")
+ACTIONS = ("flag", "impute", "drop")
+
+# Smallest deviation a spike is measured against (quiet sensors have a tiny variance)
+SPIKE_FLOOR = {"soil": 40.0, "temperature": 1.0, "humidity": 3.0, "pH": 0.2}
+# Slowly changing air readings legitimately repeat for longer than soil counts
+STUCK_FACTOR = {"soil": 1, "temperature": 2, "humidity": 2, "pH": 2}
+ALPHA = 0.1          # EWMA weight of the newest reading (~20 readings of memory)
+WARMUP = 10          # Readings before spikes are detected and means are imputed
+SHIFT_AFTER = 3      # Spikes in a row that become the new level
+
+# Statistics kept per node and channel
+MEAN, VAR, LAST, RUN, COUNT, SPIKES = range(6)
+N_STATS = 6
+
+SEVERITY = {action: i for i, action in enumerate(ACTIONS)}
+
+
+def parse_policy(text):
+    """
+    {kind: action} from "kind=action,..." (kinds not listed are flagged)
+
+    Raises:
+        ValueError: If a kind or action is unknown
+    """
+    policy = dict.fromkeys(KINDS, "flag")
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        kind, _, action = item.partition("=")
+        if kind.strip() not in KINDS or action.strip() not in ACTIONS:
+            raise ValueError(f"Bad ANOMALY_POLICY entry {item!r} (kinds: {', '.join(KINDS)}; "
+                             f"actions: {', '.join(ACTIONS)})")
+        policy[kind.strip()] = action.strip()
+    return policy
+
+
+class AnomalyDetector:
+    """Per-(field, node) sensor statistics, shared by the request threads of a process"""
+
+    def __init__(self, policy=ANOMALY_POLICY, max_nodes=ANOMALY_MAX_NODES, sigmas=ANOMALY_SPIKE_SIGMAS,
+                 stuck_after=ANOMALY_STUCK_AFTER):
+        """
+        Args:
+            policy: {kind: action} or a "kind=action,..." string
+            max_nodes: Nodes tracked; the least recently seen one is dropped beyond this
+            sigmas: Deviations from the mean that make a spike
+            stuck_after: Identical soil readings in a row that make a stuck sensor
+
+        Raises:
+            ValueError: If the policy is malformed
+        """
+        self.policy = parse_policy(policy) if isinstance(policy, str) else {**dict.fromkeys(KINDS, "flag"), **policy}
+        self.max_nodes = max(1, max_nodes)
+        self.sigmas = sigmas
+        self._floor = [SPIKE_FLOOR[c] for c in CHANNELS]
+        self._stuck = [max(2, stuck_after * STUCK_FACTOR[c]) for c in CHANNELS]
+        self._floor_row = np.array(self._floor)
+        self._stuck_row = np.array(self._stuck)
+        self._fault_channels = [c in ("temperature", "humidity") for c in CHANNELS]
+        self._fault = np.array(self._fault_channels)
+        self._temperature, self._humidity = CHANNELS.index("temperature"), CHANNELS.index("humidity")
+        self._state = np.zeros((self.max_nodes, N_STATS, len(CHANNELS)))
+        self._slots = OrderedDict()
+        self._lock = threading.Lock()
+        self.screened = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.counts = {}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _slot(self, key):
+        """State row of a node (called with the lock held)"""
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+        if len(self._slots) < self.max_nodes:
+            slot = len(self._slots)
+        else:
+            _, slot = self._slots.popitem(last=False)
+            self.evicted += 1
+        self._slots[key] = slot
+        self._state[slot] = 0.0
+        return slot
+
+    def _resolve(self, kinds, mean, warm):
+        """Action and replacement for one value given its anomaly kinds"""
+        action = max((self.policy[kind] for kind in kinds), key=SEVERITY.get)
+        if action == "impute" and not warm:
+            action = "drop" if "sensor_fault" in kinds else "flag"
+        return action, (round(mean, 2) if action == "impute" else None)
+
+    def _record(self, channel, kinds, action):
+        for kind in kinds:
+            key = (CHANNELS[channel], kind, action)
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def screen(self, data, field_id, node_id=None):
+        """
+        Check one reading and update its node's statistics
+
+        Args:
+            data: Request dictionary (non-numeric channels are skipped; the
+                encoder reports those)
+            field_id: Field the node belongs to
+            node_id: Reporting node (None for readings without one)
+
+        Returns:
+            Tuple of (reading or None when dropped, list of anomaly dictionaries);
+            the reading is a copy when values were imputed
+        """
+        values = []
+        for channel in CHANNELS:
+            value = data.get(channel)
+            numeric = isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+            values.append(float(value) if numeric else None)
+        fault = values[self._temperature] == 0 and values[self._humidity] == 0
+
+        found = []
+        with self._lock:
+            slot = self._slot((field_id, node_id or ""))
+            state = self._state[slot].tolist()
+            mean, var, last, run, count, spikes = state
+            for i, x in enumerate(values):
+                if x is None:
+                    continue
+                kinds = []
+                m, n = mean[i], count[i]
+                if fault and self._fault_channels[i]:
+                    kinds.append("sensor_fault")
+                elif n == 0:
+                    mean[i], var[i], last[i], run[i], count[i], spikes[i] = x, 0.0, x, 0.0, 1.0, 0.0
+                else:
+                    run[i] = run[i] + 1 if x == last[i] else 0.0
+                    last[i] = x
+                    deviation = x - m
+                    if n >= WARMUP and abs(deviation) > self.sigmas * max(math.sqrt(var[i]), self._floor[i]):
+                        spikes[i] += 1
+                        if spikes[i] < SHIFT_AFTER:
+                            kinds.append("spike")
+                        else:
+                            # A persistent jump is a new level (e.g. after irrigation)
+                            mean[i] = x
+                            spikes[i] = 0.0
+                    else:
+                        spikes[i] = 0.0
+                        step = ALPHA * deviation
+                        mean[i] = m + step
+                        var[i] = (1 - ALPHA) * (var[i] + deviation * step)
+                    count[i] = n + 1
+                    if run[i] + 1 >= self._stuck[i]:
+                        kinds.append("stuck")
+                if kinds:
+                    action, replacement = self._resolve(kinds, m, n >= WARMUP)
+                    self._record(i, kinds, action)
+                    found.append((i, kinds, action, replacement))
+            self._state[slot] = state
+            self.screened += 1
+            dropped = any(action == "drop" for _, _, action, _ in found)
+            if dropped:
+                self.dropped += 1
+
+        anomalies = [self._describe(i, kind, action, values[i], replacement)
+                     for i, kinds, action, replacement in found for kind in kinds]
+        if dropped:
+            return None, anomalies
+        imputed = {CHANNELS[i]: replacement for i, _, action, replacement in found if action == "impute"}
+        return (dict(data, **imputed) if imputed else data), anomalies
+
+    @staticmethod
+    def _describe(channel, kind, action, value, replacement):
+        anomaly = {"sensor": CHANNELS[channel], "kind": kind, "action": action, "value": value}
+        if replacement is not None:
+            anomaly["imputed"] = replacement
+        return anomaly
+
+    def screen_matrix(self, X, columns, keys):
+        """
+        Check a batch of readings in order and update the nodes' statistics
+
+        Readings of one node are applied in row order: rows are processed in
+        rounds, the k-th round holding every node's k-th reading, and each
+        round is one set of vectorized operations over distinct nodes.
+
+        Args:
+            X: Unscaled feature matrix; imputed values are written into it
+            columns: Column of each of CHANNELS in X
+            keys: (field_id, node_id) per row
+
+        Returns:
+            Tuple of (boolean keep mask, {row: list of anomaly dictionaries})
+        """
+        n = len(X)
+        keep = np.ones(n, dtype=bool)
+        anomalies = {}
+        if not n:
+            return keep, anomalies
+        if n > self.max_nodes:
+            # A chunk this small never evicts a node it touches itself
+            for start in range(0, n, self.max_nodes):
+                end = start + self.max_nodes
+                keep[start:end], found = self.screen_matrix(X[start:end], columns, keys[start:end])
+                anomalies.update((start + row, items) for row, items in found.items())
+            return keep, anomalies
+        V = X[:, columns].astype(np.float64)
+        fault_rows = (V[:, self._temperature] == 0) & (V[:, self._humidity] == 0)
+        F = fault_rows[:, None] & self._fault[None, :]
+
+        with self._lock:
+            slots = np.fromiter((self._slot((f, node or "")) for f, node in keys), dtype=np.intp, count=n)
+            # Rank of each row among the rows of its node
+            order = np.argsort(slots, kind="stable")
+            ordered = slots[order]
+            first = np.r_[True, ordered[1:] != ordered[:-1]]
+            starts = np.maximum.accumulate(np.where(first, np.arange(n), 0))
+            rank = np.empty(n, dtype=np.intp)
+            rank[order] = np.arange(n) - starts
+            kinds_of = np.zeros((n, len(CHANNELS), len(KINDS)), dtype=bool)
+            means = np.zeros((n, len(CHANNELS)))
+            warm = np.zeros((n, len(CHANNELS)), dtype=bool)
+            for k in range(int(rank.max()) + 1):
+                rows = np.flatnonzero(rank == k)
+                self._round(V[rows], F[rows], slots[rows], kinds_of, means, warm, rows)
+            self.screened += n
+
+            for row, channel in zip(*np.nonzero(kinds_of.any(axis=2))):
+                kinds = [KINDS[j] for j in np.flatnonzero(kinds_of[row, channel])]
+                action, replacement = self._resolve(kinds, float(means[row, channel]), bool(warm[row, channel]))
+                self._record(channel, kinds, action)
+                if action == "drop":
+                    keep[row] = False
+                elif action == "impute":
+                    X[row, columns[channel]] = replacement
+                anomalies.setdefault(int(row), []).extend(
+                    self._describe(channel, kind, action, float(V[row, channel]), replacement) for kind in kinds)
+            self.dropped += int(n - keep.sum())
+        return keep, anomalies
+
+    def _round(self, V, F, slots, kinds_of, means, warm, rows):
+        """One vectorized step over rows of distinct nodes (same arithmetic as screen())"""
+        state = self._state[slots]
+        mean, var, last, run, count, spikes = (state[:, s] for s in range(N_STATS))
+        new = (count == 0) & ~F
+        active = ~F & ~new
+        same = V == last
+        deviation = V - mean
+        spike = active & (count >= WARMUP) & (
+            np.abs(deviation) > self.sigmas * np.maximum(np.sqrt(var), self._floor_row))
+        spikes_after = np.where(spike, spikes + 1, 0.0)
+        shift = spike & (spikes_after >= SHIFT_AFTER)
+        flagged = spike & ~shift
+        update = active & ~spike
+        step = ALPHA * deviation
+        run_after = np.where(active & same, run + 1, 0.0)
+
+        kinds_of[rows, :, 0] = F
+        kinds_of[rows, :, 1] = flagged
+        kinds_of[rows, :, 2] = active & (run_after + 1 >= self._stuck_row)
+        means[rows] = mean
+        warm[rows] = count >= WARMUP
+
+        state[:, VAR] = np.where(new, 0.0, np.where(update, (1 - ALPHA) * (var + deviation * step), var))
+        state[:, MEAN] = np.where(new | shift, V, np.where(update, mean + step, mean))
+        state[:, SPIKES] = np.where(shift, 0.0, np.where(active, spikes_after, np.where(new, 0.0, spikes)))
+        state[:, RUN] = np.where(F, run, run_after)
+        state[:, LAST] = np.where(F, last, V)
+        state[:, COUNT] = np.where(F, count, count + 1)
+        self._state[slots] = state
+
+    def stats(self):
+        with self._lock:
+            counts = {f"{sensor}.{kind}.{action}": value
+                      for (sensor, kind, action), value in sorted(self.counts.items())}
+            return {
+                "nodes": len(self._slots),
+                "screened": self.screened,
+                "dropped": self.dropped,
+                "evicted_nodes": self.evicted,
+                "policy": dict(self.policy),
+                "anomalies": counts,
+            }
@@ -1,143 +1,531 @@
-from flask import Flask, request, jsonify
-import pickle
-import pandas as pd
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import os
+import time
+import atexit
 
-# Firebase initialization (optional - gracefully handle if credentials missing)
+import numpy as np
+
+from model_registry import ModelRegistry
+from feature_store import FEATURE_STORE_PATH, FeatureStore
+from dashboard_api import dashboard, store as dashboard_store
+from anomaly import ANOMALY_DETECTION, CHANNELS as ANOMALY_CHANNELS, AnomalyDetector
+from scheduler import SCHEDULER_ENABLED, IrrigationScheduler
+from prediction_cache import PredictionCache
+from write_behind import WriteBehindQueue
+from storage import firestore_client
+from field_routing import FieldRouter, resolve_ids
+from request_log import RequestLogger, configure_logging
+from metrics import (MAX_PROFILE_SECONDS, PROFILER_ENABLED, PROFILER_HZ, MetricsRegistry, format_folded,
+                     install_profile_signal, sample_stacks)
+
+# Per-request events are structured and sampled (LOG_FORMAT, LOG_SAMPLE_RATE)
+configure_logging()
+log = RequestLogger("api")
+
+# Upper bound on readings accepted by POST /predict/batch
+MAX_BATCH_SIZE = 1000
+
+# Firestore write-behind tuning
+FIRESTORE_FLUSH_SIZE = int(os.environ.get("FIRESTORE_FLUSH_SIZE", 200))
+FIRESTORE_FLUSH_INTERVAL = float(os.environ.get("FIRESTORE_FLUSH_INTERVAL", 1.0))
+FIRESTORE_MAX_PENDING = int(os.environ.get("FIRESTORE_MAX_PENDING", 10000))
+FIRESTORE_SHARDS = int(os.environ.get("FIRESTORE_SHARDS", 16))
+# Firestore sustains about one write per second per document
+FIRESTORE_MIN_DOC_INTERVAL = float(os.environ.get("FIRESTORE_MIN_DOC_INTERVAL", 1.0))
+
+# "firebase" (default), "local" for the in-memory Firestore stand-in, or "none"
+FIRESTORE_BACKEND = os.environ.get("FIRESTORE_BACKEND", "firebase")
+
+# Firestore client and write path of this process. They are created on first
+# use (or by serve.py right after a worker forks) - gRPC channels and the
+# write-behind thread must not be shared across fork()
 db = None
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
+writer = None
+router = None
+_firestore_pid = None
+
+def init_firestore():
+    """
+    Create the Firestore client and write-behind queue for this process
     
-    if os.path.exists("serviceAccountKey.json"):
-        # Check if it's a real key (not template)
-        with open("serviceAccountKey.json", "r") as f:
-            import json
-            key_data = json.load(f)
-            if "REPLACE" not in key_data.get("private_key", ""):
-                cred = credentials.Certificate("serviceAccountKey.json")
-                firebase_admin.initialize_app(cred)
-                db = firestore.client()
-                print("✓ Firebase initialized successfully!")
-            else:
-                print("⚠ Using template serviceAccountKey.json - Firebase features disabled")
-                print("  Download real credentials from Firebase Console to enable cloud features")
-    else:
-        print("⚠ serviceAccountKey.json not found - Firebase features disabled")
-except Exception as e:
-    print(f"⚠ Firebase initialization skipped: {e}")
-    print("  App will work in standalone mode without cloud storage")
-
-# Load model and scaler
-try:
-    with open("irrigation_model.pkl", "rb") as f:
-        model_data = pickle.load(f)
-        if isinstance(model_data, dict):
-            model = model_data["model"]
-            scaler = model_data["scaler"]
-        else:
-            # Old format - just the model
-            model = model_data
-            scaler = None
-    print("Model loaded successfully!")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model = None
-    scaler = None
+    Firebase is optional: when credentials are missing the app keeps working
+    in standalone mode and predictions are not saved to the cloud.
+    """
+    global db, writer, router, _firestore_pid
+    _firestore_pid = os.getpid()
+    db = writer = router = None
+    
+    db = firestore_client(FIRESTORE_BACKEND)
+    
+    # Prediction results are written to Firestore in the background
+    if db is not None:
+        writer = WriteBehindQueue(db, max_pending=FIRESTORE_MAX_PENDING,
+                                  flush_size=FIRESTORE_FLUSH_SIZE,
+                                  flush_interval=FIRESTORE_FLUSH_INTERVAL,
+                                  min_doc_interval=FIRESTORE_MIN_DOC_INTERVAL)
+        router = FieldRouter(writer, shards=FIRESTORE_SHARDS)
+        atexit.register(writer.close)
+
+def get_router():
+    """Field router of this process (initializes Firestore on first use)"""
+    if _firestore_pid != os.getpid():
+        init_firestore()
+    return router
+
+# Seconds a prediction request waits for the model while the app is still starting
+MODEL_WAIT_SECONDS = float(os.environ.get("MODEL_WAIT_SECONDS", 10))
+
+# Model versions come from MODEL_DIR (or irrigation_model.pkl) and are loaded,
+# validated and hot-swapped by the registry in the background, so health checks
+# answer immediately; GET /ready reports when predictions can be served
+registry = ModelRegistry()
+registry.start(background=os.environ.get("MODEL_LOAD", "background") == "background")
+
+# Decisions for readings that repeat at sensor resolution (PREDICTION_CACHE_MB)
+prediction_cache = PredictionCache()
+
+def resolve_model(data=None):
+    """
+    Model version for a request: pinned via "model_version" in the body, the
+    ?model_version= query parameter or the X-Model-Version header, else active
+    
+    Returns:
+        Tuple of (ModelVersion or None, error response or None)
+    """
+    if not registry.wait_ready(MODEL_WAIT_SECONDS) and not registry.ready:
+        return None, (jsonify({"error": "Model is still loading"}), 503)
+    pinned = data.get("model_version") if isinstance(data, dict) else None
+    pinned = pinned or request.args.get("model_version") or request.headers.get("X-Model-Version")
+    try:
+        version = registry.get(pinned)
+    except KeyError as e:
+        return None, (jsonify({"error": e.args[0]}), 404)
+    if version is None:
+        return None, (jsonify({"error": "Model not loaded"}), 500)
+    return version, None
+
+# Rolling per-node features (soil trend, 1h/24h means, VPD), kept across
+# restarts in FEATURE_STORE_PATH
+feature_store = FeatureStore()
+if FEATURE_STORE_PATH and os.path.exists(FEATURE_STORE_PATH):
+    try:
+        print(f"✓ Restored {feature_store.restore(FEATURE_STORE_PATH)} readings from {FEATURE_STORE_PATH}")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠ Feature store not restored ({e}) - starting with empty windows")
+
+# node_state.NodeStateProcess holding the per-node state when it lives in
+# another process (serve.py); None while it lives in this one
+node_state = None
+
+def use_node_state(state):
+    """
+    Reach the per-node state in the node_state process (serve.py, after fork)
+
+    The feature store, the anomaly detector and the irrigation scheduler are
+    replaced by proxies to the shared ones; the state process snapshots the
+    feature store.
+    """
+    global node_state, feature_store, anomaly_detector, scheduler
+    proxies = state.connect()
+    feature_store = proxies["feature_store"]
+    anomaly_detector = proxies.get("anomaly_detector")
+    scheduler = proxies.get("scheduler")
+    node_state = state
+
+def save_feature_store():
+    """Snapshot the feature store at exit, unless the node state process owns it"""
+    if FEATURE_STORE_PATH and node_state is None:
+        feature_store.snapshot(FEATURE_STORE_PATH)
+
+atexit.register(save_feature_store)
+
+# Per-node sensor statistics: DHT failures, spikes and stuck sensors are
+# flagged, imputed or dropped before scoring (ANOMALY_POLICY)
+anomaly_detector = AnomalyDetector() if ANOMALY_DETECTION else None
+
+# Pump windows across fields from the decisions (hysteresis, min on/off times,
+# power and water budgets); controllers poll GET /schedule/<field_id>
+scheduler = IrrigationScheduler() if SCHEDULER_ENABLED else None
+
+def update_features(data, field_id, node_id):
+    """Add a scored reading to its node's windows and return the node's features"""
+    if node_state is None:
+        feature_store.start_snapshots()
+    return feature_store.update(field_id, node_id, data, timestamp_ms=data.get("timestamp"))
+
+def update_features_many(readings, ids):
+    """update_features() for a batch, in one call to the store"""
+    if node_state is None:
+        feature_store.start_snapshots()
+    return feature_store.update_many(ids, readings, [data.get("timestamp") for data in readings])
+
+# Prometheus metrics (GET /metrics); queue depths and cache counters are read at scrape time
+metrics = MetricsRegistry()
+http_requests = metrics.counter("smartagro_http_requests_total", "HTTP requests by endpoint and status code",
+                                ("endpoint", "status"))
+request_seconds = metrics.histogram("smartagro_request_seconds", "Request latency by endpoint", ("endpoint",))
+stage_seconds = metrics.histogram(
+    "smartagro_stage_seconds",
+    "Time per request stage: parse, model, screen, score (cache lookup, and on a miss encode, predict, decide), "
+    "features, firestore, respond", ("endpoint", "stage"))
+decisions = metrics.counter("smartagro_decisions_total",
+                            "Decisions by the decision rule that fired (rules.py); good when none did",
+                            ("reason",))
+metrics.gauge("smartagro_firestore_queue_depth", "Firestore writes waiting in the write-behind queue",
+              lambda: writer.stats()["depth"] if writer is not None else None)
+metrics.gauge("smartagro_firestore_in_flight", "Firestore writes being committed",
+              lambda: writer.stats()["in_flight"] if writer is not None else None)
+metrics.gauge("smartagro_firestore_oldest_pending_seconds", "Age of the oldest queued Firestore write",
+              lambda: writer.stats()["oldest_age_s"] if writer is not None else None)
+metrics.gauge("smartagro_firestore_writes_total", "Firestore writes by result",
+              lambda: {(k,): v for k, v in writer.stats().items()
+                       if k in ("written", "coalesced", "deferred", "dropped", "failed")} if writer is not None else None,
+              ("result",), kind="counter")
+metrics.gauge("smartagro_prediction_cache_lookups_total", "Prediction cache lookups by result",
+              lambda: {("hit",): prediction_cache.hits, ("miss",): prediction_cache.misses}, ("result",),
+              kind="counter")
+metrics.gauge("smartagro_prediction_cache_entries", "Entries in the prediction cache",
+              lambda: prediction_cache.stats()["entries"])
+metrics.gauge("smartagro_feature_store_nodes", "Nodes with rolling-window features",
+              lambda: feature_store.stats()["nodes"])
+metrics.gauge("smartagro_anomalies_total", "Sensor anomalies by sensor, kind and action (anomaly.py)",
+              lambda: {tuple(key.split(".")): count
+                       for key, count in anomaly_detector.stats()["anomalies"].items()}
+              if anomaly_detector is not None else None,
+              ("sensor", "kind", "action"), kind="counter")
+metrics.gauge("smartagro_pumps_running", "Pumps the irrigation scheduler has switched on",
+              lambda: scheduler.stats()["running"] if scheduler is not None else None)
+metrics.gauge("smartagro_pump_watts", "Power drawn by the running pumps",
+              lambda: scheduler.stats()["watts"] if scheduler is not None else None)
+metrics.gauge("smartagro_pump_water_litres", "Water used by the pumps since UTC midnight",
+              lambda: scheduler.stats()["water_used_l"] if scheduler is not None else None)
+metrics.gauge("smartagro_pump_switches_total", "Pump switches by the irrigation scheduler",
+              lambda: {(k,): v for k, v in scheduler.stats()["switches"].items()} if scheduler is not None else None,
+              ("action",), kind="counter")
+metrics.gauge("smartagro_model_info", "Loaded model versions (1 = active)",
+              lambda: {(v["version"],): int(v["version"] == registry.status()["active"])
+                       for v in registry.status()["versions"]}, ("version",))
 
 app = Flask(__name__)
 CORS(app)
+# Downsampled time-range queries and deltas for the dashboard (/dashboard/...)
+app.register_blueprint(dashboard)
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if metrics.enabled:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        http_requests.inc(endpoint, str(response.status_code))
+        request_seconds.observe(time.perf_counter() - g.started, endpoint)
+        stages = g.get("stages")
+        if stages:
+            stage_seconds.observe_many(stages, endpoint)
+    return response
 
 @app.route("/", methods=["GET"])
 def home():
     return "Flask API is running! Use POST /predict to get predictions."
 
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up (answers while the model is still loading)"""
+    return jsonify({"status": "ok"})
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness: 200 once the model is loaded and warmed up, 503 before"""
+    if not registry.ready:
+        return jsonify({"ready": False, "reason": "model loading"}), 503
+    active = registry.get()
+    if active is None:
+        return jsonify({"ready": False, "reason": "model failed to load"}), 503
+    return jsonify({"ready": True, "model_version": active.version})
+
+@app.route("/status", methods=["GET"])
+def status():
+    """Model registry state and Firestore write-behind queue metrics"""
+    return jsonify({
+        "model_loaded": registry.ready and registry.get() is not None,
+        "models": registry.status(),
+        "firestore": writer.stats() if get_router() is not None else None,
+        "feature_store": feature_store.stats(),
+        "anomalies": anomaly_detector.stats() if anomaly_detector is not None else None,
+        "dashboard": dashboard_store.stats(),
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "prediction_cache": prediction_cache.stats()
+    })
+
+@app.route("/models", methods=["GET"])
+def models():
+    """Loaded model versions; pin one with model_version / X-Model-Version"""
+    return jsonify(registry.status())
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus text format metrics of this process"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/debug/profile", methods=["GET"])
+def debug_profile():
+    """
+    Sample all threads for ?seconds= (default 10) at ?hz= and return collapsed
+    stacks for flamegraph.pl / speedscope (PROFILER_ENABLED=1 only)
+    """
+    if not PROFILER_ENABLED:
+        return jsonify({"error": "Profiler disabled (set PROFILER_ENABLED=1)"}), 404
+    try:
+        seconds = min(float(request.args.get("seconds", 10)), MAX_PROFILE_SECONDS)
+        hz = min(float(request.args.get("hz", PROFILER_HZ)), 1000.0)
+    except ValueError:
+        return jsonify({"error": "seconds and hz must be numbers"}), 400
+    try:
+        stacks = sample_stacks(seconds, hz)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return Response(format_folded(stacks), mimetype="text/plain")
+
+@app.route("/features/<field_id>", methods=["GET"])
+@app.route("/features/<field_id>/<node_id>", methods=["GET"])
+def node_features(field_id, node_id=None):
+    """Rolling features of a node (readings without node_id use /features/<field_id>)"""
+    found = feature_store.features(field_id, node_id)
+    if found is None:
+        return jsonify({"error": "No readings for this node"}), 404
+    return jsonify({"field_id": field_id, "node_id": node_id, "features": found})
+
+def save_prediction(data, prediction, confidence, reason, field_id, node_id=None, model_version=None,
+                    features=None):
+    """
+    Queue a scored reading for Firestore (no-op when Firebase is not configured)
+    
+    Args:
+        data: Request dictionary with the raw sensor readings
+        prediction: Final irrigation decision (0/1)
+        confidence: Confidence reported for the decision
+        reason: Human-readable reason for the decision
+        field_id: Field document the reading is routed to
+        node_id: Reporting node, if known
+        model_version: Model version that scored the reading
+        features: Rolling features of the node after this reading
+    """
+    router = get_router()
+    if router is not None:
+        queued = router.route(field_id, node_id, {
+            "Soil": data.get("soil"),
+            "Light": data.get("light"),
+            "Temperature": data.get("temperature"),
+            "Humidity": data.get("humidity"),
+            "pH": data.get("pH"),
+            "Rainfall": data.get("rainfall", 0),
+            "irrigation_needed": prediction,
+            "Confidence": confidence,
+            "Reason": reason,
+            "ModelVersion": model_version,
+            "Features": features
+        }, timestamp_ms=data.get("timestamp"))
+        if not queued:
+            log.warning("firestore.queue_full", field_id=field_id)
+
+@app.route("/schedule", methods=["GET"])
+def schedule():
+    """Irrigation plan: budget use and every field's pump state (?field_id= for one field)"""
+    if scheduler is None:
+        return jsonify({"error": "Scheduler disabled (SCHEDULER_ENABLED=0)"}), 404
+    return jsonify(scheduler.plan(field_id=request.args.get("field_id")))
+
+@app.route("/schedule/<field_id>", methods=["GET"])
+def pump_command(field_id):
+    """Relay state for a field's pump controller"""
+    if scheduler is None:
+        return jsonify({"error": "Scheduler disabled (SCHEDULER_ENABLED=0)"}), 404
+    command = scheduler.command(field_id)
+    if command is None:
+        return jsonify({"error": f"No predictions for field {field_id!r} yet"}), 404
+    return jsonify(command)
+
 @app.route('/predict', methods=['POST'])
 def predict():
+    started = time.perf_counter()
+    stages = g.stages = metrics.stages()
     try:
-        if model is None:
-            return jsonify({"error": "Model not loaded"}), 500
-            
-        data = request.json
-        print(f"\n📥 Received prediction request: {data}")
-        
-        # Create DataFrame with expected feature order (WITH rainfall - using 0 as default)
-        df = pd.DataFrame([{
-            "soil": data.get("soil"),
-            "light": data.get("light"),
-            "temperature": data.get("temperature"),
-            "humidity": data.get("humidity"),
-            "pH": data.get("pH"),
-            "npk": data.get("npk", 25),  # Default value if not provided
-            "rainfall": data.get("rainfall", 0)  # Default to 0 if not provided
-        }])
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object with the sensor reading"}), 400
+        stages.mark("parse")
+        # The whole request uses this version, even if a new one is published meanwhile
+        version, error = resolve_model(data)
+        if error is not None:
+            return error
+        stages.mark("model")
         
-        print(f"📊 DataFrame for prediction:\n{df}")
-        
-        # Scale if scaler is available
-        if scaler is not None:
-            df_scaled = scaler.transform(df)
-            model_prediction = int(model.predict(df_scaled)[0])
-            confidence = round(float(model.predict_proba(df_scaled).max()), 2)
-        else:
-            model_prediction = int(model.predict(df)[0])
-            confidence = round(float(model.predict_proba(df).max()), 2)
-            
-        # CRITICAL: Override model if soil moisture is dangerously low
-        # Soil moisture values: 0-400 (0 = very dry, 400+ = waterlogged)
-        # Threshold: Below 300 needs irrigation
-        if data['soil'] < 300:
-            prediction = 1  # Force irrigation needed
-            if data['soil'] < 100:
-                reason = f"CRITICAL: Very low soil moisture ({data['soil']}) - immediate irrigation required"
-            else:
-                reason = f"Low soil moisture ({data['soil']}) - irrigation required"
-            confidence = 0.95  # High confidence for manual override
-            print(f"⚠️ OVERRIDE: Soil={data['soil']} is below 300 threshold, forcing irrigation=1")
-        else:
-            prediction = model_prediction
-            # Enhanced reasoning based on actual sensor values
-            if data['humidity'] < 30:
-                reason = "Low humidity - monitor soil moisture closely"
-            else:
-                reason = "Good moisture levels - no irrigation needed"
-            
-        print(f"🤖 Final Prediction: {prediction}, Confidence: {confidence}, Reason: {reason}")
+        try:
+            field_id, node_id = resolve_ids(data)
+            anomalies = None
+            if anomaly_detector is not None:
+                data, anomalies = anomaly_detector.screen(data, field_id, node_id)
+                stages.mark("screen")
+                if data is None:
+                    log.warning("predict.dropped", field_id=field_id, node_id=node_id, anomalies=anomalies)
+                    return jsonify({"error": "Reading dropped by anomaly detection", "anomalies": anomalies}), 422
+            # The field's decision rules (e.g. soil below 300) may override the model
+            prediction_cache.follow(registry)
+            prediction, confidence, reason, code = prediction_cache.score(version, data, stages or None)
+        except ValueError as e:
+            log.warning("predict.rejected", error=str(e))
+            return jsonify({"error": str(e)}), 400
+        stages.mark("score")
+        rule = version.scorer.rules.names[code]
+        decisions.inc(rule)
+        features = update_features(data, field_id, node_id)
+        if scheduler is not None:
+            scheduler.observe(field_id, node_id, prediction, confidence)
+        stages.mark("features")
         
         result = {
             "irrigation_needed": prediction,
             "confidence": confidence,
-            "reason": reason
+            "reason": reason,
+            "field_id": field_id,
+            "model_version": version.version,
+            "features": features
         }
+        if anomalies:
+            result["anomalies"] = anomalies
         
         # Save to Firestore if available
-        if db is not None:
+        save_prediction(data, prediction, confidence, reason, field_id, node_id, version.version, features)
+        stages.mark("firestore")
+        
+        log.sampled("predict", field_id=field_id, node_id=node_id, soil=data["soil"],
+                    irrigation_needed=prediction, confidence=confidence, rule=rule,
+                    model_version=version.version,
+                    ms=round((time.perf_counter() - started) * 1000, 2))
+        response = jsonify(result)
+        stages.mark("respond")
+        return response
+    except Exception as e:
+        log.error("predict.error", exc_info=True, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Score an array of readings in one vectorized pass
+    
+    Accepts either a JSON array of readings or {"readings": [...]}. Invalid
+    items are reported in "errors" without failing the rest of the batch.
+    """
+    started = time.perf_counter()
+    stages = g.stages = metrics.stages()
+    try:
+        data = request.get_json(silent=True)
+        stages.mark("parse")
+        version, error = resolve_model(data)
+        if error is not None:
+            return error
+        stages.mark("model")
+        readings = data.get("readings") if isinstance(data, dict) else data
+        if not isinstance(readings, list):
+            return jsonify({"error": "Expected a JSON array of readings or {\"readings\": [...]}"}), 400
+        if len(readings) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large ({len(readings)} > {MAX_BATCH_SIZE})"}), 413
+        
+        scorer = version.scorer
+        X, valid, errors = scorer.encoder.encode_batch(readings)
+        
+        # Drop rows whose field/node identifiers are unusable
+        ids, keep = [], []
+        for row, i in enumerate(valid):
             try:
-                db.collection("fields").document("field_1").set({
-                    "Soil": data.get("soil"),
-                    "Light": data.get("light"),
-                    "Temperature": data.get("temperature"),
-                    "Humidity": data.get("humidity"),
-                    "pH": data.get("pH"),
-                    "Rainfall": data.get("rainfall", 0),
-                    "irrigation_needed": prediction,
-                    "Confidence": confidence,
-                    "Reason": reason
-                }, merge=True)
-                print("✓ Data saved to Firestore")
-            except Exception as firestore_error:
-                print("⚠ Firestore Error:", firestore_error)
-        else:
-            print("ℹ Firestore not configured - prediction not saved to cloud")
-            
-        return jsonify(result)
+                ids.append(resolve_ids(readings[i]))
+                keep.append(row)
+            except ValueError as e:
+                errors.append({"index": i, "error": str(e)})
+        if len(keep) < len(valid):
+            X = X[keep]
+            valid = [valid[row] for row in keep]
+            errors.sort(key=lambda e: e["index"])
+        stages.mark("encode")
+        
+        # Readings of a node are screened in order; imputed values go into X and the reading
+        found = {}
+        if anomaly_detector is not None and valid:
+            columns = [scorer.encoder.features.index(name) for name in ANOMALY_CHANNELS]
+            passed, found = anomaly_detector.screen_matrix(X, columns, ids)
+            for row, anomalies in found.items():
+                imputed = {a["sensor"]: a["imputed"] for a in anomalies if "imputed" in a}
+                if imputed:
+                    readings[valid[row]] = dict(readings[valid[row]], **imputed)
+                    # A proxied detector (serve.py) imputes into its copy of X
+                    for sensor, value in imputed.items():
+                        X[row, columns[ANOMALY_CHANNELS.index(sensor)]] = value
+                if not passed[row]:
+                    errors.append({"index": valid[row], "error": "Reading dropped by anomaly detection",
+                                   "anomalies": anomalies})
+            if not passed.all():
+                X, ids = X[passed], [ids[row] for row in np.flatnonzero(passed)]
+                found = {valid[row]: found[row] for row in found if passed[row]}
+                valid = [valid[row] for row in np.flatnonzero(passed)]
+                errors.sort(key=lambda e: e["index"])
+            else:
+                found = {valid[row]: anomalies for row, anomalies in found.items()}
+            stages.mark("screen")
+        
+        results = []
+        if valid:
+            predictions, confidences, reasons = scorer.score_matrix(X, [field_id for field_id, _ in ids])
+            stages.mark("predict")
+            rules = scorer.rules
+            for code, count in enumerate(np.bincount(reasons, minlength=len(rules.names))):
+                if count:
+                    decisions.inc(rules.names[code], amount=int(count))
+            features = update_features_many([readings[i] for i in valid], ids)
+            for i, (field_id, node_id), prediction, confidence, code, row_features in zip(
+                    valid, ids, predictions, confidences, reasons, features):
+                results.append({
+                    "index": i,
+                    "irrigation_needed": int(prediction),
+                    "confidence": round(float(confidence), 2),
+                    "reason": rules.reason(code, readings[i]),
+                    "field_id": field_id,
+                    "features": row_features
+                })
+                if i in found:
+                    results[-1]["anomalies"] = found[i]
+            if scheduler is not None:
+                scheduler.observe_many([field_id for field_id, _ in ids], [node_id for _, node_id in ids],
+                                       predictions, confidences)
+            stages.mark("features")
+            for (field_id, node_id), result in zip(ids, results):
+                save_prediction(readings[result["index"]], result["irrigation_needed"], result["confidence"],
+                                result["reason"], field_id, node_id, version.version, result["features"])
+            stages.mark("firestore")
+        
+        log.sampled("predict.batch", count=len(readings), ok=len(results), errors=len(errors),
+                    ms=round((time.perf_counter() - started) * 1000, 2))
+        
+        response = jsonify({
+            "model_version": version.version,
+            "count": len(readings),
+            "results": results,
+            "errors": errors
+        })
+        stages.mark("respond")
+        return response
     except Exception as e:
-        print("Prediction Error:", e)
-        import traceback
-        traceback.print_exc()
+        log.error("predict.batch.error", exc_info=True, error=str(e))
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
+    # Development server; use serve.py for multi-worker production serving
     print("Starting Flask app...")
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    init_firestore()
+    if PROFILER_ENABLED:
+        install_profile_signal()
+    app.run(debug=os.environ.get("FLASK_DEBUG", "True").lower() in ("1", "true", "yes"),
+             port=int(os.environ.get("FLASK_PORT", 5001)))
\ No newline at end of file
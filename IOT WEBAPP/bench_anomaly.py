@@ -0,0 +1,166 @@
+"""
+Benchmark for the streaming anomaly stage on a replayed fleet stream.
+
+fleet_sim.Fleet produces the readings of --nodes nodes (irrigation jumps,
+rain, daily cycles) and faults are injected into the stream with known labels:
+
+    sensor_fault  temperature and humidity sent as 0 (failed DHT read), --faults
+    spike         soil moved by 800-1500 ADC units for one reading, --spikes
+    stuck         soil of --stuck of the nodes frozen from the middle of the run
+
+The stream is then screened twice by fresh detectors, one reading at a time
+(AnomalyDetector.screen, as /predict does) and in batches of --batch rows
+(screen_matrix, as /predict/batch and the gateway do), and the detections
+are compared with the labels. Irrigation jumps that the detector flags before
+it accepts the new level count as false spikes.
+
+Usage:
+    python3 bench_anomaly.py [readings] [--nodes 500] [--batch 1000] [--output anomaly.json]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from anomaly import CHANNELS, AnomalyDetector
+from fleet_sim import ADC_MAX, Fleet, to_readings
+
+
+def replay(nodes, count, seed=42):
+    """The first `count` delivered readings of a simulated fleet"""
+    fleet = Fleet(nodes, seed=seed, loss=0.0)
+    readings, t = [], 0.0
+    while len(readings) < count:
+        t += fleet.interval / 4
+        batch = fleet.due(t)
+        if batch is not None:
+            readings.extend(to_readings(batch))
+    return readings[:count]
+
+
+def inject(readings, faults, spikes, stuck, seed=7):
+    """
+    Inject faults in place
+
+    Returns:
+        Tuple of (set of (index, kind) labels, {node_id: index of its first frozen reading})
+    """
+    rng = np.random.default_rng(seed)
+    labels = set()
+    node_ids = sorted({r["node_id"] for r in readings})
+    frozen = {node_id: None for node_id in rng.choice(node_ids, int(len(node_ids) * stuck), replace=False)}
+    frozen_at, held = {}, {}
+    for i, reading in enumerate(readings):
+        node_id = reading["node_id"]
+        if node_id in frozen and i >= len(readings) // 2:
+            reading["soil"] = held.setdefault(node_id, reading["soil"])
+            frozen_at.setdefault(node_id, i)
+            continue
+        if rng.random() < faults:
+            reading["temperature"] = reading["humidity"] = 0
+            labels.add((i, "sensor_fault"))
+        if rng.random() < spikes:
+            jump = int(rng.integers(800, 1500)) * (1 if reading["soil"] < ADC_MAX / 2 else -1)
+            reading["soil"] = int(np.clip(reading["soil"] + jump, 0, ADC_MAX))
+            labels.add((i, "spike"))
+    return labels, frozen_at
+
+
+def score(found, labels, frozen_at, readings):
+    """Precision/recall per kind; stuck sensors are counted per node"""
+    detected = {(i, a["kind"]) for i, anomalies in found.items() for a in anomalies}
+    result = {}
+    for kind in ("sensor_fault", "spike"):
+        hits = {d for d in detected if d[1] == kind}
+        truth = {label for label in labels if label[1] == kind}
+        true = len(hits & truth)
+        result[kind] = {"injected": len(truth), "detected": len(hits), "true": true,
+                        "precision": round(true / len(hits), 4) if hits else 1.0,
+                        "recall": round(true / len(truth), 4) if truth else 1.0}
+    first = {}
+    for i, kind in sorted(detected):
+        if kind == "stuck":
+            first.setdefault(readings[i]["node_id"], i)
+    caught = [node_id for node_id in frozen_at if node_id in first]
+    delays = [sum(1 for j in range(frozen_at[n], first[n] + 1) if readings[j]["node_id"] == n) for n in caught]
+    result["stuck"] = {"frozen_nodes": len(frozen_at), "detected_nodes": len(first),
+                       "true_nodes": len(caught), "median_delay_readings": int(np.median(delays)) if delays else None}
+    return result
+
+
+def run_one(readings):
+    detector = AnomalyDetector()
+    found = {}
+    started = time.perf_counter()
+    for i, reading in enumerate(readings):
+        _, anomalies = detector.screen(reading, reading["field_id"], reading["node_id"])
+        if anomalies:
+            found[i] = anomalies
+    return time.perf_counter() - started, found, detector
+
+
+def run_batches(readings, size):
+    detector = AnomalyDetector()
+    X = np.array([[r[c] for c in CHANNELS] for r in readings], dtype=float)
+    keys = [(r["field_id"], r["node_id"]) for r in readings]
+    columns = list(range(len(CHANNELS)))
+    found = {}
+    started = time.perf_counter()
+    for start in range(0, len(readings), size):
+        _, batch_found = detector.screen_matrix(X[start:start + size], columns, keys[start:start + size])
+        for row, anomalies in batch_found.items():
+            found[start + row] = anomalies
+    return time.perf_counter() - started, found, detector
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anomaly stage throughput and detection on a fleet stream")
+    parser.add_argument("readings", nargs="?", type=int, default=200000)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=1000, help="Rows per screen_matrix call")
+    parser.add_argument("--faults", type=float, default=0.01, help="Fraction of readings with a DHT failure")
+    parser.add_argument("--spikes", type=float, default=0.005, help="Fraction of readings with a soil spike")
+    parser.add_argument("--stuck", type=float, default=0.02, help="Fraction of nodes whose soil sensor freezes")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    readings = replay(args.nodes, args.readings)
+    labels, frozen_at = inject(readings, args.faults, args.spikes, args.stuck)
+    print("=" * 60)
+    print(f"  Anomaly stage: {len(readings)} readings from {args.nodes} nodes")
+    print("=" * 60)
+
+    results = {"readings": len(readings), "nodes": args.nodes}
+    one_s, found, detector = run_one(readings)
+    batch_s, batch_found, _ = run_batches(readings, args.batch)
+    results["one"] = {"readings_per_s": round(len(readings) / one_s), "us_per_reading": round(one_s / len(readings) * 1e6, 3)}
+    results["batch"] = {"size": args.batch, "readings_per_s": round(len(readings) / batch_s),
+                        "us_per_reading": round(batch_s / len(readings) * 1e6, 3)}
+    results["identical"] = found == batch_found
+    print(f"\n  one at a time:    {results['one']['readings_per_s']:>10,} readings/s  "
+          f"({results['one']['us_per_reading']:.2f} µs each)")
+    print(f"  batches of {args.batch:<5} {results['batch']['readings_per_s']:>10,} readings/s  "
+          f"({results['batch']['us_per_reading']:.2f} µs each)")
+    print(f"  same anomalies both ways: {results['identical']}")
+
+    results["detection"] = detection = score(found, labels, frozen_at, readings)
+    print(f"\n  {'kind':<13} {'injected':>9} {'detected':>9} {'precision':>10} {'recall':>7}")
+    for kind in ("sensor_fault", "spike"):
+        d = detection[kind]
+        print(f"  {kind:<13} {d['injected']:>9} {d['detected']:>9} {d['precision']:>10.3f} {d['recall']:>7.3f}")
+    d = detection["stuck"]
+    print(f"  stuck nodes   {d['frozen_nodes']:>9} {d['detected_nodes']:>9}   "
+          f"({d['true_nodes']} true, median {d['median_delay_readings']} readings to detect)")
+    results["stats"] = detector.stats()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
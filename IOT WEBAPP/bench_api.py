@@ -0,0 +1,436 @@
+"""
+Load test and benchmark harness for the prediction API.
+
+Readings come from push_test_data.generate_sensor_data() with a fixed seed, so
+runs are repeatable. Three modes:
+
+    score   in-process: Scorer.score_one() per reading and score_matrix() per
+            batch size, no HTTP involved (the scoring ceiling)
+    closed  N workers, each sends its next request when the previous one
+            returns (throughput ceiling of the server)
+    open    requests start on a fixed schedule at --rate per second whether
+            or not earlier ones finished; latency is measured from the
+            scheduled start, so queueing inside the server is not hidden
+
+Every run reports p50/p95/p99 latency, a latency histogram, requests/s and
+CPU/RSS (of this process and, with --server-pid, of the API server), and can
+save them as JSON for comparison against an earlier run.
+
+Usage:
+    python3 bench_api.py score [--count 20000]
+    python3 bench_api.py closed [--url URL] [--concurrency 8] [--duration 10] [--batch 0]
+    python3 bench_api.py open [--url URL] [--rate 200] [--duration 10]
+    python3 bench_api.py closed --server-pid $(pgrep -f "app.py") --output run.json --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from dispatcher import percentile
+from push_test_data import generate_sensor_data
+
+API_URL = os.environ.get("API_URL", "http://127.0.0.1:5001/predict")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+HISTOGRAM_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Readings scored per in-process measurement (score_one is ~10 ms per call)
+SCORE_SAMPLES = 2000
+
+# Relative change that counts as a regression in --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+def make_readings(count, seed=42):
+    """Repeatable list of synthetic readings"""
+    rng = random.Random(seed)
+    return [generate_sensor_data(rng) for _ in range(count)]
+
+
+def histogram(latencies_ms):
+    """Count latencies per HISTOGRAM_BUCKETS_MS bucket ("<=X" keys, then ">X")"""
+    counts = {f"<={bound}": 0 for bound in HISTOGRAM_BUCKETS_MS}
+    counts[f">{HISTOGRAM_BUCKETS_MS[-1]}"] = 0
+    for value in latencies_ms:
+        for bound in HISTOGRAM_BUCKETS_MS:
+            if value <= bound:
+                counts[f"<={bound}"] += 1
+                break
+        else:
+            counts[f">{HISTOGRAM_BUCKETS_MS[-1]}"] += 1
+    return counts
+
+
+def summarize(latencies_ms, elapsed, items=None, errors=0):
+    """
+    Latency percentiles, histogram and throughput of one run
+
+    Args:
+        latencies_ms: Per-request latencies in milliseconds
+        elapsed: Wall time of the run in seconds
+        items: Readings scored (defaults to one per request)
+        errors: Requests that failed
+
+    Returns:
+        Dictionary of results
+    """
+    values = sorted(latencies_ms)
+    items = len(values) if items is None else items
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+        "readings_per_s": round(items / elapsed, 1) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+        "histogram_ms": histogram(values),
+    }
+
+
+def _proc_cpu_seconds(pid):
+    """User + system CPU seconds of a process (Linux /proc)"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _proc_rss_mb(pid):
+    """Resident set size of a process in MB (Linux /proc)"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class ResourceMonitor:
+    """CPU time and peak RSS of this process (and optionally the server) during a run"""
+
+    def __init__(self, server_pid=None, interval=0.2):
+        self.server_pid = server_pid
+        self.interval = interval
+        self._stop = threading.Event()
+        self._peak = {"client": 0.0, "server": 0.0}
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._record()
+
+    def _record(self):
+        try:
+            self._peak["client"] = max(self._peak["client"], _proc_rss_mb(os.getpid()))
+            if self.server_pid:
+                self._peak["server"] = max(self._peak["server"], _proc_rss_mb(self.server_pid))
+        except OSError:
+            pass  # no /proc (non-Linux) or the server exited
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._client_cpu = resource.getrusage(resource.RUSAGE_SELF)
+        self._server_cpu = self._server_seconds()
+        self._record()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._record()
+        elapsed = time.perf_counter() - self._started
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        client_cpu = (usage.ru_utime - self._client_cpu.ru_utime) + (usage.ru_stime - self._client_cpu.ru_stime)
+        self.result = {
+            "client_cpu_s": round(client_cpu, 3),
+            "client_cpu_pct": round(100 * client_cpu / elapsed, 1) if elapsed > 0 else 0.0,
+            # ru_maxrss is KB on Linux; fall back to it when /proc is unavailable
+            "client_rss_peak_mb": round(self._peak["client"] or usage.ru_maxrss / 1024, 1),
+        }
+        server_cpu = self._server_seconds()
+        if server_cpu is not None and self._server_cpu is not None:
+            self.result["server_cpu_s"] = round(server_cpu - self._server_cpu, 3)
+            self.result["server_cpu_pct"] = round(100 * (server_cpu - self._server_cpu) / elapsed, 1)
+            self.result["server_rss_peak_mb"] = round(self._peak["server"], 1)
+        return False
+
+    def _server_seconds(self):
+        if not self.server_pid:
+            return None
+        try:
+            return _proc_cpu_seconds(self.server_pid)
+        except OSError:
+            return None
+
+
+_local = threading.local()
+
+
+def _session():
+    """One keep-alive session per worker thread"""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _send(url, body, timeout):
+    """POST one request; returns True on HTTP 200"""
+    try:
+        response = _session().post(url, json=body, timeout=timeout)
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+def _request_body(readings, index, batch):
+    if batch:
+        return [readings[(index + k) % len(readings)] for k in range(batch)]
+    return readings[index % len(readings)]
+
+
+def closed_loop(url, readings, concurrency=8, duration=10.0, batch=0, timeout=10):
+    """
+    Each worker sends its next request as soon as the previous one returns
+
+    Args:
+        url: …/predict endpoint (…/predict/batch is used when batch > 0)
+        readings: Synthetic readings, reused round-robin
+        concurrency: Number of workers
+        duration: Run time in seconds
+        batch: Readings per request (0 = single-reading /predict)
+        timeout: Per-request timeout in seconds
+    """
+    target = url.rstrip("/") + "/batch" if batch else url
+    lock = threading.Lock()
+    latencies, counter = [], [0, 0]  # next index, errors
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                index = counter[0]
+                counter[0] += max(1, batch)
+            start = time.perf_counter()
+            if start >= deadline:
+                break
+            ok = _send(target, _request_body(readings, index, batch), timeout)
+            if ok:
+                local.append((time.perf_counter() - start) * 1000)
+            else:
+                with lock:
+                    counter[1] += 1
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, items=len(latencies) * max(1, batch), errors=counter[1])
+
+
+def open_loop(url, readings, rate=100.0, duration=10.0, batch=0, max_in_flight=256,
+              poisson=False, timeout=10, seed=42):
+    """
+    Start requests on a fixed schedule regardless of completions
+
+    Latency is measured from each request's scheduled start time, so a server
+    that falls behind shows up as growing latency instead of a lower send rate.
+
+    Args:
+        rate: Requests started per second
+        max_in_flight: Worker threads available to run requests
+        poisson: Exponential inter-arrival times instead of a fixed interval
+        (other arguments as in closed_loop)
+    """
+    target = url.rstrip("/") + "/batch" if batch else url
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def run(scheduled, body):
+        ok = _send(target, body, timeout)
+        with lock:
+            if ok:
+                latencies.append((time.perf_counter() - scheduled) * 1000)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    scheduled = started
+    sent = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        while scheduled < started + duration:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, scheduled, _request_body(readings, sent * max(1, batch), batch))
+            sent += 1
+            scheduled += rng.expovariate(rate) if poisson else 1.0 / rate
+    elapsed = time.perf_counter() - started
+    result = summarize(latencies, elapsed, items=len(latencies) * max(1, batch), errors=errors[0])
+    result["offered_per_s"] = rate
+    return result
+
+
+def bench_scoring(readings, batch_sizes=(1, 10, 100, 1000)):
+    """
+    In-process scoring benchmark (model + encoder, no HTTP)
+
+    Returns:
+        Dictionary with a score_one summary and one summary per batch size
+    """
+    from scoring import Scorer
+
+    scorer = Scorer.from_file()
+    scorer.score_one(readings[0])  # warm-up outside the measurement
+
+    latencies = []
+    started = time.perf_counter()
+    for reading in readings[:SCORE_SAMPLES]:
+        start = time.perf_counter()
+        scorer.score_one(reading)
+        latencies.append((time.perf_counter() - start) * 1000)
+    results = {"score_one": summarize(latencies, time.perf_counter() - started)}
+
+    for size in batch_sizes:
+        chunks = [readings[i:i + size] for i in range(0, len(readings) - size + 1, size)][:max(1, SCORE_SAMPLES // size)]
+        latencies = []
+        started = time.perf_counter()
+        for chunk in chunks:
+            start = time.perf_counter()
+            X, valid, _ = scorer.encoder.encode_batch(chunk)
+            scorer.score_matrix(X)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[f"score_matrix_{size}"] = summarize(latencies, time.perf_counter() - started,
+                                                    items=len(chunks) * size)
+    return results
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD, prefix=""):
+    """
+    Print metric changes against a baseline run
+
+    Throughput metrics (*_per_s) regress when they drop, latency metrics
+    (p50/p95/p99) when they rise, by more than the threshold.
+
+    Returns:
+        Number of regressed metrics
+    """
+    regressions = 0
+    for key, value in current.items():
+        base = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            if isinstance(base, dict) and not key.startswith("histogram"):
+                regressions += compare(value, base, threshold, f"{prefix}{key}.")
+            continue
+        higher_is_better = key.endswith("_per_s") and key != "offered_per_s"
+        lower_is_better = key in ("p50_ms", "p95_ms", "p99_ms")
+        if not (higher_is_better or lower_is_better) or not base:
+            continue
+        change = (value - base) / base
+        worse = change < -threshold if higher_is_better else change > threshold
+        regressions += worse
+        print(f"  {'✗' if worse else '✓'} {prefix}{key}: {base} → {value} ({change * 100:+.1f}%)")
+    return regressions
+
+
+def print_summary(name, result):
+    print(f"\n📊 {name}")
+    print(f"  Throughput: {result['requests_per_s']} requests/s, {result['readings_per_s']} readings/s"
+          f" ({result['requests']} ok, {result['errors']} errors)")
+    print(f"  Latency:    p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms,"
+          f" max {result['max_ms']} ms")
+    total = max(1, result["requests"])
+    for bucket, count in result["histogram_ms"].items():
+        if count:
+            print(f"  {bucket:>8} ms {count:8d}  {'█' * max(1, round(40 * count / total))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prediction API")
+    parser.add_argument("mode", choices=("score", "closed", "open"))
+    parser.add_argument("--url", default=API_URL, help="…/predict endpoint")
+    parser.add_argument("--count", type=int, default=20000, help="Synthetic readings to generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per HTTP run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Workers in closed-loop mode")
+    parser.add_argument("--rate", type=float, default=100.0, help="Requests/s in open-loop mode")
+    parser.add_argument("--poisson", action="store_true", help="Exponential inter-arrival times (open loop)")
+    parser.add_argument("--batch", type=int, default=0, help="Readings per /predict/batch request (0 = /predict)")
+    parser.add_argument("--server-pid", type=int, help="Also report CPU/RSS of this process")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"  Prediction API benchmark: {args.mode}")
+    print("=" * 60)
+
+    readings = make_readings(args.count, args.seed)
+    with ResourceMonitor(args.server_pid) as monitor:
+        if args.mode == "score":
+            results = bench_scoring(readings)
+        elif args.mode == "closed":
+            results = {"closed": closed_loop(args.url, readings, args.concurrency, args.duration, args.batch)}
+        else:
+            results = {"open": open_loop(args.url, readings, args.rate, args.duration, args.batch,
+                                         poisson=args.poisson, seed=args.seed)}
+
+    for name, result in results.items():
+        print_summary(name, result)
+    print("\n🖥  Resources")
+    for key, value in monitor.result.items():
+        print(f"  {key}: {value}")
+
+    report = {
+        "mode": args.mode,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+        "resources": monitor.result,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n🔍 Compared with {args.compare} (threshold {args.threshold * 100:.0f}%)")
+        changed = [key for key in ("mode", "batch", "concurrency", "rate")
+                   if baseline.get("config", {}).get(key) != report["config"].get(key)]
+        if changed:
+            print(f"⚠ Baseline was run with different settings: {', '.join(changed)}")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        print(f"{'✗' if regressions else '✓'} {regressions} regression(s)")
+
+    print("\n" + "=" * 60)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
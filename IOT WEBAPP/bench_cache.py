@@ -0,0 +1,174 @@
+"""
+Benchmark for the prediction cache on a realistic replayed stream.
+
+Generates what a fleet of ground nodes sends over a day: one reading per node
+every 15 seconds, with soil slowly drying out between irrigations, a daily
+temperature/humidity cycle, the LDR's Sunny/Dark light levels and occasional
+one-step sensor noise, all at sensor resolution. The stream is replayed in
+time order through
+
+    score   Scorer.score_one() directly vs PredictionCache.score()
+    api     POST /predict (Flask test client) with the cache off and on
+
+and the hit rate, p50/p99 latency and the decisions of both runs are compared.
+
+Usage:
+    python3 bench_cache.py [nodes] [hours] [--noise 0.05] [--output cache.json]
+"""
+
+import json
+import math
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from bench_api import summarize
+from lora_payload import LIGHT_LEVELS
+
+INTERVAL_S = 15
+
+
+def fleet_stream(nodes=20, hours=24.0, noise=0.05, seed=42):
+    """
+    Readings of a fleet in arrival order
+
+    Args:
+        nodes: Ground nodes reporting
+        hours: Length of the stream
+        noise: Probability that a channel reads one step off
+
+    Returns:
+        List of request dictionaries with field_id, node_id and timestamp
+    """
+    rng = random.Random(seed)
+    start_ms = 1_790_000_000_000
+    state = [{
+        "soil": rng.uniform(900, 2600),
+        "drying_per_h": rng.uniform(5, 25),
+        "temperature_offset": rng.uniform(-2, 2),
+        "humidity_offset": rng.uniform(-8, 8),
+        "pH": round(rng.uniform(5.8, 7.2), 2),
+        "phase": rng.uniform(0, 600),
+    } for _ in range(nodes)]
+
+    def jitter(value, step):
+        return value + step * rng.choice((-1, 1)) if rng.random() < noise else value
+
+    readings = []
+    for tick in range(int(hours * 3600 / INTERVAL_S)):
+        for n, node in enumerate(state):
+            t = tick * INTERVAL_S + node["phase"]
+            node["soil"] -= node["drying_per_h"] * INTERVAL_S / 3600
+            if node["soil"] < 450:
+                node["soil"] = rng.uniform(2200, 2800)  # irrigated
+            day = math.sin(2 * math.pi * (t / 86400 - 0.3))
+            readings.append({
+                "soil": int(jitter(round(node["soil"]), 1)),
+                "light": LIGHT_LEVELS["Sunny"] if day > 0 else LIGHT_LEVELS["Dark"],
+                "temperature": round(jitter(22 + 7 * day + node["temperature_offset"], 0.1), 1),
+                "humidity": round(jitter(60 - 15 * day + node["humidity_offset"], 0.1), 1),
+                "pH": round(jitter(node["pH"], 0.01), 2),
+                "field_id": f"field_{n % 4 + 1}",
+                "node_id": f"node_{n}",
+                "timestamp": start_ms + int(t * 1000),
+            })
+    return readings
+
+
+def timed(fn, readings):
+    """Per-call latencies in ms and results of fn over the stream"""
+    latencies, results = [], []
+    started = time.perf_counter()
+    for reading in readings:
+        t = time.perf_counter()
+        results.append(fn(reading))
+        latencies.append((time.perf_counter() - t) * 1000)
+    return latencies, results, time.perf_counter() - started
+
+
+def bench_score(readings):
+    from model_artifact import file_sha256
+    from prediction_cache import PredictionCache, quantize
+    from scoring import MODEL_PATH, Scorer
+
+    scorer = Scorer.from_file(MODEL_PATH)
+    scorer.warm_up()
+    version = SimpleNamespace(version="bench", sha256=file_sha256(MODEL_PATH), scorer=scorer)
+    cache = PredictionCache()
+
+    base_ms, base, base_s = timed(scorer.score_one, readings)
+    cached_ms, cached, cached_s = timed(lambda r: cache.score(version, r), readings)
+    # Decisions of the cache equal scoring the reading at sensor resolution
+    reference = [scorer.score_one(quantize(r)[1]) for r in readings]
+    return {
+        "uncached": summarize(base_ms, base_s),
+        "cached": summarize(cached_ms, cached_s),
+        "cache": cache.stats(),
+        "identical_to_quantized": cached == reference,
+        "identical_to_raw": sum(a == b for a, b in zip(cached, base)) / len(readings),
+    }
+
+
+def bench_api(readings):
+    os.environ.update(FIRESTORE_BACKEND="none", LOG_SAMPLE_RATE="0", MODEL_LOAD="sync", FEATURE_STORE_PATH="")
+    import app as api
+    from prediction_cache import PredictionCache
+
+    client = api.app.test_client()
+    runs = {}
+    for name, max_mb in (("uncached", 0), ("cached", 16)):
+        api.feature_store = api.FeatureStore()
+        api.prediction_cache = PredictionCache(max_mb=max_mb)
+        client.post("/predict", json=readings[0])  # warm-up
+        latencies, results, elapsed = timed(lambda r: client.post("/predict", json=r).get_json(), readings)
+        runs[name] = summarize(latencies, elapsed)
+        runs[name]["decisions"] = [(r["irrigation_needed"], r["confidence"]) for r in results]
+    runs["cache"] = api.prediction_cache.stats()
+    return runs
+
+
+def report(name, result):
+    base, cached = result["uncached"], result["cached"]
+    print(f"\n⚡ {name}")
+    print(f"  uncached: p50 {base['p50_ms'] * 1000:8.1f} µs  p99 {base['p99_ms'] * 1000:8.1f} µs  "
+          f"{base['requests_per_s']:9.1f} req/s")
+    print(f"  cached:   p50 {cached['p50_ms'] * 1000:8.1f} µs  p99 {cached['p99_ms'] * 1000:8.1f} µs  "
+          f"{cached['requests_per_s']:9.1f} req/s")
+    stats = result["cache"]
+    print(f"  hit rate {stats['hit_rate'] * 100:.1f}%  ({stats['entries']} entries, ~{stats['approx_mb']} MB, "
+          f"{stats['latency_saved_ms']:.0f} ms saved)  p50 x{base['p50_ms'] / cached['p50_ms']:.1f}")
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    nodes = int(args[0]) if args else 20
+    hours = float(args[1]) if len(args) > 1 else 24.0
+    noise = float(sys.argv[sys.argv.index("--noise") + 1]) if "--noise" in sys.argv else 0.05
+    output = sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else None
+
+    readings = fleet_stream(nodes, hours, noise)
+    print("=" * 60)
+    print(f"  Prediction cache: {nodes} nodes x {hours:g} h every {INTERVAL_S} s = {len(readings)} readings")
+    print("=" * 60)
+
+    score = bench_score(readings)
+    report("Scorer.score_one vs PredictionCache.score", score)
+    print(f"  decisions identical to scoring at sensor resolution: {score['identical_to_quantized']}"
+          f" (to raw readings: {score['identical_to_raw'] * 100:.2f}%)")
+
+    api = bench_api(readings[:min(len(readings), 20000)])
+    report("POST /predict", api)
+    same = api["uncached"].pop("decisions") == api["cached"].pop("decisions")
+    print(f"  same decisions with and without the cache: {same}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"nodes": nodes, "hours": hours, "noise": noise, "score": score, "api": api}, f, indent=2)
+        print(f"\n✓ Results written to {output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark for the retention and compaction job on an in-memory RTDB.
+
+Fills a local RTDB (RTDB_BACKEND=local) with --days of fleet_sim readings
+from --nodes nodes, keyed by push IDs stamped at the reading time (as the
+SDKs would have written them), plus --legacy text payloads under millis()
+keys as ground_node.ino writes them. The first --processed of those are
+behind the listener's high-water mark. Then compaction.run is
+timed with --retain-days, and the benchmark reports:
+
+    tree        JSON size of /sensor_data and the time of a full get() before and after
+    reclaimed   raw bytes deleted, aggregate bytes added, archive bytes written
+    lossless    every original reading is in the archive or still in the tree
+                (values compared as JSON), and the aggregate counts add up
+    rerun       a second run finds nothing to do
+
+Usage:
+    python3 bench_compaction.py [--nodes 20] [--days 45] [--interval 600] [--retain-days 30] [--output compaction.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+os.environ["RTDB_BACKEND"] = "local"
+
+import compaction
+from fleet_sim import Fleet, to_readings
+from local_rtdb import PushIdGenerator
+from storage import realtime_database
+
+PATH = "/sensor_data"
+
+
+def fill(database, nodes, days, interval, legacy, seed=42):
+    """Write the readings; returns how many"""
+    fleet = Fleet(nodes, interval=interval, loss=0.0, seed=seed,
+                  start_ms=int(time.time() * 1000 - days * 86400 * 1000))
+    push_id = PushIdGenerator()
+    reference = database.reference(PATH)
+    written, t = 0, 0.0
+    while t < days * 86400 - interval:
+        t += interval
+        batch = fleet.due(t)
+        if batch is not None:
+            readings = to_readings(batch)
+            reference.update({push_id(r["timestamp"]): r for r in readings})
+            written += len(readings)
+    # The ground node's own packets: text payloads under millis() keys
+    reference.update({str(1000 + 30000 * i): f"soil:{1800 + i % 400},light:{300 if i % 2 else 50},temp:{24 + i % 5},"
+                      f"humidity:{55 + i % 10},pH:6.{i % 10},npk:0,rainfall:0" for i in range(legacy)})
+    return written + legacy
+
+
+def canonical(values):
+    return Counter(json.dumps(v, sort_keys=True) for v in values)
+
+
+def snapshot(database):
+    started = time.perf_counter()
+    data = database.reference(PATH).get() or {}
+    get_ms = (time.perf_counter() - started) * 1000
+    return data, len(json.dumps(data, separators=(",", ":"))), get_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retention and compaction job on an in-memory RTDB")
+    parser.add_argument("--nodes", type=int, default=20)
+    parser.add_argument("--days", type=float, default=45.0)
+    parser.add_argument("--interval", type=float, default=600.0, help="Seconds between a node's readings")
+    parser.add_argument("--legacy", type=int, default=2000, help="Text payloads under millis() keys")
+    parser.add_argument("--processed", type=int, default=1500, help="Legacy readings the listener already scored")
+    parser.add_argument("--retain-days", type=float, default=30.0)
+    parser.add_argument("--batch", type=int, default=compaction.COMPACTION_BATCH)
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    database = realtime_database("local")
+    written = fill(database, args.nodes, args.days, args.interval, args.legacy)
+    workdir = tempfile.mkdtemp(prefix="compaction-")
+    archive_dir = os.path.join(workdir, "archive")
+    state_file = os.path.join(workdir, "listener_state.json")
+    with open(state_file, "w") as f:
+        json.dump({PATH: str(1000 + 30000 * (args.processed - 1))}, f)
+
+    print("=" * 60)
+    print(f"  Compaction: {written:,} readings from {args.nodes} nodes over {args.days:g} days, "
+          f"keeping {args.retain_days:g}")
+    print("=" * 60)
+
+    before, before_bytes, before_ms = snapshot(database)
+    summary = compaction.run(database, PATH, state_file, retain_days=args.retain_days, archive_dir=archive_dir,
+                             batch=args.batch)
+    after, after_bytes, after_ms = snapshot(database)
+    compaction.print_summary(summary)
+
+    archive = compaction.read_archive(archive_dir)
+    archived = [json.loads(raw) for raw in archive["raw"].tolist()]
+    lossless = canonical(before.values()) == canonical(archived) + canonical(after.values())
+    daily = database.reference(f"{compaction.COMPACTION_AGGREGATES_PATH}/daily").get() or {}
+    aggregated = sum(doc["count"] for nodes in daily.values() for days in nodes.values() for doc in days.values())
+    counts_match = aggregated == summary["expired"] - summary["unparsed"]
+    rerun = compaction.run(database, PATH, state_file, retain_days=args.retain_days, archive_dir=archive_dir,
+                           batch=args.batch)
+    with open(state_file) as f:
+        mark = json.load(f)[PATH]
+    mark_moved = compaction.push_id_timestamp(mark) is not None
+
+    print(f"\n  {'':<8} {'children':>10} {'bytes':>12} {'get() ms':>10}")
+    print(f"  {'before':<8} {len(before):>10,} {before_bytes:>12,} {before_ms:>10.1f}")
+    print(f"  {'after':<8} {len(after):>10,} {after_bytes:>12,} {after_ms:>10.1f}")
+    print(f"\n  archive: {summary['archive_bytes']:,} bytes for {len(archive['key']):,} readings "
+          f"({summary['archive_bytes'] / max(1, summary['raw_bytes']):.1%} of their JSON)")
+    print(f"  lossless: {lossless}, aggregate counts match: {counts_match}, "
+          f"listener mark moved to a push ID: {mark_moved}")
+    print(f"  rerun: {rerun['rekey']['rekeyed']} rekeyed, {rerun['expired']} expired")
+
+    results = {
+        "readings": written, "nodes": args.nodes, "days": args.days, "interval_s": args.interval,
+        "retain_days": args.retain_days, "batch": args.batch,
+        "before": {"children": len(before), "bytes": before_bytes, "get_ms": round(before_ms, 1)},
+        "after": {"children": len(after), "bytes": after_bytes, "get_ms": round(after_ms, 1)},
+        "summary": summary, "lossless": lossless, "counts_match": counts_match, "mark_moved": mark_moved,
+        "rerun": {"rekeyed": rerun["rekey"]["rekeyed"], "expired": rerun["expired"]},
+    }
+    shutil.rmtree(workdir)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark for the dashboard data API against downloading the whole subtree.
+
+Fills an in-memory RTDB (RTDB_BACKEND=local) with --hours of fleet_sim
+readings from --nodes nodes under push ID keys (stamped at write time, as
+the SDKs do; the readings carry their own timestamps) and compares, through the
+Flask test client, what one chart refresh costs:
+
+    full        GET of /sensor_data, as getSensorData and the dashboard do
+    series      /dashboard/series for one node over the whole range (LTTB and
+                min-max), with and without gzip
+    revalidate  the same request with If-None-Match (304 while nothing changed)
+
+Each request is timed without the RTDB sync, which runs at most every
+DASHBOARD_SYNC_INTERVAL seconds; the syncs are reported separately.
+    delta       /dashboard/delta after one more round of readings
+
+Bytes are response body sizes; times are per request in this process.
+
+Usage:
+    python3 bench_dashboard.py [--nodes 10] [--hours 12] [--points 500] [--output dashboard.json]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+
+os.environ["RTDB_BACKEND"] = "local"
+
+import dashboard_api
+from fleet_sim import Fleet, to_readings
+from flask import Flask
+from local_rtdb import PushIdGenerator
+from storage import realtime_database
+
+
+def fill(database, path, nodes, hours, seed=42):
+    """Write `hours` of readings; returns (fleet, push ID generator, readings written)"""
+    fleet = Fleet(nodes, seed=seed, loss=0.0, start_ms=int(time.time() * 1000 - hours * 3600 * 1000))
+    push_id = PushIdGenerator()
+    written = 0
+    t = 0.0
+    while t < hours * 3600:
+        t += fleet.interval
+        batch = fleet.due(t)
+        if batch is not None:
+            readings = to_readings(batch)
+            database.reference(path).update({push_id(): r for r in readings})
+            written += len(readings)
+    return fleet, push_id, written, t
+
+
+def timed(client, url, repeat=5, **headers):
+    """Best of `repeat` requests: (response, ms)"""
+    best, response = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        best = min(best, (time.perf_counter() - started) * 1000)
+    return response, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard refresh cost: whole subtree vs /dashboard queries")
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--hours", type=float, default=12.0)
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    path = dashboard_api.store.path
+    database = realtime_database("local")
+    fleet, push_id, written, t = fill(database, path, args.nodes, args.hours)
+    app = Flask(__name__)
+    app.register_blueprint(dashboard_api.dashboard)
+    client = app.test_client()
+
+    print("=" * 60)
+    print(f"  Dashboard refresh: {written} readings from {args.nodes} nodes over {args.hours:g} h")
+    print("=" * 60)
+
+    results = {"readings": written, "nodes": args.nodes, "hours": args.hours, "points": args.points}
+    started = time.perf_counter()
+    dashboard_api.store.sync(database, force=True)
+    results["initial_sync_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    # Requests below reuse the copy; the sync after new readings is timed on its own
+    dashboard_api.store.sync_interval = float("inf")
+
+    started = time.perf_counter()
+    full = json.dumps(database.reference(path).get()).encode()
+    full_ms = (time.perf_counter() - started) * 1000
+    rows = [("full subtree", len(full), len(gzip.compress(full, 6)), full_ms)]
+
+    node = "node_0"
+    url = f"/dashboard/series?field_id=field_1&node_id={node}&points={args.points}"
+    for method in ("lttb", "minmax"):
+        plain, plain_ms = timed(client, f"{url}&method={method}")
+        packed, packed_ms = timed(client, f"{url}&method={method}", **{"Accept-Encoding": "gzip"})
+        rows.append((f"series {method}", len(plain.data), len(packed.data), packed_ms))
+    etag = plain.headers["ETag"]
+    cursor = plain.get_json()["cursor"]
+    revalidated, revalidate_ms = timed(client, f"{url}&method=minmax", **{"If-None-Match": etag})
+    rows.append((f"revalidate ({revalidated.status_code})", len(revalidated.data), len(revalidated.data), revalidate_ms))
+
+    # One more report from every node, then the live update of the chart
+    batch = fleet.due(t + fleet.interval + fleet.jitter)
+    database.reference(path).update({push_id(): r for r in to_readings(batch)})
+    started = time.perf_counter()
+    dashboard_api.store.sync(database, force=True)
+    results["incremental_sync_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    delta_url = f"/dashboard/delta?field_id=field_1&node_id={node}&cursor={cursor}"
+    started = time.perf_counter()
+    delta = client.get(delta_url)
+    delta_ms = (time.perf_counter() - started) * 1000
+    rows.append((f"delta ({len(delta.get_json()['t'])} rows)", len(delta.data), len(delta.data), delta_ms))
+
+    print(f"\n  {'request':<22} {'bytes':>10} {'gzip bytes':>11} {'ms':>8}")
+    results["requests"] = []
+    for name, size, packed_size, ms in rows:
+        results["requests"].append({"request": name, "bytes": size, "gzip_bytes": packed_size, "ms": round(ms, 3)})
+        print(f"  {name:<22} {size:>10,} {packed_size:>11,} {ms:>8.2f}")
+    print(f"\n  sync of the copy: {results['initial_sync_ms']:.0f} ms initially (once per worker), "
+          f"{results['incremental_sync_ms']:.1f} ms for one round of new readings")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
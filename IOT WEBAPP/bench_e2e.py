@@ -0,0 +1,239 @@
+"""
+End-to-end benchmark: reading written to the Realtime Database → decision.
+
+Runs the whole ingest path on one machine with no network:
+
+    fleet_sim.Fleet → RTDB (storage.py backend) → fetch_and_predict listener
+        → serve.py (gunicorn, FIRESTORE_BACKEND=local) → decision
+
+A producer thread writes the fleet's readings into the database at --rate
+readings/s, in one multi-location update per round, and stamps each reading's
+"timestamp" with the wall clock at write time. The listener of
+fetch_and_predict.py (wakeup events, high-water mark, dispatcher) runs in this
+process and the latency of a reading is measured from that stamp to the
+moment its decision came back from the API.
+
+With --backend sqlite (default) the producer and the listener use separate
+connections to a temporary SQLite file, so change events cross connections as
+they would cross processes; --backend local shares one in-memory database.
+
+Usage:
+    python3 bench_e2e.py [--rate 500] [--duration 20] [--nodes 2000] [--workers 2]
+                         [--backend sqlite|local] [--output e2e.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from dispatcher import percentile
+
+
+def produce(database, path, fleet, rate, duration, stop, stats, wakeup_path=None, tick=0.05):
+    """
+    Write the fleet's readings into the database at `rate` readings/s
+
+    Args:
+        database: Realtime Database client (the producer's own connection)
+        path: Parent of one child per reading
+        fleet: fleet_sim.Fleet
+        rate: Aggregate readings per second
+        duration: Seconds to write for
+        stop: threading.Event that ends the run early
+        stats: Dictionary updated with "written" and "write_ms" (per update)
+        wakeup_path: Path set to the write time after each update, for the listener
+    """
+    from fleet_sim import to_readings
+    from local_rtdb import PushIdGenerator
+
+    reference = database.reference(path)
+    push_id = PushIdGenerator()
+    speed = rate / fleet.natural_rate
+    started = time.monotonic()
+    rounds = 0
+    while not stop.is_set():
+        elapsed = time.monotonic() - started
+        if elapsed >= duration:
+            break
+        batch = fleet.due(elapsed * speed)
+        if batch is not None:
+            children = {}
+            for reading in to_readings(batch):
+                now_ms = time.time() * 1000
+                reading["timestamp"] = now_ms
+                children[push_id(now_ms)] = reading
+            if children:
+                began = time.perf_counter()
+                reference.update(children)
+                if wakeup_path:
+                    database.reference(wakeup_path).set(now_ms)
+                stats["write_ms"].append((time.perf_counter() - began) * 1000)
+                stats["written"] += len(children)
+        rounds += 1
+        stop.wait(max(0.0, started + rounds * tick - time.monotonic()))
+
+
+def start_server(bind, workers, env):
+    """Start serve.py in the background and wait for it to answer; returns the Popen"""
+    from serve import _wait_ready
+
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--bind", bind],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if not _wait_ready(f"http://{bind}/"):
+        server.kill()
+        raise RuntimeError(f"serve.py did not start on {bind}")
+    return server
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def run(args, workdir):
+    """Run one benchmark; returns the results dictionary"""
+    bind = f"127.0.0.1:{args.port}"
+    os.environ.update(RTDB_BACKEND=args.backend, RTDB_SQLITE_PATH=os.path.join(workdir, "rtdb.sqlite"),
+                      PREDICTION_API_URL=f"http://{bind}/predict", DISPATCH_BATCH=args.dispatch_batch)
+    server_env = dict(os.environ, FIRESTORE_BACKEND="local", LOG_SAMPLE_RATE="0", PYTHONWARNINGS="ignore")
+    state_file = os.path.join(workdir, "listener_state.json")
+
+    import fetch_and_predict as listener
+    from fleet_sim import Fleet
+    from local_rtdb import SqliteRealtimeDatabase
+
+    # The producer writes through its own connection (sqlite) or the shared database (local)
+    database = listener.db if args.backend == "local" else SqliteRealtimeDatabase(os.environ["RTDB_SQLITE_PATH"])
+    database.reference(args.path).set({})
+
+    server = start_server(bind, args.workers, server_env)
+    try:
+        dispatcher = listener.get_dispatcher()
+        latencies_ms = []
+        dispatch = dispatcher.dispatch
+
+        def timed_dispatch(payloads, node_key="node_id"):
+            results = dispatch(payloads, node_key)
+            now_ms = time.time() * 1000
+            latencies_ms.extend(now_ms - payload["timestamp"]
+                                for payload, result in zip(payloads, results) if result is not None)
+            return results
+
+        dispatcher.dispatch = timed_dispatch
+
+        wakeup = threading.Event()
+        wakeup_path = f"{args.path}_updated"
+        registration = listener.db.reference(wakeup_path).listen(lambda event: wakeup.set())
+        fleet = Fleet(args.nodes, seed=args.seed)
+        stop = threading.Event()
+        produced = {"written": 0, "write_ms": []}
+        producer = threading.Thread(target=produce, name="producer", daemon=True,
+                                    args=(database, args.path, fleet, args.rate, args.duration, stop, produced,
+                                          wakeup_path))
+
+        attempts, done = {}, set()
+        decided = 0
+        started = time.monotonic()
+        next_report = started + 5
+        producer.start()
+        try:
+            while True:
+                wakeup.clear()
+                # The listener reports every page; keep the benchmark output readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    decided += listener.process_new_readings(args.path, state_file, attempts, done)
+                now = time.monotonic()
+                if now >= next_report:
+                    next_report += 5
+                    print(f"  {now - started:5.0f} s  {produced['written']} written, {decided} decided, "
+                          f"backlog {produced['written'] - decided}")
+                if not producer.is_alive():
+                    if decided >= produced["written"] or now - started > args.duration + args.drain:
+                        break
+                    wakeup.wait(0.05)
+                else:
+                    wakeup.wait(1.0)
+        finally:
+            stop.set()
+            producer.join()
+            registration.close()
+        elapsed = time.monotonic() - started
+        report = dispatcher.report()
+    finally:
+        stop_server(server)
+
+    values = sorted(latencies_ms)
+    writes = sorted(produced["write_ms"])
+    return {
+        "backend": args.backend,
+        "nodes": args.nodes,
+        "rate": args.rate,
+        "workers": args.workers,
+        "written": produced["written"],
+        "decided": decided,
+        "backlog": produced["written"] - decided,
+        "elapsed_s": round(elapsed, 3),
+        "decisions_per_s": round(decided / elapsed, 1) if elapsed > 0 else 0.0,
+        "e2e_p50_ms": round(percentile(values, 50), 2),
+        "e2e_p95_ms": round(percentile(values, 95), 2),
+        "e2e_p99_ms": round(percentile(values, 99), 2),
+        "e2e_max_ms": round(values[-1], 2) if values else 0.0,
+        "write_p50_ms": round(percentile(writes, 50), 2),
+        "write_p99_ms": round(percentile(writes, 99), 2),
+        "dispatcher": report,
+        "database": dict(getattr(database, "stats", {})),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RTDB write → decision latency, with no network")
+    parser.add_argument("--rate", type=float, default=500.0, help="Readings written per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of writing")
+    parser.add_argument("--drain", type=float, default=30.0, help="Seconds allowed to work off the backlog")
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=2, help="serve.py workers")
+    parser.add_argument("--port", type=int, default=5093)
+    parser.add_argument("--backend", choices=("sqlite", "local"), default="sqlite")
+    parser.add_argument("--path", default="/sensor_data")
+    parser.add_argument("--dispatch-batch", default="auto", help="DISPATCH_BATCH for the listener")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"  End to end: {args.backend} RTDB → listener → serve.py ({args.workers} workers)")
+    print(f"  {args.nodes} nodes, {args.rate:g} readings/s for {args.duration:g} s")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as workdir:
+        result = run(args, workdir)
+
+    print(f"\n  written {result['written']}, decided {result['decided']}, backlog {result['backlog']}")
+    print(f"  decisions/s:  {result['decisions_per_s']:.1f}")
+    print(f"  write → decision  p50 {result['e2e_p50_ms']:.1f} ms  p95 {result['e2e_p95_ms']:.1f} ms  "
+          f"p99 {result['e2e_p99_ms']:.1f} ms  max {result['e2e_max_ms']:.1f} ms")
+    print(f"  RTDB update       p50 {result['write_p50_ms']:.2f} ms  p99 {result['write_p99_ms']:.2f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
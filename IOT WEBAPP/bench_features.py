@@ -0,0 +1,138 @@
+"""
+Microbenchmark and equivalence check for the feature encoder.
+
+Compares the old per-request pandas DataFrame path with features.FeatureEncoder
+on the bundled irrigation_model.pkl, and verifies that both produce identical
+model inputs and predictions (also with a fitted StandardScaler).
+
+Usage:
+    python3 bench_features.py [count]
+"""
+
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from features import FeatureEncoder, FEATURES
+
+
+def random_reading():
+    """Random request body in the shape the API receives"""
+    return {
+        "soil": random.randint(50, 900),
+        "light": random.randint(100, 1000),
+        "temperature": round(random.uniform(15, 40), 1),
+        "humidity": round(random.uniform(20, 90), 1),
+        "pH": round(random.uniform(5.0, 8.0), 2),
+        "npk": random.randint(10, 50),
+        "rainfall": round(random.uniform(0, 100), 1)
+    }
+
+
+def dataframe_row(data, scaler=None):
+    """The pre-encoder request path from app.py"""
+    df = pd.DataFrame([{
+        "soil": data.get("soil"),
+        "light": data.get("light"),
+        "temperature": data.get("temperature"),
+        "humidity": data.get("humidity"),
+        "pH": data.get("pH"),
+        "npk": data.get("npk", 25),
+        "rainfall": data.get("rainfall", 0)
+    }])
+    return scaler.transform(df) if scaler is not None else df
+
+
+def time_per_call(fn, readings):
+    """Mean microseconds per call of fn over all readings"""
+    start = time.perf_counter()
+    for r in readings:
+        fn(r)
+    return (time.perf_counter() - start) / len(readings) * 1e6
+
+
+def bytes_per_call(fn, readings):
+    """Peak traced allocation in bytes for one call of fn"""
+    fn(readings[0])  # warm caches outside the trace
+    tracemalloc.start()
+    fn(readings[1])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def check_equivalence(model, scaler, readings):
+    """Return the number of readings where the two paths disagree"""
+    encoder = FeatureEncoder(scaler)
+    mismatches = 0
+    for r in readings:
+        expected = np.asarray(dataframe_row(r, scaler), dtype=np.float64)
+        actual = encoder.encode(r)
+        if not np.array_equal(expected, actual):
+            mismatches += 1
+            continue
+        if model is not None and not np.array_equal(model.predict_proba(expected), model.predict_proba(actual)):
+            mismatches += 1
+    return mismatches
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    random.seed(42)
+    readings = [random_reading() for _ in range(count)]
+
+    with open("irrigation_model.pkl", "rb") as f:
+        model_data = pickle.load(f)
+    if isinstance(model_data, dict):
+        model, scaler = model_data["model"], model_data["scaler"]
+    else:
+        model, scaler = model_data, None
+
+    # A fitted scaler exercises the folded mean/scale step even when the
+    # bundled model ships without one
+    fitted = StandardScaler().fit(pd.DataFrame([random_reading() for _ in range(500)], columns=list(FEATURES)))
+
+    print("=" * 60)
+    print("  Feature encoding: DataFrame path vs FeatureEncoder")
+    print("=" * 60)
+
+    failed = False
+    for label, eq_model, eq_scaler in (("bundled model", model, scaler), ("with StandardScaler", None, fitted)):
+        mismatches = check_equivalence(eq_model, eq_scaler, readings[:500])
+        status = "✓" if mismatches == 0 else "✗"
+        print(f"{status} Equivalence ({label}): {mismatches} mismatches in 500 readings")
+        failed |= mismatches > 0
+
+    for label, sc in (("no scaler", None), ("StandardScaler", fitted)):
+        encoder = FeatureEncoder(sc)
+        df_us = time_per_call(lambda r: dataframe_row(r, sc), readings)
+        enc_us = time_per_call(encoder.encode, readings)
+        df_bytes = bytes_per_call(lambda r: dataframe_row(r, sc), readings)
+        enc_bytes = bytes_per_call(encoder.encode, readings)
+        print(f"\n📊 Encoding only ({label}, {count} readings)")
+        print(f"  DataFrame:       {df_us:9.1f} µs/call  {df_bytes:8d} B peak")
+        print(f"  FeatureEncoder:  {enc_us:9.1f} µs/call  {enc_bytes:8d} B peak")
+        print(f"  Speedup:         {df_us / enc_us:9.1f}x")
+
+    if model is not None:
+        encoder = FeatureEncoder(scaler)
+        sample = readings[:200]
+        df_us = time_per_call(lambda r: model.predict_proba(dataframe_row(r, scaler)), sample)
+        enc_us = time_per_call(lambda r: model.predict_proba(encoder.encode(r)), sample)
+        print(f"\n📊 Encode + predict_proba (bundled model, {len(sample)} readings)")
+        print(f"  DataFrame:       {df_us:9.1f} µs/call")
+        print(f"  FeatureEncoder:  {enc_us:9.1f} µs/call")
+        print(f"  Saved per call:  {df_us - enc_us:9.1f} µs")
+
+    print("\n" + "=" * 60)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Fuzz check and throughput benchmark for the LoRa payload parser.
+
+The fuzz pass mutates real-looking payloads (byte flips, truncation, inserted
+separators, random garbage) and checks that parse_payload() either returns
+finite numbers for known fields or raises ValueError, and that parse_many()
+agrees with it row by row. The benchmark then parses a million packets one by
+one and in bulk.
+
+Usage:
+    python3 bench_lora_payload.py [packets] [fuzz_cases]
+"""
+
+import math
+import random
+import sys
+import time
+
+import numpy as np
+
+from lora_payload import PAYLOAD_FIELDS, parse_many, parse_payload
+
+
+def firmware_payload(rng):
+    """Payload formatted exactly like createPayload() in ESP32_Forestnode.ino"""
+    return (
+        f"humidity:{rng.uniform(20, 95):.1f}"
+        f",temperature:{rng.uniform(10, 42):.1f}"
+        f",moisture:{rng.randint(0, 4095)}"
+        f",pH:{rng.uniform(4.5, 9.0):.2f}"
+        f",light:{rng.choice(('Sunny', 'Dark'))}"
+    )
+
+
+def mutate(rng, payload):
+    """Apply one random corruption to a payload"""
+    kind = rng.randrange(7)
+    chars = list(payload)
+    if kind == 0 and chars:
+        chars[rng.randrange(len(chars))] = chr(rng.randrange(32, 127))
+    elif kind == 1:
+        return payload[:rng.randrange(len(payload) + 1)]
+    elif kind == 2:
+        chars.insert(rng.randrange(len(chars) + 1), rng.choice(",:"))
+    elif kind == 3 and chars:
+        del chars[rng.randrange(len(chars))]
+    elif kind == 4:
+        return "".join(chr(rng.randrange(0, 256)) for _ in range(rng.randrange(80)))
+    elif kind == 5:
+        return payload.replace(rng.choice(("1", "2", "5")), rng.choice(("nan", "inf", "-", ".")))
+    else:
+        parts = payload.split(",")
+        rng.shuffle(parts)
+        return ",".join(parts)
+    return "".join(chars)
+
+
+def fuzz(cases, seed=1):
+    """Return the number of fuzz cases that violated the parser contract"""
+    rng = random.Random(seed)
+    payloads, expected = [], []
+    failures = 0
+    for _ in range(cases):
+        payload = mutate(rng, firmware_payload(rng))
+        payloads.append(payload)
+        try:
+            parsed = parse_payload(payload)
+        except ValueError:
+            expected.append(None)
+            continue
+        except Exception as e:
+            print(f"✗ {type(e).__name__} for {payload!r}: {e}")
+            failures += 1
+            expected.append(None)
+            continue
+        if set(parsed) - set(PAYLOAD_FIELDS) or not all(math.isfinite(v) for v in parsed.values()):
+            print(f"✗ Bad result for {payload!r}: {parsed}")
+            failures += 1
+        expected.append(parsed)
+
+    # Bulk parsing must agree with the single-packet parser row by row
+    X, valid = parse_many([p for p in payloads if "\n" not in p])
+    rows = [e for p, e in zip(payloads, expected) if "\n" not in p]
+    for row, ok, parsed in zip(X, valid, rows):
+        if ok != (parsed is not None):
+            failures += 1
+            continue
+        if parsed is not None:
+            want = np.array([parsed.get(name, np.nan) for name in PAYLOAD_FIELDS], dtype=np.float64)
+            if not np.array_equal(row, want, equal_nan=True):
+                print(f"✗ parse_many mismatch: {row} != {want}")
+                failures += 1
+    return failures
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    cases = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+
+    print("=" * 60)
+    print("  LoRa payload parser: fuzz + benchmark")
+    print("=" * 60)
+
+    failures = fuzz(cases)
+    print(f"{'✓' if failures == 0 else '✗'} Fuzz: {cases} mutated payloads, {failures} failures")
+
+    rng = random.Random(42)
+    packets = [firmware_payload(rng) for _ in range(count)]
+
+    start = time.perf_counter()
+    for packet in packets:
+        parse_payload(packet)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    X, valid = parse_many(packets)
+    bulk = time.perf_counter() - start
+
+    mixed = list(packets)
+    for i in range(0, count, 100):
+        mixed[i] = "moisture:1200,light:Dark"  # 1% non-canonical rows
+    start = time.perf_counter()
+    parse_many(mixed)
+    bulk_mixed = time.perf_counter() - start
+
+    print(f"\n📊 {count:,} packets")
+    print(f"  parse_payload (loop):      {single:7.2f} s  {count / single:12,.0f} packets/s")
+    print(f"  parse_many (canonical):    {bulk:7.2f} s  {count / bulk:12,.0f} packets/s")
+    print(f"  parse_many (1% other):     {bulk_mixed:7.2f} s  {count / bulk_mixed:12,.0f} packets/s")
+    print(f"  Parsed OK:                 {int(valid.sum()):,}")
+    print("\n" + "=" * 60)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
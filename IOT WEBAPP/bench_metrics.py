@@ -0,0 +1,141 @@
+"""
+Benchmark for the cost of metrics and of the sampling profiler.
+
+Replays the fleet stream of bench_cache.py through POST /predict (Flask test
+client, in process) in three modes:
+
+    off        METRICS_ENABLED=0 (no counters, histograms or stage timers)
+    metrics    counters, request and per-stage histograms
+    profiling  metrics plus a sampling profile running at --hz
+
+The stream is cut into blocks of --block requests and every block is replayed
+in each mode in turn (each mode with its own feature store), so warm-up and
+drift of a busy machine hit all modes alike. Reported are latency and overhead
+relative to "off", whether the decisions are identical, and two direct
+measurements: the cost of the metric updates one /predict request makes and
+the CPU time of the profiler thread.
+
+Usage:
+    python3 bench_metrics.py [requests] [--block 200] [--hz 100] [--output metrics.json]
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+from bench_api import summarize
+from bench_cache import fleet_stream, timed
+
+
+def instrumentation_us(repeat=100000):
+    """Microseconds of the stage timer and metric updates made by one /predict request"""
+    from metrics import MetricsRegistry
+
+    registry = MetricsRegistry(enabled=True)
+    requests_total = registry.counter("requests_total", "", ("endpoint", "status"))
+    latency = registry.histogram("request_seconds", "", ("endpoint",))
+    stage_latency = registry.histogram("stage_seconds", "", ("endpoint", "stage"))
+    decisions = registry.counter("decisions_total", "", ("reason",))
+    stage_names = ("parse", "model", "encode", "predict", "decide", "score", "features", "firestore", "respond")
+
+    def one_request():
+        stages = registry.stages()
+        for stage in stage_names:
+            stages.mark(stage)
+        decisions.inc("good")
+        requests_total.inc("/predict", "200")
+        latency.observe(0.001, "/predict")
+        stage_latency.observe_many(stages, "/predict")
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        one_request()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    count = int(args[0]) if args else 20000
+    block = int(sys.argv[sys.argv.index("--block") + 1]) if "--block" in sys.argv else 200
+    hz = float(sys.argv[sys.argv.index("--hz") + 1]) if "--hz" in sys.argv else 100.0
+    output = sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else None
+
+    os.environ.update(FIRESTORE_BACKEND="none", LOG_SAMPLE_RATE="0", MODEL_LOAD="sync", FEATURE_STORE_PATH="",
+                      PREDICTION_CACHE_MB="0")
+    import app as api
+    from feature_store import FeatureStore
+    from metrics import sample_stacks
+
+    readings = fleet_stream(nodes=20, hours=count * 15 / 20 / 3600)[:count]
+    client = api.app.test_client()
+    print("=" * 60)
+    print(f"  Metrics and profiler overhead: {len(readings)} x POST /predict")
+    print("=" * 60)
+
+    names = ("off", "metrics", "profiling")
+    stores = {name: FeatureStore() for name in names}
+    latencies = {name: [] for name in names}
+    decisions = {name: [] for name in names}
+    elapsed = dict.fromkeys(names, 0.0)
+    profiler_cpu = profiler_wall = 0.0
+    samples = 0
+    client.post("/predict", json=readings[0])  # warm-up
+    for b, offset in enumerate(range(0, len(readings), block)):
+        chunk = readings[offset:offset + block]
+        for name in names[b % 3:] + names[:b % 3]:
+            api.metrics.enabled = name != "off"
+            api.feature_store = stores[name]
+            if name == "profiling":
+                stop, profile = threading.Event(), {}
+
+                def sample():
+                    cpu, wall = time.thread_time(), time.perf_counter()
+                    profile["stacks"] = sample_stacks(3600, hz, stop)
+                    profile["cpu"], profile["wall"] = time.thread_time() - cpu, time.perf_counter() - wall
+
+                profiler = threading.Thread(target=sample, name="profiler", daemon=True)
+                profiler.start()
+            ms, results, seconds = timed(lambda r: client.post("/predict", json=r).get_json(), chunk)
+            if name == "profiling":
+                stop.set()
+                profiler.join()
+                profiler_cpu += profile["cpu"]
+                profiler_wall += profile["wall"]
+                samples += sum(profile["stacks"].values())
+            latencies[name] += ms
+            elapsed[name] += seconds
+            decisions[name] += [(r["irrigation_needed"], r["confidence"]) for r in results]
+
+    runs = {}
+    for name in names:
+        runs[name] = summarize(latencies[name], elapsed[name])
+        runs[name]["mean_us"] = round(sum(latencies[name]) / len(latencies[name]) * 1000, 1)
+    runs["profiling"]["profile_samples"] = samples
+    runs["profiling"]["profiler_cpu_pct"] = round(profiler_cpu / profiler_wall * 100, 2)
+
+    base = runs["off"]["mean_us"]
+    for name in names:
+        summary = runs[name]
+        summary["overhead_pct"] = round((summary["mean_us"] / base - 1) * 100, 2)
+        print(f"  {name:10s} mean {summary['mean_us']:7.1f} µs  p50 {summary['p50_ms'] * 1000:7.1f} µs  "
+              f"p99 {summary['p99_ms'] * 1000:7.1f} µs  overhead {summary['overhead_pct']:+.2f}%")
+    direct_us = instrumentation_us()
+    print(f"\n  metric updates per request: {direct_us:.1f} µs ({direct_us / base * 100:.2f}% of a request)")
+    print(f"  profiler thread at {hz:g} Hz: {runs['profiling']['profiler_cpu_pct']:.2f}% of one CPU "
+          f"({runs['profiling']['profile_samples']} samples)")
+    same = decisions["off"] == decisions["metrics"] == decisions["profiling"]
+    print(f"\n  same decisions in every run: {same}")
+    print(f"  /metrics response: {len(api.metrics.render())} bytes")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"requests": len(readings), "block": block, "profiler_hz": hz,
+                       "instrumentation_us_per_request": round(direct_us, 2), "runs": runs}, f, indent=2)
+        print(f"\n✓ Results written to {output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Offline benchmark for per-field Firestore routing.
+
+Replays readings from many nodes against the in-memory Firestore stand-in and
+compares the old sink (blocking set() on fields/field_1 per reading) with
+FieldRouter + WriteBehindQueue. Reports request-path latency, round trips,
+readings kept in the time series and the peak write rate seen by one document.
+
+Usage:
+    python3 bench_routing.py [fields] [nodes_per_field] [readings] [latency_ms]
+"""
+
+import random
+import sys
+import time
+from collections import defaultdict
+
+from field_routing import FieldRouter
+from local_firestore import LocalFirestore
+from write_behind import WriteBehindQueue
+
+
+class CountingFirestore(LocalFirestore):
+    """LocalFirestore that records, per second, how often each document is written"""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.per_doc_second = defaultdict(int)
+
+    def _commit(self, writes):
+        second = int(time.monotonic())
+        for _, path, _, _ in writes:
+            self.per_doc_second[(path, second)] += 1
+        super()._commit(writes)
+
+    def peak_doc_rate(self):
+        return max(self.per_doc_second.values(), default=0)
+
+
+def make_readings(fields, nodes_per_field, count):
+    readings = []
+    for _ in range(count):
+        field = random.randrange(fields)
+        readings.append({
+            "field_id": f"field_{field + 1}",
+            "node_id": f"node_{field + 1}_{random.randrange(nodes_per_field)}",
+            "soil": random.randint(100, 900),
+            "humidity": round(random.uniform(20, 90), 1),
+        })
+    return readings
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_direct(readings, latency):
+    """Pre-routing behaviour: one blocking set() on fields/field_1 per reading"""
+    db = CountingFirestore(latency)
+    latencies = []
+    start = time.perf_counter()
+    for r in readings:
+        t = time.perf_counter()
+        db.collection("fields").document("field_1").set(r, merge=True)
+        latencies.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+    return db, latencies, elapsed, 0
+
+
+def run_routed(readings, latency):
+    """FieldRouter over the write-behind queue"""
+    db = CountingFirestore(latency)
+    queue = WriteBehindQueue(db, max_pending=len(readings) * 3, flush_size=200, flush_interval=1.0,
+                             min_doc_interval=1.0)
+    router = FieldRouter(queue)
+    latencies = []
+    start = time.perf_counter()
+    for r in readings:
+        t = time.perf_counter()
+        router.route(r["field_id"], r["node_id"], r)
+        latencies.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - start
+    queue.close(timeout=60)
+    return db, latencies, elapsed, queue.stats()["dropped"]
+
+
+def main():
+    fields = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    nodes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    latency = (float(sys.argv[4]) if len(sys.argv) > 4 else 5.0) / 1000
+    random.seed(7)
+    readings = make_readings(fields, nodes, count)
+
+    print("=" * 60)
+    print(f"  Routing benchmark: {count} readings, {fields} fields x {nodes} nodes")
+    print(f"  Simulated Firestore round trip: {latency * 1000:.1f} ms")
+    print("=" * 60)
+
+    for label, run in (("Direct set() on field_1", run_direct), ("FieldRouter + write-behind", run_routed)):
+        db, latencies, elapsed, dropped = run(readings, latency)
+        docs = db.to_dict()
+        series = sum(1 for path in docs if "/readings/" in path)
+        field_docs = sum(1 for path in docs if path.count("/") == 1)
+        print(f"\n📊 {label}")
+        print(f"  Request-path latency:   p50 {percentile(latencies, 50):7.3f} ms   p99 {percentile(latencies, 99):7.3f} ms")
+        print(f"  Producer throughput:    {count / elapsed:10.0f} readings/s")
+        print(f"  Firestore round trips:  {db.stats['commits']:10d}  ({db.stats['writes']} document writes)")
+        print(f"  Field documents:        {field_docs:10d}")
+        print(f"  Readings kept:          {series if series else min(1, count):10d} / {count}  (dropped by queue: {dropped})")
+        print(f"  Peak writes/s per doc:  {db.peak_doc_rate():10d}")
+
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark for the compiled decision-rule table against the hard-coded rules it replaced.
+
+The built-in table (rules.DEFAULT_RULES) is checked against the former if
+chain and np.select masks on random readings, then timed:
+
+    one     RuleTable.evaluate_one() + reason() per reading vs the if chain
+    batch   RuleTable.evaluate() per batch vs three np.select masks
+    fields  evaluate() when the rows of a batch belong to --sets rule sets
+            (the default rules with per-set thresholds, as when tuned per crop)
+
+Usage:
+    python3 bench_rules.py [readings] [--sets 8] [--output rules.json]
+"""
+
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from features import FeatureEncoder
+from rules import DEFAULT_RULE_SET, DEFAULT_RULES, RuleTable
+
+
+def hard_coded(soil, humidity):
+    """The reason logic before the rule table (rule name, reason text)"""
+    if soil < 100:
+        return "critical_soil", f"CRITICAL: Very low soil moisture ({soil}) - immediate irrigation required"
+    if soil < 300:
+        return "low_soil", f"Low soil moisture ({soil}) - irrigation required"
+    if humidity < 30:
+        return "low_humidity", "Low humidity - monitor soil moisture closely"
+    return "good", "Good moisture levels - no irrigation needed"
+
+
+def hard_coded_matrix(soil, humidity):
+    override = soil < 300
+    return np.select([soil < 100, override, humidity < 30], [3, 2, 1], default=0)
+
+
+def make_readings(count, seed=7):
+    rng = random.Random(seed)
+    return [{
+        "soil": rng.choice((rng.randint(0, 4095), rng.randint(0, 400), 99, 100, 299, 300)),
+        "light": rng.randint(0, 1000),
+        "temperature": round(rng.uniform(10, 40), 1),
+        "humidity": rng.choice((round(rng.uniform(0, 100), 1), 29.9, 30)),
+        "pH": round(rng.uniform(5, 8), 2),
+        "rainfall": round(rng.uniform(0, 50), 1),
+        "field_id": f"field_{rng.randint(1, 8)}",
+    } for _ in range(count)]
+
+
+def per_call_us(function, items, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, time.perf_counter() - started)
+    return best / len(items) * 1e6
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    count = int(args[0]) if args else 50000
+    sets = int(sys.argv[sys.argv.index("--sets") + 1]) if "--sets" in sys.argv else 8
+    output = sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else None
+
+    readings = make_readings(count)
+    table = RuleTable()
+    X, valid, errors = FeatureEncoder().encode_batch(readings)
+    soil, humidity = X[:, 0], X[:, 3]
+    print("=" * 60)
+    print(f"  Decision rules: compiled table vs hard-coded, {count} readings")
+    print("=" * 60)
+
+    same = all((table.names[table.evaluate_one(r)], table.reason(table.evaluate_one(r), r))
+               == hard_coded(r["soil"], r["humidity"]) for r in readings)
+    legacy = ("good", "low_humidity", "low_soil", "critical_soil")
+    codes = table.evaluate(X)
+    same = same and all(table.names[c] == legacy[o] for c, o in zip(codes, hard_coded_matrix(soil, humidity)))
+    print(f"  same decisions as the hard-coded rules: {same}")
+
+    results = {"readings": count, "identical": same}
+    table_us = per_call_us(lambda r: table.reason(table.evaluate_one(r, table.rule_set(r["field_id"])), r), readings)
+    chain_us = per_call_us(lambda r: hard_coded(r["soil"], r["humidity"]), readings)
+    results["one"] = {"table_us": round(table_us, 3), "hard_coded_us": round(chain_us, 3)}
+    print(f"\n  one reading:  table {table_us:.2f} µs   hard-coded {chain_us:.2f} µs")
+
+    # The default rules with shifted thresholds in `sets` sets, fields spread over them
+    default = DEFAULT_RULES["rule_sets"][DEFAULT_RULE_SET]
+    config = {"rule_sets": {DEFAULT_RULE_SET: default},
+              "fields": {f"field_{i + 1}": f"crop_{i}" for i in range(1, sets)}}
+    for i in range(1, sets):
+        config["rule_sets"][f"crop_{i}"] = [
+            dict(rule, when=[[feature, op, value + 10 * i] for feature, op, value in rule["when"]]) for rule in default]
+    fields_table = RuleTable(config)
+    print(f"\n  {'batch':>6}  {'table µs':>10}  {'hard-coded µs':>14}  {f'{sets} sets µs':>12}")
+    results["batch"] = []
+    for size in (1, 10, 100, 1000):
+        chunks = [slice(i, i + size) for i in range(0, min(count, size * 200), size)]
+        index = {chunk.start: fields_table.rule_sets([r["field_id"] for r in readings[chunk]]) for chunk in chunks}
+        table_us = per_call_us(lambda chunk: table.evaluate(X[chunk]), chunks)
+        chain_us = per_call_us(lambda chunk: hard_coded_matrix(soil[chunk], humidity[chunk]), chunks)
+        sets_us = per_call_us(lambda chunk: fields_table.evaluate(X[chunk], index[chunk.start]), chunks)
+        results["batch"].append({"size": size, "table_us": round(table_us, 2), "hard_coded_us": round(chain_us, 2),
+                                 "sets_us": round(sets_us, 2)})
+        print(f"  {size:>6}  {table_us:>10.2f}  {chain_us:>14.2f}  {sets_us:>12.2f}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
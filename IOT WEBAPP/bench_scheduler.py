@@ -0,0 +1,171 @@
+"""
+Simulation benchmark for the irrigation scheduler.
+
+--fields fields with --nodes nodes each are simulated in --step second steps
+over --hours. Soil moisture (a 0-1 fraction here) dries faster in the
+afternoon and rises while the field's pump runs. Every node reports every
+step, and its prediction stands in for the model: P(irrigation needed) is a
+logistic function of the node's noisy moisture reading, so predictions flip
+near the threshold the way the real ones do. The same weather and noise then
+drive two policies:
+
+    toggle     the relay follows each reading's prediction, as controlPump()
+               did (no timers, no budget)
+    scheduler  IrrigationScheduler with --max-watts (default: 15% of all pumps
+               at once), replanned after every step's predictions
+
+The report covers:
+- pump switches per pump and day (chatter);
+- peak and budget-exceeding draw, and water used;
+- field-hours too dry (moisture < --dry) and too wet (> --wet);
+- the scheduler's replan and observe times at this scale.
+
+Usage:
+    python3 bench_scheduler.py [--fields 2000] [--nodes 2] [--hours 24] [--step 60] [--output scheduler.json]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from scheduler import DEFAULT_PUMP, IrrigationScheduler
+
+THRESHOLD = 0.32     # Moisture below which the stand-in model wants irrigation
+SPREAD = 0.03        # Width of its logistic ramp
+
+
+def predictions(readings):
+    """(irrigation_needed, confidence) arrays of the stand-in model"""
+    p = 1.0 / (1.0 + np.exp((readings - THRESHOLD) / SPREAD))
+    needed = p > 0.5
+    return needed, np.clip(np.where(needed, p, 1.0 - p), 0.5, 0.99).round(2)
+
+
+def simulate(policy, args, seed=42):
+    """Run one policy; returns its results dictionary"""
+    rng = np.random.default_rng(seed)
+    fields, nodes = args.fields, args.nodes
+    moisture = rng.uniform(0.25, 0.6, fields)
+    drying = rng.uniform(0.0003, 0.0009, fields)          # per minute at the daily mean
+    wetting = rng.uniform(0.004, 0.008, fields)           # per minute of pumping
+    offsets = rng.normal(0.0, 0.02, (fields, nodes))
+    field_ids = [f"field_{i}" for i in range(fields)]
+    flat_fields = [f for f in field_ids for _ in range(nodes)]
+    flat_nodes = [f"node_{j}" for _ in field_ids for j in range(nodes)]
+    watts = DEFAULT_PUMP["watts"]
+    flow = DEFAULT_PUMP["flow_lpm"]
+    budget = args.max_watts or 0.15 * fields * watts
+
+    scheduler = IrrigationScheduler(pumps={"default": dict(DEFAULT_PUMP), "fields": {}}, max_watts=budget,
+                                    max_fields=fields) if policy == "scheduler" else None
+    index = {f: i for i, f in enumerate(field_ids)}
+    pump = np.zeros(fields, dtype=bool)
+    switches = 0
+    peak = over_budget = 0
+    water = dry = wet = 0.0
+    replan_ms, observe_ms = [], []
+    start_ms = 1_750_000_000_000 - 1_750_000_000_000 % 86_400_000   # midnight UTC
+    steps = int(args.hours * 3600 / args.step)
+    minutes = args.step / 60
+
+    for step in range(steps):
+        now_ms = start_ms + int(step * args.step * 1000)
+        hour = (step * args.step / 3600) % 24
+        rate = drying * (1 + 0.8 * np.sin(2 * np.pi * (hour - 9) / 24))
+        moisture = np.clip(moisture - rate * minutes + np.where(pump, wetting * minutes, 0.0), 0.0, 1.0)
+        readings = moisture[:, None] + offsets + rng.normal(0, 0.015, (fields, nodes))
+        needed, confidence = predictions(readings.ravel())
+
+        if scheduler is None:
+            # The relay follows the last node's reading of each field
+            new = needed.reshape(fields, nodes)[:, -1]
+        else:
+            started = time.perf_counter()
+            scheduler.observe_many(flat_fields, flat_nodes, needed, confidence, now_ms)
+            observe_ms.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            changes = scheduler.replan(now_ms)
+            replan_ms.append((time.perf_counter() - started) * 1000)
+            new = pump.copy()
+            for change in changes:
+                new[index[change["field_id"]]] = change["on"]
+        switches += int((new != pump).sum())
+        pump = new
+        draw = pump.sum() * watts
+        peak = max(peak, draw)
+        over_budget += draw > budget
+        water += pump.sum() * flow * minutes
+        dry += (moisture < args.dry).sum() * args.step / 3600
+        wet += (moisture > args.wet).sum() * args.step / 3600
+
+    days = args.hours / 24
+    result = {
+        "switches_per_pump_day": round(switches / fields / days, 2),
+        "peak_watts": float(peak),
+        "budget_watts": budget,
+        "steps_over_budget_pct": round(100 * over_budget / steps, 2),
+        "water_l_per_field_day": round(water / fields / days, 1),
+        "dry_field_hours": round(float(dry), 1),
+        "wet_field_hours": round(float(wet), 1),
+    }
+    if scheduler is not None:
+        replans = np.array(replan_ms)
+        result.update({
+            "replan_ms": {"p50": round(float(np.percentile(replans, 50)), 3),
+                          "p99": round(float(np.percentile(replans, 99)), 3), "max": round(float(replans.max()), 3)},
+            "observe_us_per_prediction": round(float(np.mean(observe_ms)) * 1000 / (fields * nodes), 3),
+            "stats": scheduler.stats(),
+        })
+        started = time.perf_counter()
+        scheduler.replan(now_ms + 1)
+        result["idle_replan_ms"] = round((time.perf_counter() - started) * 1000, 4)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Irrigation scheduler vs per-reading relay toggling")
+    parser.add_argument("--fields", type=int, default=2000)
+    parser.add_argument("--nodes", type=int, default=2, help="Nodes per field")
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--step", type=float, default=60.0, help="Seconds between readings")
+    parser.add_argument("--max-watts", type=float, default=0.0, help="Power budget (default: 15%% of all pumps)")
+    parser.add_argument("--dry", type=float, default=0.2, help="Moisture below which a field is too dry")
+    parser.add_argument("--wet", type=float, default=0.6, help="Moisture above which a field is too wet")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"  Irrigation scheduling: {args.fields} fields x {args.nodes} nodes, {args.hours:g} h "
+          f"in {args.step:g} s steps")
+    print("=" * 60)
+    results = {"fields": args.fields, "nodes": args.nodes, "hours": args.hours, "step_s": args.step}
+    for policy in ("toggle", "scheduler"):
+        results[policy] = simulate(policy, args)
+
+    rows = (("switches per pump and day", "switches_per_pump_day", "{:,.2f}"),
+            ("peak draw (W)", "peak_watts", "{:,.0f}"),
+            ("steps over budget (%)", "steps_over_budget_pct", "{:.2f}"),
+            ("water per field and day (L)", "water_l_per_field_day", "{:,.1f}"),
+            ("field-hours too dry", "dry_field_hours", "{:,.1f}"),
+            ("field-hours too wet", "wet_field_hours", "{:,.1f}"))
+    print(f"\n  budget: {results['scheduler']['budget_watts']:,.0f} W\n")
+    print(f"  {'':<28} {'toggle':>12} {'scheduler':>12}")
+    for name, key, fmt in rows:
+        print(f"  {name:<28} {fmt.format(results['toggle'][key]):>12} {fmt.format(results['scheduler'][key]):>12}")
+    timing = results["scheduler"]
+    print(f"\n  replan: p50 {timing['replan_ms']['p50']:.2f} ms, p99 {timing['replan_ms']['p99']:.2f} ms, "
+          f"max {timing['replan_ms']['max']:.2f} ms over {args.fields} fields "
+          f"(no new predictions: {timing['idle_replan_ms']:.3f} ms)")
+    print(f"  observe: {timing['observe_us_per_prediction']:.2f} µs per prediction")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Cold-start benchmark for the prediction API.
+
+Every measurement runs in a fresh interpreter, so nothing is cached in
+sys.modules. For the pickled scikit-learn model and the memory-mapped forest
+artifact it reports:
+
+    import_ms    time until `import app` returns (health checks can answer)
+    ready_ms     time until the model is loaded and warmed up
+    predict_ms   latency of the first /predict request after ready
+    modules      modules imported by then (sklearn/pandas/firebase_admin flagged)
+
+and, for the model alone, pickle.load vs artifact load (with checksum check).
+
+Usage:
+    python3 bench_startup.py [repeats] [--output startup.json]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+APP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.registry.wait_ready()
+ready = time.perf_counter()
+client = app.app.test_client()
+t = time.perf_counter()
+status = client.post("/predict", json={"soil": 650, "light": 400, "temperature": 30, "humidity": 50, "pH": 7.0}).status_code
+predicted = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "ready_ms": (ready - started) * 1000,
+    "predict_ms": (predicted - t) * 1000,
+    "status": status,
+    "model": type(app.registry.get().scorer.model).__name__,
+    "modules": len(sys.modules),
+    "heavy": sorted(m for m in ("sklearn", "pandas", "firebase_admin") if m in sys.modules),
+}))
+"""
+
+LOAD_PROBE = """
+import json, time
+started = time.perf_counter()
+from scoring import MODEL_PATH, load_pickle
+from model_artifact import artifact_path, load_artifact
+t = time.perf_counter()
+if "{fmt}" == "pickle":
+    load_pickle(MODEL_PATH)
+else:
+    load_artifact(artifact_path(MODEL_PATH))
+print(json.dumps({{"load_ms": (time.perf_counter() - t) * 1000}}))
+"""
+
+
+def run_probe(code, env_overrides):
+    env = dict(os.environ, FIRESTORE_BACKEND="none", LOG_SAMPLE_RATE="0", PYTHONWARNINGS="ignore",
+               **env_overrides)
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def median_of(runs, key):
+    return round(statistics.median(run[key] for run in runs), 1)
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    repeats = int(args[0]) if args else 5
+    output = sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else None
+
+    print("=" * 60)
+    print(f"  Cold start: median of {repeats} fresh interpreters")
+    print("=" * 60)
+
+    # Make sure the artifact exists so its one-off build isn't timed
+    run_probe(APP_PROBE, {"MODEL_FORMAT": "auto", "MODEL_LOAD": "sync"})
+
+    results = {}
+    configs = (
+        ("pickle, sync load", {"MODEL_FORMAT": "pickle", "MODEL_LOAD": "sync"}),
+        ("pickle, background load", {"MODEL_FORMAT": "pickle", "MODEL_LOAD": "background"}),
+        ("artifact, sync load", {"MODEL_FORMAT": "auto", "MODEL_LOAD": "sync"}),
+        ("artifact, background load", {"MODEL_FORMAT": "auto", "MODEL_LOAD": "background"}),
+    )
+    for name, env in configs:
+        runs = [run_probe(APP_PROBE, env) for _ in range(repeats)]
+        results[name] = {
+            "import_ms": median_of(runs, "import_ms"),
+            "ready_ms": median_of(runs, "ready_ms"),
+            "predict_ms": median_of(runs, "predict_ms"),
+            "model": runs[0]["model"],
+            "modules": runs[0]["modules"],
+            "heavy_modules": runs[0]["heavy"],
+        }
+        r = results[name]
+        print(f"\n🚀 {name} ({r['model']})")
+        print(f"  import app:     {r['import_ms']:8.1f} ms")
+        print(f"  model ready:    {r['ready_ms']:8.1f} ms")
+        print(f"  first predict:  {r['predict_ms']:8.1f} ms")
+        print(f"  modules:        {r['modules']} ({', '.join(r['heavy_modules']) or 'no sklearn/pandas/firebase'})")
+
+    print("\n📦 Model load alone")
+    for fmt in ("pickle", "artifact"):
+        runs = [run_probe(LOAD_PROBE.format(fmt=fmt), {}) for _ in range(repeats)]
+        results[f"load_{fmt}_ms"] = median_of(runs, "load_ms")
+        print(f"  {fmt:<9} {results[f'load_{fmt}_ms']:8.1f} ms")
+
+    before = results["pickle, sync load"]["ready_ms"]
+    after = results["artifact, background load"]["import_ms"]
+    print(f"\n✓ Health checks answer after {after:.0f} ms instead of {before:.0f} ms")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"repeats": repeats, "results": results}, f, indent=2)
+        print(f"✓ Results written to {output}")
+    print("\n" + "=" * 60)
+
+
+if __name__ == "__main__":
+    main()
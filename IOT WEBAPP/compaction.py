@@ -0,0 +1,484 @@
+"""
+Retention and compaction of the /sensor_data tree.
+
+The ground node writes every packet to /sensor_data/<millis()> and nothing
+removes it, so every read of the path gets slower as the tree grows. A run of
+this job does two passes:
+
+    rekey   children whose key is not a push ID (millis() keys, which restart
+            at 0 on every reboot and then overwrite and interleave with
+            older readings) move to push IDs stamped at the time of the run,
+            in their current key order. Push IDs never collide and sort by
+            the time they were written, and readings the listener
+            (fetch_and_predict.py) already processed stay behind its
+            high-water mark.
+    expire  readings whose push ID is older than COMPACTION_RETAIN_DAYS are
+            written to a compressed columnar archive segment
+            (COMPACTION_ARCHIVE_DIR/raw-<first key>-<last key>.npz), merged
+            into hourly and daily aggregates under COMPACTION_AGGREGATES_PATH,
+            and deleted. The aggregates and the deletion of each batch of
+            COMPACTION_BATCH readings go in one multi-location update, so a run
+            that stops half way never counts a reading twice; a segment that
+            already exists is not written again.
+
+Aggregates are stored per field and node (readings without a node_id under
+"~"): <path>/hourly/<field_id>/<node_id>/2024-06-10T14 and .../daily/.../2024-06-10
+hold the count, the first and last timestamp, and n/mean/min/max per sensor.
+
+Usage:
+    python3 compaction.py run [--path /sensor_data] [--retain-days 30] [--batch 500] [--dry-run]
+    python3 compaction.py rekey [--path /sensor_data]
+    python3 compaction.py archive [archive/] [--export readings.jsonl]
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from dashboard_api import SENSORS, reading_values
+from feature_store import MIN_EPOCH_MS
+from field_routing import resolve_ids
+from local_rtdb import PushIdGenerator, key_order, push_id_timestamp
+
+COMPACTION_RETAIN_DAYS = float(os.environ.get("COMPACTION_RETAIN_DAYS", 30))
+COMPACTION_ARCHIVE_DIR = os.environ.get("COMPACTION_ARCHIVE_DIR", "archive")
+COMPACTION_AGGREGATES_PATH = os.environ.get("COMPACTION_AGGREGATES_PATH", "/sensor_aggregates")
+COMPACTION_BATCH = int(os.environ.get("COMPACTION_BATCH", 500))
+
+# Children fetched per query while scanning
+PAGE_SIZE = 1000
+ROLLUPS = {"hourly": (3600 * 1000, "%Y-%m-%dT%H"), "daily": (86400 * 1000, "%Y-%m-%d")}
+# Aggregate key of readings without a node_id (not a valid node_id, so never taken)
+NO_NODE = "~"
+ARCHIVE_COLUMNS = ("key", "field_id", "node_id", "timestamp", "written", "raw") + SENSORS
+
+
+def _relative(path):
+    return path.strip("/")
+
+
+def _size(key, value):
+    """Approximate stored size of a child: its key and JSON value"""
+    return len(key) + len(json.dumps(value, separators=(",", ":")))
+
+
+def scan(reference, start=None, stop=None, page_size=PAGE_SIZE):
+    """
+    Children of a reference in key order, fetched a page at a time
+
+    Args:
+        reference: Database reference holding one child per reading
+        start: First key (inclusive), None for the beginning
+        stop: Predicate on the key; the scan ends at the first key for which it is true
+        page_size: Children per query
+
+    Yields:
+        (key, value) tuples
+    """
+    after = None
+    while True:
+        query = reference.order_by_key()
+        if after is not None or start is not None:
+            query = query.start_at(after if after is not None else start)
+        data = query.limit_to_first(page_size + 1).get()
+        if isinstance(data, list):
+            # RTDB returns small sequential integer keys as an array
+            items = [(str(i), v) for i, v in enumerate(data) if v is not None]
+        elif isinstance(data, dict):
+            items = list(data.items())
+        else:
+            return
+        items.sort(key=lambda kv: key_order(kv[0]))
+        if after is not None:
+            items = [kv for kv in items if key_order(kv[0]) > key_order(after)]
+        for key, value in items[:page_size]:
+            if stop is not None and stop(key):
+                return
+            yield key, value
+            after = key
+        if len(items) < page_size:
+            return
+
+
+def legacy_children(reference, page_size=PAGE_SIZE):
+    """
+    Children whose key is not a push ID
+
+    Push IDs of any realistic time start with "-": the keys before that range
+    (every 32-bit integer key sorts first) and after it are scanned, the push
+    IDs in between are not.
+    """
+    yield from scan(reference, stop=lambda key: key.startswith("-"), page_size=page_size)
+    yield from ((key, value) for key, value in scan(reference, start=".", page_size=page_size)
+                if push_id_timestamp(key) is None)
+
+
+def rekey(database, path="/sensor_data", batch=COMPACTION_BATCH, listener_state=None, dry_run=False,
+          push_id=None):
+    """
+    Move the children of `path` whose key is not a push ID to push IDs
+
+    Args:
+        database: Realtime Database client (storage.realtime_database)
+        path: Database path holding one child per reading
+        batch: Children moved per multi-location update
+        listener_state: fetch_and_predict.py state file; when its mark for
+            `path` is a legacy key, the readings at or before it get push IDs
+            older than every existing one and the mark follows them
+        dry_run: Count only
+        push_id: PushIdGenerator (tests)
+
+    Returns:
+        Summary dictionary (rekeyed, processed, batches)
+    """
+    push_id = push_id or PushIdGenerator()
+    reference = database.reference(path)
+    root = database.reference("/")
+    base = _relative(path)
+    mark = None
+    if listener_state and os.path.exists(listener_state):
+        from fetch_and_predict import load_high_water_mark
+        mark = load_high_water_mark(path, listener_state)
+    # Only a legacy mark can be at or after a legacy key: a push ID mark sorts after all of them
+    legacy_mark = mark is not None and push_id_timestamp(mark) is None
+
+    now_ms = int(time.time() * 1000)
+    processed_ms = now_ms - 1
+    if legacy_mark:
+        oldest = next(scan(reference, start="-", stop=lambda key: push_id_timestamp(key) is None, page_size=1), None)
+        if oldest is not None:
+            processed_ms = push_id_timestamp(oldest[0]) - 1
+
+    summary = {"rekeyed": 0, "processed": 0, "batches": 0}
+    new_mark = None
+    pending = {}
+    for key, value in legacy_children(reference):
+        processed = legacy_mark and key_order(key) <= key_order(mark)
+        new_key = push_id(processed_ms if processed else now_ms)
+        pending[f"{base}/{key}"] = None
+        pending[f"{base}/{new_key}"] = value
+        summary["rekeyed"] += 1
+        if processed:
+            summary["processed"] += 1
+            new_mark = new_key
+        if len(pending) >= 2 * batch:
+            summary["batches"] += 1
+            if not dry_run:
+                root.update(pending)
+            pending = {}
+    if pending:
+        summary["batches"] += 1
+        if not dry_run:
+            root.update(pending)
+    if new_mark is not None and not dry_run:
+        from fetch_and_predict import save_high_water_mark
+        save_high_water_mark(path, new_mark, listener_state)
+    return summary
+
+
+def _rollup_groups(keys, times, values, width_ms):
+    """
+    Aggregate rows by (field, node) group and time bucket
+
+    Args:
+        keys: Group index per row
+        times: Reading time per row (ms)
+        values: Sensor matrix (NaN = missing)
+        width_ms: Bucket width
+
+    Yields:
+        (group, bucket start ms, count, first ms, last ms, n, sum, min, max per sensor)
+    """
+    buckets = times // width_ms
+    order = np.lexsort((times, buckets, keys))
+    keys, buckets, times, values = keys[order], buckets[order], times[order], values[order]
+    boundary = np.ones(len(keys), dtype=bool)
+    boundary[1:] = (keys[1:] != keys[:-1]) | (buckets[1:] != buckets[:-1])
+    starts = np.flatnonzero(boundary)
+    present = ~np.isnan(values)
+    n = np.add.reduceat(present, starts, axis=0)
+    sums = np.add.reduceat(np.where(present, values, 0.0), starts, axis=0)
+    mins = np.minimum.reduceat(np.where(present, values, np.inf), starts, axis=0)
+    maxs = np.maximum.reduceat(np.where(present, values, -np.inf), starts, axis=0)
+    counts = np.diff(np.append(starts, len(keys)))
+    lasts = np.append(starts[1:], len(keys)) - 1
+    for i, start in enumerate(starts):
+        yield (int(keys[start]), int(buckets[start]) * width_ms, int(counts[i]), int(times[start]),
+               int(times[lasts[i]]), n[i], sums[i], mins[i], maxs[i])
+
+
+def merge_aggregate(existing, count, first_ms, last_ms, n, sums, mins, maxs):
+    """Aggregate document combining an existing one (or None) with new readings"""
+    doc = {"count": count, "first_ms": first_ms, "last_ms": last_ms}
+    if existing:
+        doc = {"count": existing.get("count", 0) + count,
+               "first_ms": min(existing.get("first_ms", first_ms), first_ms),
+               "last_ms": max(existing.get("last_ms", last_ms), last_ms)}
+    for c, sensor in enumerate(SENSORS):
+        old = (existing or {}).get(sensor)
+        if not n[c] and not old:
+            continue
+        total, low, high = float(sums[c]), float(mins[c]), float(maxs[c])
+        count_c = int(n[c])
+        if old:
+            total += old["mean"] * old["n"]
+            count_c += old["n"]
+            low, high = min(low, old["min"]), max(high, old["max"])
+        doc[sensor] = {"n": count_c, "mean": round(total / count_c, 4), "min": low, "max": high}
+    return doc
+
+
+def write_segment(directory, columns):
+    """
+    Write one archive segment unless it exists (atomic rename)
+
+    Returns:
+        Bytes written (0 when the segment was already there)
+    """
+    os.makedirs(directory, exist_ok=True)
+    keys = columns["key"]
+    target = os.path.join(directory, f"raw-{keys[0]}-{keys[-1]}.npz")
+    if os.path.exists(target):
+        return 0
+    tmp = f"{target}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **columns)
+    os.replace(tmp, target)
+    return os.path.getsize(target)
+
+
+def read_archive(directory=COMPACTION_ARCHIVE_DIR):
+    """
+    Every archived reading, ordered by key (duplicates from repeated runs dropped)
+
+    Returns:
+        Dictionary of ARCHIVE_COLUMNS arrays
+    """
+    parts = []
+    for name in sorted(glob.glob(os.path.join(directory, "raw-*.npz"))):
+        with np.load(name, allow_pickle=False) as segment:
+            parts.append({column: segment[column] for column in ARCHIVE_COLUMNS})
+    if not parts:
+        return {column: np.array([]) for column in ARCHIVE_COLUMNS}
+    columns = {column: np.concatenate([p[column] for p in parts]) for column in ARCHIVE_COLUMNS}
+    order = sorted(range(len(columns["key"])), key=lambda i: key_order(str(columns["key"][i])))
+    keys = columns["key"][order]
+    keep = np.ones(len(keys), dtype=bool)
+    keep[1:] = keys[1:] != keys[:-1]
+    return {column: values[order][keep] for column, values in columns.items()}
+
+
+class Compactor:
+    """Expire old readings of one path into the archive and the aggregates"""
+
+    def __init__(self, database, path="/sensor_data", retain_days=COMPACTION_RETAIN_DAYS,
+                 archive_dir=COMPACTION_ARCHIVE_DIR, aggregates_path=COMPACTION_AGGREGATES_PATH,
+                 batch=COMPACTION_BATCH, dry_run=False, pause=0.0):
+        """
+        Args:
+            database: Realtime Database client (storage.realtime_database)
+            path: Database path holding one child per reading
+            retain_days: Raw readings written within this many days are kept
+            archive_dir: Directory of the archive segments
+            aggregates_path: Database path of the hourly and daily aggregates
+            batch: Readings archived and deleted per multi-location update
+            dry_run: Count only: no archive, aggregates or deletes
+            pause: Seconds to wait between batches (spreads the load)
+        """
+        self.database = database
+        self.path = path
+        self.retain_days = retain_days
+        self.archive_dir = archive_dir
+        self.aggregates_path = _relative(aggregates_path)
+        self.batch = max(1, batch)
+        self.dry_run = dry_run
+        self.pause = pause
+        self.stats = {"expired": 0, "batches": 0, "unparsed": 0, "buckets": 0, "raw_bytes": 0,
+                      "aggregate_bytes": 0, "archive_bytes": 0}
+
+    def expire(self, now_ms=None):
+        """
+        Archive, aggregate and delete every reading older than the retention period
+
+        Returns:
+            The stats dictionary
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        cutoff = now_ms - self.retain_days * 86400 * 1000
+        reference = self.database.reference(self.path)
+        # Push IDs sort by write time: the scan stops at the first one to keep
+        items = []
+        for key, value in scan(reference, start="-",
+                               stop=lambda k: (push_id_timestamp(k) or math.inf) >= cutoff):
+            items.append((key, value))
+            if len(items) >= self.batch:
+                self._compact(items)
+                items = []
+        if items:
+            self._compact(items)
+        self.stats["reclaimed_bytes"] = self.stats["raw_bytes"] - self.stats["aggregate_bytes"]
+        return self.stats
+
+    def _compact(self, items):
+        """Archive one batch, then merge its aggregates and delete it in one update"""
+        n = len(items)
+        columns = {"key": np.array([key for key, _ in items]),
+                   "written": np.array([push_id_timestamp(key) for key, _ in items], dtype=np.int64)}
+        field_ids, node_ids, times, raw = [], [], np.empty(n, dtype=np.int64), []
+        values = np.full((n, len(SENSORS)), np.nan)
+        for i, (key, value) in enumerate(items):
+            raw.append(json.dumps(value, separators=(",", ":")))
+            self.stats["raw_bytes"] += len(key) + len(raw[-1])
+            try:
+                reading, values[i] = reading_values(value)
+                field_id, node_id = resolve_ids(reading)
+            except ValueError:
+                # Archived as is, but not aggregated
+                field_ids.append("")
+                node_ids.append("")
+                times[i] = columns["written"][i]
+                self.stats["unparsed"] += 1
+                continue
+            t = reading.get("timestamp")
+            wall_clock = isinstance(t, (int, float)) and not isinstance(t, bool) and t >= MIN_EPOCH_MS
+            times[i] = int(t) if wall_clock else columns["written"][i]
+            field_ids.append(field_id)
+            node_ids.append(node_id or NO_NODE)
+        columns.update(field_id=np.array(field_ids), node_id=np.array(node_ids), timestamp=times,
+                       raw=np.array(raw), **{sensor: values[:, c] for c, sensor in enumerate(SENSORS)})
+
+        updates = {f"{_relative(self.path)}/{key}": None for key, _ in items}
+        parsed = np.flatnonzero(np.array(field_ids) != "")
+        if len(parsed):
+            updates.update(self._aggregates(np.array(field_ids)[parsed], np.array(node_ids)[parsed],
+                                            times[parsed], values[parsed]))
+        self.stats["expired"] += n
+        self.stats["batches"] += 1
+        if self.dry_run:
+            return
+        self.stats["archive_bytes"] += write_segment(self.archive_dir, columns)
+        self.database.reference("/").update(updates)
+        if self.pause:
+            time.sleep(self.pause)
+
+    def _aggregates(self, field_ids, node_ids, times, values):
+        """{path: document} of the hourly and daily buckets touched by a batch, merged with stored ones"""
+        groups = {}
+        for pair in zip(field_ids.tolist(), node_ids.tolist()):
+            groups.setdefault(pair, len(groups))
+        names = list(groups)
+        keys = np.array([groups[pair] for pair in zip(field_ids.tolist(), node_ids.tolist())])
+        updates = {}
+        for rollup, (width_ms, label_format) in ROLLUPS.items():
+            rows = list(_rollup_groups(keys, times, values, width_ms))
+            labels = [time.strftime(label_format, time.gmtime(row[1] / 1000)) for row in rows]
+            # One range query per (field, node) for the stored buckets of this batch
+            stored = {}
+            for group in {row[0] for row in rows}:
+                field_id, node_id = names[group]
+                own = [label for row, label in zip(rows, labels) if row[0] == group]
+                query = (self.database.reference(f"/{self.aggregates_path}/{rollup}/{field_id}/{node_id}")
+                         .order_by_key().start_at(min(own)).end_at(max(own)))
+                stored[group] = query.get() or {}
+            for (group, _, count, first_ms, last_ms, n, sums, mins, maxs), label in zip(rows, labels):
+                field_id, node_id = names[group]
+                existing = stored[group].get(label)
+                doc = merge_aggregate(existing, count, first_ms, last_ms, n, sums, mins, maxs)
+                updates[f"{self.aggregates_path}/{rollup}/{field_id}/{node_id}/{label}"] = doc
+                self.stats["aggregate_bytes"] += _size(label, doc) - (_size(label, existing) if existing else 0)
+                self.stats["buckets"] += existing is None
+        return updates
+
+
+def run(database, path="/sensor_data", listener_state=None, **options):
+    """Rekey, then expire; returns the combined summary"""
+    started = time.perf_counter()
+    summary = rekey(database, path, batch=options.get("batch", COMPACTION_BATCH), listener_state=listener_state,
+                    dry_run=options.get("dry_run", False))
+    summary = {"rekey": summary, **Compactor(database, path, **options).expire()}
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def print_summary(summary):
+    rekeyed = summary["rekey"]
+    print(f"  Rekeyed:    {rekeyed['rekeyed']:,} legacy keys ({rekeyed['processed']:,} already processed)")
+    print(f"  Expired:    {summary['expired']:,} readings in {summary['batches']} batches "
+          f"({summary['unparsed']} archived without aggregates)")
+    print(f"  Aggregates: {summary['buckets']:,} new hourly/daily buckets")
+    print(f"  Archive:    {summary['archive_bytes']:,} bytes written")
+    print(f"  Reclaimed:  {summary['reclaimed_bytes']:,} bytes "
+          f"({summary['raw_bytes']:,} raw deleted, {summary['aggregate_bytes']:,} aggregates added)")
+    print(f"  Time:       {summary['seconds']:.2f} s")
+
+
+def export_archive(directory, output):
+    """Write the archived readings as JSON lines (rescore.py reads them)"""
+    columns = read_archive(directory)
+    with open(output, "w") as f:
+        for i, key in enumerate(columns["key"].tolist()):
+            value = json.loads(columns["raw"][i])
+            if isinstance(value, str):
+                try:
+                    value = reading_values(value)[0]
+                except ValueError:
+                    continue
+            f.write(json.dumps({"key": key, "timestamp": int(columns["timestamp"][i]), **value}) + "\n")
+    return len(columns["key"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retention and compaction of the sensor_data tree")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    for name, text in (("run", "Rekey, then archive, aggregate and delete expired readings"),
+                       ("rekey", "Move legacy (millis()) keys to push IDs")):
+        mode = sub.add_parser(name, help=text)
+        mode.add_argument("--path", default="/sensor_data")
+        mode.add_argument("--batch", type=int, default=COMPACTION_BATCH, help="Children per update")
+        mode.add_argument("--listener-state", default=os.environ.get("LISTENER_STATE_FILE", ".listener_state.json"),
+                          help="fetch_and_predict.py state file whose mark follows rekeyed readings")
+        mode.add_argument("--dry-run", action="store_true", help="Report what would change")
+        if name == "run":
+            mode.add_argument("--retain-days", type=float, default=COMPACTION_RETAIN_DAYS)
+            mode.add_argument("--archive-dir", default=COMPACTION_ARCHIVE_DIR)
+            mode.add_argument("--aggregates-path", default=COMPACTION_AGGREGATES_PATH)
+            mode.add_argument("--pause", type=float, default=0.0, help="Seconds between batches")
+    archive_mode = sub.add_parser("archive", help="Summarize (or export) the archive")
+    archive_mode.add_argument("directory", nargs="?", default=COMPACTION_ARCHIVE_DIR)
+    archive_mode.add_argument("--export", help="Write the readings as JSON lines")
+    args = parser.parse_args()
+
+    if args.mode == "archive":
+        columns = read_archive(args.directory)
+        count = len(columns["key"])
+        size = sum(os.path.getsize(name) for name in glob.glob(os.path.join(args.directory, "raw-*.npz")))
+        print(f"📦 {args.directory}: {count:,} readings, {size:,} bytes")
+        if count:
+            first, last = (time.strftime("%Y-%m-%d %H:%M", time.gmtime(t / 1000))
+                           for t in (columns["timestamp"].min(), columns["timestamp"].max()))
+            print(f"  {first} → {last} UTC")
+        if args.export:
+            print(f"✓ {export_archive(args.directory, args.export):,} readings written to {args.export}")
+        return
+
+    from storage import realtime_database
+    database = realtime_database()
+    print(f"🧹 Compacting {args.path}{' (dry run)' if args.dry_run else ''}")
+    if args.mode == "rekey":
+        summary = rekey(database, args.path, args.batch, args.listener_state, args.dry_run)
+        print(f"  Rekeyed {summary['rekeyed']:,} legacy keys ({summary['processed']:,} already processed) "
+              f"in {summary['batches']} updates")
+        return
+    summary = run(database, args.path, args.listener_state, retain_days=args.retain_days,
+                  archive_dir=args.archive_dir, aggregates_path=args.aggregates_path, batch=args.batch,
+                  dry_run=args.dry_run, pause=args.pause)
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,563 @@
+"""
+Dashboard data API: time-range queries with server-side downsampling and deltas.
+
+The dashboard and the getSensorData Cloud Function download the whole
+/sensor_data subtree on every refresh. This blueprint, served by the
+prediction API, keeps a columnar copy of the readings per (field, node) and
+answers the queries a chart needs instead:
+
+    GET /dashboard/series   readings of a node (or of every node of a field)
+                            between start and end, downsampled per sensor to
+                            at most ?points= points (LTTB, or min-max buckets
+                            that keep every extreme)
+    GET /dashboard/delta    raw readings added since ?cursor= (the cursor of
+                            the previous response), for live updates
+    GET /dashboard/nodes    fields and nodes with their reading counts and time range
+
+The copy is synced from DASHBOARD_RTDB_PATH with order_by_key().start_at()
+queries on the request path, at most every DASHBOARD_SYNC_INTERVAL seconds,
+so only new children are downloaded. Cursors are Realtime Database keys,
+valid in every worker. Responses carry a weak ETag that changes only when the
+queried nodes get new readings (If-None-Match answers 304) and are
+gzip-compressed when the client accepts it.
+"""
+
+import bisect
+import gzip
+import json
+import math
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from flask import Blueprint, Response, jsonify, request
+
+from feature_store import MIN_EPOCH_MS
+from field_routing import resolve_ids
+from local_rtdb import key_order, push_id_timestamp
+from lora_frame import decode_any
+
+DASHBOARD_RTDB_PATH = os.environ.get("DASHBOARD_RTDB_PATH", "/sensor_data")
+DASHBOARD_SYNC_INTERVAL = float(os.environ.get("DASHBOARD_SYNC_INTERVAL", 2.0))
+# Readings kept per node (the oldest quarter is dropped when full) and nodes kept
+DASHBOARD_MAX_READINGS = int(os.environ.get("DASHBOARD_MAX_READINGS", 100000))
+DASHBOARD_MAX_NODES = int(os.environ.get("DASHBOARD_MAX_NODES", 1024))
+
+# Children fetched per sync query
+PAGE_SIZE = 1000
+DEFAULT_POINTS = 500
+MAX_POINTS = 10000
+# Rows returned by one /dashboard/delta call (the client follows "more")
+MAX_DELTA_ROWS = 5000
+# Recent keys kept to turn cursors into positions; older cursors get "reset"
+CURSOR_WINDOW = 200000
+GZIP_MIN_BYTES = 1024
+# Average LTTB bucket size from which a bucket is scanned with NumPy instead of a Python loop
+LTTB_VECTOR_BUCKET = 16
+
+SENSORS = ("soil", "temperature", "humidity", "pH", "light", "rainfall")
+# Names the ground node and older clients use for the same values
+ALIASES = {"soil": ("soil", "soilMoisture"), "temperature": ("temperature", "temp"), "humidity": ("humidity",),
+           "pH": ("pH", "ph"), "light": ("light", "lightIntensity"), "rainfall": ("rainfall",)}
+METHODS = ("lttb", "minmax")
+
+
+def lttb(t, y, points):
+    """
+    Largest-Triangle-Three-Buckets downsampling
+
+    Keeps the first and last point and, from each of points - 2 equal buckets,
+    the point forming the largest triangle with the point kept before it and
+    the mean of the next bucket, so the shape of the line survives.
+
+    Args:
+        t: Sorted timestamps
+        y: Values (no NaN)
+        points: Points to keep
+
+    Returns:
+        Sorted indices of the kept points
+    """
+    n = len(t)
+    if n <= points or points < 3:
+        return np.arange(n) if n <= points else np.array([0, n - 1])[:max(points, 0)]
+    t = t - t[0]
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    t_sum = np.concatenate(([0.0], np.cumsum(t)))
+    y_sum = np.concatenate(([0.0], np.cumsum(y)))
+    # Mean of each bucket after the first, and of the last point for the last bucket
+    next_lo, next_hi = np.append(edges[1:-1], n - 1), np.append(edges[2:], n)
+    size = next_hi - next_lo
+    t_next = ((t_sum[next_hi] - t_sum[next_lo]) / size).tolist()
+    y_next = ((y_sum[next_hi] - y_sum[next_lo]) / size).tolist()
+    vector = n >= LTTB_VECTOR_BUCKET * points
+    if not vector:
+        # Small buckets: a plain loop beats NumPy's per-call overhead
+        t, y = t.tolist(), y.tolist()
+    edges = edges.tolist()
+    kept = [0]
+    a = 0
+    for b in range(points - 2):
+        lo, hi = edges[b], edges[b + 1]
+        ta, ya, tn, yn = t[a], y[a], t_next[b], y_next[b]
+        # Twice the triangle area; the constant factor does not change the argmax
+        if vector:
+            a = lo + int(np.argmax(np.abs((ta - tn) * (y[lo:hi] - ya) - (ta - t[lo:hi]) * (yn - ya))))
+        else:
+            best = -1.0
+            for i in range(lo, hi):
+                area = abs((ta - tn) * (y[i] - ya) - (ta - t[i]) * (yn - ya))
+                if area > best:
+                    best, a = area, i
+        kept.append(a)
+    kept.append(n - 1)
+    return np.array(kept, dtype=np.int64)
+
+
+def min_max(y, points):
+    """
+    Min-max downsampling: the lowest and highest point of points // 2 equal buckets
+
+    Unlike LTTB every local extreme (a dry-out minimum, a sensor spike) is kept.
+
+    Returns:
+        Sorted indices of the kept points
+    """
+    n = len(y)
+    if n <= points:
+        return np.arange(n)
+    buckets = max(1, points // 2)
+    starts = np.arange(buckets) * n // buckets
+    bucket = np.repeat(np.arange(buckets), np.diff(np.append(starts, n)))
+    kept = []
+    for reduce in (np.minimum, np.maximum):
+        hits = np.flatnonzero(y == reduce.reduceat(y, starts)[bucket])
+        first = np.ones(len(hits), dtype=bool)
+        first[1:] = bucket[hits[1:]] != bucket[hits[:-1]]
+        kept.append(hits[first])
+    return np.unique(np.concatenate(kept))
+
+
+def reading_values(value):
+    """
+    Sensor values of a stored reading (NaN where absent)
+
+    Raises:
+        ValueError: If a raw LoRa payload cannot be parsed
+    """
+    if isinstance(value, (str, bytes)):
+        value = decode_any(value)
+    elif not isinstance(value, dict):
+        raise ValueError("unsupported reading format")
+    row = []
+    for sensor in SENSORS:
+        x = next((value[name] for name in ALIASES[sensor] if name in value), None)
+        numeric = isinstance(x, (int, float)) and not isinstance(x, bool) and math.isfinite(x)
+        row.append(float(x) if numeric else math.nan)
+    return value, row
+
+
+class _Series:
+    """Growable columns of one node, kept sorted by timestamp"""
+
+    def __init__(self, max_readings):
+        self.max_readings = max_readings
+        self.t = np.empty(64)
+        self.seq = np.empty(64, dtype=np.int64)
+        self.values = np.empty((64, len(SENSORS)))
+        self.n = 0
+        self.sorted = True
+        self.last_seq = -1
+        self.last_key = None
+
+    def append(self, t, seq, row, key):
+        if self.n == len(self.t):
+            if self.n >= self.max_readings:
+                # Drop the oldest quarter at once so trimming stays O(1) amortized
+                self.columns()
+                drop = max(1, self.n // 4)
+                for name in ("t", "seq", "values"):
+                    column = getattr(self, name)
+                    column[:self.n - drop] = column[drop:self.n]
+                self.n -= drop
+            else:
+                size = min(2 * len(self.t), max(self.max_readings, 64))
+                for name in ("t", "seq", "values"):
+                    column = getattr(self, name)
+                    grown = np.empty((size,) + column.shape[1:], dtype=column.dtype)
+                    grown[:self.n] = column[:self.n]
+                    setattr(self, name, grown)
+        if self.n and t < self.t[self.n - 1]:
+            self.sorted = False
+        self.t[self.n], self.seq[self.n], self.values[self.n] = t, seq, row
+        self.n += 1
+        self.last_seq, self.last_key = seq, key
+
+    def columns(self):
+        """(t, seq, values) views sorted by timestamp"""
+        if not self.sorted:
+            order = np.argsort(self.t[:self.n], kind="stable")
+            self.t[:self.n], self.seq[:self.n], self.values[:self.n] = (
+                self.t[order], self.seq[order], self.values[order])
+            self.sorted = True
+        return self.t[:self.n], self.seq[:self.n], self.values[:self.n]
+
+
+class SeriesStore:
+    """Columnar copy of the readings under one RTDB path, shared by the request threads"""
+
+    def __init__(self, path=DASHBOARD_RTDB_PATH, max_readings=DASHBOARD_MAX_READINGS,
+                 max_nodes=DASHBOARD_MAX_NODES, sync_interval=DASHBOARD_SYNC_INTERVAL):
+        """
+        Args:
+            path: Database path holding one child per reading
+            max_readings: Readings kept per node
+            max_nodes: Nodes kept; the least recently updated one is dropped beyond this
+            sync_interval: Minimum seconds between two syncs
+        """
+        self.path = path
+        self.max_readings = max(64, max_readings)
+        self.max_nodes = max(1, max_nodes)
+        self.sync_interval = sync_interval
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._last_sync = None
+        self._after = None
+        self._seq = 0
+        # Key order, seq and key of the most recent readings, for cursors
+        self._cursor_orders = []
+        self._cursor_seqs = []
+        self._cursor_keys = []
+        self.stats_ = {"synced": 0, "rejected": 0, "evicted_nodes": 0, "sync_ms": 0.0}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def add(self, key, value, received_ms=None):
+        """
+        Add one child of the path (children are added in key order)
+
+        The reading's "timestamp" is used when it is wall-clock time; otherwise
+        the time encoded in a push ID key, else the time it was received.
+
+        Returns:
+            True if the reading was stored
+        """
+        try:
+            value, row = reading_values(value)
+            field_id, node_id = resolve_ids(value)
+        except ValueError:
+            self.stats_["rejected"] += 1
+            return False
+        t = value.get("timestamp")
+        if not isinstance(t, (int, float)) or isinstance(t, bool) or not t >= MIN_EPOCH_MS:
+            t = push_id_timestamp(key)
+            if t is None:
+                t = time.time() * 1000 if received_ms is None else received_ms
+        with self._lock:
+            series_key = (field_id, node_id or "")
+            series = self._series.get(series_key)
+            if series is None:
+                if len(self._series) >= self.max_nodes:
+                    self._series.popitem(last=False)
+                    self.stats_["evicted_nodes"] += 1
+                series = self._series[series_key] = _Series(self.max_readings)
+            else:
+                self._series.move_to_end(series_key)
+            self._seq += 1
+            series.append(float(t), self._seq, row, key)
+            self._cursor_orders.append(key_order(key))
+            self._cursor_seqs.append(self._seq)
+            self._cursor_keys.append(key)
+            if len(self._cursor_orders) > 2 * CURSOR_WINDOW:
+                del self._cursor_orders[:CURSOR_WINDOW], self._cursor_seqs[:CURSOR_WINDOW]
+                del self._cursor_keys[:CURSOR_WINDOW]
+        return True
+
+    def sync(self, database, force=False):
+        """
+        Fetch the children added after the last key seen
+
+        Requests arriving while another one syncs use the data as it is,
+        except before the first sync.
+
+        Returns:
+            Number of readings stored
+        """
+        now = time.monotonic()
+        if not force and self._last_sync is not None and now - self._last_sync < self.sync_interval:
+            return 0
+        if not self._sync_lock.acquire(blocking=self._last_sync is None):
+            return 0
+        try:
+            if not force and self._last_sync is not None and time.monotonic() - self._last_sync < self.sync_interval:
+                return 0
+            started = time.perf_counter()
+            stored = 0
+            reference = database.reference(self.path)
+            while True:
+                query = reference.order_by_key()
+                if self._after is not None:
+                    query = query.start_at(self._after)
+                data = query.limit_to_first(PAGE_SIZE + 1).get()
+                if isinstance(data, list):
+                    # RTDB returns small sequential integer keys as an array
+                    items = [(str(i), v) for i, v in enumerate(data) if v is not None]
+                elif isinstance(data, dict):
+                    items = list(data.items())
+                else:
+                    items = []
+                items.sort(key=lambda kv: key_order(kv[0]))
+                if self._after is not None:
+                    after = key_order(self._after)
+                    items = [kv for kv in items if key_order(kv[0]) > after]
+                received_ms = time.time() * 1000
+                for key, value in items[:PAGE_SIZE]:
+                    stored += self.add(key, value, received_ms)
+                    self._after = key
+                if len(items) < PAGE_SIZE:
+                    break
+            self._last_sync = time.monotonic()
+            self.stats_["synced"] += stored
+            self.stats_["sync_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            return stored
+        finally:
+            self._sync_lock.release()
+
+    def cursor_seq(self, cursor):
+        """
+        Position of a cursor key (readings with a greater seq come after it)
+
+        Returns:
+            seq, or None when the cursor is older than the recent keys kept
+        """
+        with self._lock:
+            orders, seqs = self._cursor_orders, self._cursor_seqs
+            order = key_order(cursor)
+            if orders and order < orders[0] and self._seq > len(orders):
+                return None
+            i = bisect.bisect_right(orders, order)
+            return seqs[i - 1] if i else 0
+
+    def cursor_key(self, seq):
+        """Key of the reading stored with seq, or None once it left the recent keys"""
+        with self._lock:
+            i = bisect.bisect_left(self._cursor_seqs, seq)
+            if i < len(self._cursor_seqs) and self._cursor_seqs[i] == seq:
+                return self._cursor_keys[i]
+        return None
+
+    def last_key(self, field_id, node_id=None):
+        """Newest key of one node, or of every node of the field (None without readings)"""
+        with self._lock:
+            if node_id is not None:
+                chosen = [self._series.get((field_id, node_id))]
+            else:
+                chosen = [s for (f, _), s in self._series.items() if f == field_id]
+            chosen = [s for s in chosen if s is not None and s.n]
+            return max(chosen, key=lambda s: s.last_seq).last_key if chosen else None
+
+    def select(self, field_id, node_id=None):
+        """
+        Copies of (t, seq, values) for one node, or every node of the field
+        when node_id is None, sorted by timestamp; plus the newest key among them
+
+        Returns:
+            Tuple of (t, seq, values, last_key), or None if there are no readings
+        """
+        with self._lock:
+            if node_id is not None:
+                chosen = [self._series.get((field_id, node_id))]
+            else:
+                chosen = [s for (f, _), s in self._series.items() if f == field_id]
+            chosen = [s for s in chosen if s is not None and s.n]
+            if not chosen:
+                return None
+            parts = [s.columns() for s in chosen]
+            last_key = max(chosen, key=lambda s: s.last_seq).last_key
+            t = np.concatenate([p[0] for p in parts])
+            seq = np.concatenate([p[1] for p in parts])
+            values = np.concatenate([p[2] for p in parts])
+        if len(parts) > 1:
+            order = np.argsort(t, kind="stable")
+            t, seq, values = t[order], seq[order], values[order]
+        return t, seq, values, last_key
+
+    def nodes(self):
+        with self._lock:
+            return [{"field_id": field_id, "node_id": node_id or None, "readings": s.n,
+                     "start": int(s.t[:s.n].min()), "end": int(s.t[:s.n].max()), "cursor": s.last_key}
+                    for (field_id, node_id), s in self._series.items() if s.n]
+
+    def stats(self):
+        with self._lock:
+            readings = sum(s.n for s in self._series.values())
+            return {"nodes": len(self._series), "readings": readings, "cursor": self._after,
+                    "path": self.path, **self.stats_}
+
+
+store = SeriesStore()
+dashboard = Blueprint("dashboard", __name__, url_prefix="/dashboard")
+
+
+def _database():
+    from storage import realtime_database
+    return realtime_database()
+
+
+def _synced():
+    """Sync the store; returns an error response when the database is unavailable"""
+    try:
+        store.sync(_database())
+    except (ValueError, OSError) as e:
+        return jsonify({"error": f"Realtime Database unavailable: {e}"}), 503
+    return None
+
+
+def _respond(payload, etag=None):
+    """JSON response with a weak ETag, gzip-compressed when accepted and worth it"""
+    response = Response(json.dumps(payload, separators=(",", ":")), mimetype="application/json")
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    if response.content_length >= GZIP_MIN_BYTES and "gzip" in request.accept_encodings:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def _etag(last_key):
+    """Same in every worker: the newest key of the queried nodes and the query"""
+    return f"{last_key}:{zlib.crc32(request.query_string):08x}"
+
+
+def _not_modified(etag):
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    return None
+
+
+def _query():
+    """Common query parameters: (field_id, node_id, sensor indices)"""
+    field_id, node_id = resolve_ids({"field_id": request.args.get("field_id"),
+                                     "node_id": request.args.get("node_id")})
+    names = request.args.get("sensors")
+    names = names.split(",") if names else list(SENSORS)
+    unknown = [name for name in names if name not in SENSORS]
+    if unknown:
+        raise ValueError(f"Unknown sensors {unknown} (use {', '.join(SENSORS)})")
+    return field_id, node_id, [SENSORS.index(name) for name in names]
+
+
+def _number(name, default=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number") from None
+
+
+@dashboard.route("/series", methods=["GET"])
+def series():
+    """
+    Downsampled readings in [start, end] (epoch ms)
+
+    Query: field_id, node_id (omit for every node of the field), sensors,
+    start, end, points, method (lttb | minmax)
+    """
+    error = _synced()
+    if error is not None:
+        return error
+    try:
+        field_id, node_id, columns = _query()
+        start, end = _number("start", -math.inf), _number("end", math.inf)
+        points = int(min(max(_number("points", DEFAULT_POINTS), 2), MAX_POINTS))
+        method = request.args.get("method", "lttb")
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method!r} (use {' or '.join(METHODS)})")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    last_key = store.last_key(field_id, node_id)
+    if last_key is None:
+        return jsonify({"error": "No readings for this field/node"}), 404
+    etag = _etag(last_key)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+
+    t, seq, values, last_key = store.select(field_id, node_id)
+    lo, hi = np.searchsorted(t, start, side="left"), np.searchsorted(t, end, side="right")
+    t, values = t[lo:hi], values[lo:hi]
+    result = {}
+    for c in columns:
+        present = ~np.isnan(values[:, c])
+        ts, ys = t[present], values[present, c]
+        kept = lttb(ts, ys, points) if method == "lttb" else min_max(ys, points)
+        result[SENSORS[c]] = {"t": ts[kept].astype(np.int64).tolist(), "v": ys[kept].tolist(), "raw": len(ys)}
+    return _respond({"field_id": field_id, "node_id": node_id, "method": method, "points": points,
+                     "cursor": last_key, "series": result}, etag)
+
+
+@dashboard.route("/delta", methods=["GET"])
+def delta():
+    """
+    Raw readings stored after ?cursor= (a key returned by /series, /delta or /nodes)
+
+    Rows come in the order they were written; "more" is true when the call
+    returned MAX_DELTA_ROWS and should be repeated with the new cursor.
+    "reset" means the cursor is too old: reload with /series.
+    """
+    error = _synced()
+    if error is not None:
+        return error
+    try:
+        field_id, node_id, columns = _query()
+        cursor = request.args.get("cursor")
+        if not cursor:
+            raise ValueError("cursor is required (from /dashboard/series)")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    after = store.cursor_seq(cursor)
+    last_key = store.last_key(field_id, node_id)
+    if after is None or last_key is None:
+        return _respond({"field_id": field_id, "node_id": node_id, "cursor": cursor, "reset": after is None,
+                         "more": False, "t": [], **{SENSORS[c]: [] for c in columns}})
+    etag = _etag(last_key)
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    t, seq, values, last_key = store.select(field_id, node_id)
+
+    rows = np.flatnonzero(seq > after)
+    rows = rows[np.argsort(seq[rows], kind="stable")]
+    more = len(rows) > MAX_DELTA_ROWS
+    rows = rows[:MAX_DELTA_ROWS]
+    payload = {"field_id": field_id, "node_id": node_id, "reset": False, "more": more,
+               "t": t[rows].astype(np.int64).tolist()}
+    for c in columns:
+        column = values[rows, c]
+        payload[SENSORS[c]] = [None if math.isnan(x) else x for x in column.tolist()]
+    # The next call starts after the newest row returned
+    payload["cursor"] = (store.cursor_key(int(seq[rows[-1]])) or last_key) if more else last_key
+    return _respond(payload, etag)
+
+
+@dashboard.route("/nodes", methods=["GET"])
+def nodes():
+    """Fields and nodes with their reading counts, time range and latest key"""
+    error = _synced()
+    if error is not None:
+        return error
+    return _respond({"nodes": store.nodes(), "stats": store.stats()})
@@ -0,0 +1,232 @@
+"""
+Concurrent dispatch of sensor readings to the Flask prediction API.
+
+Readings are sent over a pooled keep-alive HTTP session by a bounded number of
+worker threads. Readings of the same node are delivered in order (one node is
+never handled by two workers at once), failed requests are retried with
+jittered exponential backoff, and the batch endpoint is used when the server
+has it. Batches are packed across nodes, so a page of readings from many
+nodes takes ceil(n / batch_size) requests; a node whose readings span two
+batches has them sent one after the other. A summary of throughput and latency percentiles is kept for the run.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "http://127.0.0.1:5001/predict"
+
+# Status codes worth retrying (server overloaded or restarting)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class PredictionDispatcher:
+    """Send readings to the prediction API concurrently, preserving per-node order"""
+
+    def __init__(self, api_url=API_URL, concurrency=8, max_retries=3, backoff=0.2,
+                 max_backoff=5.0, use_batch="auto", batch_size=100, timeout=10):
+        """
+        Args:
+            api_url: URL of the single-reading endpoint (…/predict)
+            concurrency: Maximum number of requests in flight
+            max_retries: Retries per request after the first attempt
+            backoff: Base delay in seconds for the exponential backoff
+            max_backoff: Upper bound for a single backoff delay
+            use_batch: True, False or "auto" (use …/predict/batch if the server has it)
+            batch_size: Readings per batch request
+            timeout: Per-request timeout in seconds
+        """
+        self.api_url = api_url
+        self.batch_url = api_url.rstrip("/") + "/batch"
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.use_batch = use_batch
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._batch_supported = None if use_batch == "auto" else bool(use_batch)
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Start a new measurement window"""
+        with self._lock:
+            self._latencies = []
+            self._stats = {"readings": 0, "ok": 0, "failed": 0, "requests": 0, "retries": 0}
+            self._started = time.perf_counter()
+
+    def _sleep_backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def _post(self, url, payload):
+        """
+        POST with retries
+
+        Returns:
+            The requests.Response of the last attempt, or None if every attempt
+            failed to connect
+        """
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._lock:
+                    self._stats["retries"] += 1
+                self._sleep_backoff(attempt - 1)
+            start = time.perf_counter()
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                response = None
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._stats["requests"] += 1
+                self._latencies.append(elapsed_ms)
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+        return response
+
+    def _send_single(self, payload):
+        response = self._post(self.api_url, payload)
+        if response is not None and response.status_code == 200:
+            return response.json()
+        return None
+
+    def _send_batch(self, payloads):
+        """
+        Score payloads with one batch request
+
+        Returns:
+            List of results aligned with payloads (None for rejected items), or
+            None if the server has no batch endpoint
+        """
+        response = self._post(self.batch_url, payloads)
+        if response is not None and response.status_code in (404, 405):
+            return None
+        results = [None] * len(payloads)
+        if response is not None and response.status_code == 200:
+            for item in response.json().get("results", []):
+                results[item["index"]] = item
+        return results
+
+    def _deliver(self, chunks):
+        """Send chunks of readings one after the other; returns [(index, result)]"""
+        out = []
+        for chunk in chunks:
+            if self._batch_supported is not False:
+                results = self._send_batch([payload for _, payload in chunk])
+                if results is not None:
+                    if any(r is not None for r in results):
+                        with self._lock:
+                            self._batch_supported = True
+                    out.extend((i, r) for (i, _), r in zip(chunk, results))
+                    continue
+                with self._lock:
+                    fell_back, self._batch_supported = self._batch_supported is not False, False
+                if fell_back:
+                    print("ℹ Batch endpoint not available - sending readings one at a time")
+            out.extend((i, self._send_single(payload)) for i, payload in chunk)
+        return out
+
+    def _pack(self, groups):
+        """
+        Pack the node groups into batches of up to batch_size readings
+
+        Each node's readings stay in order and contiguous. Consecutive batches
+        that share a node form one chain, delivered by a single worker.
+
+        Returns:
+            List of chains, each a list of batches of (index, payload)
+        """
+        flat = [item for indexed in groups for item in indexed]
+        nodes = [node for node, indexed in enumerate(groups) for _ in indexed]
+        chains = []
+        for start in range(0, len(flat), self.batch_size):
+            chunk = flat[start:start + self.batch_size]
+            if start and nodes[start] == nodes[start - 1]:
+                chains[-1].append(chunk)
+            else:
+                chains.append([chunk])
+        return chains
+
+    def dispatch(self, payloads, node_key="node_id"):
+        """
+        Send payloads to the API
+
+        Args:
+            payloads: List of prediction request dictionaries
+            node_key: Payload key identifying the node; readings of one node
+                are delivered in list order
+
+        Returns:
+            List of API results aligned with payloads (None where a reading failed)
+        """
+        groups = {}
+        for i, payload in enumerate(payloads):
+            groups.setdefault(payload.get(node_key), []).append((i, payload))
+
+        if self._batch_supported is False:
+            chains = [[indexed] for indexed in groups.values()]
+        else:
+            chains = self._pack(list(groups.values()))
+
+        results = [None] * len(payloads)
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, max(1, len(chains)))) as pool:
+            for delivered in pool.map(self._deliver, chains):
+                for i, result in delivered:
+                    results[i] = result
+
+        ok = sum(r is not None for r in results)
+        with self._lock:
+            self._stats["readings"] += len(payloads)
+            self._stats["ok"] += ok
+            self._stats["failed"] += len(payloads) - ok
+        return results
+
+    def report(self):
+        """
+        Throughput and latency summary since the last reset_stats()
+
+        Returns:
+            Dictionary with counters, readings/s and request latency percentiles (ms)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+            elapsed = time.perf_counter() - self._started
+        stats["elapsed_s"] = round(elapsed, 3)
+        stats["readings_per_s"] = round(stats["ok"] / elapsed, 1) if elapsed > 0 else 0.0
+        stats["batch"] = self._batch_supported
+        for p in (50, 95, 99):
+            stats[f"p{p}_ms"] = round(percentile(latencies, p), 2)
+        return stats
+
+    def print_report(self):
+        stats = self.report()
+        print("\n📈 Dispatch summary")
+        print(f"  Readings:   {stats['ok']} ok, {stats['failed']} failed in {stats['elapsed_s']} s")
+        print(f"  Throughput: {stats['readings_per_s']} readings/s ({stats['requests']} requests, {stats['retries']} retries)")
+        print(f"  Latency:    p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms")
+        print(f"  Mode:       {'batch' if stats['batch'] else 'single'}")
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,361 @@
+"""
+Rolling-window features per sensor node.
+
+Every node's readings go into a fixed-size ring buffer of NumPy arrays
+(timestamp, soil, temperature, humidity, vapour pressure deficit). For each
+window (1 hour and 24 hours) the store keeps running sums of the values and of
+the least-squares terms for the soil trend, so adding a reading - and dropping
+the ones that fell out of a window - is O(1) amortized however long the
+window is. From those sums it reports:
+
+    soil_slope_<w>          soil moisture trend over the window, ADC units per
+                            hour (negative = drying out)
+    <column>_mean_<w>       mean soil, temperature, humidity and VPD
+    readings_<w>            readings in the window
+    vpd_kpa, dew_point_c    derived from the latest temperature and humidity
+
+Memory is bounded by FEATURE_STORE_CAPACITY readings per node and
+FEATURE_STORE_MAX_NODES nodes (least recently updated nodes are dropped). The
+buffers can be snapshotted to a .npz file and restored after a restart.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+FEATURE_STORE_PATH = os.environ.get("FEATURE_STORE_PATH", "feature_store.npz")
+FEATURE_STORE_SNAPSHOT_INTERVAL = float(os.environ.get("FEATURE_STORE_SNAPSHOT_INTERVAL", 300))
+# 24 hours of readings every 15 seconds
+FEATURE_STORE_CAPACITY = int(os.environ.get("FEATURE_STORE_CAPACITY", 5760))
+FEATURE_STORE_MAX_NODES = int(os.environ.get("FEATURE_STORE_MAX_NODES", 256))
+# Readings stamped further ahead of the server clock (seconds) use the arrival time
+FEATURE_STORE_MAX_SKEW = float(os.environ.get("FEATURE_STORE_MAX_SKEW", 300))
+
+WINDOWS = {"1h": 3600.0, "24h": 86400.0}
+COLUMNS = ("soil", "temperature", "humidity", "vpd")
+SNAPSHOT_FORMAT = 1
+
+# Timestamps below this (ms) are device uptime, not wall-clock time
+MIN_EPOCH_MS = 1e12
+
+
+def vapour_pressure_deficit(temperature, humidity):
+    """VPD in kPa (Tetens saturation vapour pressure)"""
+    saturation = 0.6108 * math.exp(17.27 * temperature / (temperature + 237.3))
+    return saturation * (1.0 - humidity / 100.0)
+
+
+def reading_time_ms(timestamp_ms, max_skew=FEATURE_STORE_MAX_SKEW):
+    """
+    Wall-clock time of a reading in epoch milliseconds
+
+    Args:
+        timestamp_ms: The reading's "timestamp" as sent by the client
+        max_skew: Seconds a timestamp may be ahead of the server clock
+
+    Returns:
+        timestamp_ms if it is a number between MIN_EPOCH_MS and now + max_skew;
+        otherwise now (missing, uptime, far-future or non-numeric timestamps)
+    """
+    now_ms = time.time() * 1000
+    if (isinstance(timestamp_ms, bool) or not isinstance(timestamp_ms, (int, float))
+            or not MIN_EPOCH_MS <= timestamp_ms <= now_ms + max_skew * 1000):
+        return now_ms
+    return timestamp_ms
+
+
+def dew_point(temperature, humidity):
+    """Dew point in °C (Magnus formula); None for 0% humidity"""
+    if humidity <= 0:
+        return None
+    gamma = math.log(humidity / 100.0) + 17.62 * temperature / (243.12 + temperature)
+    return 243.12 * gamma / (17.62 - gamma)
+
+
+class NodeSeries:
+    """Ring buffer and per-window running sums for one node"""
+
+    # Running sums per window: n, sum of each column, then t, t², t·soil for the soil slope
+    N, T, TT, TS = 0, len(COLUMNS) + 1, len(COLUMNS) + 2, len(COLUMNS) + 3
+
+    def __init__(self, capacity, windows=WINDOWS):
+        self.capacity = capacity
+        self.windows = dict(windows)
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((capacity, len(COLUMNS)), dtype=np.float32)
+        self.head = 0       # next slot to write
+        self.count = 0
+        self.last_t = -math.inf
+        # Times in the sums are relative to t_ref, re-based every `capacity` updates
+        # so float rounding from adding and subtracting cannot accumulate
+        self.t_ref = None
+        self.updates = 0
+        self.start = {name: 0 for name in self.windows}
+        self.sums = {name: np.zeros(len(COLUMNS) + 4) for name in self.windows}
+
+    def _row(self, i):
+        t = self.t[i] - self.t_ref
+        values = self.values[i].astype(np.float64)
+        row = np.empty(len(COLUMNS) + 4)
+        row[self.N] = 1.0
+        row[1:self.T] = values
+        row[self.T] = t
+        row[self.TT] = t * t
+        row[self.TS] = t * values[0]
+        return row
+
+    def append(self, t, soil, temperature, humidity):
+        """
+        Add a reading; readings not newer than the last one are ignored
+
+        Returns:
+            True if the reading was added
+        """
+        if t <= self.last_t:
+            return False
+        if self.t_ref is None:
+            self.t_ref = t
+        if self.count == self.capacity:
+            # The oldest reading is about to be overwritten: drop it from every window
+            oldest = self.head
+            for name in self.windows:
+                if self.sums[name][self.N] and self.start[name] == oldest:
+                    self.sums[name] -= self._row(oldest)
+                    self.start[name] = (oldest + 1) % self.capacity
+
+        i = self.head
+        self.t[i] = t
+        self.values[i] = (soil, temperature, humidity, vapour_pressure_deficit(temperature, humidity))
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.last_t = t
+
+        row = self._row(i)
+        for name, span in self.windows.items():
+            sums = self.sums[name]
+            if not sums[self.N]:
+                self.start[name] = i
+            sums += row
+            start = self.start[name]
+            while t - self.t[start] > span:
+                sums -= self._row(start)
+                start = (start + 1) % self.capacity
+            self.start[name] = start
+
+        self.updates += 1
+        if self.updates >= self.capacity:
+            self._rebase()
+        return True
+
+    def _rebase(self):
+        """Recompute the running sums exactly (amortized O(1) per update)"""
+        self.updates = 0
+        oldest = (self.head - self.count) % self.capacity
+        self.t_ref = self.t[oldest]
+        for name in self.windows:
+            n = int(self.sums[name][self.N])
+            self.sums[name][:] = 0.0
+            for k in range(n):
+                self.sums[name] += self._row((self.start[name] + k) % self.capacity)
+
+    def ordered(self):
+        """(timestamps, values) from oldest to newest"""
+        index = (np.arange(self.count) + self.head - self.count) % self.capacity
+        return self.t[index], self.values[index]
+
+    def features(self):
+        """Rolling features as a JSON-ready dictionary (None where undefined)"""
+        latest = (self.head - 1) % self.capacity
+        temperature, humidity = float(self.values[latest, 1]), float(self.values[latest, 2])
+        dew = dew_point(temperature, humidity)
+        result = {
+            "vpd_kpa": round(float(self.values[latest, 3]), 3),
+            "dew_point_c": None if dew is None else round(dew, 2),
+        }
+        for name, sums in self.sums.items():
+            n = sums[self.N]
+            result[f"readings_{name}"] = int(n)
+            for c, column in enumerate(COLUMNS):
+                result[f"{column}_mean_{name}"] = round(float(sums[c + 1] / n), 3) if n else None
+            denominator = n * sums[self.TT] - sums[self.T] ** 2
+            slope = None
+            if n >= 2 and denominator > 1e-9 * max(1.0, n * sums[self.TT]):
+                slope = (n * sums[self.TS] - sums[self.T] * sums[1]) / denominator * 3600.0
+            result[f"soil_slope_{name}"] = None if slope is None else round(float(slope), 3)
+        return result
+
+
+class FeatureStore:
+    """Per-(field, node) rolling features, shared by the request threads of a process"""
+
+    def __init__(self, capacity=FEATURE_STORE_CAPACITY, max_nodes=FEATURE_STORE_MAX_NODES, windows=WINDOWS):
+        """
+        Args:
+            capacity: Readings kept per node
+            max_nodes: Nodes kept; the least recently updated one is dropped beyond this
+            windows: {name: seconds} rolling windows
+        """
+        self.capacity = max(2, capacity)
+        self.max_nodes = max(1, max_nodes)
+        self.windows = dict(windows)
+        self._nodes = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.evicted = 0
+        self._snapshotter_pid = None
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._snapshotter_pid = None
+
+    def update(self, field_id, node_id, data, timestamp_ms=None):
+        """
+        Add a reading and return the node's features
+
+        Args:
+            field_id: Field the node belongs to
+            node_id: Reporting node (None for readings without one)
+            data: Reading with soil, temperature and humidity
+            timestamp_ms: Reading time in epoch milliseconds (default or invalid: now,
+                see reading_time_ms())
+
+        Returns:
+            Feature dictionary, see NodeSeries.features()
+        """
+        timestamp_ms = reading_time_ms(timestamp_ms)
+        key = (field_id, node_id or "")
+        with self._lock:
+            series = self._nodes.get(key)
+            if series is None:
+                series = self._nodes[key] = NodeSeries(self.capacity, self.windows)
+                if len(self._nodes) > self.max_nodes:
+                    self._nodes.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._nodes.move_to_end(key)
+            if not series.append(timestamp_ms / 1000.0, float(data["soil"]),
+                                 float(data["temperature"]), float(data["humidity"])):
+                self.rejected += 1
+            return series.features()
+
+    def update_many(self, keys, readings, timestamps_ms=None):
+        """
+        Add readings in order and return each one's features
+
+        Args:
+            keys: (field_id, node_id) per reading
+            readings: Readings with soil, temperature and humidity
+            timestamps_ms: Reading times in epoch milliseconds (None or invalid entries: now)
+
+        Returns:
+            List of feature dictionaries, see NodeSeries.features()
+        """
+        if timestamps_ms is None:
+            timestamps_ms = [None] * len(readings)
+        return [self.update(field_id, node_id, data, timestamp_ms)
+                for (field_id, node_id), data, timestamp_ms in zip(keys, readings, timestamps_ms)]
+
+    def features(self, field_id, node_id=None):
+        """Current features of a node, or None if it has no readings"""
+        with self._lock:
+            series = self._nodes.get((field_id, node_id or ""))
+            return None if series is None else series.features()
+
+    def nodes(self):
+        with self._lock:
+            return list(self._nodes)
+
+    def stats(self):
+        with self._lock:
+            readings = sum(s.count for s in self._nodes.values())
+        bytes_per_node = self.capacity * (8 + 4 * len(COLUMNS))
+        return {
+            "nodes": len(self._nodes),
+            "readings": readings,
+            "capacity_per_node": self.capacity,
+            "buffer_mb": round(len(self._nodes) * bytes_per_node / 2**20, 2),
+            "rejected_out_of_order": self.rejected,
+            "evicted_nodes": self.evicted,
+        }
+
+    # Persistence
+
+    def snapshot(self, path=FEATURE_STORE_PATH):
+        """
+        Write every node's readings to a .npz file (atomic replace)
+
+        Returns:
+            Number of readings written
+        """
+        with self._lock:
+            keys = list(self._nodes)
+            series = [self._nodes[k].ordered() for k in keys]
+        counts = np.array([len(t) for t, _ in series], dtype=np.int64)
+        tmp = f"{path}.tmp{os.getpid()}.npz"
+        np.savez(
+            tmp,
+            format_version=np.array(SNAPSHOT_FORMAT),
+            field_ids=np.array([k[0] for k in keys], dtype=str),
+            node_ids=np.array([k[1] for k in keys], dtype=str),
+            counts=counts,
+            t=np.concatenate([t for t, _ in series]) if keys else np.zeros(0),
+            values=np.concatenate([v for _, v in series]) if keys else np.zeros((0, len(COLUMNS)), np.float32),
+        )
+        os.replace(tmp, path)
+        return int(counts.sum())
+
+    def restore(self, path=FEATURE_STORE_PATH):
+        """
+        Load a snapshot written by snapshot(), replacing the current contents
+
+        Returns:
+            Number of readings restored
+
+        Raises:
+            ValueError: If the file has another format version
+            OSError: If the file cannot be read
+        """
+        with np.load(path, allow_pickle=False) as snap:
+            if int(snap["format_version"]) != SNAPSHOT_FORMAT:
+                raise ValueError(f"Unsupported feature store snapshot format {int(snap['format_version'])}")
+            field_ids, node_ids, counts = snap["field_ids"], snap["node_ids"], snap["counts"]
+            t, values = snap["t"], snap["values"]
+        nodes = OrderedDict()
+        offset = 0
+        for field_id, node_id, count in zip(field_ids, node_ids, counts):
+            series = NodeSeries(self.capacity, self.windows)
+            # Replaying rebuilds the window sums; only the newest `capacity` readings fit
+            for k in range(max(offset, offset + count - self.capacity), offset + count):
+                series.append(float(t[k]), *(float(x) for x in values[k, :3]))
+            nodes[(str(field_id), str(node_id))] = series
+            offset += count
+        while len(nodes) > self.max_nodes:
+            nodes.popitem(last=False)
+        with self._lock:
+            self._nodes = nodes
+        return int(sum(s.count for s in nodes.values()))
+
+    def start_snapshots(self, path=FEATURE_STORE_PATH, interval=FEATURE_STORE_SNAPSHOT_INTERVAL):
+        """Snapshot every `interval` seconds from a daemon thread of this process"""
+        if not path or interval <= 0 or self._snapshotter_pid == os.getpid():
+            return
+        with self._lock:
+            if self._snapshotter_pid == os.getpid():
+                return
+            self._snapshotter_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.snapshot(path)
+                except Exception as e:
+                    print(f"⚠ Feature store snapshot failed: {e}")
+
+        threading.Thread(target=run, name="feature-snapshots", daemon=True).start()
@@ -0,0 +1,155 @@
+"""
+Feature encoding for the irrigation model.
+
+Turns a prediction request dictionary straight into a float NumPy row in the
+column order the model was trained on, validating types and ranges and applying
+the StandardScaler in the same step - no pandas DataFrame per request.
+"""
+
+import math
+import threading
+
+import numpy as np
+
+# Model input columns, in the order the model was trained on
+FEATURES = ("soil", "light", "temperature", "humidity", "pH", "npk", "rainfall")
+FEATURE_DEFAULTS = {"npk": 25, "rainfall": 0}
+
+# Accepted (min, max) for each feature, inclusive
+FEATURE_RANGES = {
+    "soil": (0, 4095),           # 12-bit ADC reading
+    "light": (0, 65535),
+    "temperature": (-40, 85),    # DHT operating range in °C
+    "humidity": (0, 100),        # %
+    "pH": (0, 14),
+    "npk": (0, 1000),
+    "rainfall": (0, 1000),       # mm
+}
+
+
+class FeatureEncoder:
+    """
+    Precompiled request → model-row encoder, built once at model load
+
+    The scaler's mean/scale are copied out of the estimator when the encoder is
+    built, so encoding a reading is a fill of a preallocated per-thread buffer
+    followed by two in-place NumPy operations.
+    """
+
+    def __init__(self, scaler=None, features=FEATURES, defaults=None, ranges=None):
+        """
+        Args:
+            scaler: Fitted StandardScaler (or None when the model takes raw features)
+            features: Feature names in model column order
+            defaults: Values used when a feature is missing from the request
+            ranges: Accepted (min, max) per feature
+        """
+        self.features = tuple(features)
+        self.defaults = dict(FEATURE_DEFAULTS if defaults is None else defaults)
+        ranges = FEATURE_RANGES if ranges is None else ranges
+        self._fields = tuple(
+            (i, name, self.defaults.get(name), ranges.get(name, (-math.inf, math.inf)))
+            for i, name in enumerate(self.features)
+        )
+        self.n_features = len(self.features)
+
+        names = getattr(scaler, "feature_names_in_", None)
+        if names is not None and tuple(names) != self.features:
+            raise ValueError(f"Scaler was fitted on columns {list(names)}, expected {list(self.features)}")
+
+        mean = getattr(scaler, "mean_", None)
+        scale = getattr(scaler, "scale_", None)
+        self._mean = None if mean is None else np.asarray(mean, dtype=np.float64).reshape(1, -1)
+        self._scale = None if scale is None else np.asarray(scale, dtype=np.float64).reshape(1, -1)
+        self._local = threading.local()
+
+    def _coerce(self, name, value, default, bounds):
+        """Validate one feature value and return it as a float"""
+        if value is None:
+            if default is None:
+                raise ValueError(f"Missing required field '{name}'")
+            value = default
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Field '{name}' must be a number, got {value!r}")
+        value = float(value)
+        low, high = bounds
+        if not (low <= value <= high):
+            raise ValueError(f"Field '{name}' out of range [{low}, {high}]: {value}")
+        return value
+
+    def fill(self, data, out):
+        """
+        Write the validated, unscaled features of one reading into `out`
+
+        Args:
+            data: Request dictionary with sensor readings
+            out: 1-D float64 array of length n_features
+        """
+        if not isinstance(data, dict):
+            raise ValueError("Reading must be a JSON object")
+        get = data.get
+        coerce = self._coerce
+        for i, name, default, bounds in self._fields:
+            out[i] = coerce(name, get(name), default, bounds)
+
+    def scale(self, X):
+        """
+        Apply the folded scaler to a feature matrix in place
+
+        Mirrors StandardScaler.transform exactly (subtract mean, divide by scale).
+
+        Args:
+            X: 2-D float64 array with n_features columns
+
+        Returns:
+            X, scaled
+        """
+        if self._mean is not None:
+            np.subtract(X, self._mean, out=X)
+        if self._scale is not None:
+            np.divide(X, self._scale, out=X)
+        return X
+
+    def encode(self, data):
+        """
+        Encode a single reading into a scaled (1, n_features) model row
+
+        The returned array is a per-thread buffer that is reused by the next
+        call, so it must be consumed (e.g. passed to predict_proba) first.
+
+        Args:
+            data: Request dictionary with sensor readings
+
+        Returns:
+            Scaled float64 array of shape (1, n_features)
+
+        Raises:
+            ValueError: If a feature is missing, non-numeric or out of range
+        """
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = self._local.row = np.empty((1, self.n_features), dtype=np.float64)
+        self.fill(data, row[0])
+        return self.scale(row)
+
+    def encode_batch(self, items):
+        """
+        Encode many readings into an unscaled feature matrix
+
+        Args:
+            items: List of request dictionaries
+
+        Returns:
+            Tuple of (X, valid, errors): X holds one unscaled row per valid item,
+            valid lists their indices in `items`, errors lists
+            {"index", "error"} dicts for the rejected ones
+        """
+        X = np.empty((len(items), self.n_features), dtype=np.float64)
+        valid, errors = [], []
+        for i, item in enumerate(items):
+            try:
+                self.fill(item, X[len(valid)])
+                valid.append(i)
+            except ValueError as e:
+                errors.append({"index": i, "error": str(e)})
+        return X[:len(valid)], valid, errors
@@ -3,24 +3,48 @@ Script to fetch sensor data from Firebase Realtime Database
 and send it to the Flask API for irrigation predictions.
 """
 
-import firebase_admin
-from firebase_admin import credentials, db
 import requests
-import time
 import json
+import os
+import threading
 
-# Initialize Firebase Admin SDK with Realtime Database
-cred = credentials.Certificate("serviceAccountKey.json")
+from dispatcher import PredictionDispatcher
+from scoring import build_request
+from storage import realtime_database
 
-# Initialize with the Realtime Database URL from your firebase config
-# You need to specify the databaseURL
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': 'https://agrivision-1e11f-default-rtdb.asia-southeast1.firebasedatabase.app'
-    })
+# Realtime Database client (Firebase, or a local stand-in with RTDB_BACKEND=local|sqlite)
+db = realtime_database()
 
 # Flask API endpoint
-API_URL = "http://127.0.0.1:5001/predict"
+API_URL = os.environ.get("PREDICTION_API_URL", "http://127.0.0.1:5001/predict")
+
+# Where the listener remembers the last processed key of each path
+LISTENER_STATE_FILE = os.environ.get("LISTENER_STATE_FILE", ".listener_state.json")
+
+# Small path that writers touch after adding readings; the listener subscribes
+# to it to wake up early ("" = incremental polling only). Subscribing to the
+# readings path itself would download the whole subtree as the initial event.
+LISTENER_WAKEUP_PATH = os.environ.get("LISTENER_WAKEUP_PATH", "")
+
+# Children fetched per incremental query
+PAGE_SIZE = 500
+
+# Attempts before a reading the API keeps rejecting is skipped
+MAX_ATTEMPTS = 3
+
+# Requests in flight when catching up on a backlog ("auto" uses /predict/batch if available)
+DISPATCH_CONCURRENCY = int(os.environ.get("DISPATCH_CONCURRENCY", 8))
+DISPATCH_BATCH = os.environ.get("DISPATCH_BATCH", "auto")
+
+_dispatcher = None
+
+def get_dispatcher():
+    """Shared dispatcher (one pooled HTTP session for the whole process)"""
+    global _dispatcher
+    if _dispatcher is None:
+        use_batch = DISPATCH_BATCH if DISPATCH_BATCH == "auto" else DISPATCH_BATCH.lower() in ("1", "true", "yes")
+        _dispatcher = PredictionDispatcher(API_URL, concurrency=DISPATCH_CONCURRENCY, use_batch=use_batch)
+    return _dispatcher
 
 def fetch_sensor_data(path='/sensor_data'):
     """
@@ -47,31 +71,31 @@ def fetch_sensor_data(path='/sensor_data'):
         print(f"✗ Error fetching from Firebase: {e}")
         return None
 
+def build_payload(sensor_data):
+    """
+    Prepare a reading in the format expected by the API (see scoring.build_request)
+    
+    Raises:
+        ValueError: If a raw LoRa payload cannot be parsed
+    """
+    return build_request(sensor_data)
+
 def send_to_prediction_api(sensor_data):
     """
     Send sensor data to Flask API for prediction
     
     Args:
-        sensor_data: Dictionary containing sensor readings
+        sensor_data: Dictionary containing sensor readings (or a raw LoRa payload string)
     
     Returns:
         Prediction response from API
     """
     try:
-        # Prepare data in the format expected by the API
-        payload = {
-            "soil": sensor_data.get("soil", sensor_data.get("soilMoisture", 0)),
-            "light": sensor_data.get("light", sensor_data.get("lightIntensity", 0)),
-            "temperature": sensor_data.get("temperature", sensor_data.get("temp", 0)),
-            "humidity": sensor_data.get("humidity", 0),
-            "pH": sensor_data.get("pH", sensor_data.get("ph", 7.0)),
-            "npk": sensor_data.get("npk", 25),
-            "rainfall": sensor_data.get("rainfall", 0)
-        }
+        payload = build_payload(sensor_data)
         
         print(f"\n→ Sending to API: {json.dumps(payload, indent=2)}")
         
-        response = requests.post(API_URL, json=payload, timeout=10)
+        response = get_dispatcher().session.post(API_URL, json=payload, timeout=10)
         
         if response.status_code == 200:
             result = response.json()
@@ -91,41 +115,228 @@ def send_to_prediction_api(sensor_data):
         print(f"✗ Error sending to API: {e}")
         return None
 
-def listen_realtime(path='/sensor_data', interval=5):
+def key_order(key):
+    """
+    Sort key matching Realtime Database key ordering
+    
+    Keys that parse as 32-bit integers sort first, numerically; all other
+    keys follow in lexicographic order.
+    """
+    try:
+        number = int(key)
+        if -2**31 <= number < 2**31 and str(number) == key:
+            return (0, number, "")
+    except ValueError:
+        pass
+    return (1, 0, key)
+
+def load_high_water_mark(path, state_file=LISTENER_STATE_FILE):
+    """
+    Load the last processed child key for a database path
+    
+    Returns:
+        The key, or None if nothing has been processed yet
+    """
+    try:
+        with open(state_file, "r") as f:
+            return json.load(f).get(path)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_high_water_mark(path, key, state_file=LISTENER_STATE_FILE):
+    """Persist the last processed child key for a database path (atomic replace)"""
+    try:
+        with open(state_file, "r") as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = {}
+    state[path] = key
+    tmp = f"{state_file}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_file)
+
+def fetch_new_readings(path, after_key=None, page_size=PAGE_SIZE):
+    """
+    Fetch the children of a path that come after a key, in key order
+    
+    Uses order_by_key().start_at() so only new children are downloaded,
+    no matter how large the subtree has grown.
+    
+    Args:
+        path: Database path holding one child per reading
+        after_key: Last processed key (None = start from the beginning)
+        page_size: Maximum number of new children to return
+    
+    Returns:
+        List of (key, value) tuples sorted by key
+    """
+    query = db.reference(path).order_by_key()
+    if after_key is not None:
+        query = query.start_at(after_key)
+    data = query.limit_to_first(page_size + 1).get()
+    
+    if isinstance(data, list):
+        # RTDB returns small sequential integer keys as an array
+        items = [(str(i), v) for i, v in enumerate(data) if v is not None]
+    elif isinstance(data, dict):
+        items = list(data.items())
+    else:
+        return []
+    
+    items.sort(key=lambda kv: key_order(kv[0]))
+    if after_key is not None:
+        last = key_order(after_key)
+        items = [kv for kv in items if key_order(kv[0]) > last]
+    return items[:page_size]
+
+def process_new_readings(path, state_file=LISTENER_STATE_FILE, attempts=None, done=None):
+    """
+    Send every reading newer than the high-water mark to the prediction API
+    
+    Each page of new readings is dispatched concurrently (per-node order is
+    kept). The mark then advances over the longest run of readings that
+    succeeded, so a restart resumes right after them. Readings that failed
+    are retried on the next call, and one that fails MAX_ATTEMPTS times is
+    skipped; readings after the first failure that did succeed are kept in
+    `done` and not sent again while the mark catches up with them.
+    
+    Args:
+        path: Database path holding one child per reading
+        state_file: JSON file holding the high-water marks
+        attempts: Dictionary tracking failed attempts per key across calls
+        done: Set of keys beyond the mark that already succeeded, kept across calls
+    
+    Returns:
+        Number of readings processed
+    """
+    if attempts is None:
+        attempts = {}
+    if done is None:
+        done = set()
+    dispatcher = get_dispatcher()
+    processed = 0
+    last_key = load_high_water_mark(path, state_file)
+    
+    while True:
+        items = fetch_new_readings(path, last_key)
+        if not items:
+            return processed
+        
+        keys, payloads = [], []
+        for key, value in items:
+            if key in done:
+                continue
+            try:
+                if not isinstance(value, (dict, str)):
+                    raise ValueError("unsupported reading format")
+                payloads.append(build_payload(value))
+                keys.append(key)
+            except ValueError as e:
+                print(f"⚠ Skipping {path}/{key} ({e}): {value!r}")
+        
+        print(f"\n📊 {len(payloads)} new readings after key {last_key}")
+        results = dict(zip(keys, dispatcher.dispatch(payloads)))
+        
+        blocked = False
+        for key, _ in items:
+            if key in done:
+                # Sent by an earlier call; only the mark has to move past it
+                if not blocked:
+                    done.discard(key)
+                    last_key = key
+                continue
+            if results.get(key, True) is None:
+                if blocked:
+                    continue
+                attempts[key] = attempts.get(key, 0) + 1
+                if attempts[key] < MAX_ATTEMPTS:
+                    blocked = True
+                    continue
+                print(f"⚠ Giving up on {path}/{key} after {MAX_ATTEMPTS} attempts")
+            attempts.pop(key, None)
+            processed += 1
+            if blocked:
+                done.add(key)
+            else:
+                last_key = key
+        
+        if last_key is not None:
+            save_high_water_mark(path, last_key, state_file)
+        if blocked or len(items) < PAGE_SIZE:
+            return processed
+
+def listen_realtime(path='/sensor_data', interval=5, state_file=LISTENER_STATE_FILE,
+                    wakeup_path=LISTENER_WAKEUP_PATH):
     """
-    Continuously listen for changes in Firebase Realtime Database
-    and send updates to the prediction API
+    Continuously process new readings from Firebase Realtime Database
+    and send them to the prediction API
+    
+    Only children after the persisted high-water mark are fetched (with an
+    order_by_key().start_at() query), so each cycle downloads new readings
+    only and a restart never reprocesses old ones.
     
     Args:
         path: Database path to monitor
-        interval: Polling interval in seconds (for simple polling)
+        interval: Seconds between incremental queries
+        state_file: JSON file holding the high-water marks
+        wakeup_path: Small path whose change events wake the listener before
+            the interval is up (None or "" = poll only). The readings path is
+            never subscribed to: the SDK would send its whole subtree as the
+            initial event.
     """
     print(f"\n🔄 Starting realtime listener on path: {path}")
-    print(f"📡 Polling every {interval} seconds...")
-    print("Press Ctrl+C to stop\n")
+    print(f"📌 Resuming after key: {load_high_water_mark(path, state_file)}")
     
-    last_data = None
+    wakeup = threading.Event()
+    registration = None
+    if wakeup_path:
+        try:
+            registration = db.reference(wakeup_path).listen(lambda event: wakeup.set())
+            print(f"📡 Subscribed to change events on {wakeup_path}")
+        except Exception as e:
+            print(f"⚠ Event subscription failed ({e}) - falling back to incremental polling")
+    if registration is None:
+        print(f"📡 Checking for new readings every {interval} seconds...")
+    print("Press Ctrl+C to stop\n")
     
+    attempts, done = {}, set()
     try:
         while True:
-            data = fetch_sensor_data(path)
-            
-            # Only send to API if data exists and has changed
-            if data and data != last_data:
-                print("\n" + "="*60)
-                print(f"📊 New sensor data detected!")
-                print("="*60)
-                send_to_prediction_api(data)
-                last_data = data
-            elif not data:
-                print(f"⚠ Waiting for data at {path}...")
-            else:
+            wakeup.clear()
+            try:
+                processed = process_new_readings(path, state_file, attempts, done)
+            except Exception as e:
+                print(f"✗ Error fetching from Firebase: {e}")
+                processed = 0
+            if not processed:
                 print(".", end="", flush=True)
             
-            time.sleep(interval)
+            # Events wake us early; the interval still bounds the wait so
+            # readings deferred after an API failure get retried
+            wakeup.wait(interval)
             
     except KeyboardInterrupt:
         print("\n\n✓ Stopped listening")
+        get_dispatcher().print_report()
+    finally:
+        if registration is not None:
+            registration.close()
+
+def catch_up(path='/sensor_data', state_file=LISTENER_STATE_FILE):
+    """
+    Process the backlog of readings after the high-water mark once, then exit
+    
+    Args:
+        path: Database path holding one child per reading
+        state_file: JSON file holding the high-water marks
+    """
+    print(f"\n⏩ Catching up on {path} after key: {load_high_water_mark(path, state_file)}")
+    dispatcher = get_dispatcher()
+    dispatcher.reset_stats()
+    processed = process_new_readings(path, state_file)
+    print(f"\n✓ Processed {processed} readings")
+    dispatcher.print_report()
 
 def fetch_once(path='/sensor_data'):
     """
@@ -145,7 +356,7 @@ def fetch_once(path='/sensor_data'):
         print("\n⚠ No data available. Make sure:")
         print("  1. Your Firebase Realtime Database has data at the specified path")
         print("  2. The database rules allow read access")
-        print("  3. The databaseURL is correct")
+        print("  3. FIREBASE_DATABASE_URL (or RTDB_BACKEND) is correct")
 
 if __name__ == "__main__":
     import sys
@@ -156,7 +367,7 @@ if __name__ == "__main__":
     
     # Check if Flask API is running
     try:
-        test_response = requests.get("http://127.0.0.1:5001/", timeout=2)
+        test_response = requests.get(API_URL.rsplit("/", 1)[0] + "/", timeout=2)
         print("✓ Flask API is running\n")
     except:
         print("⚠ WARNING: Flask API doesn't seem to be running!")
@@ -166,10 +377,13 @@ if __name__ == "__main__":
     mode = sys.argv[1] if len(sys.argv) > 1 else "once"
     db_path = sys.argv[2] if len(sys.argv) > 2 else "/sensor_data"
     
-    if mode == "listen":
-        # Continuous monitoring mode
+    if mode == "catchup":
+        # Send the whole backlog concurrently, then exit
+        catch_up(db_path)
+    elif mode in ("listen", "poll"):
+        # Continuous monitoring mode ("poll" ignores LISTENER_WAKEUP_PATH)
         interval = int(sys.argv[3]) if len(sys.argv) > 3 else 5
-        listen_realtime(db_path, interval)
+        listen_realtime(db_path, interval, wakeup_path=LISTENER_WAKEUP_PATH if mode == "listen" else None)
     else:
         # Fetch once mode (default)
         fetch_once(db_path)
@@ -0,0 +1,129 @@
+"""
+Routing of prediction results to per-field Firestore documents.
+
+Each scored reading is written to:
+
+    fields/{field_id}                      latest state of the field (merged)
+    fields/{field_id}/nodes/{node_id}      latest state of the reporting node
+    fields/{field_id}/readings/{doc_id}    append-only time series
+
+Writes go through a sink with a put(path, data) method - normally the
+write_behind.WriteBehindQueue, which coalesces the latest-state documents so
+each receives at most one write per flush interval. Time-series documents get
+unique, shard-prefixed IDs so concurrent appends never contend on a document
+and don't hotspot a single range of Firestore's monotonically ordered index.
+"""
+
+import random
+import re
+import time
+import uuid
+import zlib
+
+DEFAULT_FIELD_ID = "field_1"
+DEFAULT_SHARDS = 16
+
+# Firestore document IDs must not contain "/"; keep IDs short and URL safe
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def validate_id(value, name):
+    """
+    Check a field/node identifier is usable as a Firestore document ID
+
+    Args:
+        value: Identifier from the request
+        name: Name used in the error message
+
+    Returns:
+        The identifier as a string
+
+    Raises:
+        ValueError: If the identifier is not 1-64 characters of [A-Za-z0-9_-]
+    """
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"'{name}' must be a string or integer")
+    value = str(value)
+    if not _ID_PATTERN.match(value):
+        raise ValueError(f"Invalid '{name}': {value!r} (use 1-64 characters of A-Z, a-z, 0-9, _ and -)")
+    return value
+
+
+def resolve_ids(data):
+    """
+    Get the (field_id, node_id) a reading belongs to
+
+    Readings without a field_id go to DEFAULT_FIELD_ID so existing clients keep
+    writing to fields/field_1.
+
+    Args:
+        data: Request dictionary
+
+    Returns:
+        Tuple of (field_id, node_id or None)
+    """
+    field_id = data.get("field_id")
+    node_id = data.get("node_id")
+    field_id = DEFAULT_FIELD_ID if field_id is None else validate_id(field_id, "field_id")
+    node_id = None if node_id is None else validate_id(node_id, "node_id")
+    return field_id, node_id
+
+
+class FieldRouter:
+    """Fan a scored reading out to its field, node and time-series documents"""
+
+    def __init__(self, sink, shards=DEFAULT_SHARDS, collection="fields"):
+        """
+        Args:
+            sink: Object with put(path, data), e.g. a WriteBehindQueue
+            shards: Number of prefixes used to spread time-series document IDs
+            collection: Top-level collection holding the field documents
+        """
+        self.sink = sink
+        self.shards = max(1, shards)
+        self.collection = collection
+
+    def reading_id(self, node_id, timestamp_ms):
+        """
+        Unique, shard-prefixed ID for a time-series document
+
+        Format: "{shard:02x}-{timestamp_ms:013d}-{random}". The shard is derived
+        from the node so one node's readings stay in timestamp order within
+        their shard, while different nodes spread across shards. Readings
+        without a node get a random shard, so they don't all append to one.
+        """
+        if node_id is None:
+            shard = random.randrange(self.shards)
+        else:
+            shard = zlib.crc32(str(node_id).encode()) % self.shards
+        return f"{shard:02x}-{timestamp_ms:013d}-{uuid.uuid4().hex[:8]}"
+
+    def route(self, field_id, node_id, record, timestamp_ms=None):
+        """
+        Queue the writes for one scored reading
+
+        Args:
+            field_id: Field the reading belongs to
+            node_id: Reporting node (None if unknown)
+            record: Fields to store (sensor values and the decision)
+            timestamp_ms: Reading time in epoch milliseconds (default or invalid: now)
+
+        Returns:
+            True if every write was accepted by the sink
+        """
+        if isinstance(timestamp_ms, bool) or not isinstance(timestamp_ms, (int, float)) or not 0 <= timestamp_ms < 1e13:
+            timestamp_ms = time.time() * 1000
+        timestamp_ms = int(timestamp_ms)
+        field_path = f"{self.collection}/{field_id}"
+        latest = dict(record, field_id=field_id, updated_at=timestamp_ms)
+        if node_id is not None:
+            latest["node_id"] = node_id
+
+        ok = self.sink.put(field_path, latest)
+        if node_id is not None:
+            ok &= self.sink.put(f"{field_path}/nodes/{node_id}", latest)
+        ok &= self.sink.put(
+            f"{field_path}/readings/{self.reading_id(node_id, timestamp_ms)}",
+            dict(latest, timestamp=timestamp_ms)
+        )
+        return bool(ok)
@@ -0,0 +1,671 @@
+"""
+Fleet simulator for scale testing ingest.
+
+Models N virtual ground nodes spread over a few fields and drives one of the
+ingest paths with their readings at a controlled aggregate rate from a single
+asyncio event loop:
+
+    http      POST /predict (or /predict/batch) over keep-alive connections
+    rtdb      multi-location updates into a local RTDB stand-in (in memory,
+              or --backend sqlite shared with other processes) or the real
+              database (--backend firebase)
+    gateway   UDP datagrams to a running gateway.py, or to one started
+              in-process (--loopback)
+
+The readings follow a simple, correlated model instead of independent random
+numbers:
+
+    soil        dries out at a per-node rate scaled by the vapour pressure
+                deficit, is irrigated back up when it reaches the node's
+                trigger level, and rises with rain falling on its field
+    weather     daily temperature/humidity/light cycle per field plus each
+                node's microclimate; fields turn cloudy and rain at random
+    radio       every node reports every --interval seconds with +-jitter;
+                packets are lost in bursts (Gilbert-Elliott channel with an
+                average loss of --loss and mean burst length --burst)
+
+Readings carry simulated timestamps. With --rate above the fleet's natural
+rate (nodes / interval), simulated time runs faster than real time, so a day
+of readings can be replayed in minutes while the feature store still sees
+--interval spacing per node.
+
+Usage:
+    python3 fleet_sim.py http --nodes 5000 --rate 2000 --duration 30 [--batch 50]
+    python3 fleet_sim.py rtdb --nodes 5000 --rate 5000 --duration 30 [--export sim_export.json]
+    python3 fleet_sim.py gateway --nodes 5000 --rate 3000 --duration 30 --loopback
+
+Common options: --fields, --interval, --jitter, --loss, --burst, --seed,
+--output sim.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+from dispatcher import percentile
+from lora_frame import encode_frame
+from lora_payload import LIGHT_LEVELS
+
+REPORT_INTERVAL_S = 15.0
+ADC_MAX = 4095
+# Soil ADC units one millimetre of rain adds
+RAIN_SOIL_PER_MM = 40.0
+
+
+def vapour_pressure_deficit(temperature, humidity):
+    """VPD in kPa for arrays (same formula as feature_store.vapour_pressure_deficit)"""
+    saturation = 0.6108 * np.exp(17.27 * temperature / (temperature + 237.3))
+    return saturation * (1.0 - humidity / 100.0)
+
+
+class Fleet:
+    """State of every virtual node and field, advanced in NumPy"""
+
+    def __init__(self, nodes, fields=8, interval=15.0, jitter=2.0, loss=0.02, burst=4.0, seed=42,
+                 start_ms=None):
+        """
+        Args:
+            nodes: Virtual ground nodes
+            fields: Fields the nodes are spread over (round robin)
+            interval: Seconds between a node's readings
+            jitter: Maximum random offset of each transmission in seconds
+            loss: Long-run fraction of packets lost
+            burst: Mean length of a loss burst in packets (1 = independent losses)
+            seed: Random seed; the same seed gives the same readings
+            start_ms: Simulated start time in epoch milliseconds (default: now)
+        """
+        self.nodes = nodes
+        self.fields = fields
+        self.interval = interval
+        self.jitter = min(jitter, interval / 2)
+        self.start_ms = int(time.time() * 1000) if start_ms is None else start_ms
+        self.rng = rng = np.random.default_rng(seed)
+
+        self.field = np.arange(nodes) % fields
+        self.soil = rng.uniform(900, 2600, nodes)
+        self.drying_per_h = rng.uniform(15, 60, nodes)        # ADC units per hour at 1 kPa VPD
+        self.trigger = rng.uniform(380, 520, nodes)          # irrigation starts below this
+        self.pH = rng.uniform(5.8, 7.2, nodes)
+        self.temperature_offset = rng.normal(0, 0.8, nodes)
+        self.humidity_offset = rng.normal(0, 3.0, nodes)
+        self.seq = rng.integers(0, 65536, nodes)
+        self.last_t = np.zeros(nodes)
+        self.next_t = rng.uniform(0, interval, nodes)        # simulated seconds since start
+
+        self.field_temperature = rng.uniform(-3, 3, fields)
+        self.field_humidity = rng.uniform(-8, 8, fields)
+        self.cloudy = np.zeros(fields, dtype=bool)
+        self.raining = np.zeros(fields, dtype=bool)
+        self.rain_mm = np.zeros(fields)                      # cumulative per field
+        self.rain_seen = np.zeros(nodes)                     # field rain_mm at the node's last reading
+        self.weather_t = 0.0
+
+        # Gilbert-Elliott channel: bad state loses every packet
+        self.p_recover = 1.0 / max(1.0, burst)
+        self.p_fail = min(1.0, loss * self.p_recover / (1.0 - loss)) if loss < 1 else 1.0
+        self.bad = rng.random(nodes) < loss
+        self.stats = {"readings": 0, "lost": 0, "irrigations": 0}
+
+    @property
+    def natural_rate(self):
+        """Readings per second the fleet produces in real time"""
+        return self.nodes / self.interval
+
+    def _advance_weather(self, t):
+        """Move cloud and rain states forward to simulated time t (per simulated minute)"""
+        rng = self.rng
+        while self.weather_t + 60 <= t:
+            self.weather_t += 60
+            flip = rng.random(self.fields)
+            self.cloudy = np.where(self.cloudy, flip >= 1 / 180, flip < 1 / 360)
+            # Cloudy spells last ~3 h and come every ~6 h; about half of them bring ~30 min of rain
+            start = rng.random(self.fields) < 1 / 240
+            self.raining = self.cloudy & (self.raining & (rng.random(self.fields) >= 1 / 30) | start)
+            self.rain_mm += np.where(self.raining, rng.uniform(0.01, 0.08, self.fields), 0.0)
+
+    def due(self, t):
+        """
+        Readings of every node whose transmission time has come by simulated time t
+
+        Returns:
+            Dictionary of arrays (node, field, timestamp_ms, seq, soil, temperature,
+            humidity, pH, sunny, rainfall, lost), in transmission order
+        """
+        nodes = np.flatnonzero(self.next_t <= t)
+        if not len(nodes):
+            return None
+        self._advance_weather(t)
+        rng = self.rng
+        sent = self.next_t[nodes]
+        order = np.argsort(sent, kind="stable")
+        nodes, sent = nodes[order], sent[order]
+        field = self.field[nodes]
+        n = len(nodes)
+
+        absolute_s = self.start_ms / 1000.0 + sent
+        day = np.sin(2 * np.pi * (absolute_s / 86400.0 - 0.3))
+        cloudy = self.cloudy[field]
+        temperature = (22 + 7 * day + self.field_temperature[field] + self.temperature_offset[nodes]
+                       - 2.0 * cloudy + rng.normal(0, 0.15, n))
+        humidity = np.clip(60 - 15 * day + self.field_humidity[field] + self.humidity_offset[nodes]
+                           + 12.0 * cloudy + rng.normal(0, 1.0, n), 5, 100)
+
+        hours = (sent - np.where(self.last_t[nodes] > 0, self.last_t[nodes], sent)) / 3600.0
+        vpd = vapour_pressure_deficit(temperature, humidity)
+        rain = self.rain_mm[field] - self.rain_seen[nodes]
+        soil = self.soil[nodes] - self.drying_per_h[nodes] * (0.3 + vpd) * hours + RAIN_SOIL_PER_MM * rain
+        irrigate = soil < self.trigger[nodes]
+        soil = np.where(irrigate, rng.uniform(2200, 2800, n), np.minimum(soil, ADC_MAX))
+        self.soil[nodes] = soil
+        self.rain_seen[nodes] = self.rain_mm[field]
+        self.last_t[nodes] = sent
+        self.next_t[nodes] = sent + self.interval + rng.uniform(-self.jitter, self.jitter, n)
+
+        self.seq[nodes] = (self.seq[nodes] + 1) & 0xFFFF
+        bad = self.bad[nodes]
+        bad = np.where(bad, rng.random(n) >= self.p_recover, rng.random(n) < self.p_fail)
+        self.bad[nodes] = bad
+
+        self.stats["readings"] += n
+        self.stats["lost"] += int(bad.sum())
+        self.stats["irrigations"] += int(irrigate.sum())
+        return {
+            "node": nodes,
+            "field": field,
+            "timestamp_ms": (absolute_s * 1000).astype(np.int64),
+            "seq": self.seq[nodes].copy(),
+            "soil": np.clip(np.rint(soil + rng.normal(0, 3, n)), 0, ADC_MAX).astype(np.int64),
+            "temperature": np.round(temperature, 1),
+            "humidity": np.round(humidity, 1),
+            "pH": np.round(self.pH[nodes] + rng.normal(0, 0.02, n), 2),
+            "sunny": (day > 0) & ~cloudy,
+            "rainfall": np.round(rain, 1),
+            "lost": bad,
+        }
+
+
+def to_readings(batch):
+    """API request dictionaries of the delivered readings of a batch"""
+    keep = ~batch["lost"]
+    columns = {name: batch[name][keep].tolist() for name in
+               ("node", "field", "timestamp_ms", "seq", "soil", "temperature", "humidity", "pH", "sunny",
+                "rainfall")}
+    sunny, dark = LIGHT_LEVELS["Sunny"], LIGHT_LEVELS["Dark"]
+    return [{
+        "soil": soil,
+        "light": sunny if is_sunny else dark,
+        "temperature": temperature,
+        "humidity": humidity,
+        "pH": pH,
+        "rainfall": rainfall,
+        "field_id": f"field_{field + 1}",
+        "node_id": f"node_{node}",
+        "seq": seq,
+        "timestamp": timestamp_ms,
+    } for node, field, timestamp_ms, seq, soil, temperature, humidity, pH, is_sunny, rainfall in zip(
+        *(columns[name] for name in ("node", "field", "timestamp_ms", "seq", "soil", "temperature",
+                                     "humidity", "pH", "sunny", "rainfall")))]
+
+
+def to_payloads(batch, payload="frame"):
+    """
+    Radio payloads of the delivered readings of a batch
+
+    Args:
+        payload: "frame" (16-byte binary frame), "hex" (frame as stored in RTDB)
+            or "text" (createPayload() format)
+    """
+    keep = ~batch["lost"]
+    rows = zip(*(batch[name][keep].tolist() for name in
+                 ("node", "seq", "humidity", "temperature", "soil", "pH", "sunny")))
+    if payload == "text":
+        return [f"humidity:{h:.1f},temperature:{t:.1f},moisture:{s},pH:{p:.2f},light:{'Sunny' if sun else 'Dark'}"
+                .encode() for _, _, h, t, s, p, sun in rows]
+    frames = [encode_frame(node, seq, h, t, s, p, sun) for node, seq, h, t, s, p, sun in rows]
+    return [f.hex() for f in frames] if payload == "hex" else frames
+
+
+class LatencyRecorder:
+    """Delivered/failed counters and latencies (ms) of one target"""
+
+    def __init__(self):
+        self.delivered = self.failed = self.shed = self.requests = 0
+        self.latencies = []
+        self.statuses = {}
+
+    def summary(self, elapsed):
+        values = sorted(self.latencies)
+        return {
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "shed": self.shed,
+            "requests": self.requests,
+            "delivered_per_s": round(self.delivered / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(values, 50), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "max_ms": round(values[-1], 3) if values else 0.0,
+            "statuses": self.statuses,
+        }
+
+
+class HttpConnection:
+    """One HTTP/1.1 keep-alive connection on asyncio streams (JSON POST only)"""
+
+    def __init__(self, host, port, timeout=10.0):
+        self.host, self.port, self.timeout = host, port, timeout
+        self._reader = self._writer = None
+
+    async def post(self, path, body):
+        """
+        Returns:
+            (status code, response body)
+        """
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+        self._writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        try:
+            return await asyncio.wait_for(self._response(), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _response(self):
+        status = int((await self._reader.readline()).split(b" ", 2)[1])
+        length, close = None, False
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.lower() == "close":
+                close = True
+        body = await (self._reader.readexactly(length) if length is not None else self._reader.read())
+        if close or length is None:
+            self.close()
+        return status, body
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class HttpTarget:
+    """POST readings to the prediction API from `connections` concurrent connections"""
+
+    def __init__(self, url, connections=16, batch=0, max_pending=20000):
+        """
+        Args:
+            url: /predict URL; with batch > 0 requests go to <url>/batch
+            connections: Requests in flight
+            batch: Readings per /predict/batch request (0 = one /predict per reading)
+            max_pending: Readings queued before new ones are shed (counted, not sent)
+        """
+        from urllib.parse import urlsplit
+
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.path = parts.path.rstrip("/") + ("/batch" if batch else "")
+        self.connections = connections
+        self.batch = batch
+        self.max_pending = max_pending
+        self.stats = LatencyRecorder()
+        self._queue = None
+        self._pending = 0
+        self._workers = []
+
+    def describe(self):
+        return f"http://{self.host}:{self.port}{self.path} ({self.connections} connections)"
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.connections)]
+
+    def send(self, batch):
+        readings = to_readings(batch)
+        if self._pending + len(readings) > self.max_pending:
+            self.stats.shed += len(readings)
+            return
+        now = time.perf_counter()
+        size = self.batch or 1
+        for i in range(0, len(readings), size):
+            group = readings[i:i + size]
+            self._pending += len(group)
+            self._queue.put_nowait((now, group if self.batch else group[0], len(group)))
+
+    async def _worker(self):
+        connection = HttpConnection(self.host, self.port)
+        try:
+            while True:
+                queued, body, count = await self._queue.get()
+                try:
+                    status, _ = await connection.post(self.path, json.dumps(body).encode())
+                    ok = 200 <= status < 300
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    status, ok = "error", False
+                stats = self.stats
+                stats.requests += 1
+                stats.statuses[str(status)] = stats.statuses.get(str(status), 0) + 1
+                if ok:
+                    stats.delivered += count
+                    stats.latencies.append((time.perf_counter() - queued) * 1000)
+                else:
+                    stats.failed += count
+                self._pending -= count
+                self._queue.task_done()
+        finally:
+            connection.close()
+
+    async def close(self, timeout=30.0):
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠ {self._pending} readings still queued after {timeout:g} s")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        return {}
+
+
+class RtdbTarget:
+    """Write readings into the Realtime Database as the ground node's gateway would"""
+
+    def __init__(self, backend="local", path="/sensor_data", payload="json", batch=500, in_flight=8,
+                 latency=0.0, export=None):
+        """
+        Args:
+            backend: "local" (in memory), "sqlite" (RTDB_SQLITE_PATH) or "firebase", see storage.py
+            path: Parent of one child per reading, keyed by push ID
+            payload: "json" (reading dictionary), "text" or "hex" (raw LoRa payload)
+            batch: Children per multi-location update
+            in_flight: Updates running at once (in the default thread pool)
+            latency: Emulated round-trip seconds of the local backend
+            export: Write a local database to this JSON file at the end
+        """
+        from local_rtdb import LocalRealtimeDatabase, PushIdGenerator
+        from storage import realtime_database
+
+        if backend == "local":
+            self.db = LocalRealtimeDatabase(latency=latency)
+        else:
+            self.db = realtime_database(backend)
+        self.backend = backend
+        self.path = path
+        self.payload = payload
+        self.batch = max(1, batch)
+        self.in_flight = max(1, in_flight)
+        self.export = export
+        self.push_id = PushIdGenerator()
+        self.stats = LatencyRecorder()
+        self._running = set()
+
+    def describe(self):
+        return f"{self.backend} RTDB {self.path} ({self.payload}, {self.batch} children per update)"
+
+    async def start(self):
+        self._reference = self.db.reference(self.path)
+
+    def send(self, batch):
+        keep = ~batch["lost"]
+        timestamps = batch["timestamp_ms"][keep].tolist()
+        values = to_readings(batch) if self.payload == "json" else to_payloads(batch, self.payload)
+        if self.payload == "text":
+            values = [v.decode() for v in values]
+        children = {self.push_id(ms): value for ms, value in zip(timestamps, values)}
+        items = list(children.items())
+        loop = asyncio.get_running_loop()
+        for i in range(0, len(items), self.batch):
+            group = dict(items[i:i + self.batch])
+            if len(self._running) >= self.in_flight:
+                self.stats.shed += len(group)
+                continue
+            task = loop.create_task(self._update(group))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _update(self, children):
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._reference.update, children)
+        except Exception as e:
+            self.stats.failed += len(children)
+            self.stats.statuses[type(e).__name__] = self.stats.statuses.get(type(e).__name__, 0) + 1
+            return
+        self.stats.requests += 1
+        self.stats.delivered += len(children)
+        self.stats.latencies.append((time.perf_counter() - started) * 1000)
+
+    async def close(self, timeout=30.0):
+        if self._running:
+            await asyncio.wait(list(self._running), timeout=timeout)
+        result = {}
+        if self.backend != "firebase":
+            result["database"] = dict(self.db.stats)
+            if self.export:
+                size = self.db.export(self.export)
+                result["export"] = {"path": self.export, "mb": round(size / 2**20, 2)}
+                print(f"💾 Exported {self.path} to {self.export} ({size / 2**20:.1f} MB)")
+        return result
+
+
+class _Datagrams(asyncio.DatagramProtocol):
+    def __init__(self, stats):
+        self.stats = stats
+
+    def error_received(self, exc):
+        self.stats.failed += 1
+
+
+class GatewayTarget:
+    """Send radio payloads as UDP datagrams, one per reading"""
+
+    def __init__(self, address=None, payload="frame", loopback=False, model=None):
+        """
+        Args:
+            address: (host, port) of a running gateway.py udp
+            payload: "frame" (binary) or "text"
+            loopback: Start a gateway in this process on 127.0.0.1 instead
+            model: Model file for the loopback gateway (default: scoring.MODEL_PATH)
+        """
+        self.address = address
+        self.payload = payload
+        self.loopback = loopback
+        self.model = model
+        self.gateway = None
+        self.stats = LatencyRecorder()
+        self._transport = None
+
+    def describe(self):
+        where = "in-process gateway" if self.loopback else "udp://%s:%d" % self.address
+        return f"{where} ({self.payload} payloads)"
+
+    async def start(self):
+        if self.loopback:
+            from gateway import Gateway, open_udp, read_udp
+            from scoring import MODEL_PATH, Scorer
+
+            self.gateway = Gateway(Scorer.from_file(self.model or MODEL_PATH))
+            sock = open_udp("127.0.0.1", 0)
+            self.address = sock.getsockname()
+            threading.Thread(target=read_udp, args=(self.gateway, sock), daemon=True).start()
+            threading.Thread(target=self.gateway.run, daemon=True).start()
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _Datagrams(self.stats), remote_addr=self.address)
+
+    def send(self, batch):
+        if int(batch["node"].max()) > 0xFFFF:
+            raise ValueError("Binary frames carry 16-bit node ids: use at most 65536 nodes")
+        for datagram in to_payloads(batch, self.payload):
+            self._transport.sendto(datagram)
+            self.stats.delivered += 1
+        self.stats.requests = self.stats.delivered
+
+    async def close(self, timeout=30.0):
+        self._transport.close()
+        if self.gateway is None:
+            return {}
+        # Let the reader thread pick up what is still in the socket, then wait for scoring
+        deadline = time.monotonic() + timeout
+        last = -1
+        while time.monotonic() < deadline:
+            report = self.gateway.report()
+            if report["received"] == last and self.gateway.drain(0.1):
+                break
+            last = report["received"]
+            await asyncio.sleep(0.2)
+        self.gateway.stop()
+        return {"gateway": self.gateway.report()}
+
+
+async def drive(fleet, target, rate=None, duration=30.0, tick=0.01):
+    """
+    Run the fleet against a target for `duration` seconds of real time
+
+    Args:
+        fleet: Fleet to simulate
+        target: HttpTarget, RtdbTarget or GatewayTarget
+        rate: Aggregate readings per second (default: the fleet's natural rate)
+        duration: Real seconds to run
+        tick: Seconds between scheduling rounds
+
+    Returns:
+        Results dictionary
+    """
+    speed = (rate or fleet.natural_rate) / fleet.natural_rate
+    await target.start()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    next_report = REPORT_INTERVAL_S
+    rounds = late = 0
+    while True:
+        elapsed = loop.time() - started
+        if elapsed >= duration:
+            break
+        batch = fleet.due(elapsed * speed)
+        if batch is not None:
+            target.send(batch)
+        rounds += 1
+        if elapsed >= next_report:
+            next_report += REPORT_INTERVAL_S
+            print(f"  {elapsed:5.0f} s  {fleet.stats['readings']} readings, {target.stats.delivered} delivered, "
+                  f"{target.stats.shed} shed, {target.stats.failed} failed")
+        # Fixed cadence: a slow round shortens the next sleep instead of shifting the schedule
+        delay = started + rounds * tick - loop.time()
+        if delay < -tick:
+            late += 1
+        await asyncio.sleep(max(0.0, delay))
+    send_elapsed = loop.time() - started
+    extra = await target.close()
+    elapsed = loop.time() - started
+
+    result = {
+        "nodes": fleet.nodes,
+        "fields": fleet.fields,
+        "interval_s": fleet.interval,
+        "speed": round(speed, 2),
+        "simulated_hours": round(send_elapsed * speed / 3600, 3),
+        "offered_per_s": round(fleet.stats["readings"] / send_elapsed, 1),
+        "fleet": dict(fleet.stats),
+        "loss_rate": round(fleet.stats["lost"] / fleet.stats["readings"], 4) if fleet.stats["readings"] else 0.0,
+        "late_rounds": late,
+        "target": target.stats.summary(elapsed),
+    }
+    result.update(extra)
+    return result
+
+
+def print_result(result):
+    fleet, target = result["fleet"], result["target"]
+    print("\n📈 Fleet summary")
+    print(f"  Simulated: {result['simulated_hours']} h of {result['nodes']} nodes at x{result['speed']} speed")
+    print(f"  Offered:   {fleet['readings']} readings ({result['offered_per_s']}/s), "
+          f"{fleet['lost']} lost on the radio ({result['loss_rate'] * 100:.1f}%), {fleet['irrigations']} irrigations")
+    print(f"  Target:    {target['delivered']} delivered ({target['delivered_per_s']}/s), "
+          f"{target['shed']} shed, {target['failed']} failed")
+    if target["p50_ms"]:
+        print(f"  Latency:   p50 {target['p50_ms']} ms, p99 {target['p99_ms']} ms, max {target['max_ms']} ms")
+    if "gateway" in result:
+        gateway = result["gateway"]
+        print(f"  Gateway:   {gateway['scored']} scored of {gateway['received']} received, "
+              f"decision p50 {gateway['p50_ms']} ms, p99 {gateway['p99_ms']} ms")
+    if result["late_rounds"]:
+        print(f"  ⚠ {result['late_rounds']} scheduling rounds ran late (the simulator itself is saturated)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of ground nodes against an ingest path")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--fields", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=15.0, help="Seconds between a node's readings")
+    parser.add_argument("--jitter", type=float, default=2.0, help="Max transmission offset in seconds")
+    parser.add_argument("--loss", type=float, default=0.02, help="Average packet loss")
+    parser.add_argument("--burst", type=float, default=4.0, help="Mean packets per loss burst")
+    parser.add_argument("--rate", type=float, help="Aggregate readings/s (default: nodes / interval)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Real seconds to run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON")
+    sub = parser.add_subparsers(dest="target", required=True)
+
+    http_mode = sub.add_parser("http", help="POST readings to the prediction API")
+    http_mode.add_argument("--url", default="http://127.0.0.1:5001/predict")
+    http_mode.add_argument("--connections", type=int, default=16)
+    http_mode.add_argument("--batch", type=int, default=0, help="Readings per /predict/batch request")
+
+    rtdb_mode = sub.add_parser("rtdb", help="Write readings into the Realtime Database")
+    rtdb_mode.add_argument("--backend", choices=("local", "sqlite", "firebase"), default="local",
+                           help="sqlite: shared file RTDB_SQLITE_PATH, e.g. read by fetch_and_predict.py")
+    rtdb_mode.add_argument("--path", default="/sensor_data")
+    rtdb_mode.add_argument("--payload", choices=("json", "text", "hex"), default="json")
+    rtdb_mode.add_argument("--batch", type=int, default=500, help="Children per update")
+    rtdb_mode.add_argument("--latency", type=float, default=0.0, help="Emulated round trip (local backend)")
+    rtdb_mode.add_argument("--export", help="Write the local database as JSON at the end")
+
+    gateway_mode = sub.add_parser("gateway", help="Send radio payloads to the gateway over UDP")
+    gateway_mode.add_argument("--to", default="127.0.0.1:5005", help="host:port of gateway.py udp")
+    gateway_mode.add_argument("--loopback", action="store_true", help="Run a gateway in this process")
+    gateway_mode.add_argument("--payload", choices=("frame", "text"), default="frame")
+    args = parser.parse_args()
+
+    if args.target == "http":
+        target = HttpTarget(args.url, args.connections, args.batch)
+    elif args.target == "rtdb":
+        target = RtdbTarget(args.backend, args.path, args.payload, args.batch, latency=args.latency,
+                            export=args.export)
+    else:
+        host, port = args.to.rsplit(":", 1)
+        target = GatewayTarget((host, int(port)), args.payload, args.loopback)
+
+    fleet = Fleet(args.nodes, args.fields, args.interval, args.jitter, args.loss, args.burst, args.seed)
+    rate = args.rate or fleet.natural_rate
+    print("=" * 60)
+    print(f"  Fleet simulator: {args.nodes} nodes → {target.describe()}")
+    print(f"  {rate:g} readings/s (natural rate {fleet.natural_rate:g}/s), {args.duration:g} s")
+    print("=" * 60)
+
+    try:
+        result = asyncio.run(drive(fleet, target, rate, args.duration))
+    except KeyboardInterrupt:
+        print("\n🛑 Stopped")
+        return 1
+    print_result(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    print("\n" + "=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,481 @@
+"""
+Gateway daemon: score LoRa readings next to the ground node.
+
+Reads the ground node's "Received: ..." lines from its USB serial port (or
+readings sent as UDP datagrams), decodes them, scores them in-process with the
+loaded model and hands the results to the Firestore write-behind queue. The
+irrigation decision no longer waits for RTDB, polling or an HTTP hop - it is
+made milliseconds after the line arrives; cloud writes happen in the background.
+
+Usage:
+    python3 gateway.py serial /dev/ttyUSB0 [--baud 115200] [--record capture.log]
+    python3 gateway.py udp [--host 0.0.0.0] [--port 5005]
+    python3 gateway.py replay sample_traffic.log --loopback udp|pty
+    python3 gateway.py replay capture.log --to 127.0.0.1:5005 [--interval 0.1]
+
+Common options: --field-id, --backend firebase|local|none, --batch-size, --verbose
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+from anomaly import ANOMALY_DETECTION, CHANNELS as ANOMALY_CHANNELS, AnomalyDetector
+from dispatcher import percentile
+from field_routing import DEFAULT_FIELD_ID, FieldRouter, resolve_ids, validate_id
+from lora_frame import FRAME_SIZE, MAGIC, decode_any
+from scoring import MODEL_PATH, Scorer, build_request
+from storage import firestore_client
+from write_behind import WriteBehindQueue
+
+PREFIX = b"Received: "
+UDP_PORT = int(os.environ.get("GATEWAY_UDP_PORT", 5005))
+SERIAL_BAUD = 115200
+
+# Readings scored per model call when lines arrive faster than they are scored
+BATCH_SIZE = 64
+
+# Latency samples kept for the percentile report
+LATENCY_WINDOW = 10000
+
+
+def extract_payload(line, require_prefix=False):
+    """
+    Get the LoRa payload out of one line or datagram
+
+    Args:
+        line: Raw bytes (a serial line without its newline, or a UDP datagram)
+        require_prefix: Only accept "Received: ..." lines (the ground node's
+            serial port also carries log messages)
+
+    Returns:
+        The payload (bytes for a raw binary frame, str otherwise), or None if
+        the line is not a reading
+    """
+    if len(line) == FRAME_SIZE and line[0] == MAGIC and not require_prefix:
+        return bytes(line)
+    line = line.rstrip(b"\r\n")
+    if line.startswith(PREFIX):
+        line = line[len(PREFIX):]
+    elif require_prefix:
+        return None
+    text = line.decode("ascii", errors="replace").strip()
+    return text or None
+
+
+class Gateway:
+    """Micro-batching scorer fed by one or more reader threads"""
+
+    def __init__(self, scorer, router=None, field_id=DEFAULT_FIELD_ID, batch_size=BATCH_SIZE,
+                 on_decision=None, anomaly_detector=None):
+        """
+        Args:
+            scorer: scoring.Scorer with the loaded model
+            router: field_routing.FieldRouter for upstream writes (None = don't forward)
+            field_id: Field the gateway's readings belong to
+            batch_size: Maximum readings scored per model call
+            on_decision: Optional callback receiving each decision dictionary
+            anomaly_detector: anomaly.AnomalyDetector screening readings before
+                scoring (default: a new one when ANOMALY_DETECTION is on)
+        """
+        self.scorer = scorer
+        self.router = router
+        self.field_id = validate_id(field_id, "field_id")
+        self.batch_size = max(1, batch_size)
+        self.on_decision = on_decision
+        if anomaly_detector is None and ANOMALY_DETECTION:
+            anomaly_detector = AnomalyDetector()
+        self.anomaly_detector = anomaly_detector
+
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._stats = {"received": 0, "ignored": 0, "invalid": 0, "scored": 0,
+                       "anomalous": 0, "forwarded": 0, "dropped_upstream": 0, "batches": 0}
+        self._started = time.perf_counter()
+
+    def submit(self, line, received=None, require_prefix=False):
+        """Queue one raw line/datagram for scoring (thread safe)"""
+        payload = extract_payload(line, require_prefix)
+        with self._lock:
+            self._stats["received" if payload is not None else "ignored"] += 1
+        if payload is not None:
+            self._queue.put((payload, time.perf_counter() if received is None else received,
+                             int(time.time() * 1000)))
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Score queued readings until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.2)]
+            except queue.Empty:
+                continue
+            # Whatever queued up while the last batch was scored goes in one call
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.process(batch)
+
+    def drain(self, timeout=5.0):
+        """Wait until every queued reading has been scored"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return self._queue.unfinished_tasks == 0
+
+    def process(self, batch):
+        """
+        Decode, score and forward a batch of (payload, received, timestamp_ms)
+
+        Returns:
+            List of decision dictionaries for the readings that scored
+        """
+        requests, received = [], []
+        invalid = 0
+        for payload, started, timestamp_ms in batch:
+            try:
+                data = build_request(decode_any(payload))
+            except ValueError as e:
+                invalid += 1
+                print(f"⚠ Skipping unreadable payload {payload!r}: {e}")
+                continue
+            data.setdefault("field_id", self.field_id)
+            data["timestamp"] = timestamp_ms
+            requests.append(data)
+            received.append(started)
+
+        X, valid, errors = self.scorer.encoder.encode_batch(requests)
+        for error in errors:
+            print(f"⚠ Rejected reading {requests[error['index']]}: {error['error']}")
+
+        ids = [resolve_ids(requests[i]) for i in valid]
+        dropped = anomalous = 0
+        found = {}
+        if self.anomaly_detector is not None and valid:
+            # DHT failures arrive as 0 °C / 0 %; impute or drop them before the model sees them
+            columns = [self.scorer.encoder.features.index(name) for name in ANOMALY_CHANNELS]
+            passed, found = self.anomaly_detector.screen_matrix(X, columns, ids)
+            anomalous = len(found)
+            for row, anomalies in found.items():
+                imputed = {a["sensor"]: a["imputed"] for a in anomalies if "imputed" in a}
+                if imputed:
+                    requests[valid[row]].update(imputed)
+            if not passed.all():
+                dropped = len(valid) - int(passed.sum())
+                X = X[passed]
+                found = {valid[row]: found[row] for row in found if passed[row]}
+                ids = [ids[row] for row in range(len(valid)) if passed[row]]
+                valid = [valid[row] for row in range(len(valid)) if passed[row]]
+            else:
+                found = {valid[row]: anomalies for row, anomalies in found.items()}
+
+        decisions = []
+        if valid:
+            predictions, confidences, reasons = self.scorer.score_matrix(
+                X, [field_id for field_id, _ in ids])
+            decided = time.perf_counter()
+            for i, (field_id, node_id), prediction, confidence, code in zip(
+                    valid, ids, predictions, confidences, reasons):
+                data = requests[i]
+                decision = {
+                    "field_id": field_id,
+                    "node_id": node_id,
+                    "seq": data.get("seq"),
+                    "irrigation_needed": int(prediction),
+                    "confidence": round(float(confidence), 2),
+                    "reason": self.scorer.rules.reason(code, data),
+                    "latency_ms": round((decided - received[i]) * 1000, 3),
+                }
+                if i in found:
+                    decision["anomalies"] = found[i]
+                decisions.append(decision)
+                if self.on_decision is not None:
+                    self.on_decision(decision)
+                self._forward(data, decision)
+
+        with self._lock:
+            self._stats["invalid"] += invalid + len(errors) + dropped
+            self._stats["anomalous"] += anomalous
+            self._stats["scored"] += len(decisions)
+            self._stats["batches"] += 1
+            self._latencies.extend(d["latency_ms"] for d in decisions)
+        for _ in batch:
+            self._queue.task_done()
+        return decisions
+
+    def _forward(self, data, decision):
+        """Queue a decision for Firestore (never blocks the scoring loop)"""
+        if self.router is None:
+            return
+        queued = self.router.route(decision["field_id"], decision["node_id"], {
+            "Soil": data.get("soil"),
+            "Light": data.get("light"),
+            "Temperature": data.get("temperature"),
+            "Humidity": data.get("humidity"),
+            "pH": data.get("pH"),
+            "Rainfall": data.get("rainfall", 0),
+            "irrigation_needed": decision["irrigation_needed"],
+            "Confidence": decision["confidence"],
+            "Reason": decision["reason"],
+            "Source": "gateway"
+        }, timestamp_ms=data["timestamp"])
+        with self._lock:
+            self._stats["forwarded" if queued else "dropped_upstream"] += 1
+
+    def report(self):
+        """
+        Counters and decision latency percentiles (receive → decision, ms)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        elapsed = time.perf_counter() - self._started
+        stats["elapsed_s"] = round(elapsed, 3)
+        stats["queued"] = self._queue.qsize()
+        for p in (50, 99):
+            stats[f"p{p}_ms"] = round(percentile(latencies, p), 3)
+        stats["max_ms"] = round(latencies[-1], 3) if latencies else 0.0
+        return stats
+
+    def print_report(self):
+        stats = self.report()
+        print("\n📈 Gateway summary")
+        print(f"  Lines:     {stats['received']} readings, {stats['ignored']} other lines, {stats['invalid']} invalid")
+        print(f"  Scored:    {stats['scored']} in {stats['batches']} batches")
+        print(f"  Anomalous: {stats['anomalous']} readings flagged, imputed or dropped")
+        print(f"  Upstream:  {stats['forwarded']} queued, {stats['dropped_upstream']} dropped")
+        print(f"  Latency:   p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms")
+
+
+def open_serial(path, baud=SERIAL_BAUD):
+    """
+    Open a serial device (or pseudo-terminal) in raw mode
+
+    Uses termios directly, so no pyserial is needed and a pty slave works the
+    same way as /dev/ttyUSB0.
+
+    Returns:
+        File descriptor of the opened device
+    """
+    import termios
+    import tty
+
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+    if os.isatty(fd):
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        speed = getattr(termios, f"B{baud}", None)
+        if speed is not None:
+            attrs[4] = attrs[5] = speed
+        attrs[2] |= termios.CLOCAL | termios.CREAD
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return fd
+
+
+def read_serial(gateway, fd, record=None):
+    """Reader thread: split the serial stream into lines and submit them"""
+    buffer = b""
+    while not gateway._stop.is_set():
+        try:
+            chunk = os.read(fd, 4096)
+        except OSError:
+            break  # device unplugged or pty closed
+        if not chunk:
+            break
+        received = time.perf_counter()
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if record is not None:
+                record.write(line.rstrip(b"\r") + b"\n")
+                record.flush()
+            gateway.submit(line, received, require_prefix=True)
+
+
+def open_udp(host="0.0.0.0", port=UDP_PORT):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.settimeout(0.5)
+    return sock
+
+
+def read_udp(gateway, sock):
+    """Reader thread: one datagram holds a binary frame or one or more text lines"""
+    while not gateway._stop.is_set():
+        try:
+            datagram, _ = sock.recvfrom(2048)
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        received = time.perf_counter()
+        if len(datagram) == FRAME_SIZE and datagram[0] == MAGIC:
+            gateway.submit(datagram, received)
+            continue
+        for line in datagram.splitlines():
+            gateway.submit(line, received)
+
+
+def open_upstream(backend):
+    """
+    Build the Firestore write path for the chosen backend
+
+    Returns:
+        FieldRouter backed by a WriteBehindQueue, or None when forwarding is off
+    """
+    if backend == "none":
+        return None
+    db = firestore_client(backend)
+    if db is None:
+        print("  Decisions will not be forwarded upstream")
+        return None
+    writer = WriteBehindQueue(db, max_pending=int(os.environ.get("FIRESTORE_MAX_PENDING", 10000)),
+                              flush_size=int(os.environ.get("FIRESTORE_FLUSH_SIZE", 200)),
+                              flush_interval=float(os.environ.get("FIRESTORE_FLUSH_INTERVAL", 1.0)),
+                              min_doc_interval=float(os.environ.get("FIRESTORE_MIN_DOC_INTERVAL", 1.0)))
+    return FieldRouter(writer, shards=int(os.environ.get("FIRESTORE_SHARDS", 16)))
+
+
+def read_capture(path, readings_only=False):
+    """
+    Lines of a recorded serial capture (as written by --record), as bytes
+
+    Args:
+        path: Capture file
+        readings_only: Keep only "Received: ..." lines (UDP carries readings,
+            not the ground node's console log)
+    """
+    with open(path, "rb") as f:
+        lines = [line.rstrip(b"\r\n") for line in f if line.strip()]
+    if readings_only:
+        lines = [line for line in lines if line.startswith(PREFIX)]
+    return lines
+
+
+def replay(lines, send, interval=0.0):
+    """Send recorded lines with an optional pause between them"""
+    for line in lines:
+        send(line)
+        if interval:
+            time.sleep(interval)
+
+
+def replay_loopback(gateway, lines, transport, interval=0.0):
+    """
+    Replay a capture through a real UDP socket or pseudo-terminal into the gateway
+
+    Exercises the same reader code as a live deployment: the capture is written
+    to a pty master (the gateway reads the slave like a serial port) or sent to
+    a UDP socket bound on 127.0.0.1.
+    """
+    scoring = threading.Thread(target=gateway.run, daemon=True)
+    scoring.start()
+    if transport == "pty":
+        master, slave = os.openpty()
+        fd = open_serial(os.ttyname(slave))
+        reader = threading.Thread(target=read_serial, args=(gateway, fd), daemon=True)
+        reader.start()
+        replay(lines, lambda line: os.write(master, line + b"\r\n"), interval)
+    else:
+        sock = open_udp("127.0.0.1", 0)
+        reader = threading.Thread(target=read_udp, args=(gateway, sock), daemon=True)
+        reader.start()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        target = sock.getsockname()
+        replay(lines, lambda line: sender.sendto(line, target), interval)
+
+    # Wait for the reader to pick up the tail of the capture, then for scoring
+    expected = len(lines)
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        stats = gateway.report()
+        if stats["received"] + stats["ignored"] >= expected and gateway.drain(0.1):
+            break
+        time.sleep(0.01)
+    gateway.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score ground node readings locally")
+    parser.add_argument("--field-id", default=DEFAULT_FIELD_ID, help="Field the readings belong to")
+    parser.add_argument("--backend", default=os.environ.get("FIRESTORE_BACKEND", "firebase"),
+                        choices=("firebase", "local", "none"), help="Where decisions are forwarded")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--verbose", action="store_true", help="Print every decision as a JSON line")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    serial_mode = sub.add_parser("serial", help="Read the ground node's USB serial port")
+    serial_mode.add_argument("device")
+    serial_mode.add_argument("--baud", type=int, default=SERIAL_BAUD)
+    serial_mode.add_argument("--record", help="Append every raw line to this capture file")
+
+    udp_mode = sub.add_parser("udp", help="Receive readings as UDP datagrams")
+    udp_mode.add_argument("--host", default="0.0.0.0")
+    udp_mode.add_argument("--port", type=int, default=UDP_PORT)
+
+    replay_mode = sub.add_parser("replay", help="Replay a recorded capture")
+    replay_mode.add_argument("capture")
+    replay_mode.add_argument("--loopback", choices=("udp", "pty"),
+                             help="Run a gateway in-process and replay into it")
+    replay_mode.add_argument("--to", help="Send the capture to a running UDP gateway (host:port)")
+    replay_mode.add_argument("--interval", type=float, default=0.0, help="Seconds between lines")
+    args = parser.parse_args()
+
+    if args.mode == "replay" and args.to:
+        host, port = args.to.rsplit(":", 1)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        lines = read_capture(args.capture, readings_only=True)
+        replay(lines, lambda line: sender.sendto(line, (host, int(port))), args.interval)
+        print(f"✓ Sent {len(lines)} lines to {args.to}")
+        return
+
+    scorer = Scorer.from_file(args.model)
+    print("Model loaded successfully!")
+    router = open_upstream(args.backend)
+    on_decision = (lambda d: print(json.dumps(d))) if args.verbose else None
+    gateway = Gateway(scorer, router, field_id=args.field_id, batch_size=args.batch_size,
+                      on_decision=on_decision)
+
+    try:
+        if args.mode == "replay":
+            transport = args.loopback or "udp"
+            lines = read_capture(args.capture, readings_only=transport == "udp")
+            replay_loopback(gateway, lines, transport, args.interval)
+        else:
+            if args.mode == "serial":
+                record = open(args.record, "ab") if args.record else None
+                fd = open_serial(args.device, args.baud)
+                reader = threading.Thread(target=read_serial, args=(gateway, fd, record), daemon=True)
+                print(f"📡 Reading {args.device} at {args.baud} baud")
+            else:
+                sock = open_udp(args.host, args.port)
+                reader = threading.Thread(target=read_udp, args=(gateway, sock), daemon=True)
+                print(f"📡 Listening for readings on udp://{args.host}:{args.port}")
+            reader.start()
+            print("  Press Ctrl+C to stop\n")
+            gateway.run()
+    except KeyboardInterrupt:
+        print("\n\n🛑 Gateway stopped")
+    finally:
+        gateway.stop()
+        gateway.print_report()
+        if router is not None:
+            router.sink.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,10 @@
 #define LORA_DIO0 2
 #define LORA_SYNC_WORD 0xF3
 
+// Binary frames from the forest node (see lora_frame.py)
+#define FRAME_MAGIC 0xA1
+#define FRAME_SIZE 16
+
 FirebaseData fbdo;
 FirebaseAuth auth;
 FirebaseConfig config;
@@ -68,9 +72,24 @@ void setup() {
 void loop() {
   int packetSize = LoRa.parsePacket();
   if (packetSize) {
+    uint8_t buffer[256];
+    int length = 0;
+    while (LoRa.available() && length < (int)sizeof(buffer)) {
+      buffer[length++] = LoRa.read();
+    }
+
+    // Binary frames are stored as hex; text payloads as-is
     String incoming = "";
-    while (LoRa.available()) {
-      incoming += (char)LoRa.read();
+    if (length == FRAME_SIZE && buffer[0] == FRAME_MAGIC) {
+      char hex[3];
+      for (int i = 0; i < length; i++) {
+        snprintf(hex, sizeof(hex), "%02x", buffer[i]);
+        incoming += hex;
+      }
+    } else {
+      for (int i = 0; i < length; i++) {
+        incoming += (char)buffer[i];
+      }
     }
 
     Serial.println("Received: " + incoming);
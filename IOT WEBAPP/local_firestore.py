@@ -0,0 +1,152 @@
+"""
+In-memory stand-in for the Firestore client.
+
+Implements the subset of google.cloud.firestore used by this project
+(collection/document references, set with merge, get, stream, batched writes)
+so the storage path can run and be benchmarked without credentials or network.
+"""
+
+import copy
+import threading
+import time
+import uuid
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+class DocumentSnapshot:
+    """Result of DocumentReference.get()"""
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def set(self, data, merge=False):
+        self._client._commit([("set", self.path, data, merge)])
+
+    def update(self, data):
+        self._client._commit([("update", self.path, data, True)])
+
+    def delete(self):
+        self._client._commit([("delete", self.path, None, False)])
+
+    def get(self):
+        return DocumentSnapshot(self, self._client._read(self.path))
+
+
+class CollectionReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = uuid.uuid4().hex[:20]
+        return DocumentReference(self._client, f"{self.path}/{document_id}")
+
+    def stream(self):
+        """Yield snapshots of the documents directly in this collection, ordered by id"""
+        for path in self._client._list(self.path):
+            ref = DocumentReference(self._client, path)
+            yield DocumentSnapshot(ref, self._client._read(path))
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def _add(self, op, reference, data, merge):
+        if len(self._writes) >= MAX_BATCH_WRITES:
+            raise ValueError(f"Maximum {MAX_BATCH_WRITES} writes allowed per batch")
+        self._writes.append((op, reference.path, data, merge))
+
+    def set(self, reference, data, merge=False):
+        self._add("set", reference, data, merge)
+
+    def update(self, reference, data):
+        self._add("update", reference, data, True)
+
+    def delete(self, reference):
+        self._add("delete", reference, None, False)
+
+    def commit(self):
+        self._client._commit(self._writes)
+        writes, self._writes = self._writes, []
+        return writes
+
+
+class LocalFirestore:
+    """
+    Thread-safe in-memory Firestore client
+
+    Every set()/commit() counts as one round trip in `stats`; `latency` seconds
+    are slept per round trip to emulate the network when benchmarking.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._docs = {}
+        self._lock = threading.Lock()
+        self.stats = {"commits": 0, "writes": 0}
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def document(self, path):
+        return DocumentReference(self, path)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def _commit(self, writes):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            for op, path, data, merge in writes:
+                if op == "delete":
+                    self._docs.pop(path, None)
+                    continue
+                if op == "update" and path not in self._docs:
+                    raise KeyError(f"No document to update: {path}")
+                if merge and path in self._docs:
+                    self._docs[path].update(copy.deepcopy(data))
+                else:
+                    self._docs[path] = copy.deepcopy(data)
+            self.stats["commits"] += 1
+            self.stats["writes"] += len(writes)
+
+    def _read(self, path):
+        with self._lock:
+            data = self._docs.get(path)
+            return copy.deepcopy(data) if data is not None else None
+
+    def _list(self, collection_path):
+        prefix = collection_path + "/"
+        with self._lock:
+            return sorted(p for p in self._docs if p.startswith(prefix) and "/" not in p[len(prefix):])
+
+    def to_dict(self):
+        """Snapshot of every document keyed by its full path"""
+        with self._lock:
+            return copy.deepcopy(self._docs)
@@ -0,0 +1,556 @@
+"""
+Local stand-ins for the Firebase Realtime Database.
+
+Implement the subset of firebase_admin.db used by this project (references,
+child, get/set/update/push/delete, listen and order_by_key queries with
+start_at, end_at and limit_to_first/last) so ingest can be simulated and
+benchmarked without credentials or network:
+
+    LocalRealtimeDatabase    in memory, for one process
+    SqliteRealtimeDatabase   a SQLite file (WAL) shared by the processes of
+                             one machine, e.g. a simulator writing readings
+                             and fetch_and_predict.py reading them
+
+The tree can be written out in the format of the console's "Export JSON",
+which rescore.py reads. storage.py picks the backend (RTDB_BACKEND).
+"""
+
+import bisect
+import copy
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+# Characters of Firebase push IDs, in ASCII (= key) order
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+def key_order(key):
+    """Sort key matching RTDB key ordering (same rule as fetch_and_predict.key_order)"""
+    # Push IDs start with "-" too: test for digits before paying for int()'s exception
+    digits = key[1:] if key[:1] == "-" else key
+    if digits.isascii() and digits.isdigit():
+        number = int(key)
+        if -2**31 <= number < 2**31 and str(number) == key:
+            return (0, number, "")
+    return (1, 0, key)
+
+
+class PushIdGenerator:
+    """
+    Chronological push IDs as generated by the Firebase SDKs
+
+    8 characters of millisecond timestamp followed by 12 random characters;
+    within one millisecond the random part is incremented, so keys sort in
+    the order they were generated.
+    """
+
+    def __init__(self, rng=None):
+        self._rng = rng or random.Random()
+        self._last_ms = None
+        self._last_random = None
+        self._lock = threading.Lock()
+
+    def __call__(self, timestamp_ms=None):
+        ms = int(time.time() * 1000) if timestamp_ms is None else int(timestamp_ms)
+        with self._lock:
+            if ms == self._last_ms:
+                digits = self._last_random
+                i = 11
+                while digits[i] == 63:
+                    digits[i] = 0
+                    i -= 1
+                digits[i] += 1
+            else:
+                digits = [self._rng.randrange(64) for _ in range(12)]
+            self._last_ms, self._last_random = ms, digits
+        prefix = []
+        for _ in range(8):
+            prefix.append(PUSH_CHARS[ms % 64])
+            ms //= 64
+        return "".join(reversed(prefix)) + "".join(PUSH_CHARS[d] for d in digits)
+
+
+def push_id_timestamp(key):
+    """Millisecond timestamp of a push ID, or None if the key is not one"""
+    if len(key) != 20:
+        return None
+    ms = 0
+    for char in key[:8]:
+        digit = PUSH_CHARS.find(char)
+        if digit < 0:
+            return None
+        ms = ms * 64 + digit
+    return ms
+
+
+def _split(path):
+    return [part for part in path.strip("/").split("/") if part]
+
+
+class Query:
+    """order_by_key() query; other orderings are not needed here"""
+
+    def __init__(self, reference):
+        self._reference = reference
+        self._start = self._end = None
+        self._first = self._last = None
+
+    def start_at(self, key):
+        self._start = key
+        return self
+
+    def end_at(self, key):
+        self._end = key
+        return self
+
+    def limit_to_first(self, count):
+        self._first = count
+        return self
+
+    def limit_to_last(self, count):
+        self._last = count
+        return self
+
+    def get(self):
+        return self._reference._db._query(_split(self._reference.path), self._start, self._end,
+                                          self._first, self._last)
+
+
+class Event:
+    """Change notification passed to listen() callbacks"""
+
+    def __init__(self, event_type, path, data=None):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class ListenerRegistration:
+    def __init__(self, close):
+        self._close = close
+
+    def close(self):
+        self._close()
+
+
+class Reference:
+    def __init__(self, database, path):
+        self._db = database
+        self.path = "/" + "/".join(_split(path))
+        self.key = _split(path)[-1] if _split(path) else None
+
+    def child(self, path):
+        return Reference(self._db, f"{self.path}/{path}")
+
+    def get(self):
+        return self._db._read(_split(self.path))
+
+    def set(self, value):
+        self._db._write([(_split(self.path), value)])
+
+    def update(self, value):
+        """Multi-location update: keys may be paths relative to this reference"""
+        base = _split(self.path)
+        self._db._write([(base + _split(key), child) for key, child in value.items()])
+
+    def push(self, value=""):
+        reference = self.child(self._db.push_id())
+        if value != "":
+            reference.set(value)
+        return reference
+
+    def delete(self):
+        self._db._write([(_split(self.path), None)])
+
+    def order_by_key(self):
+        return Query(self)
+
+    def listen(self, callback):
+        """
+        Call callback(Event) from a background thread after changes at or below this path
+
+        Like the SDK, an initial event with the current data is sent first.
+        """
+        return self._db._listen(self.path, callback)
+
+
+def _select_keys(data, start, end, first, last):
+    """Keys of an order_by_key() query over an in-memory dictionary"""
+    # 32-bit integer keys have at most 11 characters; the rest sort as plain strings
+    numbers, others = [], []
+    for key in data:
+        (numbers if len(key) <= 11 and not key_order(key)[0] else others).append(key)
+    keys = sorted(numbers, key=int) + sorted(others)
+    if start is not None:
+        keys = keys[bisect.bisect_left(keys, key_order(start), key=key_order):]
+    if end is not None:
+        keys = keys[:bisect.bisect_right(keys, key_order(end), key=key_order)]
+    if first is not None:
+        keys = keys[:first]
+    if last is not None:
+        keys = keys[-last:] if last else []
+    return keys
+
+
+def _normalize(value):
+    """Copy of a value as stored: arrays become objects keyed by index, empty objects disappear"""
+    if isinstance(value, list):
+        value = {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        value = {str(k): _normalize(v) for k, v in value.items()}
+        return {k: v for k, v in value.items() if v is not None} or None
+    return value
+
+
+def _related(a, b):
+    """True if one path is at or below the other"""
+    return a == b or a.startswith(b.rstrip("/") + "/") or b.startswith(a.rstrip("/") + "/")
+
+
+class LocalRealtimeDatabase:
+    """
+    Thread-safe in-memory Realtime Database
+
+    Every set()/update()/push() with a value counts as one round trip in
+    `stats`; `latency` seconds are slept per round trip to emulate the network.
+    """
+
+    def __init__(self, latency=0.0, seed=None):
+        self.latency = latency
+        self.push_id = PushIdGenerator(random.Random(seed))
+        self._root = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.stats = {"round_trips": 0, "writes": 0}
+
+    def reference(self, path="/"):
+        return Reference(self, path)
+
+    def _write(self, writes):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            for parts, value in writes:
+                self._set(parts, _normalize(value))
+            self.stats["round_trips"] += 1
+            self.stats["writes"] += len(writes)
+            listeners = list(self._listeners)
+        for path, queue in listeners:
+            if any(_related(path, "/" + "/".join(parts)) for parts, _ in writes):
+                queue.put("/")
+
+    def _set(self, parts, value):
+        if not parts:
+            self._root = value if isinstance(value, dict) else {}
+            return
+        node, trail = self._root, []
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            trail.append((node, part))
+            node = child
+        if value is None or value == {}:
+            node.pop(parts[-1], None)
+            # RTDB has no empty objects: drop parents left empty
+            while trail and not node:
+                parent, part = trail.pop()
+                del parent[part]
+                node = parent
+        else:
+            node[parts[-1]] = value
+
+    def _read(self, parts):
+        with self._lock:
+            node = self._root
+            for part in parts:
+                if not isinstance(node, dict) or part not in node:
+                    return None
+                node = node[part]
+            return copy.deepcopy(node)
+
+    def _query(self, parts, start, end, first, last):
+        with self._lock:
+            node = self._root
+            for part in parts:
+                if not isinstance(node, dict) or part not in node:
+                    return None
+                node = node[part]
+            if not isinstance(node, dict):
+                return copy.deepcopy(node)
+            # Copy only the children the query returns
+            return {k: copy.deepcopy(node[k]) for k in _select_keys(node, start, end, first, last)}
+
+    def _listen(self, path, callback):
+        return _start_listener(self, path, callback)[0]
+
+    def export(self, path, out_path="/"):
+        """
+        Write the subtree at `out_path` as JSON (like the console's "Export JSON")
+
+        Returns:
+            Number of bytes written
+        """
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.reference(out_path).get() or {}, f, separators=(",", ":"))
+            size = f.tell()
+        os.replace(tmp, path)
+        return size
+
+
+def _start_listener(database, path, callback):
+    """
+    Deliver change events of `path` to callback from a daemon thread
+
+    Returns:
+        Tuple of (ListenerRegistration, queue that wakes the listener)
+    """
+    import queue as queue_module
+
+    events = queue_module.Queue()
+    entry = (path, events)
+    with database._lock:
+        database._listeners.append(entry)
+    events.put(None)    # initial snapshot
+
+    def run():
+        while True:
+            item = events.get()
+            if item is StopIteration:
+                return
+            # Changes that arrived while the callback ran are reported once
+            while not events.empty():
+                if events.get_nowait() is StopIteration:
+                    return
+            if item is None:
+                callback(Event("put", "/", database.reference(path).get()))
+            else:
+                callback(Event("put", item))
+
+    def close():
+        with database._lock:
+            if entry in database._listeners:
+                database._listeners.remove(entry)
+        events.put(StopIteration)
+
+    threading.Thread(target=run, name=f"rtdb-listener{path}", daemon=True).start()
+    return ListenerRegistration(close), events
+
+
+class SqliteRealtimeDatabase:
+    """
+    Realtime Database stand-in stored in a SQLite file
+
+    Every node of the tree is a row keyed by its full path; objects have a NULL
+    value and leaves a JSON scalar. Children are indexed in RTDB key order, so
+    order_by_key() queries read only the children they return. Several
+    processes can use the same file: writes are serialized by SQLite (WAL
+    mode), and listeners notice other processes' commits by polling
+    PRAGMA data_version.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS nodes (
+            path TEXT PRIMARY KEY,
+            parent TEXT NOT NULL,
+            kind INTEGER NOT NULL,      -- 0: 32-bit integer key, 1: other key (RTDB order)
+            num INTEGER NOT NULL,
+            skey TEXT NOT NULL,
+            value TEXT                  -- JSON scalar, NULL for objects
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS children ON nodes (parent, kind, num, skey);
+    """
+
+    def __init__(self, path, latency=0.0, poll_interval=0.05, seed=None):
+        """
+        Args:
+            path: SQLite file (created if missing)
+            latency: Seconds slept per round trip to emulate the network
+            poll_interval: Seconds between checks for other processes' writes (listen)
+        """
+        self.path = path
+        self.latency = latency
+        self.poll_interval = poll_interval
+        self.push_id = PushIdGenerator(random.Random(seed))
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._pid = None
+        self.stats = {"round_trips": 0, "writes": 0}
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._pid = os.getpid()
+        self._listeners = []
+
+    def _connection(self):
+        # A connection must not be used across fork
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._connect()
+        return self._conn
+
+    def reference(self, path="/"):
+        return Reference(self, path)
+
+    @staticmethod
+    def _row(parts, value):
+        path = "/" + "/".join(parts)
+        parent = "/" + "/".join(parts[:-1])
+        kind, num, skey = key_order(parts[-1])
+        return path, parent, kind, num, skey, value
+
+    @staticmethod
+    def _flatten(parts, value, rows):
+        """Rows of a normalized value"""
+        if isinstance(value, dict):
+            rows.append(SqliteRealtimeDatabase._row(parts, None))
+            for key, child in value.items():
+                SqliteRealtimeDatabase._flatten(parts + [key], child, rows)
+        else:
+            rows.append(SqliteRealtimeDatabase._row(parts, json.dumps(value)))
+
+    def _write(self, writes):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ancestors = set()
+                for parts, value in writes:
+                    path = "/" + "/".join(parts)
+                    value = _normalize(value)
+                    if not parts:
+                        conn.execute("DELETE FROM nodes")
+                    else:
+                        conn.execute("DELETE FROM nodes WHERE path = ? OR (path > ? AND path < ?)",
+                                     (path, path + "/", path + "0"))
+                    if value is None:
+                        self._prune(conn, parts)
+                        continue
+                    rows = []
+                    for depth in range(1, len(parts)):
+                        if tuple(parts[:depth]) not in ancestors:
+                            ancestors.add(tuple(parts[:depth]))
+                            rows.append(self._row(parts[:depth], None))
+                    if parts:
+                        self._flatten(parts, value, rows)
+                    elif isinstance(value, dict):
+                        for key, child in value.items():
+                            self._flatten([key], child, rows)
+                    # An ancestor that held a scalar becomes an object
+                    conn.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?) "
+                                     "ON CONFLICT (path) DO UPDATE SET value = excluded.value", rows)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.stats["round_trips"] += 1
+            self.stats["writes"] += len(writes)
+            listeners = list(self._listeners)
+        for path, queue in listeners:
+            if any(_related(path, "/" + "/".join(parts)) for parts, _ in writes):
+                queue.put("/")
+
+    @staticmethod
+    def _prune(conn, parts):
+        """Remove ancestors left without children (RTDB has no empty objects)"""
+        for depth in range(len(parts) - 1, 0, -1):
+            path = "/" + "/".join(parts[:depth])
+            if conn.execute("SELECT 1 FROM nodes WHERE parent = ? LIMIT 1", (path,)).fetchone():
+                return
+            conn.execute("DELETE FROM nodes WHERE path = ? AND value IS NULL", (path,))
+
+    def _subtree(self, conn, path):
+        if path == "/":
+            rows = conn.execute("SELECT path, value FROM nodes WHERE value IS NOT NULL").fetchall()
+            prefix = 1
+        else:
+            row = conn.execute("SELECT value FROM nodes WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                return None
+            if row[0] is not None:
+                return json.loads(row[0])
+            rows = conn.execute("SELECT path, value FROM nodes WHERE path > ? AND path < ? AND value IS NOT NULL",
+                                (path + "/", path + "0")).fetchall()
+            prefix = len(path) + 1
+        tree = {}
+        for leaf, value in rows:
+            node = tree
+            parts = leaf[prefix:].split("/")
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = json.loads(value)
+        return tree or None
+
+    def _read(self, parts):
+        with self._lock:
+            return self._subtree(self._connection(), "/" + "/".join(parts))
+
+    def _query(self, parts, start, end, first, last):
+        parent = "/" + "/".join(parts)
+        sql, args = "SELECT path, substr(path, ?) FROM nodes WHERE parent = ?", [len(parent) + 1 + (parent != "/"), parent]
+        if start is not None:
+            sql += " AND (kind, num, skey) >= (?, ?, ?)"
+            args += key_order(start)
+        if end is not None:
+            sql += " AND (kind, num, skey) <= (?, ?, ?)"
+            args += key_order(end)
+        if last is not None:
+            sql += " ORDER BY kind DESC, num DESC, skey DESC LIMIT ?"
+            args.append(last)
+        else:
+            sql += " ORDER BY kind, num, skey"
+            if first is not None:
+                sql += " LIMIT ?"
+                args.append(first)
+        with self._lock:
+            conn = self._connection()
+            children = conn.execute(sql, args).fetchall()
+            if last is not None:
+                children.reverse()
+            if not children:
+                data = self._subtree(conn, parent)
+                return data if not isinstance(data, dict) else {}
+            return {key: self._subtree(conn, path) for path, key in children}
+
+    def _listen(self, path, callback):
+        registration, events = _start_listener(self, path, callback)
+        stop = threading.Event()
+
+        def poll():
+            # data_version changes when another connection commits
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            while not stop.wait(self.poll_interval):
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != version:
+                    version = current
+                    events.put("/")
+            conn.close()
+
+        threading.Thread(target=poll, name=f"rtdb-poll{path}", daemon=True).start()
+
+        def close():
+            stop.set()
+            registration.close()
+
+        return ListenerRegistration(close)
+
+    def export(self, path, out_path="/"):
+        return LocalRealtimeDatabase.export(self, path, out_path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
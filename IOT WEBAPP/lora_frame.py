@@ -0,0 +1,264 @@
+"""
+Compact binary LoRa frame format and codec.
+
+Version 1 frame (16 bytes, little-endian), as built by createFrame() in
+ESP32_Forestnode.ino:
+
+    offset  type  field
+    0       u8    magic/version (0xA0 | version)
+    1       u16   node id
+    3       u16   sequence number (wraps)
+    5       u16   humidity x10 (0xFFFF = sensor read failed)
+    7       i16   temperature x10 (0x7FFF = sensor read failed)
+    9       u16   soil moisture (raw 12-bit ADC)
+    11      u16   pH x100
+    13      u8    flags (bit 0: light = Sunny)
+    14      u16   CRC-16/CCITT-FALSE of bytes 0-13
+
+The ground node stores binary frames in RTDB as a hex string. decode_any()
+accepts a frame, its hex form or the legacy text payload.
+
+Run as a script to compare airtime of the text and binary formats:
+
+    python3 lora_frame.py [sf] [bw_hz]
+"""
+
+import binascii
+import math
+import struct
+import sys
+
+import numpy as np
+
+from lora_payload import LIGHT_LEVELS, PAYLOAD_FIELDS, parse_payload
+
+VERSION = 1
+MAGIC = 0xA0 | VERSION
+FRAME = struct.Struct("<BHHHhHHBH")
+FRAME_SIZE = FRAME.size
+FLAG_SUNNY = 0x01
+
+HUMIDITY_MISSING = 0xFFFF
+TEMPERATURE_MISSING = 0x7FFF
+
+# Zero-copy view of a buffer of frames
+FRAME_DTYPE = np.dtype([
+    ("magic", "u1"), ("node_id", "<u2"), ("seq", "<u2"), ("humidity", "<u2"),
+    ("temperature", "<i2"), ("moisture", "<u2"), ("ph", "<u2"), ("flags", "u1"), ("crc", "<u2"),
+])
+assert FRAME_DTYPE.itemsize == FRAME_SIZE
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF)"""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def _crc_table():
+    table = np.zeros(256, dtype=np.uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[byte] = crc & 0xFFFF
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def encode_frame(node_id, seq, humidity, temperature, moisture, pH, light):
+    """
+    Build a version 1 frame (used by simulators and tests; the node builds it in C)
+
+    Args:
+        node_id: Node identifier (0-65535)
+        seq: Sequence number (wraps at 65536)
+        humidity: Relative humidity in % (None if the read failed)
+        temperature: Temperature in °C (None if the read failed)
+        moisture: Raw soil moisture ADC value
+        pH: pH value
+        light: "Sunny"/"Dark" or a truthy/falsy value
+
+    Returns:
+        16-byte frame
+    """
+    sunny = light in ("Sunny", "sunny") if isinstance(light, str) else bool(light)
+    body = FRAME.pack(
+        MAGIC, node_id & 0xFFFF, seq & 0xFFFF,
+        HUMIDITY_MISSING if humidity is None else int(round(humidity * 10)),
+        TEMPERATURE_MISSING if temperature is None else int(round(temperature * 10)),
+        int(moisture), int(round(pH * 100)), FLAG_SUNNY if sunny else 0, 0
+    )
+    return body[:-2] + struct.pack("<H", crc16(body[:-2]))
+
+
+def decode_frame(buffer, offset=0):
+    """
+    Decode one frame without copying the buffer
+
+    Args:
+        buffer: bytes, bytearray or memoryview holding the frame
+        offset: Position of the frame in the buffer
+
+    Returns:
+        Dictionary with node_id, seq and the API fields (humidity/temperature
+        are left out when the node flagged a failed read)
+
+    Raises:
+        ValueError: If the buffer is too short, the version is unknown or the CRC fails
+    """
+    view = memoryview(buffer)
+    if len(view) - offset < FRAME_SIZE:
+        raise ValueError(f"Frame too short ({len(view) - offset} < {FRAME_SIZE} bytes)")
+    magic, node_id, seq, humidity, temperature, moisture, ph, flags, crc = FRAME.unpack_from(view, offset)
+    if magic != MAGIC:
+        raise ValueError(f"Unknown frame version byte 0x{magic:02x}")
+    if crc16(view[offset:offset + FRAME_SIZE - 2]) != crc:
+        raise ValueError("Frame CRC mismatch")
+
+    reading = {
+        "node_id": node_id,
+        "seq": seq,
+        "soil": moisture,
+        "pH": ph / 100,
+        "light": LIGHT_LEVELS["Sunny"] if flags & FLAG_SUNNY else LIGHT_LEVELS["Dark"],
+    }
+    if humidity != HUMIDITY_MISSING:
+        reading["humidity"] = humidity / 10
+    if temperature != TEMPERATURE_MISSING:
+        reading["temperature"] = temperature / 10
+    return reading
+
+
+def decode_frames(buffer):
+    """
+    Decode a buffer of back-to-back frames into NumPy arrays
+
+    The buffer is viewed in place with a structured dtype; CRCs are checked
+    for all frames at once with a table-driven CRC over the byte columns.
+
+    Args:
+        buffer: bytes-like object whose length is a multiple of FRAME_SIZE
+
+    Returns:
+        Tuple of (X, valid, node_id, seq): X is float64 (n, 5) in
+        PAYLOAD_FIELDS order (NaN where a sensor read failed), valid marks
+        frames with the right version and CRC
+    """
+    view = memoryview(buffer)
+    if len(view) % FRAME_SIZE:
+        raise ValueError(f"Buffer length {len(view)} is not a multiple of {FRAME_SIZE}")
+    frames = np.frombuffer(view, dtype=FRAME_DTYPE)
+    raw = np.frombuffer(view, dtype=np.uint8).reshape(-1, FRAME_SIZE)
+
+    crc = np.full(len(frames), 0xFFFF, dtype=np.uint16)
+    for column in range(FRAME_SIZE - 2):
+        crc = (crc << 8) ^ _CRC_TABLE[(crc >> 8) ^ raw[:, column]]
+    valid = (frames["magic"] == MAGIC) & (crc == frames["crc"])
+
+    humidity = frames["humidity"].astype(np.float64) / 10
+    humidity[frames["humidity"] == HUMIDITY_MISSING] = np.nan
+    temperature = frames["temperature"].astype(np.float64) / 10
+    temperature[frames["temperature"] == TEMPERATURE_MISSING] = np.nan
+
+    X = np.empty((len(frames), len(PAYLOAD_FIELDS)))
+    X[:, PAYLOAD_FIELDS.index("soil")] = frames["moisture"]
+    X[:, PAYLOAD_FIELDS.index("temperature")] = temperature
+    X[:, PAYLOAD_FIELDS.index("humidity")] = humidity
+    X[:, PAYLOAD_FIELDS.index("pH")] = frames["ph"] / 100
+    X[:, PAYLOAD_FIELDS.index("light")] = np.where(
+        frames["flags"] & FLAG_SUNNY, LIGHT_LEVELS["Sunny"], LIGHT_LEVELS["Dark"]
+    )
+    return X, valid, frames["node_id"], frames["seq"]
+
+
+def decode_any(payload):
+    """
+    Decode a binary frame, its hex string, or a legacy text payload
+
+    Args:
+        payload: bytes or str as received from the radio or stored in RTDB
+
+    Returns:
+        Dictionary keyed by API field name (plus node_id/seq for binary frames)
+
+    Raises:
+        ValueError: If the payload cannot be decoded
+    """
+    if isinstance(payload, str):
+        if len(payload) == 2 * FRAME_SIZE and payload[:2].lower() == f"{MAGIC:02x}":
+            return decode_frame(bytes.fromhex(payload))
+        return parse_payload(payload)
+    if len(payload) == FRAME_SIZE and payload[0] == MAGIC:
+        return decode_frame(payload)
+    return parse_payload(payload)
+
+
+def lora_airtime(payload_bytes, sf=12, bw=125000, cr=1, preamble=8, explicit_header=True,
+                 crc=True, low_data_rate_optimize=None):
+    """
+    Time on air of one LoRa packet (Semtech SX127x datasheet formula)
+
+    Args:
+        payload_bytes: Payload length in bytes
+        sf: Spreading factor (6-12)
+        bw: Bandwidth in Hz
+        cr: Coding rate index (1 = 4/5 ... 4 = 4/8)
+        preamble: Preamble length in symbols
+        explicit_header: Whether the explicit header is sent
+        crc: Whether the payload CRC is enabled
+        low_data_rate_optimize: Force LDRO on/off (default: on when symbols exceed 16 ms)
+
+    Returns:
+        Airtime in seconds
+    """
+    symbol = (2 ** sf) / bw
+    if low_data_rate_optimize is None:
+        low_data_rate_optimize = symbol > 0.016
+    de = 1 if low_data_rate_optimize else 0
+    ih = 0 if explicit_header else 1
+    numerator = 8 * payload_bytes - 4 * sf + 28 + (16 if crc else 0) - 20 * ih
+    payload_symbols = 8 + max(math.ceil(numerator / (4 * (sf - 2 * de))) * (cr + 4), 0)
+    return (preamble + 4.25) * symbol + payload_symbols * symbol
+
+
+def compare_formats(sf=12, bw=125000, interval=15.0, duty_cycle=0.01):
+    """
+    Airtime and channel capacity of the text and binary payloads
+
+    Capacity assumes pure ALOHA (18.4% peak channel utilisation) and one
+    packet per node every `interval` seconds.
+
+    Returns:
+        Dictionary keyed by format name with bytes, airtime and capacity figures
+    """
+    text = "humidity:61.0,temperature:29.4,moisture:1843,pH:6.85,light:Sunny"
+    results = {}
+    for name, size in (("text", len(text)), ("binary", FRAME_SIZE)):
+        airtime = lora_airtime(size, sf=sf, bw=bw)
+        results[name] = {
+            "bytes": size,
+            "airtime_s": airtime,
+            "min_interval_at_duty_cycle_s": airtime / duty_cycle,
+            "nodes_per_channel": round(0.184 * interval / airtime, 1),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    sf = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    bw = int(float(sys.argv[2])) if len(sys.argv) > 2 else 125000
+    results = compare_formats(sf, bw)
+
+    print("=" * 60)
+    print(f"  LoRa airtime: SF{sf}, {bw / 1000:g} kHz, CR 4/5, 15 s interval")
+    print("=" * 60)
+    for name, r in results.items():
+        print(f"\n📡 {name} payload ({r['bytes']} bytes)")
+        print(f"  Airtime:                 {r['airtime_s'] * 1000:8.1f} ms")
+        print(f"  Min interval at 1% duty: {r['min_interval_at_duty_cycle_s']:8.1f} s")
+        print(f"  Nodes per channel:       {r['nodes_per_channel']:8.1f}")
+    saving = 1 - results["binary"]["airtime_s"] / results["text"]["airtime_s"]
+    print(f"\n✓ Binary frames save {saving * 100:.0f}% airtime")
+    print("\n" + "=" * 60)
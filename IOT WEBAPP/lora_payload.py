@@ -0,0 +1,181 @@
+"""
+Parser for the LoRa text payload sent by the forest node.
+
+ESP32_Forestnode.ino sends readings as comma-separated key:value pairs:
+
+    humidity:61.0,temperature:29.4,moisture:1843,pH:6.85,light:Sunny
+
+and the ground node stores that string as-is under /sensor_data/<millis>.
+This module turns it into the prediction API's field names (moisture → soil,
+Sunny/Dark → a numeric light level), one packet at a time or many at once
+into a NumPy matrix.
+"""
+
+import math
+import re
+
+import numpy as np
+
+# Payload key → API field
+KEY_MAP = {
+    "moisture": "soil",
+    "soil": "soil",
+    "humidity": "humidity",
+    "temperature": "temperature",
+    "temp": "temperature",
+    "pH": "pH",
+    "ph": "pH",
+    "light": "light",
+}
+
+# The LDR is read digitally, so the node only reports Sunny or Dark
+LIGHT_LEVELS = {"Sunny": 800.0, "sunny": 800.0, "Dark": 100.0, "dark": 100.0}
+
+# Column order of the matrix returned by parse_many()
+PAYLOAD_FIELDS = ("soil", "temperature", "humidity", "pH", "light")
+_COLUMN = {name: i for i, name in enumerate(PAYLOAD_FIELDS)}
+
+_NUMBER = r"(-?\d+(?:\.\d+)?)"
+# Exactly what createPayload() emits; everything else takes the general path
+_CANONICAL = re.compile(
+    rf"^humidity:{_NUMBER},temperature:{_NUMBER},moisture:{_NUMBER},pH:{_NUMBER},light:(Sunny|Dark)$",
+    re.MULTILINE
+)
+
+
+def _value(field, text):
+    """Convert one payload value to a number (soil stays an integer ADC count)"""
+    if field == "light":
+        level = LIGHT_LEVELS.get(text)
+        if level is not None:
+            return level
+    try:
+        number = float(text)
+    except ValueError:
+        raise ValueError(f"Invalid value for '{field}': {text!r}") from None
+    if not math.isfinite(number):
+        raise ValueError(f"Invalid value for '{field}': {text!r}")
+    if field == "soil" and number.is_integer():
+        return int(number)
+    return number
+
+
+def parse_payload(payload):
+    """
+    Parse one LoRa text payload
+
+    A single left-to-right scan over the string: no intermediate token lists.
+    Unknown keys are ignored; missing keys are simply absent from the result.
+
+    Args:
+        payload: Payload as str or bytes (an optional "Received: " prefix is allowed)
+
+    Returns:
+        Dictionary keyed by API field name (soil, temperature, humidity, pH, light)
+
+    Raises:
+        ValueError: If a pair has no ":" or a value is not a number / light level
+    """
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        payload = bytes(payload).decode("ascii", errors="replace")
+    if payload.startswith("Received: "):
+        payload = payload[10:]
+
+    result = {}
+    end = len(payload)
+    pos = 0
+    while pos < end:
+        comma = payload.find(",", pos)
+        if comma < 0:
+            comma = end
+        colon = payload.find(":", pos, comma)
+        if colon < 0:
+            if payload[pos:comma].strip():
+                raise ValueError(f"Malformed pair {payload[pos:comma]!r}")
+        else:
+            key = payload[pos:colon].strip()
+            field = KEY_MAP.get(key)
+            if field is not None:
+                result[field] = _value(field, payload[colon + 1:comma].strip())
+        pos = comma + 1
+    return result
+
+
+def parse_many(payloads):
+    """
+    Parse many payloads into a float matrix
+
+    When every payload has the exact firmware layout, the whole batch is
+    matched with one regex scan and converted column-wise by NumPy; otherwise
+    rows that don't match fall back to parse_payload().
+
+    Args:
+        payloads: Sequence of payload strings
+
+    Returns:
+        Tuple of (X, valid): X is a float64 array of shape (n, 5) in
+        PAYLOAD_FIELDS order with NaN for missing values, valid is a boolean
+        array marking the payloads that parsed
+    """
+    n = len(payloads)
+    X = np.full((n, len(PAYLOAD_FIELDS)), np.nan)
+    valid = np.zeros(n, dtype=bool)
+    if n == 0:
+        return X, valid
+
+    try:
+        text = "\n".join(payloads)
+    except TypeError:
+        text = None  # bytes or other objects: take the per-row path
+    if text is not None and text.count("\n") == n - 1:
+        found = _CANONICAL.findall(text)
+        if len(found) == n:
+            _fill_canonical(X, np.array(found))
+            valid[:] = True
+            return X, valid
+
+    rows, groups = [], []
+    for i, payload in enumerate(payloads):
+        match = _CANONICAL.fullmatch(payload) if isinstance(payload, str) else None
+        if match is not None:
+            rows.append(i)
+            groups.append(match.groups())
+            continue
+        try:
+            parsed = parse_payload(payload)
+        except (ValueError, TypeError, AttributeError):
+            continue
+        for field, value in parsed.items():
+            X[i, _COLUMN[field]] = value
+        valid[i] = True
+    if rows:
+        X[rows] = _fill_canonical(np.empty((len(rows), len(PAYLOAD_FIELDS))), np.array(groups))
+        valid[rows] = True
+    return X, valid
+
+
+def _fill_canonical(X, groups):
+    """Write regex groups (humidity, temperature, moisture, pH, light) into X"""
+    X[:, 0] = groups[:, 2].astype(np.float64)
+    X[:, 1] = groups[:, 1].astype(np.float64)
+    X[:, 2] = groups[:, 0].astype(np.float64)
+    X[:, 3] = groups[:, 3].astype(np.float64)
+    X[:, 4] = np.where(groups[:, 4] == "Sunny", LIGHT_LEVELS["Sunny"], LIGHT_LEVELS["Dark"])
+    return X
+
+
+def to_readings(X, valid):
+    """
+    Turn parse_many() output back into API request dictionaries
+
+    Returns:
+        List aligned with the input: a dictionary for valid rows (missing
+        fields left out), None for rows that failed to parse
+    """
+    readings = []
+    for row, ok in zip(X.tolist(), valid.tolist()):
+        if not ok:
+            readings.append(None)
+            continue
+        readings.append({name: value for name, value in zip(PAYLOAD_FIELDS, row) if value == value})
+    return readings
@@ -0,0 +1,301 @@
+"""
+Prometheus metrics and an on-demand sampling profiler for the prediction API.
+
+Counters and histograms are plain Python objects updated in the request path
+(one lock acquisition per update) and rendered in the Prometheus text
+exposition format by GET /metrics. Gauges such as queue depths are read from
+callbacks at scrape time, so they cost nothing per request. METRICS_ENABLED=0
+turns every update into an early return.
+
+The profiler is opt-in (PROFILER_ENABLED=1). While it runs, a thread samples
+the stacks of all other threads PROFILER_HZ times per second and counts them
+in the collapsed "frame;frame;frame count" format read by flamegraph.pl and
+speedscope. A profile is taken by GET /debug/profile?seconds=10 or, for a
+gunicorn worker, by sending SIGUSR2 to the worker, which writes
+<PROFILE_DIR>/profile-<pid>-<time>.folded.
+"""
+
+import bisect
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0").lower() in ("1", "true", "yes")
+PROFILER_HZ = float(os.environ.get("PROFILER_HZ", 100))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp")
+MAX_PROFILE_SECONDS = 60
+
+# Seconds; request stages range from a few microseconds to a slow Firestore enqueue
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # label values → [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def observe_many(self, observations, *label_prefix):
+        """Observe {last label value: seconds} in one lock acquisition"""
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            for label, value in observations.items():
+                key = label_prefix + (label,)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+                series[bisect.bisect_left(self.buckets, value)] += 1
+                series[-1] += value
+
+    def render(self):
+        with self._lock:
+            snapshot = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', _format_value(bound)))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time: a number or {label values tuple: number}"""
+
+    kind = "gauge"
+
+    def __init__(self, registry, name, documentation, callback, labels=(), kind="gauge"):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}"
+                for key, v in sorted(value.items()) if v is not None]
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together by /metrics"""
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(self, name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(self, name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def stages(self):
+        """Stage timer for one request (a no-op one when metrics are disabled)"""
+        return Stages() if self.enabled else NO_STAGES
+
+    def gauge(self, name, documentation, callback, labels=(), kind="gauge"):
+        """
+        Register a scrape-time callback
+
+        Args:
+            kind: "gauge", or "counter" for totals kept elsewhere (e.g. queue stats)
+        """
+        metric = Gauge(self, name, documentation, callback, labels, kind)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            samples = metric.render()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+class Stages(dict):
+    """Seconds per stage of one request; mark(stage) ends the stage begun at the previous mark"""
+
+    def __init__(self):
+        super().__init__()
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self[stage] = self.get(stage, 0.0) + now - self._last
+        self._last = now
+
+
+class _NoStages(dict):
+    """Stand-in when metrics are disabled: empty (falsy) and mark() does nothing"""
+
+    def mark(self, stage):
+        pass
+
+
+NO_STAGES = _NoStages()
+
+
+# Sampling profiler
+
+_profile_lock = threading.Lock()
+
+
+def _collapse(frame):
+    """Stack of one frame as 'outer;...;inner' (file basename and function per frame)"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(seconds, hz=PROFILER_HZ, stop=None):
+    """
+    Sample every other thread's stack for a while
+
+    Args:
+        seconds: Length of the profile
+        hz: Samples per second
+        stop: Optional threading.Event that ends the profile early
+
+    Returns:
+        Counter of collapsed stacks ("thread;frame;...;frame" → samples)
+
+    Raises:
+        RuntimeError: If another profile is already running in this process
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        me = threading.get_ident()
+        stacks = StackCounter()
+        interval = 1.0 / hz
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+        while next_sample < deadline and not (stop is not None and stop.is_set()):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    stacks[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+            next_sample += interval
+            time.sleep(max(0.0, next_sample - time.monotonic()))
+        return stacks
+    finally:
+        _profile_lock.release()
+
+
+def format_folded(stacks):
+    """Collapsed-stack text for flamegraph.pl / speedscope, hottest first"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile_to_file(seconds=10.0, directory=PROFILE_DIR, hz=PROFILER_HZ):
+    """Take a profile and write it to <directory>/profile-<pid>-<time>.folded; returns the path"""
+    path = os.path.join(directory, f"profile-{os.getpid()}-{int(time.time())}.folded")
+    stacks = sample_stacks(seconds, hz)
+    with open(path, "w") as f:
+        f.write(format_folded(stacks))
+    return path
+
+
+def install_profile_signal(signum=signal.SIGUSR2, seconds=10.0):
+    """
+    Profile for `seconds` in the background whenever this process gets `signum`
+
+    Must be called from the main thread (for gunicorn workers: post_worker_init).
+    """
+    def handler(received, frame):
+        def run():
+            try:
+                print(f"🔥 Profile written to {profile_to_file(seconds)}")
+            except RuntimeError as e:
+                print(f"⚠ {e}")
+        threading.Thread(target=run, name="profiler", daemon=True).start()
+
+    signal.signal(signum, handler)
@@ -0,0 +1,252 @@
+"""
+Fast-loading, integrity-checked model artifact.
+
+Unpickling irrigation_model.pkl imports scikit-learn (about two seconds) and
+rebuilds every tree object. For tree ensembles the fitted model is just a few
+flat arrays, so this module exports them once into a directory of .npy files:
+
+    irrigation_model.forest/
+        manifest.json     format version, source pickle SHA-256, classes,
+                          scaler mean/scale, SHA-256 of every array file
+        feature.npy       split feature per node
+        threshold.npy     split threshold per node
+        children.npy      (left, right) child per node, global indices;
+                          leaves point to themselves
+        value.npy         class probabilities per node
+        roots.npy         root node of each tree
+
+The arrays are memory-mapped on load (read-only, shared between processes)
+and checked against the manifest's hashes. ForestPredictor evaluates all trees
+at once with NumPy and returns the same probabilities as the scikit-learn
+forest, so only NumPy is needed at serving time.
+"""
+
+import hashlib
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+FORMAT_VERSION = 1
+ARRAYS = ("feature", "threshold", "children", "value", "roots")
+
+
+def artifact_path(model_path):
+    """Artifact directory next to a pickle: irrigation_model.pkl → irrigation_model.forest"""
+    return os.path.splitext(model_path)[0] + ".forest"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ForestPredictor:
+    """predict_proba() for a random forest stored as flat node arrays"""
+
+    def __init__(self, feature, threshold, children, value, roots, classes, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.n_estimators = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted RandomForestClassifier / ExtraTreesClassifier"""
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            own = np.arange(offset, offset + n, dtype=np.int32)
+            leaf = tree.children_left == -1
+            # Leaves loop back to themselves, so every sample can take max_depth steps
+            children.append(np.stack([
+                np.where(leaf, own, tree.children_left + offset),
+                np.where(leaf, own, tree.children_right + offset),
+            ], axis=1).astype(np.int32))
+            features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            total = value.sum(axis=1, keepdims=True)
+            total[total == 0.0] = 1.0
+            values.append(value / total)
+            roots.append(offset)
+            offset += n
+        return cls(np.concatenate(features), np.concatenate(thresholds), np.concatenate(children),
+                   np.concatenate(values), np.array(roots, dtype=np.int32),
+                   model.classes_, max(e.tree_.max_depth for e in model.estimators_), model.n_features_in_)
+
+    def predict_proba(self, X):
+        """
+        Class probabilities, averaged over trees like RandomForestClassifier
+
+        Args:
+            X: Array of shape (n_samples, n_features)
+
+        Returns:
+            Array of shape (n_samples, n_classes)
+        """
+        # scikit-learn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n, n_features = X.shape
+        flat = X.ravel()
+        row_start = (np.arange(n, dtype=np.intp) * n_features)[:, None]
+        node = np.tile(np.asarray(self.roots, dtype=np.intp), (n, 1))
+        children = self.children.reshape(-1)
+        for _ in range(self.max_depth):
+            # One step down every tree for every sample: child = children[node, go_right]
+            go_right = flat.take(row_start + self.feature.take(node)) > self.threshold.take(node)
+            node = children.take(node * 2 + go_right)
+        # Summing over the tree axis accumulates tree by tree, in the same order as scikit-learn
+        proba = self.value.take(node.T, axis=0).sum(axis=0)
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def export_artifact(model, scaler, path, source_sha256=None):
+    """
+    Write a forest (and optional StandardScaler) as an artifact directory
+
+    The files are written to a temporary directory and renamed into place, so
+    a concurrent loader never sees a half-written artifact.
+
+    Raises:
+        TypeError: If the model is not a tree ensemble classifier
+    """
+    if not hasattr(model, "estimators_") or not hasattr(model.estimators_[0], "tree_"):
+        raise TypeError(f"Cannot export {type(model).__name__}: only tree ensembles are supported")
+    forest = ForestPredictor.from_sklearn(model)
+    tmp = f"{path}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    hashes = {}
+    for name in ARRAYS:
+        file = os.path.join(tmp, f"{name}.npy")
+        np.save(file, np.ascontiguousarray(getattr(forest, name)))
+        hashes[name] = file_sha256(file)
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "source_sha256": source_sha256,
+        "classes": forest.classes_.tolist(),
+        "n_estimators": forest.n_estimators,
+        "max_depth": forest.max_depth,
+        "n_features": forest.n_features_in_,
+        "scaler": None if scaler is None else {
+            "mean": np.asarray(scaler.mean_, dtype=np.float64).tolist(),
+            "scale": np.asarray(scaler.scale_, dtype=np.float64).tolist(),
+            "feature_names": [str(n) for n in getattr(scaler, "feature_names_in_", [])] or None,
+        },
+        "sha256": hashes,
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    if os.path.isdir(path):
+        old = f"{path}.old{os.getpid()}"
+        os.rename(path, old)
+        os.rename(tmp, path)
+        for name in os.listdir(old):
+            os.remove(os.path.join(old, name))
+        os.rmdir(old)
+    else:
+        os.rename(tmp, path)
+    return manifest
+
+
+def load_artifact(path, source_sha256=None, verify=True):
+    """
+    Memory-map an artifact directory
+
+    Args:
+        path: Artifact directory
+        source_sha256: If given, the artifact must have been built from this pickle
+        verify: Check every array file against the manifest's SHA-256
+
+    Returns:
+        Tuple of (ForestPredictor, scaler-like object or None)
+
+    Raises:
+        ValueError: If the artifact is stale, from another format version or corrupt
+        OSError: If files are missing
+    """
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {manifest.get('format_version')}")
+    if source_sha256 is not None and manifest.get("source_sha256") != source_sha256:
+        raise ValueError("Artifact was built from a different model file")
+
+    arrays = {}
+    for name in ARRAYS:
+        file = os.path.join(path, f"{name}.npy")
+        if verify and file_sha256(file) != manifest["sha256"][name]:
+            raise ValueError(f"Checksum mismatch for {name}.npy")
+        arrays[name] = np.load(file, mmap_mode="r", allow_pickle=False)
+
+    scaler = None
+    if manifest["scaler"] is not None:
+        names = manifest["scaler"].get("feature_names")
+        scaler = SimpleNamespace(
+            mean_=np.asarray(manifest["scaler"]["mean"]),
+            scale_=np.asarray(manifest["scaler"]["scale"]),
+            feature_names_in_=None if names is None else np.asarray(names, dtype=object),
+        )
+    forest = ForestPredictor(classes=manifest["classes"], max_depth=manifest["max_depth"],
+                             n_features=manifest["n_features"], **arrays)
+    return forest, scaler
+
+
+def load_or_build(model_path, unpickle):
+    """
+    Load the artifact for a pickle, (re)building it when missing or stale
+
+    Args:
+        model_path: Path of the source pickle
+        unpickle: Function returning (model, scaler) from the pickle (only
+            called when the artifact has to be built)
+
+    Returns:
+        Tuple of (model, scaler); the pickled model itself if it cannot be exported
+    """
+    path = artifact_path(model_path)
+    source = file_sha256(model_path)
+    try:
+        return load_artifact(path, source_sha256=source)
+    except (OSError, ValueError, KeyError):
+        pass  # missing, stale or corrupt: rebuild below
+
+    model, scaler = unpickle(model_path)
+    try:
+        export_artifact(model, scaler, path, source_sha256=source)
+    except (TypeError, OSError) as e:
+        print(f"⚠ Model artifact not written ({e}) - using the pickled model")
+        return model, scaler
+    return load_artifact(path, source_sha256=source)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from scoring import MODEL_PATH, load_pickle
+
+    source = sys.argv[1] if len(sys.argv) > 1 else MODEL_PATH
+    model, scaler = load_pickle(source)
+    manifest = export_artifact(model, scaler, artifact_path(source), source_sha256=file_sha256(source))
+    forest, _ = load_artifact(artifact_path(source))
+    X = np.random.default_rng(0).uniform(0, 1000, size=(5000, forest.n_features_in_))
+    same = np.array_equal(forest.predict_proba(X), model.predict_proba(X))
+    print(f"{'✓' if same else '✗'} Wrote {artifact_path(source)} ({manifest['n_estimators']} trees,"
+          f" {len(forest.feature)} nodes); predictions {'identical' if same else 'DIFFER'}")
+    sys.exit(0 if same else 1)
@@ -0,0 +1,320 @@
+"""
+Versioned model registry with hot reload.
+
+Model versions are pickles in a directory (MODEL_DIR, default "models/"); the
+file name without .pkl is the version, e.g. models/2026-10-18.pkl. Both the
+{"model", "scaler"} dictionary format and a bare pickled model are accepted.
+When the directory has no models the registry serves MODEL_PATH
+(irrigation_model.pkl) as its only version, so existing deployments keep
+working unchanged.
+
+A background thread rescans the directory. New or changed files are loaded
+and validated off the request path, then published by replacing one
+reference, so a request that already holds a version keeps using it while new
+requests get the new one. The newest valid version is active unless a file
+named ACTIVE in the directory names another one (write a version name into it
+to roll back). Requests can pin any loaded version.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from scoring import MODEL_PATH, Scorer
+from model_artifact import file_sha256
+
+MODEL_DIR = os.environ.get("MODEL_DIR", "models")
+MODEL_POLL_INTERVAL = float(os.environ.get("MODEL_POLL_INTERVAL", 5.0))
+
+# Versions kept in memory besides the active one
+MAX_LOADED_VERSIONS = int(os.environ.get("MAX_LOADED_VERSIONS", 3))
+
+# Files younger than this may still be being copied; pick them up on the next scan
+SETTLE_SECONDS = 1.0
+
+# Readings every candidate model must score sensibly before it is published
+PROBE_READINGS = [
+    {"soil": soil, "light": light, "temperature": temperature, "humidity": humidity, "pH": ph,
+     "npk": 25, "rainfall": rainfall}
+    for soil, light, temperature, humidity, ph, rainfall in (
+        (50, 100, 10, 20, 5.0, 0), (250, 400, 35, 40, 7.0, 10), (650, 800, 28, 60, 6.5, 12),
+        (1200, 300, 22, 85, 7.5, 0), (3000, 900, 40, 15, 8.5, 80), (4000, 50, -5, 95, 4.5, 200),
+    )
+]
+
+
+class ModelVersion:
+    """One loaded, validated model version"""
+
+    def __init__(self, version, path, sha256, mtime, scorer, load_ms):
+        self.version = version
+        self.path = path
+        self.sha256 = sha256
+        self.mtime = mtime
+        self.scorer = scorer
+        self.load_ms = load_ms
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "sha256": self.sha256,
+            "model": type(self.scorer.model).__name__,
+            "modified": round(self.mtime, 3),
+            "loaded_at": round(self.loaded_at, 3),
+            "load_ms": round(self.load_ms, 1),
+        }
+
+
+def validate(scorer):
+    """
+    Check a freshly loaded scorer before it can serve traffic
+
+    Raises:
+        ValueError: If the model does not take the encoder's features or
+            returns unusable predictions for the probe readings
+    """
+    model = scorer.model
+    if not hasattr(model, "predict_proba") or not hasattr(model, "classes_"):
+        raise ValueError(f"{type(model).__name__} has no predict_proba/classes_")
+    n_features = getattr(model, "n_features_in_", scorer.encoder.n_features)
+    if n_features != scorer.encoder.n_features:
+        raise ValueError(f"Model expects {n_features} features, encoder provides {scorer.encoder.n_features}")
+    if not set(np.asarray(model.classes_).tolist()) <= {0, 1}:
+        raise ValueError(f"Unexpected classes {list(model.classes_)} (expected 0/1)")
+
+    X, valid, errors = scorer.encoder.encode_batch(PROBE_READINGS)
+    if errors:
+        raise ValueError(f"Probe readings rejected: {errors}")
+    predictions, confidences, _ = scorer.score_matrix(X)
+    if len(predictions) != len(PROBE_READINGS) or not np.all(np.isfinite(confidences)):
+        raise ValueError("Model returned incomplete or non-finite predictions")
+    if not np.all((confidences >= 0) & (confidences <= 1)):
+        raise ValueError("Model returned confidences outside [0, 1]")
+
+
+class ModelRegistry:
+    """Load, validate and atomically publish model versions from a directory"""
+
+    def __init__(self, directory=MODEL_DIR, fallback_path=MODEL_PATH, poll_interval=MODEL_POLL_INTERVAL,
+                 max_loaded=MAX_LOADED_VERSIONS):
+        """
+        Args:
+            directory: Directory of <version>.pkl files (may not exist)
+            fallback_path: Model served when the directory has no models
+            poll_interval: Seconds between directory scans (0 = no watcher)
+            max_loaded: Versions kept in memory besides the active one
+        """
+        self.directory = directory
+        self.fallback_path = fallback_path
+        self.poll_interval = poll_interval
+        self.max_loaded = max(0, max_loaded)
+
+        # Published state: replaced as a whole, never mutated, so readers need no lock
+        self._state = {"active": None, "versions": {}}
+        # Incremented whenever the active version or the set of loaded versions changes
+        self.generation = 0
+        self._scan_lock = threading.Lock()
+        self._watcher_lock = threading.Lock()
+        self._errors = {}
+        self._last_scan = None
+        self._ready = threading.Event()
+        self._watcher = None
+        self._watcher_pid = None
+        self._stop = threading.Event()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """A lock held by another thread at fork() would never be released in the child"""
+        self._scan_lock = threading.Lock()
+        self._watcher_lock = threading.Lock()
+        self._watcher_pid = None
+
+    # Request path
+
+    def get(self, version=None):
+        """
+        Get the model version to score a request with
+
+        Args:
+            version: Version to pin (None = active version)
+
+        Returns:
+            ModelVersion, or None if no model is loaded
+
+        Raises:
+            KeyError: If a pinned version is not available
+        """
+        self._ensure_watcher()
+        state = self._state
+        if version is None:
+            return state["versions"].get(state["active"])
+        found = state["versions"].get(str(version))
+        if found is None:
+            raise KeyError(f"Unknown model version '{version}'")
+        return found
+
+    def wait_ready(self, timeout=None):
+        """Block until the first scan finished; True if a model is active"""
+        return self._ready.wait(timeout) and self._state["active"] is not None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    # Loading
+
+    def candidates(self):
+        """Model files to serve: {version: path}"""
+        found = {}
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".pkl"):
+                    found[name[:-4]] = os.path.join(self.directory, name)
+        if not found and os.path.exists(self.fallback_path):
+            found[os.path.splitext(os.path.basename(self.fallback_path))[0]] = self.fallback_path
+        return found
+
+    def _load(self, version, path, mtime):
+        started = time.perf_counter()
+        scorer = Scorer.from_file(path)
+        validate(scorer)
+        scorer.warm_up()
+        return ModelVersion(version, path, file_sha256(path), mtime, scorer,
+                            (time.perf_counter() - started) * 1000)
+
+    def _pinned_active(self):
+        """Version named in <directory>/ACTIVE, if any"""
+        try:
+            with open(os.path.join(self.directory, "ACTIVE")) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def scan(self):
+        """
+        Load new or changed model files and publish the result
+
+        Invalid files are reported in status() and never replace a working
+        version.
+
+        Returns:
+            List of versions loaded by this scan
+        """
+        with self._scan_lock:
+            now = time.time()
+            current = self._state["versions"]
+            versions = dict(current)
+            loaded = []
+            candidates = self.candidates()
+            for version, path in candidates.items():
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                known = current.get(version)
+                if known is not None and known.mtime == mtime:
+                    continue
+                if now - mtime < SETTLE_SECONDS and self._state["active"] is not None:
+                    continue  # may still be being copied; pick it up on the next scan
+                error = self._errors.get(version)
+                if error is not None and error["mtime"] == mtime:
+                    continue  # already rejected this file
+                try:
+                    versions[version] = self._load(version, path, mtime)
+                    self._errors.pop(version, None)
+                    loaded.append(version)
+                    print(f"✓ Model version '{version}' loaded ({versions[version].load_ms:.0f} ms)")
+                except Exception as e:
+                    self._errors[version] = {"mtime": mtime, "error": f"{type(e).__name__}: {e}"}
+                    print(f"⚠ Model version '{version}' rejected: {e}")
+
+            # Versions whose file disappeared are dropped, except the active one
+            # while ACTIVE still pins it or no other version is left to serve
+            previous = self._state["active"]
+            keep = previous in versions and (self._pinned_active() == previous
+                                             or not any(v in candidates for v in versions))
+            versions = {v: m for v, m in versions.items() if v in candidates or (keep and v == previous)}
+            active = self._choose_active(versions)
+            versions = self._evict(versions, active)
+            if active != self._state["active"] and active is not None:
+                print(f"🔄 Active model version: {active}")
+            if active != self._state["active"] or versions != current:
+                self.generation += 1
+            self._state = {"active": active, "versions": versions}
+            self._last_scan = now
+            self._ready.set()
+            return loaded
+
+    def _choose_active(self, versions):
+        pinned = self._pinned_active()
+        if pinned in versions:
+            return pinned
+        if pinned is not None:
+            print(f"⚠ ACTIVE names unknown version '{pinned}' - using the newest")
+        if not versions:
+            return None
+        return max(versions.values(), key=lambda m: (m.mtime, m.version)).version
+
+    def _evict(self, versions, active):
+        """Keep the active version and the newest max_loaded others"""
+        others = sorted((m for v, m in versions.items() if v != active), key=lambda m: m.mtime, reverse=True)
+        keep = {m.version for m in others[:self.max_loaded]}
+        return {v: m for v, m in versions.items() if v == active or v in keep}
+
+    # Background watcher
+
+    def start(self, background=True):
+        """
+        Run the first scan (in the background or now) and start the watcher
+
+        Args:
+            background: Return immediately and load in a thread
+        """
+        if background:
+            threading.Thread(target=self._first_scan, name="model-registry", daemon=True).start()
+        else:
+            self._first_scan()
+
+    def _first_scan(self):
+        try:
+            self.scan()
+        finally:
+            self._ready.set()
+            self._ensure_watcher()
+
+    def _ensure_watcher(self):
+        """Start the watcher thread in this process (again after a fork)"""
+        if self.poll_interval <= 0 or not self._ready.is_set() or self._watcher_pid == os.getpid():
+            return
+        with self._watcher_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"⚠ Model scan failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        """Active version, loaded versions and rejected files"""
+        state = self._state
+        return {
+            "active": state["active"],
+            "directory": self.directory,
+            "versions": [m.describe() for m in sorted(state["versions"].values(), key=lambda m: m.mtime)],
+            "rejected": {v: e["error"] for v, e in self._errors.items()},
+            "last_scan": None if self._last_scan is None else round(self._last_scan, 3),
+        }
@@ -0,0 +1,182 @@
+"""
+Per-node state shared by the gunicorn workers of serve.py.
+
+The feature store, the anomaly detector and the irrigation scheduler keep
+per-node state in memory. If every worker held its own copy, a node's
+readings would be split between the workers (short windows, statistics that
+never warm up), each worker would plan pumps against the whole power budget
+and answer GET /schedule/<field_id> differently, and every worker would
+snapshot its part of the feature store over the others' at FEATURE_STORE_PATH.
+
+serve.py therefore forks one state process from the master after app.py is
+imported - so it inherits the restored objects - and before gunicorn forks
+the workers. It serves the objects with a multiprocessing manager on a Unix
+socket, and each worker calls them through proxies (one round trip, tens of
+microseconds, per call). Only the state process snapshots the feature store:
+every FEATURE_STORE_SNAPSHOT_INTERVAL seconds and once more when it is
+stopped.
+"""
+
+import functools
+import os
+import select
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import traceback
+from multiprocessing.managers import BaseManager
+
+from feature_store import FEATURE_STORE_PATH
+
+# Objects the state process can serve, by app.py global name
+NAMES = ("feature_store", "anomaly_detector", "scheduler")
+
+# The objects served by this process (state process only)
+_served = {}
+
+
+class NodeStateManager(BaseManager):
+    """Manager exposing the objects in _served under their names"""
+
+
+for _name in NAMES:
+    NodeStateManager.register(_name, callable=functools.partial(_served.get, _name))
+
+
+class NodeStateProcess:
+    """Handle on the state process, usable in the process that started it and its forks"""
+
+    def __init__(self, pid, address, authkey, names, directory):
+        self.pid = pid
+        self.address = address
+        self.authkey = authkey
+        self.names = tuple(names)
+        self._directory = directory
+        self._owner = os.getpid()
+
+    def connect(self):
+        """
+        Proxies to the served objects for this process (call after fork)
+
+        Returns:
+            {name: proxy} for every served object
+        """
+        manager = NodeStateManager(address=self.address, authkey=self.authkey)
+        manager.connect()
+        return {name: getattr(manager, name)() for name in self.names}
+
+    def stop(self, timeout=30.0):
+        """
+        Stop the state process after its final snapshot
+
+        Only the process that started it can stop it: gunicorn workers fork
+        inside serve() and unwind through its cleanup when they exit.
+
+        Returns:
+            True if it exited within `timeout` seconds (it is killed otherwise);
+            False in any other process
+        """
+        if os.getpid() != self._owner:
+            return False
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + timeout
+        exited = False
+        while True:
+            try:
+                pid, _ = os.waitpid(self.pid, os.WNOHANG)
+            except ChildProcessError:
+                pid = self.pid  # already reaped (gunicorn's SIGCHLD handler reaps any child)
+            if pid:
+                exited = True
+                break
+            if time.monotonic() >= deadline:
+                os.kill(self.pid, signal.SIGKILL)
+                os.waitpid(self.pid, 0)
+                break
+            time.sleep(0.05)
+        shutil.rmtree(self._directory, ignore_errors=True)
+        return exited
+
+
+def start(objects, snapshot_path=FEATURE_STORE_PATH, timeout=10.0):
+    """
+    Fork the state process serving `objects` and wait until it accepts connections
+
+    Args:
+        objects: {name: object} with names from NAMES; None values are skipped
+        snapshot_path: Where the state process snapshots the feature store ("" = never)
+        timeout: Seconds to wait for the process to listen
+
+    Returns:
+        NodeStateProcess
+
+    Raises:
+        RuntimeError: If the state process did not start
+    """
+    objects = {name: obj for name, obj in objects.items() if obj is not None}
+    unknown = set(objects) - set(NAMES)
+    if unknown:
+        raise ValueError(f"Unknown node state objects: {sorted(unknown)}")
+    directory = tempfile.mkdtemp(prefix="smartagro-state-")
+    address = os.path.join(directory, "socket")
+    authkey = os.urandom(32)
+    parent = os.getpid()
+    ready_read, ready_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            os.close(ready_read)
+            _served.update(objects)
+            _serve(address, authkey, parent, snapshot_path, ready_write)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+    os.close(ready_write)
+    state = NodeStateProcess(pid, address, authkey, objects, directory)
+    ready = select.select([ready_read], [], [], timeout)[0] and os.read(ready_read, 1)
+    os.close(ready_read)
+    if not ready:
+        state.stop(timeout=1.0)
+        raise RuntimeError("Node state process did not start")
+    return state
+
+
+def _serve(address, authkey, parent, snapshot_path, ready):
+    """Body of the state process: serve until SIGTERM or the parent is gone, then snapshot"""
+    server = NodeStateManager(address=address, authkey=authkey).get_server()
+    stopped = threading.Event()
+
+    def terminate(signum, frame):
+        raise SystemExit(0)  # serve_forever() returns on SystemExit
+
+    def watch_parent():
+        while not stopped.wait(1.0):
+            if os.getppid() != parent:
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+
+    # Ctrl+C reaches the whole process group; the master stops this process after its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, terminate)
+    threading.Thread(target=watch_parent, name="node-state-parent", daemon=True).start()
+    store = _served.get("feature_store")
+    if store is not None and snapshot_path:
+        store.start_snapshots(snapshot_path)
+    os.write(ready, b"1")
+    os.close(ready)
+    try:
+        server.serve_forever()
+    except SystemExit:
+        pass  # serve_forever() itself ends with sys.exit()
+    stopped.set()
+    if store is not None and snapshot_path:
+        print(f"✓ Saved {store.snapshot(snapshot_path)} feature store readings to {snapshot_path}")
+    shutil.rmtree(os.path.dirname(address), ignore_errors=True)
@@ -0,0 +1,195 @@
+"""
+Cache of /predict decisions keyed on quantized sensor readings.
+
+Nodes report every 15 seconds and consecutive readings usually agree to the
+sensors' resolution, so the same decision is computed over and over. Readings
+are snapped down to RESOLUTION (whole ADC counts for soil, 0.1 °C, 0.01 pH,
+...) and the decision for the snapped reading is cached. Hits and misses both
+return the decision for the snapped reading, which can differ from scoring the
+raw reading wherever the model splits between two steps. Flooring (rather than
+rounding) keeps every rule comparison against a multiple of the step, such as
+soil < 300 or humidity < 30, the same as for the raw value.
+Readings whose field uses a rule set with other comparisons (see
+RuleTable.quantization_safe) are scored without the cache.
+
+Entries are evicted least recently used beyond PREDICTION_CACHE_MB and expire
+after PREDICTION_CACHE_TTL seconds. Entries are keyed by model version and file
+hash plus the field's rule set, and are dropped when the registry publishes a
+different model.
+"""
+
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from features import FEATURE_DEFAULTS
+
+# 0 disables the cache
+PREDICTION_CACHE_MB = float(os.environ.get("PREDICTION_CACHE_MB", 16))
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", 300))
+
+# Sensor resolution per model input
+RESOLUTION = {
+    "soil": 1,            # 12-bit ADC counts
+    "light": 1,
+    "temperature": 0.1,   # °C
+    "humidity": 0.1,      # %
+    "pH": 0.01,
+    "npk": 1,
+    "rainfall": 0.1,      # mm
+}
+
+
+def quantize(data, resolution=RESOLUTION, defaults=FEATURE_DEFAULTS):
+    """
+    Snap a reading down to sensor resolution
+
+    Args:
+        data: Request dictionary with sensor readings
+
+    Returns:
+        Tuple of (cache key, quantized reading), or None when a value is
+        missing or not a finite number (the scorer reports those)
+    """
+    key = []
+    reading = dict(data)
+    for name, step in resolution.items():
+        value = data.get(name, defaults.get(name))
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return None
+        # The epsilon keeps 30.1 / 0.1 = 300.99999999999997 in bucket 301
+        k = math.floor(value / step + 1e-6)
+        key.append(k)
+        reading[name] = k * step if isinstance(step, int) else round(k * step, 6)
+    return tuple(key), reading
+
+
+def version_token(version):
+    """Cache namespace of a loaded model version"""
+    return version.version, version.sha256
+
+
+class PredictionCache:
+    """Thread-safe LRU + TTL cache in front of Scorer.score_one()"""
+
+    def __init__(self, max_mb=PREDICTION_CACHE_MB, ttl=PREDICTION_CACHE_TTL, resolution=RESOLUTION):
+        """
+        Args:
+            max_mb: Approximate memory cap in MiB (0 disables the cache)
+            ttl: Seconds an entry is served before it is recomputed
+            resolution: Quantization step per model input
+        """
+        self.resolution = dict(resolution)
+        self.ttl = ttl
+        self.entry_bytes = self._estimate_entry_bytes()
+        self.max_entries = int(max(0.0, max_mb) * 2**20 / self.entry_bytes)
+        self.generation = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.expired = self.evictions = self.invalidations = self.uncacheable = 0
+        self.hit_seconds = self.miss_seconds = self.saved_seconds = 0.0
+
+    def _estimate_entry_bytes(self):
+        """Approximate size of one entry: key, value and the OrderedDict's per-entry overhead"""
+        key = (("irrigation_model", "0" * 64), 0, tuple(range(10**6, 10**6 + len(self.resolution))))
+        value = (time.monotonic(), (1, 0.87, "Low soil moisture (1234) - irrigation required" + "x" * 40, 2))
+        size = sys.getsizeof(key) + sys.getsizeof(key[2]) + sum(sys.getsizeof(k) for k in key[2])
+        size += sys.getsizeof(value) + sys.getsizeof(value[1]) + sum(sys.getsizeof(v) for v in value[1])
+        return size + 150
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def follow(self, registry):
+        """Drop the entries of other model versions after the registry published a change"""
+        if registry.generation == self.generation:
+            return
+        active = registry.get()
+        keep = None if active is None else version_token(active)
+        with self._lock:
+            stale = [key for key in self._entries if key[0] != keep]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            self.generation = registry.generation
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def score(self, version, data, stages=None):
+        """
+        Score a reading with a model version, through the cache
+
+        Args:
+            version: ModelVersion from the registry
+            data: Request dictionary with sensor readings
+            stages: Optional stage timing dictionary, see Scorer.score_one()
+
+        Returns:
+            Tuple of (prediction, confidence, reason, code of the rule that
+            fired), as Scorer.score_one() returns
+
+        Raises:
+            ValueError: If the reading fails validation (never cached)
+        """
+        if not self.enabled:
+            return version.scorer.score_one(data, stages)
+        rules = version.scorer.rules
+        rule_set = rules.rule_set(data.get("field_id"))
+        quantized = quantize(data, self.resolution)
+        if quantized is None or rule_set not in rules.quantization_safe(self.resolution):
+            self.uncacheable += 1
+            return version.scorer.score_one(data, stages)
+
+        started = time.perf_counter()
+        key = (version_token(version), rule_set, quantized[0])
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    elapsed = time.perf_counter() - started
+                    self.hits += 1
+                    self.hit_seconds += elapsed
+                    if self.misses:
+                        self.saved_seconds += max(0.0, self.miss_seconds / self.misses - elapsed)
+                    return entry[1]
+                del self._entries[key]
+                self.expired += 1
+
+        result = version.scorer.score_one(quantized[1], stages)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+            self._entries[key] = (now + self.ttl, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "approx_mb": round(len(self._entries) * self.entry_bytes / 2**20, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "uncacheable": self.uncacheable,
+            "avg_hit_us": round(self.hit_seconds / self.hits * 1e6, 1) if self.hits else None,
+            "avg_miss_us": round(self.miss_seconds / self.misses * 1e6, 1) if self.misses else None,
+            "latency_saved_ms": round(self.saved_seconds * 1000, 1),
+        }
@@ -2,6 +2,12 @@ from flask import Flask, request, jsonify
 import firebase_admin
 from firebase_admin import credentials, firestore
 import pickle
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
 import pandas as pd
 from flask_cors import CORS
 
@@ -26,6 +32,66 @@ except Exception as e:
     model = None
     scaler = None
 
+# Firestore document IDs must not contain "/"
+FIELD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Same time-series ID scheme as field_routing.py: "{shard:02x}-{ts:013d}-{random}"
+READING_SHARDS = 16
+# Latest-state field documents are written at most once per interval (seconds)
+MIN_FIELD_WRITE_INTERVAL = 1.0
+
+_field_lock = threading.Lock()
+_field_written = {}     # field_id -> monotonic time of the last write
+_field_pending = {}     # field_id -> merged record waiting for the interval
+
+
+def reading_id(node_id, timestamp_ms):
+    """Shard-prefixed time-series document ID (random shard without a node)"""
+    if node_id is None:
+        shard = random.randrange(READING_SHARDS)
+    else:
+        shard = zlib.crc32(str(node_id).encode()) % READING_SHARDS
+    return f"{shard:02x}-{timestamp_ms:013d}-{uuid.uuid4().hex[:8]}"
+
+
+def _write_field(field_id, record):
+    try:
+        db.collection("fields").document(field_id).set(record, merge=True)
+    except Exception as firestore_error:
+        print("Firestore Error:", firestore_error)
+
+
+def _flush_field(field_id):
+    with _field_lock:
+        record = _field_pending.pop(field_id, None)
+        _field_written[field_id] = time.monotonic()
+    if record is not None:
+        _write_field(field_id, record)
+
+
+def set_field_state(field_id, record):
+    """
+    Merge record into fields/{field_id}, coalescing writes to that document
+
+    A write within MIN_FIELD_WRITE_INTERVAL of the previous one is held back
+    and merged with any later ones; a timer writes the result once the
+    interval has passed, as the write-behind queue in app.py does.
+    """
+    with _field_lock:
+        pending = _field_pending.get(field_id)
+        if pending is not None:
+            pending.update(record)
+            return
+        wait = _field_written.get(field_id, float("-inf")) + MIN_FIELD_WRITE_INTERVAL - time.monotonic()
+        if wait > 0:
+            _field_pending[field_id] = dict(record)
+            timer = threading.Timer(wait, _flush_field, (field_id,))
+            timer.daemon = True
+            timer.start()
+            return
+        _field_written[field_id] = time.monotonic()
+    _write_field(field_id, record)
+
 app = Flask(__name__)
 CORS(app)
 
@@ -40,6 +106,10 @@ def predict():
             return jsonify({"error": "Model not loaded"}), 500
             
         data = request.json
+        field_id = str(data.get("field_id", "field_1"))
+        if not FIELD_ID_PATTERN.match(field_id):
+            return jsonify({"error": f"Invalid field_id: {field_id!r}"}), 400
+        
         # Create DataFrame with expected feature order
         df = pd.DataFrame([{
             "soil": data.get("soil"),
@@ -69,10 +139,11 @@ def predict():
         result = {
             "irrigation_needed": prediction,
             "confidence": confidence,
-            "reason": reason
+            "reason": reason,
+            "field_id": field_id
         }
         try:
-            db.collection("fields").document("field_1").set({
+            record = {
                 "Soil": data.get("soil"),
                 "Light": data.get("light"),
                 "Temperature": data.get("temperature"),
@@ -82,8 +153,14 @@ def predict():
                 "Rainfall": data.get("rainfall"),
                 "irrigation_needed": prediction,
                 "Confidence": confidence,
-                "Reason": reason
-            }, merge=True)
+                "Reason": reason,
+                "timestamp": int(time.time() * 1000)
+            }
+            # Latest state per field (coalesced), plus an append-only time series
+            set_field_state(field_id, record)
+            node_id = data.get("node_id")
+            db.collection("fields").document(field_id).collection("readings") \
+                .document(reading_id(node_id, record["timestamp"])).set(record)
         except Exception as firestore_error:
             print("Firestore Error:", firestore_error)
             # Don't return error - just log it
@@ -2,29 +2,34 @@
 Script to push test sensor data to Firebase Realtime Database
 """
 
-import firebase_admin
-from firebase_admin import credentials, db
 import time
 import random
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate("serviceAccountKey.json")
-
-if not firebase_admin._apps:
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': 'https://agrivision-1e11f-default-rtdb.asia-southeast1.firebasedatabase.app'
-    })
+def get_db():
+    """
+    Realtime Database client (storage.realtime_database, RTDB_BACKEND)
+    
+    Created on first use so generate_sensor_data() can be used (e.g. by
+    bench_api.py) without Firebase credentials.
+    """
+    from storage import realtime_database
+    return realtime_database()
 
-def generate_sensor_data():
-    """Generate random sensor data for testing"""
+def generate_sensor_data(rng=random):
+    """
+    Generate random sensor data for testing
+    
+    Args:
+        rng: Random source (pass a random.Random(seed) for a repeatable sequence)
+    """
     return {
-        "soil": random.randint(100, 900),
-        "light": random.randint(100, 1000),
-        "temperature": round(random.uniform(15, 40), 1),
-        "humidity": round(random.uniform(20, 90), 1),
-        "pH": round(random.uniform(5.0, 8.0), 1),
-        "npk": random.randint(10, 50),
-        "rainfall": round(random.uniform(0, 100), 1),
+        "soil": rng.randint(100, 900),
+        "light": rng.randint(100, 1000),
+        "temperature": round(rng.uniform(15, 40), 1),
+        "humidity": round(rng.uniform(20, 90), 1),
+        "pH": round(rng.uniform(5.0, 8.0), 1),
+        "npk": rng.randint(10, 50),
+        "rainfall": round(rng.uniform(0, 100), 1),
         "timestamp": int(time.time() * 1000)
     }
 
@@ -37,7 +42,7 @@ def push_single_data(path='/sensor_data'):
     print(f"Data: {data}\n")
     
     try:
-        ref = db.reference(path)
+        ref = get_db().reference(path)
         ref.set(data)
         print("✓ Data pushed successfully!")
         return data
@@ -67,7 +72,7 @@ def push_continuous(path='/sensor_data', interval=5, count=None):
             data = generate_sensor_data()
             
             try:
-                ref = db.reference(path)
+                ref = get_db().reference(path)
                 ref.set(data)
                 pushed += 1
                 
@@ -90,7 +95,7 @@ def push_historical_data(path='/historical_data', count=10):
     print(f"\n📚 Pushing {count} historical records to {path}")
     
     try:
-        ref = db.reference(path)
+        ref = get_db().reference(path)
         
         for i in range(count):
             data = generate_sensor_data()
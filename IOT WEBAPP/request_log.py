@@ -0,0 +1,92 @@
+"""
+Structured, sampled request logging for the prediction API.
+
+Each request produces at most one event with key/value fields instead of a
+handful of print() calls. Routine events are sampled (LOG_SAMPLE_RATE, e.g.
+0.01 logs one request in a hundred); warnings about dropped work and errors
+are always logged. LOG_FORMAT=json writes one JSON object per line for log
+collectors, LOG_FORMAT=text a readable key=value line for development.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 1.0))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+
+_settings = {"sample_rate": LOG_SAMPLE_RATE}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, event, pid and the event fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """'time LEVEL event key=value ...' for a terminal"""
+
+    def format(self, record):
+        fields = " ".join(f"{k}={v}" for k, v in getattr(record, "fields", {}).items())
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(fmt=None, sample_rate=None, level=None):
+    """
+    Install the handler for the "smartagro" loggers
+
+    Args:
+        fmt: "json" or "text" (default: LOG_FORMAT)
+        sample_rate: Fraction of routine request events to log (default: LOG_SAMPLE_RATE)
+        level: Logging level name (default: LOG_LEVEL)
+    """
+    if sample_rate is not None:
+        _settings["sample_rate"] = max(0.0, min(1.0, float(sample_rate)))
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else TextFormatter())
+    root = logging.getLogger("smartagro")
+    root.handlers[:] = [handler]
+    root.setLevel(level or LOG_LEVEL)
+    root.propagate = False
+
+
+class RequestLogger:
+    """Thin wrapper adding sampling and key/value fields to a logging.Logger"""
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(f"smartagro.{name}")
+
+    def sampled(self, event, level=logging.INFO, **fields):
+        """Log a routine event for a LOG_SAMPLE_RATE fraction of calls (warnings and errors: every call)"""
+        if level >= logging.WARNING:
+            self.logger.log(level, event, extra={"fields": fields})
+            return
+        rate = _settings["sample_rate"]
+        if rate < 1.0 and random.random() >= rate:
+            return
+        if rate < 1.0:
+            fields["sample_rate"] = rate
+        self.logger.log(level, event, extra={"fields": fields})
+
+    def warning(self, event, **fields):
+        self.logger.warning(event, extra={"fields": fields})
+
+    def error(self, event, exc_info=False, **fields):
+        self.logger.error(event, exc_info=exc_info, extra={"fields": fields})
@@ -0,0 +1,554 @@
+"""
+Offline bulk re-scoring of historical sensor readings.
+
+Re-runs the irrigation decision over an exported history - for example after
+retraining - without going through the API:
+
+    rtdb-export.json   Realtime Database JSON export; --path selects the
+                       subtree (e.g. /historical_data). Children are readings
+                       (objects or raw LoRa payload strings) keyed by push key
+    *.jsonl            one reading object per line ("key" is optional)
+    *.csv              header row with soil, light, temperature, ... columns
+
+The input is streamed: the JSON export is parsed incrementally and sibling
+subtrees are skipped without being loaded, so memory stays constant however
+large the export is. Readings are decoded and vectorized in chunks and scored
+by a pool of worker processes, each with its own copy of the model. Results
+are written in input order to CSV or Parquet (a directory of part files,
+needs pyarrow). Progress is checkpointed to <output>.progress.json after each
+committed chunk; --resume continues an interrupted run from there.
+
+Usage:
+    python3 rescore.py export.json results.csv --path /historical_data
+    python3 rescore.py readings.jsonl results.parquet --workers 4 --chunk 5000
+    python3 rescore.py export.json results.csv --path /sensor_data --resume
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from features import FEATURES
+from scoring import MODEL_PATH, Scorer, build_request
+
+CHUNK_SIZE = 5000
+# Parquet part files hold this many chunks; a checkpoint is written per part
+PARQUET_CHUNKS_PER_PART = 20
+PROGRESS_INTERVAL = 2.0
+
+OUTPUT_COLUMNS = ("key", "field_id", "node_id", "timestamp") + FEATURES + (
+    "irrigation_needed", "confidence", "reason_code", "reason", "model_version", "error")
+
+# Push keys written by push_test_data.py are epoch milliseconds
+MIN_EPOCH_MS = 10**12
+
+
+# Input readers: each yields (key, value) and exposes the bytes consumed so far
+
+class JsonExportReader:
+    """
+    Stream the children of one object in a (possibly huge) JSON document
+
+    Only the children that are yielded are ever materialized; everything else
+    is scanned past character by character.
+    """
+
+    _STRUCTURAL = re.compile(r'["{}\[\]]')
+
+    def __init__(self, path, subpath=None, read_size=1 << 20):
+        self.file = open(path, "r", encoding="utf-8")
+        self.segments = [s for s in (subpath or "").split("/") if s]
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    @property
+    def bytes_read(self):
+        return self.file.buffer.tell()
+
+    def _fill(self, minimum=0):
+        """Drop the consumed prefix and read at least `minimum` more characters"""
+        if self.eof:
+            return False
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        chunk = self.file.read(max(self.read_size, minimum))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def _peek(self):
+        """Next non-whitespace character (without consuming it), or '' at EOF"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars or not char:
+            raise ValueError(f"Malformed JSON export: expected {chars!r}, got {char!r}")
+        self.pos += 1
+        return char
+
+    def _value(self):
+        """Decode the next value, reading more input until it is complete"""
+        self._peek()
+        want = self.read_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number at the very end of the buffer may continue in the next read
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow geometrically so one large value is not re-parsed once per read
+            self._fill(want)
+            want *= 2
+
+    def _skip(self):
+        """Consume the next value without building it"""
+        if self._peek() not in "{[":
+            self._value()
+            return
+        depth = 0
+        while True:
+            match = self._STRUCTURAL.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("Malformed JSON export: unexpected end of file")
+                continue
+            self.pos = match.start()
+            char = match.group()
+            if char == '"':
+                self._value()  # strings may contain brackets
+                continue
+            self.pos += 1
+            depth += 1 if char in "{[" else -1
+            if depth == 0:
+                return
+
+    def _children(self):
+        """(key, value) of the container at the current position"""
+        opening = self._expect("{[")
+        if opening == "[":
+            # RTDB exports small sequential integer keys as an array
+            index = 0
+            if self._peek() == "]":
+                self.pos += 1
+                return
+            while True:
+                yield str(index), self._value()
+                index += 1
+                if self._expect(",]") == "]":
+                    return
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            yield key, self._value()
+            if self._expect(",}") == "}":
+                return
+
+    def __iter__(self):
+        for segment in self.segments:
+            # Descend: skip every sibling until the segment's key
+            if self._peek() != "{":
+                raise KeyError(f"/{'/'.join(self.segments)}: '{segment}' is not an object key")
+            self._expect("{")
+            while True:
+                if self._peek() == "}":
+                    raise KeyError(f"/{'/'.join(self.segments)}: no key '{segment}'")
+                key = self._value()
+                self._expect(":")
+                if key == segment:
+                    break
+                self._skip()
+                if self._expect(",}") == "}":
+                    raise KeyError(f"/{'/'.join(self.segments)}: no key '{segment}'")
+        if self._peek() == "n":
+            return  # the path exists but is null
+        for key, value in self._children():
+            if value is not None:
+                yield key, value
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesReader:
+    """One JSON reading per line; {"key": ..., "value": ...} lines are unwrapped"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+
+    @property
+    def bytes_read(self):
+        return self.file.tell()
+
+    def __iter__(self):
+        for number, line in enumerate(iter(self.file.readline, b""), 1):
+            if not line.strip():
+                continue
+            value = json.loads(line)
+            key = number
+            if isinstance(value, dict) and "key" in value:
+                key = value["key"]
+                value = value["value"] if "value" in value else {k: v for k, v in value.items() if k != "key"}
+            yield str(key), value
+
+    def close(self):
+        self.file.close()
+
+
+class CsvReader:
+    """CSV with a header row; numeric columns are converted, empty cells dropped"""
+
+    def __init__(self, path):
+        self.raw = open(path, "rb")
+        self.file = io.TextIOWrapper(self.raw, encoding="utf-8", newline="")
+
+    @property
+    def bytes_read(self):
+        return self.raw.tell()
+
+    def __iter__(self):
+        for number, row in enumerate(csv.DictReader(self.file), 1):
+            key = row.pop("key", None) or number
+            reading = {}
+            for name, text in row.items():
+                if text is None or text == "":
+                    continue
+                try:
+                    reading[name] = int(text) if text.lstrip("-").isdigit() else float(text)
+                except ValueError:
+                    reading[name] = text
+            yield str(key), reading
+
+    def close(self):
+        self.file.close()
+
+
+def open_reader(path, subpath=None):
+    if path.endswith(".jsonl") or path.endswith(".ndjson"):
+        return JsonLinesReader(path)
+    if path.endswith(".csv"):
+        return CsvReader(path)
+    return JsonExportReader(path, subpath)
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Scoring (runs in the worker processes)
+
+_worker = {}
+
+
+def init_worker(model_path):
+    """Load the model once per worker process"""
+    scorer = Scorer.from_file(model_path)
+    scorer.warm_up()
+    _worker["scorer"] = scorer
+    _worker["version"] = os.path.splitext(os.path.basename(model_path))[0]
+
+
+def score_chunk(items):
+    """
+    Decode and score one chunk of (key, value) readings
+
+    Returns:
+        List of output rows (tuples in OUTPUT_COLUMNS order), one per input
+    """
+    scorer, version = _worker["scorer"], _worker["version"]
+    readings, failed = [], {}
+    for i, (_, value) in enumerate(items):
+        try:
+            if not isinstance(value, (dict, str, bytes)):
+                raise ValueError("Reading must be a JSON object or a LoRa payload")
+            readings.append(build_request(value))
+        except ValueError as e:
+            readings.append({})
+            failed[i] = str(e)
+
+    X, valid, errors = scorer.encoder.encode_batch(readings)
+    for error in errors:
+        failed.setdefault(error["index"], error["error"])
+    scored = {}
+    if valid:
+        predictions, confidences, reasons = scorer.score_matrix(X, [readings[i].get("field_id") for i in valid])
+        for i, prediction, confidence, code in zip(valid, predictions, confidences, reasons):
+            scored[i] = (int(prediction), round(float(confidence), 4), int(code))
+
+    rows = []
+    for i, (key, _) in enumerate(items):
+        reading = readings[i]
+        timestamp = reading.get("timestamp")
+        if timestamp is None and key.isdigit() and int(key) >= MIN_EPOCH_MS:
+            timestamp = int(key)
+        features = tuple(reading.get(name) for name in FEATURES)
+        if i in scored:
+            prediction, confidence, code = scored[i]
+            result = (prediction, confidence, code, scorer.rules.reason(code, reading), version, None)
+        else:
+            result = (None, None, None, None, version, failed.get(i))
+        rows.append((key, reading.get("field_id"), reading.get("node_id"), timestamp) + features + result)
+    return rows
+
+
+# Output sinks: rows are written in input order, commit() makes them durable
+
+class CsvSink:
+    def __init__(self, path, state=None):
+        self.path = path
+        if state is None:
+            self.file = open(path, "w", newline="", encoding="utf-8")
+            csv.writer(self.file).writerow(OUTPUT_COLUMNS)
+        else:
+            # Drop whatever was written after the last checkpoint
+            with open(path, "r+b") as f:
+                f.truncate(state["output_bytes"])
+            self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.pending = 0
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.pending += 1
+        return True  # commit after every chunk
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        return {"output_bytes": self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """Directory of part-NNNNN.parquet files, PARQUET_CHUNKS_PER_PART chunks each"""
+
+    def __init__(self, path, state=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("✗ Parquet output needs pyarrow: pip install pyarrow (or write .csv)")
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.part = 0 if state is None else state["parts"]
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            # Parts after the checkpoint are incomplete or from an older run
+            if name.endswith(".tmp") or (name.startswith("part-") and int(name[5:10]) >= self.part):
+                os.remove(os.path.join(path, name))
+        self.writer = None
+        self.pending = 0
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        table = self.pa.table({name: list(column) for name, column in zip(OUTPUT_COLUMNS, columns)})
+        if self.writer is None:
+            self.tmp = os.path.join(self.path, f"part-{self.part:05d}.parquet.tmp")
+            self.writer = self.pq.ParquetWriter(self.tmp, table.schema)
+        else:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+        self.pending += 1
+        return self.pending >= PARQUET_CHUNKS_PER_PART
+
+    def commit(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.tmp, os.path.join(self.path, f"part-{self.part:05d}.parquet"))
+            self.writer = None
+            self.part += 1
+        self.pending = 0
+        return {"parts": self.part}
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.tmp)
+
+
+# Checkpoints
+
+def input_identity(path, subpath, chunk_size, model_path):
+    stat = os.stat(path)
+    return {"input": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime,
+            "path": subpath, "chunk_size": chunk_size, "model": os.path.abspath(model_path)}
+
+
+def load_checkpoint(progress_path, identity):
+    """
+    Checkpoint of an interrupted run over the same input
+
+    Raises:
+        SystemExit: If the checkpoint belongs to a different input or settings
+    """
+    with open(progress_path) as f:
+        state = json.load(f)
+    if state["identity"] != identity:
+        raise SystemExit(f"✗ {progress_path} is from a different input, path, chunk size or model - "
+                         f"delete it or run without --resume")
+    return state
+
+
+def save_checkpoint(progress_path, state):
+    tmp = f"{progress_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, progress_path)
+
+
+def rescore(input_path, output_path, subpath=None, workers=None, chunk_size=CHUNK_SIZE,
+            model_path=MODEL_PATH, resume=False):
+    """
+    Score every reading of an export and write the results
+
+    Returns:
+        Summary dictionary (rows, errors, seconds, rows_per_s)
+    """
+    workers = workers or os.cpu_count() or 1
+    progress_path = f"{output_path}.progress.json"
+    identity = input_identity(input_path, subpath, chunk_size, model_path)
+    state = None
+    if resume and os.path.exists(progress_path) and os.path.exists(output_path):
+        state = load_checkpoint(progress_path, identity)
+        if state.get("done"):
+            print(f"✓ {output_path} is already complete ({state['rows']} rows)")
+            return state
+        print(f"↻ Resuming after {state['rows']:,} rows")
+    parquet = output_path.endswith(".parquet")
+    sink = (ParquetSink if parquet else CsvSink)(output_path, state and state["sink"])
+    done_rows = state["rows"] if state else 0
+    errors = state["errors"] if state else 0
+
+    reader = open_reader(input_path, subpath)
+    total_bytes = max(1, identity["size"])
+    items = iter(reader)
+    for _ in range(done_rows):
+        next(items)  # already scored before the interruption
+    chunks = chunked(items, chunk_size)
+
+    if workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(model_path,))
+    else:
+        pool = None
+        init_worker(model_path)
+
+    started = last_report = time.perf_counter()
+    new_rows = uncommitted_rows = uncommitted_errors = 0
+    try:
+        # At most 2 chunks per worker in flight keeps memory bounded and the output ordered
+        in_flight = []
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < 2 * workers:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                elif pool is None:
+                    in_flight.append(score_chunk(chunk))
+                else:
+                    in_flight.append(pool.submit(score_chunk, chunk))
+            if not in_flight:
+                break
+            rows = in_flight.pop(0)
+            rows = rows if pool is None else rows.result()
+            uncommitted_rows += len(rows)
+            uncommitted_errors += sum(1 for row in rows if row[-1] is not None)
+            if sink.write(rows):
+                done_rows += uncommitted_rows
+                errors += uncommitted_errors
+                new_rows += uncommitted_rows
+                uncommitted_rows = uncommitted_errors = 0
+                save_checkpoint(progress_path, {"identity": identity, "rows": done_rows, "errors": errors,
+                                                "sink": sink.commit(), "done": False})
+
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                rate = (new_rows + uncommitted_rows) / (now - started)
+                print(f"\r  {done_rows + uncommitted_rows:>12,} rows  "
+                      f"{min(100.0, reader.bytes_read / total_bytes * 100):5.1f}%  {rate:>10,.0f} rows/s",
+                      end="", flush=True)
+
+        done_rows += uncommitted_rows
+        errors += uncommitted_errors
+        new_rows += uncommitted_rows
+        summary = {"identity": identity, "rows": done_rows, "errors": errors, "sink": sink.commit(), "done": True}
+        save_checkpoint(progress_path, summary)
+    finally:
+        sink.close()
+        reader.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    summary.update(seconds=round(elapsed, 2), rows_per_s=round(new_rows / elapsed, 1) if elapsed else 0.0)
+    print(f"\r  {done_rows:>12,} rows  100.0%  {summary['rows_per_s']:>10,.0f} rows/s")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score historical readings in bulk")
+    parser.add_argument("input", help="RTDB JSON export, .jsonl or .csv")
+    parser.add_argument("output", help="Results: .csv file or .parquet directory")
+    parser.add_argument("--path", help="Subtree of the JSON export, e.g. /historical_data")
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (default: all cores)")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="Readings per chunk")
+    parser.add_argument("--model", default=MODEL_PATH, help="Model pickle to score with")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"  Re-scoring {args.input}{args.path or ''} with {args.model}")
+    print("=" * 60)
+    try:
+        summary = rescore(args.input, args.output, args.path, args.workers, args.chunk, args.model, args.resume)
+    except KeyboardInterrupt:
+        print("\n⚠ Interrupted - run again with --resume to continue")
+        return 130
+    except (KeyError, ValueError, OSError) as e:
+        print(f"\n✗ {e.args[0] if isinstance(e, KeyError) else e}")
+        return 1
+    print(f"\n✓ {summary['rows']:,} readings ({summary['errors']:,} rejected) → {args.output}")
+    if "seconds" in summary:
+        print(f"  {summary['seconds']} s, {summary['rows_per_s']:,.0f} rows/s")
+    print("\n" + "=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+"""
+Declarative decision rules applied on top of the model's prediction.
+
+The override and reason logic is a table rather than code: named rule sets
+(one per crop, field or anything else) hold an ordered list of rules, and
+fields are mapped to a rule set. The first rule of a reading's set whose
+conditions all hold decides the reason text and may force the decision and
+its confidence; when none fires the model's decision stands with the
+"good" reason.
+
+    {
+      "rule_sets": {
+        "default": [
+          {"name": "critical_soil", "when": [["soil", "<", 100]], "irrigate": 1, "confidence": 0.95,
+           "reason": "CRITICAL: Very low soil moisture ({soil}) - immediate irrigation required"},
+          ...
+        ],
+        "rice": [...]
+      },
+      "fields": {"field_3": "rice"}
+    }
+
+The table is read from RULES_PATH (rules.example.json shows the format; the
+built-in DEFAULT_RULES apply when the file does not exist) and compiled once
+per loaded model into column indices and comparison functions. A batch is
+evaluated with one NumPy mask per condition and np.select, a single reading
+with a loop over plain tuples, so neither path parses anything per request.
+
+Usage:
+    python3 rules.py [rules.json]     # validate a table and print the compiled rules
+"""
+
+import json
+import operator
+import os
+import string
+import sys
+
+import numpy as np
+
+from features import FEATURE_DEFAULTS, FEATURES
+
+RULES_PATH = os.environ.get("RULES_PATH", "rules.json")
+
+DEFAULT_RULE_SET = "default"
+GOOD = "good"
+GOOD_REASON = "Good moisture levels - no irrigation needed"
+
+# Comparison operators; the same functions work on scalars and NumPy columns
+OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+             "==": operator.eq, "!=": operator.ne}
+
+# Soil moisture is a 12-bit ADC reading (0 = very dry)
+DEFAULT_RULES = {
+    "rule_sets": {
+        DEFAULT_RULE_SET: [
+            {"name": "critical_soil", "when": [["soil", "<", 100]], "irrigate": 1, "confidence": 0.95,
+             "reason": "CRITICAL: Very low soil moisture ({soil}) - immediate irrigation required"},
+            {"name": "low_soil", "when": [["soil", "<", 300]], "irrigate": 1, "confidence": 0.95,
+             "reason": "Low soil moisture ({soil}) - irrigation required"},
+            {"name": "low_humidity", "when": [["humidity", "<", 30]],
+             "reason": "Low humidity - monitor soil moisture closely"},
+        ],
+    },
+    "fields": {},
+}
+
+
+def load_rules(path=RULES_PATH):
+    """
+    Rule table configuration from a JSON file
+
+    Returns:
+        The parsed table, or DEFAULT_RULES when the file does not exist
+
+    Raises:
+        ValueError: If the file is not valid JSON
+    """
+    if not path or not os.path.exists(path):
+        return DEFAULT_RULES
+    with open(path) as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from None
+
+
+class _Reading(dict):
+    """Reading for str.format_map(); missing features fall back to their defaults"""
+
+    def __init__(self, data, defaults):
+        super().__init__(data)
+        self._defaults = defaults
+
+    def __missing__(self, key):
+        return self._defaults.get(key, "")
+
+
+class RuleTable:
+    """
+    Compiled rule table
+
+    Every rule of every set gets a code (its index in `names`); code 0 is the
+    "good" outcome when no rule fires.
+    """
+
+    def __init__(self, config=None, features=FEATURES, defaults=FEATURE_DEFAULTS):
+        """
+        Args:
+            config: Table as described in the module docstring (default: DEFAULT_RULES)
+            features: Feature names in encoder column order (conditions refer to these)
+            defaults: Feature values used when a reading omits one
+
+        Raises:
+            ValueError: If the table is malformed
+        """
+        config = DEFAULT_RULES if config is None else config
+        self.features = tuple(features)
+        self.defaults = dict(defaults)
+        rule_sets = config.get("rule_sets") if isinstance(config, dict) else None
+        if not isinstance(rule_sets, dict) or DEFAULT_RULE_SET not in rule_sets:
+            raise ValueError(f"Rule table needs a 'rule_sets' object with a '{DEFAULT_RULE_SET}' set")
+
+        self.set_names = (DEFAULT_RULE_SET,) + tuple(name for name in rule_sets if name != DEFAULT_RULE_SET)
+        self.names = [GOOD]
+        self.reasons = [config.get("good_reason", GOOD_REASON)]
+        self._conditions = [()]   # per code: ((column, feature, op symbol, function, value), ...)
+        self._set_codes = []      # per set: codes in priority order
+        irrigate, confidence = [-1], [np.nan]
+        for set_name in self.set_names:
+            rules = rule_sets[set_name]
+            if not isinstance(rules, list):
+                raise ValueError(f"Rule set '{set_name}' must be a list of rules")
+            codes = []
+            for position, rule in enumerate(rules):
+                where = f"rule_sets.{set_name}[{position}]"
+                if not isinstance(rule, dict) or not isinstance(rule.get("name"), str):
+                    raise ValueError(f"{where}: a rule is an object with a 'name'")
+                self._conditions.append(tuple(self._compile_condition(c, where) for c in rule.get("when", [])))
+                irrigate.append(self._compile_action(rule, where))
+                value = rule.get("confidence")
+                if value is not None and not (isinstance(value, (int, float)) and 0 <= value <= 1):
+                    raise ValueError(f"{where}: confidence must be between 0 and 1")
+                confidence.append(np.nan if value is None else float(value))
+                reason = rule.get("reason", rule["name"])
+                self._check_reason(reason, where)
+                codes.append(len(self.names))
+                self.names.append(rule["name"])
+                self.reasons.append(reason)
+            self._set_codes.append(tuple(codes))
+        self.names = tuple(self.names)
+        self.reasons = tuple(self.reasons)
+        self._irrigate = np.array(irrigate, dtype=np.int8)
+        self._confidence = np.array(confidence, dtype=np.float64)
+        self._actions = tuple((None if i < 0 else i, None if np.isnan(c) else c)
+                              for i, c in zip(irrigate, confidence))
+        self._templated = tuple("{" in reason for reason in self.reasons)
+        self._single = tuple(
+            tuple((code, tuple((feature, function, value) for _, feature, _, function, value in self._conditions[code]))
+                  for code in codes)
+            for codes in self._set_codes
+        )
+        self._compile_groups()
+
+        fields = config.get("fields", {})
+        if not isinstance(fields, dict):
+            raise ValueError("'fields' must map field IDs to rule set names")
+        unknown = sorted(set(fields.values()) - set(self.set_names))
+        if unknown:
+            raise ValueError(f"Fields refer to unknown rule sets: {unknown}")
+        self._field_sets = {field_id: self.set_names.index(name) for field_id, name in fields.items()}
+        self._safe = {}
+
+    @classmethod
+    def from_file(cls, path=RULES_PATH, **kwargs):
+        return cls(load_rules(path), **kwargs)
+
+    def _compile_groups(self):
+        """
+        Group rule sets of the same shape (same rules, features and operators)
+
+        Sets that differ only in thresholds, e.g. one per crop, are evaluated
+        together: their thresholds and codes become matrices indexed by rule set,
+        so a batch gathers each row's thresholds and runs one pass for the group.
+        """
+        shapes = {}
+        self._set_group = np.zeros(len(self._set_codes), dtype=np.intp)
+        for index, codes in enumerate(self._set_codes):
+            shape = tuple(tuple((column, symbol) for column, _, symbol, _, _ in self._conditions[code])
+                          for code in codes)
+            self._set_group[index] = shapes.setdefault(shape, len(shapes))
+        self._groups = []
+        for shape, group in shapes.items():
+            spec, position = [], 0
+            for rule in shape:
+                spec.append(tuple((column, OPERATORS[symbol], position + j) for j, (column, symbol) in enumerate(rule)))
+                position += len(rule)
+            thresholds = np.zeros((len(self._set_codes), position), dtype=np.float64)
+            rule_codes = np.zeros((len(self._set_codes), len(shape)), dtype=np.intp)
+            for index in np.flatnonzero(self._set_group == group):
+                row = [value for code in self._set_codes[index] for *_, value in self._conditions[code]]
+                thresholds[index] = row
+                rule_codes[index] = self._set_codes[index]
+            self._groups.append((tuple(spec), thresholds, rule_codes))
+
+    def _compile_condition(self, condition, where):
+        if not (isinstance(condition, (list, tuple)) and len(condition) == 3):
+            raise ValueError(f"{where}: a condition is [feature, operator, value], got {condition!r}")
+        feature, symbol, value = condition
+        if feature not in self.features:
+            raise ValueError(f"{where}: unknown feature {feature!r} (use one of {', '.join(self.features)})")
+        if symbol not in OPERATORS:
+            raise ValueError(f"{where}: unknown operator {symbol!r} (use one of {' '.join(OPERATORS)})")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{where}: threshold must be a number, got {value!r}")
+        return self.features.index(feature), feature, symbol, OPERATORS[symbol], value
+
+    @staticmethod
+    def _compile_action(rule, where):
+        value = rule.get("irrigate")
+        if value is None:
+            return -1
+        if value not in (0, 1) or isinstance(value, float):
+            raise ValueError(f"{where}: irrigate must be 0, 1 or null (keep the model's decision)")
+        return int(value)
+
+    def _check_reason(self, reason, where):
+        if not isinstance(reason, str):
+            raise ValueError(f"{where}: reason must be a string")
+        try:
+            fields = [name for _, name, _, _ in string.Formatter().parse(reason) if name is not None]
+        except ValueError as e:
+            raise ValueError(f"{where}: reason {reason!r}: {e}") from None
+        unknown = [name for name in fields if name not in self.features]
+        if unknown:
+            raise ValueError(f"{where}: reason refers to unknown fields {unknown}")
+
+    def rule_set(self, field_id):
+        """Index of the rule set of a field (unmapped fields use the default set)"""
+        return self._field_sets.get(field_id, 0)
+
+    def rule_sets(self, field_ids):
+        """
+        Rule set index per row, or None when every row uses the default set
+
+        Args:
+            field_ids: Field ID per row (None entries use the default set)
+        """
+        if not self._field_sets:
+            return None
+        indices = [self._field_sets.get(field_id, 0) for field_id in field_ids]
+        return np.array(indices, dtype=np.intp) if any(indices) else None
+
+    def evaluate(self, X, rule_sets=None):
+        """
+        Code of the rule that fires for each row
+
+        Args:
+            X: Unscaled feature matrix in encoder column order
+            rule_sets: Rule set index per row (see rule_sets()), or None for the default set
+
+        Returns:
+            Array of codes (0 where no rule fires)
+        """
+        codes = np.zeros(len(X), dtype=np.intp)
+        if rule_sets is None or not len(X):
+            self._evaluate_set(X, 0, codes)
+            return codes
+        if (rule_sets == rule_sets[0]).all():
+            self._evaluate_set(X, int(rule_sets[0]), codes)
+            return codes
+        groups = self._set_group[rule_sets]
+        if (groups == groups[0]).all():
+            self._evaluate_group(X, rule_sets, int(groups[0]), codes)
+            return codes
+        # Rows sorted by group, so every group is evaluated on a contiguous slice only
+        order = np.argsort(groups, kind="stable")
+        ordered = groups[order]
+        bounds = [0] + (np.flatnonzero(np.diff(ordered)) + 1).tolist() + [len(ordered)]
+        X, rule_sets, grouped = X[order], rule_sets[order], np.zeros(len(X), dtype=np.intp)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            self._evaluate_group(X[start:end], rule_sets[start:end], int(ordered[start]), grouped[start:end])
+        codes[order] = grouped
+        return codes
+
+    def _evaluate_group(self, X, rule_sets, group, codes):
+        """Write the codes of rows whose rule sets share one shape, with per-row thresholds"""
+        spec, thresholds, rule_codes = self._groups[group]
+        thresholds, rule_codes = thresholds[rule_sets], rule_codes[rule_sets]
+        for k in range(len(spec) - 1, -1, -1):
+            mask = None
+            for column, function, position in spec[k]:
+                hit = function(X[:, column], thresholds[:, position])
+                mask = hit if mask is None else mask & hit
+            if mask is None:
+                codes[:] = rule_codes[:, k]
+            else:
+                np.copyto(codes, rule_codes[:, k], where=mask)
+
+    def _evaluate_set(self, X, index, codes):
+        """Write the codes of one rule set's rows into `codes` (lowest priority first, so the first rule wins)"""
+        for code in reversed(self._set_codes[index]):
+            mask = None
+            for column, _, _, function, value in self._conditions[code]:
+                hit = function(X[:, column], value)
+                mask = hit if mask is None else mask & hit
+            if mask is None:
+                codes[:] = code
+            else:
+                np.copyto(codes, code, where=mask)
+
+    def evaluate_one(self, reading, rule_set=0):
+        """Code of the rule that fires for one reading (a validated request dictionary)"""
+        defaults = self.defaults
+        for code, conditions in self._single[rule_set]:
+            for feature, function, value in conditions:
+                observed = reading.get(feature)
+                if not function(defaults.get(feature) if observed is None else observed, value):
+                    break
+            else:
+                return code
+        return 0
+
+    def apply(self, codes, predictions, confidences):
+        """Decisions and confidences after the fired rules' overrides (arrays aligned with codes)"""
+        irrigate = self._irrigate[codes]
+        forced = self._confidence[codes]
+        return (np.where(irrigate >= 0, irrigate, predictions),
+                np.where(np.isnan(forced), confidences, forced))
+
+    def action(self, code):
+        """
+        Override of one rule
+
+        Returns:
+            Tuple of (decision or None, confidence or None); None keeps the model's value
+        """
+        return self._actions[code]
+
+    def reason(self, code, reading):
+        """Reason text of a code, with {feature} placeholders filled from the reading"""
+        if not self._templated[code]:
+            return self.reasons[code]
+        return self.reasons[code].format_map(_Reading(reading, self.defaults))
+
+    def quantization_safe(self, resolution):
+        """
+        Rule sets whose decisions cannot change when readings are snapped down to `resolution`
+
+        A condition keeps its outcome under flooring when it is "<" or ">=" with a
+        threshold on the grid of its feature (e.g. soil < 300 with 1-count steps).
+
+        Args:
+            resolution: Step per feature (see prediction_cache.RESOLUTION)
+
+        Returns:
+            Frozenset of rule set indices
+        """
+        token = tuple(sorted(resolution.items()))
+        if token in self._safe:
+            return self._safe[token]
+        safe = set()
+        for index, codes in enumerate(self._set_codes):
+            ok = True
+            for code in codes:
+                for _, feature, symbol, _, value in self._conditions[code]:
+                    step = resolution.get(feature)
+                    if step is None:
+                        continue
+                    ratio = value / step
+                    if symbol not in ("<", ">=") or abs(ratio - round(ratio)) > 1e-6:
+                        ok = False
+            if ok:
+                safe.add(index)
+        self._safe[token] = frozenset(safe)
+        return self._safe[token]
+
+    def describe(self):
+        """Lines listing every compiled rule"""
+        lines = []
+        for index, set_name in enumerate(self.set_names):
+            fields = sorted(f for f, i in self._field_sets.items() if i == index)
+            lines.append(f"{set_name}" + (f" (fields: {', '.join(fields)})" if fields else ""))
+            for code in self._set_codes[index]:
+                when = " and ".join(f"{feature} {symbol} {value:g}"
+                                    for _, feature, symbol, _, value in self._conditions[code]) or "always"
+                decision, confidence = self.action(code)
+                then = "keep model" if decision is None else f"irrigate={decision}"
+                if confidence is not None:
+                    then += f" @ {confidence:g}"
+                lines.append(f"  [{code}] {self.names[code]}: {when} → {then}")
+        return lines
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else RULES_PATH
+    try:
+        table = RuleTable.from_file(path)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    source = path if os.path.exists(path) else "built-in DEFAULT_RULES"
+    print(f"✓ {len(table.names) - 1} rules in {len(table.set_names)} rule sets ({source})")
+    for line in table.describe():
+        print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,6 @@ try:
     except Exception as e:
         print("Failed to parse JSON:", e)
 except requests.exceptions.ConnectionError:
-    print("Error: Could not connect to Flask server. Make sure it's running on http://127.0.0.1:5000")
+    print("Error: Could not connect to Flask server. Make sure it's running on http://127.0.0.1:5001")
 except Exception as e:
     print(f"Error: {e}")
@@ -0,0 +1,435 @@
+"""
+Irrigation scheduling across fields: pump windows from the prediction stream.
+
+A prediction says whether one reading needs irrigation; switching a relay on
+every one of them makes the pump chatter, and nothing bounds the total draw
+when many fields dry out at once. The scheduler turns the stream into pump
+windows instead:
+
+    demand      every node's P(irrigation needed) (the confidence of a
+                positive prediction, 1 - confidence of a negative one),
+                smoothed per node and averaged over the field's nodes that
+                reported within SCHEDULER_STALE_S
+    hysteresis  a pump starts at demand >= SCHEDULER_ON_THRESHOLD and keeps
+                running until it falls to SCHEDULER_OFF_THRESHOLD
+    timers      a pump stays on for SCHEDULER_MIN_ON_S and off for
+                SCHEDULER_MIN_OFF_S after a switch, whatever the demand; a
+                window ends after SCHEDULER_MAX_ON_S so waiting fields get
+                their turn
+    budget      running pumps draw at most SCHEDULER_MAX_WATTS together and
+                use at most SCHEDULER_DAILY_WATER_L per UTC day (0 = no limit).
+                Running windows keep their share; the rest goes to waiting
+                fields by demand
+
+Each pump has a flow and a power rating (SCHEDULER_PUMPS_PATH, see
+pumps.example.json; one pump per field). observe() updates one field in
+O(nodes of the field). replan() re-evaluates every field with array
+operations, but only when a prediction arrived or a timer expired since the
+last plan, and returns the switches only.
+
+Usage:
+    python3 scheduler.py [pumps.json]     # print the pump table in use
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1").lower() in ("1", "true", "yes")
+SCHEDULER_PUMPS_PATH = os.environ.get("SCHEDULER_PUMPS_PATH", "pumps.json")
+SCHEDULER_ON_THRESHOLD = float(os.environ.get("SCHEDULER_ON_THRESHOLD", 0.7))
+SCHEDULER_OFF_THRESHOLD = float(os.environ.get("SCHEDULER_OFF_THRESHOLD", 0.4))
+SCHEDULER_MIN_ON_S = float(os.environ.get("SCHEDULER_MIN_ON_S", 300))
+SCHEDULER_MIN_OFF_S = float(os.environ.get("SCHEDULER_MIN_OFF_S", 600))
+SCHEDULER_MAX_ON_S = float(os.environ.get("SCHEDULER_MAX_ON_S", 1800))
+SCHEDULER_MAX_WATTS = float(os.environ.get("SCHEDULER_MAX_WATTS", 0))
+SCHEDULER_DAILY_WATER_L = float(os.environ.get("SCHEDULER_DAILY_WATER_L", 0))
+SCHEDULER_STALE_S = float(os.environ.get("SCHEDULER_STALE_S", 900))
+SCHEDULER_MAX_FIELDS = int(os.environ.get("SCHEDULER_MAX_FIELDS", 10000))
+
+DEFAULT_PUMP = {"flow_lpm": 20.0, "watts": 750.0}
+ALPHA = 0.3          # EWMA weight of a node's newest prediction
+DAY_MS = 86400 * 1000
+NEVER = -2**62       # "switched" time of a pump that never switched
+
+# Why a pump is off or waiting (codes in the _blocked array)
+REASONS = ("", "power budget", "water budget")
+OFF_REASONS = {"stale": "no recent predictions", "max_on": "maximum window reached",
+               "demand": "demand fell below the off threshold"}
+
+
+def load_pumps(path=SCHEDULER_PUMPS_PATH):
+    """
+    Pump table from a JSON file
+
+    Returns:
+        {"default": {...}, "fields": {field_id: {...}}}; the built-in default
+        pump for every field when the file does not exist
+
+    Raises:
+        ValueError: If the file is not valid JSON or a rating is not positive
+    """
+    table = {"default": dict(DEFAULT_PUMP), "fields": {}}
+    if not path or not os.path.exists(path):
+        return table
+    with open(path) as f:
+        try:
+            loaded = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from None
+    table["default"].update(loaded.get("default", {}))
+    table["fields"] = {field_id: {**table["default"], **pump} for field_id, pump in loaded.get("fields", {}).items()}
+    for field_id, pump in [("default", table["default"]), *table["fields"].items()]:
+        for rating in ("flow_lpm", "watts"):
+            if not isinstance(pump.get(rating), (int, float)) or pump[rating] <= 0:
+                raise ValueError(f"{path}: {field_id}.{rating} must be a positive number")
+    return table
+
+
+class IrrigationScheduler:
+    """Pump windows of every field, shared by the request threads of a process"""
+
+    def __init__(self, pumps=None, on_threshold=SCHEDULER_ON_THRESHOLD, off_threshold=SCHEDULER_OFF_THRESHOLD,
+                 min_on_s=SCHEDULER_MIN_ON_S, min_off_s=SCHEDULER_MIN_OFF_S, max_on_s=SCHEDULER_MAX_ON_S,
+                 max_watts=SCHEDULER_MAX_WATTS, daily_water_l=SCHEDULER_DAILY_WATER_L,
+                 stale_s=SCHEDULER_STALE_S, max_fields=SCHEDULER_MAX_FIELDS):
+        """
+        Args:
+            pumps: Pump table (load_pumps()); None loads SCHEDULER_PUMPS_PATH
+            on_threshold: Demand at which a pump starts
+            off_threshold: Demand at which a running pump stops
+            min_on_s: Seconds a pump runs at least once started
+            min_off_s: Seconds a pump rests at least once stopped
+            max_on_s: Longest window in seconds
+            max_watts: Power of all running pumps together (0 = no limit)
+            daily_water_l: Litres per UTC day over all pumps (0 = no limit)
+            stale_s: Seconds after which a node's prediction no longer counts
+            max_fields: Fields scheduled; predictions for more are ignored
+
+        Raises:
+            ValueError: If the thresholds or timers are inconsistent
+        """
+        if not 0 <= off_threshold < on_threshold <= 1:
+            raise ValueError(f"Need 0 <= off threshold ({off_threshold}) < on threshold ({on_threshold}) <= 1")
+        if not 0 <= min_on_s <= max_on_s:
+            raise ValueError(f"Need 0 <= minimum on time ({min_on_s} s) <= maximum on time ({max_on_s} s)")
+        self.pumps = load_pumps() if pumps is None else pumps
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.min_on_ms = int(min_on_s * 1000)
+        self.min_off_ms = int(min_off_s * 1000)
+        self.max_on_ms = int(max_on_s * 1000)
+        self.max_watts = max_watts or math.inf
+        self.daily_water_l = daily_water_l or math.inf
+        self.stale_ms = int(stale_s * 1000)
+        self.max_fields = max(1, max_fields)
+
+        self._index = {}
+        self._names = []
+        self._nodes = []
+        capacity = min(self.max_fields, 64)
+        self._demand = np.zeros(capacity)
+        self._updated = np.full(capacity, NEVER, dtype=np.int64)
+        self._on = np.zeros(capacity, dtype=bool)
+        self._switched = np.full(capacity, NEVER, dtype=np.int64)
+        self._started = np.full(capacity, NEVER, dtype=np.int64)
+        self._flow = np.zeros(capacity)
+        self._watts = np.zeros(capacity)
+        self._blocked = np.zeros(capacity, dtype=np.int8)
+
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._next_event = NEVER
+        self._last_ms = None
+        self._day = None
+        self.water_used_l = 0.0
+        self.observed = 0
+        self.ignored = 0
+        self.replans = 0
+        self.skipped = 0
+        self.switches = {"on": 0, "off": 0}
+        self.last_replan_ms = 0.0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _field(self, field_id):
+        """Slot of a field (called with the lock held); None beyond max_fields"""
+        i = self._index.get(field_id)
+        if i is not None:
+            return i
+        i = len(self._names)
+        if i >= self.max_fields:
+            return None
+        if i == len(self._demand):
+            size = min(2 * i, self.max_fields)
+            for name in ("_demand", "_updated", "_on", "_switched", "_started", "_flow", "_watts", "_blocked"):
+                old = getattr(self, name)
+                grown = np.full(size, NEVER if old.dtype == np.int64 else 0, dtype=old.dtype)
+                grown[:i] = old
+                setattr(self, name, grown)
+        pump = self.pumps["fields"].get(field_id, self.pumps["default"])
+        self._flow[i], self._watts[i] = pump["flow_lpm"], pump["watts"]
+        self._index[field_id] = i
+        self._names.append(field_id)
+        self._nodes.append({})
+        return i
+
+    def observe(self, field_id, node_id, irrigation_needed, confidence, now_ms=None):
+        """
+        Take one prediction into its field's demand
+
+        Args:
+            field_id: Field of the reading
+            node_id: Node of the reading (None for single-node fields)
+            irrigation_needed: The prediction (0/1)
+            confidence: Its confidence (0.5-1)
+            now_ms: Time of the prediction (default: now)
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+        need = float(confidence) if irrigation_needed else 1.0 - float(confidence)
+        need = min(1.0, max(0.0, need))
+        with self._lock:
+            self._observe(field_id, node_id, need, now_ms)
+
+    def observe_many(self, field_ids, node_ids, predictions, confidences, now_ms=None):
+        """observe() for a batch of predictions (one lock acquisition)"""
+        now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+        needs = np.where(np.asarray(predictions, dtype=bool), confidences, 1.0 - np.asarray(confidences, dtype=float))
+        with self._lock:
+            for field_id, node_id, need in zip(field_ids, node_ids, np.clip(needs, 0.0, 1.0).tolist()):
+                self._observe(field_id, node_id, need, now_ms)
+
+    def _observe(self, field_id, node_id, need, now_ms):
+        i = self._field(field_id)
+        if i is None:
+            self.ignored += 1
+            return
+        nodes = self._nodes[i]
+        previous = nodes.get(node_id)
+        if previous is not None and now_ms - previous[1] < self.stale_ms:
+            need = previous[0] + ALPHA * (need - previous[0])
+        nodes[node_id] = (need, now_ms)
+        fresh = [value for value, t in nodes.values() if now_ms - t < self.stale_ms]
+        if len(fresh) < len(nodes):
+            for key in [key for key, (_, t) in nodes.items() if now_ms - t >= self.stale_ms]:
+                del nodes[key]
+        self._demand[i] = sum(fresh) / len(fresh)
+        self._updated[i] = now_ms
+        self.observed += 1
+        self._dirty = True
+
+    def _accrue(self, now_ms):
+        """Count the water of the running pumps up to now; reset it at UTC midnight"""
+        day = now_ms // DAY_MS
+        if day != self._day:
+            self.water_used_l = 0.0
+            self._dirty = True
+        if self._last_ms is not None and now_ms > self._last_ms:
+            n = len(self._names)
+            # Litres before midnight belong to the previous day
+            counted_from = max(self._last_ms, day * DAY_MS)
+            self.water_used_l += float(self._flow[:n][self._on[:n]].sum()) * (now_ms - counted_from) / 60000
+        self._day = day
+        self._last_ms = now_ms if self._last_ms is None else max(now_ms, self._last_ms)
+
+    def replan(self, now_ms=None):
+        """
+        Re-evaluate every pump if a prediction arrived or a timer expired
+
+        Args:
+            now_ms: Time of the plan (default: now)
+
+        Returns:
+            List of switches, each {"field_id", "on", "reason", "demand"}
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+        with self._lock:
+            self._accrue(now_ms)
+            if not self._dirty and now_ms < self._next_event:
+                self.skipped += 1
+                return []
+            started = time.perf_counter()
+            switches = self._replan(now_ms)
+            self.last_replan_ms = (time.perf_counter() - started) * 1000
+            self.replans += 1
+            return switches
+
+    def _replan(self, now_ms):
+        n = len(self._names)
+        on, switched, started_ms = self._on[:n], self._switched[:n], self._started[:n]
+        flow, watts = self._flow[:n], self._watts[:n]
+        fresh = now_ms - self._updated[:n] < self.stale_ms
+        demand = np.where(fresh, self._demand[:n], 0.0)
+        since = now_ms - switched
+
+        # Timers first: a pump inside its minimum on/off time keeps its state
+        held_on = on & (since < self.min_on_ms)
+        held_off = ~on & (since < self.min_off_ms)
+        window_over = now_ms - started_ms >= self.max_on_ms
+        keep = on & ~held_on & (demand > self.off_threshold) & ~window_over
+        start = ~on & ~held_off & (demand >= self.on_threshold)
+
+        # Budgets: held pumps take their share, then running windows, then the neediest fields
+        power_left = self.max_watts - watts[held_on].sum()
+        min_on_l = flow * self.min_on_ms / 60000
+        remaining_hold_l = flow[held_on] * (self.min_on_ms - since[held_on]) / 60000
+        water_left = self.daily_water_l - self.water_used_l - remaining_hold_l.sum()
+        candidates = np.flatnonzero(keep | start)
+        order = candidates[np.lexsort((-demand[candidates], ~on[candidates]))]
+        granted = held_on.copy()
+        blocked = np.zeros(n, dtype=np.int8)
+        for i in order.tolist():
+            if watts[i] > power_left:
+                blocked[i] = 1
+            elif water_left <= 0 or (not on[i] and min_on_l[i] > water_left):
+                blocked[i] = 2
+            else:
+                granted[i] = True
+                power_left -= watts[i]
+                if not on[i]:
+                    water_left -= min_on_l[i]
+
+        switches = []
+        for i in np.flatnonzero(granted != on).tolist():
+            if granted[i]:
+                reason = f"demand {demand[i]:.2f} >= {self.on_threshold:g}"
+                started_ms[i] = now_ms
+            elif blocked[i]:
+                reason = REASONS[blocked[i]]
+            elif not fresh[i]:
+                reason = OFF_REASONS["stale"]
+            elif window_over[i]:
+                reason = OFF_REASONS["max_on"]
+            else:
+                reason = OFF_REASONS["demand"]
+            switched[i] = now_ms
+            self.switches["on" if granted[i] else "off"] += 1
+            switches.append({"field_id": self._names[i], "on": bool(granted[i]), "reason": reason,
+                             "demand": round(float(demand[i]), 3)})
+        on[:] = granted
+        self._blocked[:n] = blocked
+
+        # Next time the plan can change without a new prediction
+        events = [switched[on] + self.min_on_ms, started_ms[on] + self.max_on_ms,
+                  switched[~on & (demand >= self.on_threshold)] + self.min_off_ms,
+                  self._updated[:n][fresh] + self.stale_ms, [(now_ms // DAY_MS + 1) * DAY_MS]]
+        running_flow = flow[on].sum()
+        if running_flow and math.isfinite(self.daily_water_l):
+            left = self.daily_water_l - self.water_used_l
+            events.append([now_ms + max(0, int(left / running_flow * 60000))])
+        upcoming = np.concatenate([np.asarray(e, dtype=np.int64) for e in events])
+        upcoming = upcoming[upcoming > now_ms]
+        self._next_event = int(upcoming.min()) if len(upcoming) else math.inf
+        self._dirty = False
+        return switches
+
+    def command(self, field_id, now_ms=None):
+        """
+        Relay state of a field's pump (what a controller polling the API applies)
+
+        Returns:
+            {"field_id", "on", "until_ms", "reason", "demand"}, or None for an unknown field
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+        self.replan(now_ms)
+        with self._lock:
+            i = self._index.get(field_id)
+            if i is None:
+                return None
+            return self._entry(i, now_ms)
+
+    def _entry(self, i, now_ms):
+        on = bool(self._on[i])
+        fresh = now_ms - self._updated[i] < self.stale_ms
+        demand = float(self._demand[i]) if fresh else 0.0
+        entry = {"field_id": self._names[i], "on": on, "demand": round(demand, 3),
+                 "since_ms": int(self._switched[i]) if self._switched[i] != NEVER else None}
+        if on:
+            # Ends earlier if the demand falls below the off threshold after the minimum on time
+            entry["until_ms"] = int(self._started[i] + self.max_on_ms)
+            entry["reason"] = "irrigating"
+        elif self._blocked[i]:
+            entry["until_ms"] = None
+            entry["reason"] = f"waiting: {REASONS[self._blocked[i]]}"
+        else:
+            hold = self._switched[i] + self.min_off_ms
+            entry["until_ms"] = int(hold) if hold > now_ms else None
+            entry["reason"] = ("resting" if hold > now_ms and demand >= self.on_threshold
+                               else "no irrigation needed")
+        return entry
+
+    def plan(self, now_ms=None, field_id=None):
+        """
+        Current plan: budget use and one entry per field (running and waiting first)
+
+        Args:
+            now_ms: Time of the plan (default: now)
+            field_id: Only this field's entry
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else int(now_ms)
+        self.replan(now_ms)
+        with self._lock:
+            n = len(self._names)
+            on = self._on[:n]
+            indices = ([self._index[field_id]] if field_id in self._index else []) if field_id is not None else \
+                np.lexsort((-self._demand[:n], self._blocked[:n] == 0, ~on)).tolist()
+            return {
+                "time_ms": now_ms,
+                "running": int(on.sum()),
+                "waiting": int((self._blocked[:n] > 0).sum()),
+                "watts": float(self._watts[:n][on].sum()),
+                "max_watts": self.max_watts if math.isfinite(self.max_watts) else None,
+                "water_used_l": round(self.water_used_l, 1),
+                "daily_water_l": self.daily_water_l if math.isfinite(self.daily_water_l) else None,
+                "fields": [self._entry(i, now_ms) for i in indices],
+            }
+
+    def stats(self):
+        with self._lock:
+            n = len(self._names)
+            on = self._on[:n]
+            return {
+                "fields": n,
+                "running": int(on.sum()),
+                "waiting": int((self._blocked[:n] > 0).sum()),
+                "watts": float(self._watts[:n][on].sum()),
+                "water_used_l": round(self.water_used_l, 1),
+                "observed": self.observed,
+                "ignored": self.ignored,
+                "replans": self.replans,
+                "replans_skipped": self.skipped,
+                "last_replan_ms": round(self.last_replan_ms, 3),
+                "switches": dict(self.switches),
+                "thresholds": {"on": self.on_threshold, "off": self.off_threshold},
+            }
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else SCHEDULER_PUMPS_PATH
+    try:
+        pumps = load_pumps(path)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    source = path if os.path.exists(path) else "built-in default"
+    default = pumps["default"]
+    print(f"✓ Pump table ({source}): default {default['flow_lpm']:g} L/min, {default['watts']:g} W")
+    for field_id, pump in sorted(pumps["fields"].items()):
+        print(f"  {field_id}: {pump['flow_lpm']:g} L/min, {pump['watts']:g} W")
+    limits = (f"{SCHEDULER_MAX_WATTS:g} W" if SCHEDULER_MAX_WATTS else "no power limit",
+              f"{SCHEDULER_DAILY_WATER_L:g} L/day" if SCHEDULER_DAILY_WATER_L else "no water limit")
+    print(f"  on at {SCHEDULER_ON_THRESHOLD:g}, off at {SCHEDULER_OFF_THRESHOLD:g}; "
+          f"min on {SCHEDULER_MIN_ON_S:g} s, min off {SCHEDULER_MIN_OFF_S:g} s, max on {SCHEDULER_MAX_ON_S:g} s; "
+          f"{limits[0]}, {limits[1]}")
+
+
+if __name__ == "__main__":
+    main()
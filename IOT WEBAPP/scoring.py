@@ -0,0 +1,181 @@
+"""
+Irrigation scoring shared by the Flask API and the gateway daemon.
+
+Loads the model artifact and turns encoded readings into decisions: one
+predict_proba call gives the model's class and confidence, then the decision
+rules (rules.py) pick the reason and apply their overrides.
+"""
+
+import os
+import pickle
+import time
+
+import numpy as np
+
+from features import FeatureEncoder
+from lora_frame import decode_any
+from rules import RuleTable
+
+MODEL_PATH = os.environ.get("MODEL_PATH", "irrigation_model.pkl")
+
+# "auto": serve from the memory-mapped artifact (built from the pickle on first
+# use, see model_artifact.py); "pickle": always unpickle the scikit-learn model
+MODEL_FORMAT = os.environ.get("MODEL_FORMAT", "auto")
+
+
+def load_model(path=MODEL_PATH, model_format=None):
+    """
+    Load the model (and scaler)
+
+    Returns:
+        Tuple of (model, scaler or None)
+    """
+    if (model_format or MODEL_FORMAT) == "pickle":
+        return load_pickle(path)
+    from model_artifact import load_or_build
+    return load_or_build(path, load_pickle)
+
+
+def load_pickle(path=MODEL_PATH):
+    """
+    Load the model (and scaler) from a pickle
+
+    Supports both the {"model", "scaler"} dictionary format and the old
+    format that holds only the model.
+
+    Returns:
+        Tuple of (model, scaler or None)
+    """
+    with open(path, "rb") as f:
+        model_data = pickle.load(f)
+    if isinstance(model_data, dict):
+        return model_data["model"], model_data["scaler"]
+    # Old format - just the model
+    return model_data, None
+
+
+def build_request(sensor_data):
+    """
+    Prepare a reading in the format expected by the API
+
+    Args:
+        sensor_data: Dictionary containing sensor readings, or the raw LoRa
+            payload (text or hex binary frame) stored by the ground node
+
+    Returns:
+        Prediction request dictionary
+
+    Raises:
+        ValueError: If a raw LoRa payload cannot be parsed
+    """
+    if isinstance(sensor_data, (str, bytes)):
+        sensor_data = decode_any(sensor_data)
+
+    request = {
+        "soil": sensor_data.get("soil", sensor_data.get("soilMoisture", 0)),
+        "light": sensor_data.get("light", sensor_data.get("lightIntensity", 0)),
+        "temperature": sensor_data.get("temperature", sensor_data.get("temp", 0)),
+        "humidity": sensor_data.get("humidity", 0),
+        "pH": sensor_data.get("pH", sensor_data.get("ph", 7.0)),
+        "npk": sensor_data.get("npk", 25),
+        "rainfall": sensor_data.get("rainfall", 0)
+    }
+    # Routing and ordering information is passed through when present
+    for key in ("field_id", "node_id", "seq", "timestamp"):
+        if key in sensor_data:
+            request[key] = sensor_data[key]
+    return request
+
+
+class Scorer:
+    """Model + encoder + decision rules, built once per loaded model"""
+
+    def __init__(self, model, scaler=None, rules=None):
+        """
+        Args:
+            model: Classifier with predict_proba and classes_
+            scaler: Fitted StandardScaler, or None
+            rules: RuleTable (default: compiled from RULES_PATH)
+        """
+        self.model = model
+        self.scaler = scaler
+        self.encoder = FeatureEncoder(scaler)
+        self.rules = rules if rules is not None else RuleTable.from_file(
+            features=self.encoder.features, defaults=self.encoder.defaults)
+
+    @classmethod
+    def from_file(cls, path=MODEL_PATH, model_format=None, rules=None):
+        return cls(*load_model(path, model_format), rules=rules)
+
+    def warm_up(self):
+        """Run one prediction so the first request doesn't pay for lazy initialization"""
+        self.score_one({"soil": 500, "light": 500, "temperature": 25, "humidity": 50, "pH": 7.0})
+
+    def score_matrix(self, X, field_ids=None):
+        """
+        Score many feature rows in one vectorized pass
+
+        A single predict_proba call yields both the class (argmax) and the
+        confidence (max probability). The decision rules are evaluated as masks
+        on the unscaled rows before scaling.
+
+        Args:
+            X: Unscaled feature matrix from encoder.encode_batch() (scaled in place)
+            field_ids: Field ID per row, selecting its rule set (default: the default set)
+
+        Returns:
+            Tuple of (predictions, confidences, rule codes) as NumPy arrays;
+            self.rules.names[code] is the rule that fired
+        """
+        reasons = self.rules.evaluate(X, None if field_ids is None else self.rules.rule_sets(field_ids))
+
+        proba = self.model.predict_proba(self.encoder.scale(X))
+        best = proba.argmax(axis=1)
+        model_prediction = self.model.classes_[best].astype(int)
+        confidence = proba[np.arange(len(best)), best]
+
+        predictions, confidences = self.rules.apply(reasons, model_prediction, confidence)
+        return predictions, confidences, reasons
+
+    def score_one(self, data, stages=None):
+        """
+        Score a single reading
+
+        Args:
+            data: Request dictionary with sensor readings
+            stages: Optional dictionary that receives the seconds spent in
+                "encode" (validation and scaling), "predict" and "decide"
+
+        Returns:
+            Tuple of (prediction, confidence, reason, rule code); the reading's
+            "field_id" selects the rule set
+
+        Raises:
+            ValueError: If the reading fails validation
+        """
+        if stages is not None:
+            started = time.perf_counter()
+            X = self.encoder.encode(data)
+            encoded = time.perf_counter()
+            proba = self.model.predict_proba(X)[0]
+            predicted = time.perf_counter()
+            result = self._decide(proba, data)
+            stages["encode"] = encoded - started
+            stages["predict"] = predicted - encoded
+            stages["decide"] = time.perf_counter() - predicted
+            return result
+        # One predict_proba call gives both the class and the confidence
+        return self._decide(self.model.predict_proba(self.encoder.encode(data))[0], data)
+
+    def _decide(self, proba, data):
+        """Apply the decision rules to one row of probabilities"""
+        rules = self.rules
+        code = rules.evaluate_one(data, rules.rule_set(data.get("field_id")))
+        decision, confidence = rules.action(code)
+        if decision is None or confidence is None:
+            best = int(proba.argmax())
+            if decision is None:
+                decision = int(self.model.classes_[best])
+            if confidence is None:
+                confidence = round(float(proba[best]), 2)
+        return decision, confidence, rules.reason(code, data), code
@@ -0,0 +1,234 @@
+"""
+Production entry point for the prediction API.
+
+Runs app.py under gunicorn with several worker processes. The model is loaded
+once in the master before the workers fork (preload_app), so its arrays are
+shared copy-on-write instead of being loaded once per worker; gc.freeze()
+keeps the garbage collector from touching - and so copying - those pages.
+Everything that must not cross a fork (the Firebase/Firestore client, the
+write-behind thread) is created per worker in post_fork. Per-node state (the
+feature store, the anomaly detector and the irrigation scheduler) lives in one
+state process forked before the workers, which reach it through proxies
+(node_state.py), so there is one pump budget and one plan for all workers. Request logs are JSON lines sampled
+at LOG_SAMPLE_RATE.
+
+Usage:
+    python3 serve.py [--workers 4] [--threads 1] [--bind 0.0.0.0:5001]
+    python3 serve.py bench [--workers 1,2,4] [--duration 10] [--output scaling.json]
+
+Environment: WEB_CONCURRENCY (workers), GUNICORN_THREADS, PORT (Cloud Run),
+LOG_FORMAT (default json), LOG_SAMPLE_RATE (default 0.01).
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+DEFAULT_WORKERS = int(os.environ.get("WEB_CONCURRENCY", min(4, os.cpu_count() or 1)))
+DEFAULT_THREADS = int(os.environ.get("GUNICORN_THREADS", 1))
+DEFAULT_BIND = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+
+
+def post_fork(server, worker):
+    """Per-worker initialization (runs in the worker right after fork)"""
+    import app as api
+
+    random.seed()  # otherwise every worker samples the same log lines
+    api.init_firestore()
+    if api.node_state is not None:
+        api.use_node_state(api.node_state)
+
+
+def post_worker_init(worker):
+    """Runs in the worker after gunicorn installed its signal handlers"""
+    import app as api
+
+    if api.PROFILER_ENABLED:
+        api.install_profile_signal()  # kill -USR2 <worker pid> writes a profile
+
+
+def serve(workers=DEFAULT_WORKERS, threads=DEFAULT_THREADS, bind=DEFAULT_BIND):
+    """Load the model in this process and hand over to gunicorn"""
+    from gunicorn.app.base import BaseApplication
+
+    import node_state
+    os.environ.setdefault("LOG_FORMAT", "json")
+    os.environ.setdefault("LOG_SAMPLE_RATE", "0.01")
+    os.environ["MODEL_LOAD"] = "sync"
+    import app as api  # loads the model once, before fork
+
+    if api.registry.get() is None:
+        print("✗ Model not loaded - refusing to start workers")
+        return 1
+    # Forked now, so it inherits the restored feature store; the workers inherit the handle
+    api.node_state = node_state.start({"feature_store": api.feature_store,
+                                       "anomaly_detector": api.anomaly_detector,
+                                       "scheduler": api.scheduler}, api.FEATURE_STORE_PATH)
+    gc.freeze()
+
+    class ApiServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    print(f"🚀 Serving on http://{bind} with {workers} workers x {threads} threads "
+          f"(node state in process {api.node_state.pid})")
+    try:
+        ApiServer(api.app, {
+            "bind": bind,
+            "workers": workers,
+            "threads": threads,
+            "worker_class": "gthread" if threads > 1 else "sync",
+            "preload_app": True,
+            "post_fork": post_fork,
+            "post_worker_init": post_worker_init,
+            "timeout": 30,
+            "graceful_timeout": 10,
+            "keepalive": 5,
+        }).run()
+    finally:
+        # After the workers: the state process takes its final snapshot and exits
+        api.node_state.stop()
+    return 0
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _pss_mb(pid):
+    """Proportional set size: shared pages are split between the processes sharing them"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _wait_ready(url, timeout=60.0):
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def bench(worker_counts, duration=10.0, concurrency_per_worker=4, threads=1, port=5091):
+    """
+    Measure closed-loop throughput for each worker count
+
+    Each configuration starts a fresh server (local in-memory Firestore,
+    request logging off) and is driven by bench_api.closed_loop() from this
+    process, so the load generator shares the machine's cores.
+
+    Returns:
+        List of result dictionaries, one per worker count
+    """
+    from bench_api import closed_loop, make_readings
+
+    readings = make_readings(5000)
+    env = dict(os.environ, FIRESTORE_BACKEND="local", LOG_SAMPLE_RATE="0", PYTHONWARNINGS="ignore")
+    results = []
+    for workers in worker_counts:
+        bind = f"127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, __file__, "--workers", str(workers), "--threads", str(threads), "--bind", bind],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        try:
+            if not _wait_ready(f"http://{bind}/"):
+                print(f"✗ Server with {workers} workers did not start")
+                continue
+            url = f"http://{bind}/predict"
+            closed_loop(url, readings, concurrency=workers * concurrency_per_worker, duration=1.0)  # warm-up
+            result = closed_loop(url, readings, concurrency=workers * concurrency_per_worker, duration=duration)
+            processes = [server.pid] + _children(server.pid)
+            result["workers"] = workers
+            result["pss_total_mb"] = round(sum(_pss_mb(pid) for pid in processes), 1)
+            results.append(result)
+            print(f"  {workers:>3} workers: {result['requests_per_s']:8.1f} req/s  "
+                  f"p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+                  f"PSS {result['pss_total_mb']:6.1f} MB")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        port += 1
+
+    if results:
+        base = results[0]["requests_per_s"] / results[0]["workers"] or 1.0
+        for result in results:
+            result["speedup"] = round(result["requests_per_s"] / results[0]["requests_per_s"], 2) \
+                if results[0]["requests_per_s"] else 0.0
+            result["efficiency"] = round(result["requests_per_s"] / (base * result["workers"]), 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the prediction API with gunicorn")
+    parser.add_argument("mode", nargs="?", default="serve", choices=("serve", "bench"))
+    parser.add_argument("--workers", default=None,
+                        help="Worker processes (bench: comma-separated list, default 1,2,4,...,cpus)")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="Threads per worker")
+    parser.add_argument("--bind", default=DEFAULT_BIND)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per bench configuration")
+    parser.add_argument("--output", help="Write bench results as JSON")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        return serve(int(args.workers or DEFAULT_WORKERS), args.threads, args.bind)
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(n) for n in args.workers.split(",")]
+    else:
+        counts = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1))) or [1]
+    print("=" * 60)
+    print(f"  Worker scaling ({cpus} CPUs, {args.threads} threads/worker)")
+    print("=" * 60)
+    if max(counts) > cpus:
+        print(f"⚠ More workers than CPUs ({max(counts)} > {cpus}) - expect flat scaling")
+    results = bench(counts, args.duration, threads=args.threads)
+    print("\n📊 Scaling")
+    for result in results:
+        print(f"  {result['workers']:>3} workers: x{result['speedup']:<5} efficiency {result['efficiency'] * 100:5.0f}%")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpus": cpus, "threads": args.threads, "results": results}, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    print("\n" + "=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
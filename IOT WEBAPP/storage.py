@@ -0,0 +1,128 @@
+"""
+Storage backends for the Realtime Database and Firestore.
+
+The API, the gateway and the scripts get their database clients from here
+instead of initializing firebase_admin themselves, so the whole ingest path
+can run against local stand-ins on one machine with no network:
+
+    RTDB_BACKEND=firebase       firebase_admin.db on FIREBASE_DATABASE_URL
+    RTDB_BACKEND=local          in memory (local_rtdb.LocalRealtimeDatabase), one process
+    RTDB_BACKEND=sqlite         RTDB_SQLITE_PATH, shared by the processes of one machine
+
+    FIRESTORE_BACKEND=firebase  firebase_admin.firestore
+    FIRESTORE_BACKEND=local     in memory (local_firestore.LocalFirestore)
+    FIRESTORE_BACKEND=none      predictions are not stored
+
+Every Realtime Database backend offers the same reference()/child()/get()/
+set()/update()/push()/delete()/listen() and order_by_key() query calls.
+"""
+
+import json
+import os
+
+RTDB_BACKEND = os.environ.get("RTDB_BACKEND", "firebase")
+RTDB_SQLITE_PATH = os.environ.get("RTDB_SQLITE_PATH", "local_rtdb.sqlite")
+FIREBASE_DATABASE_URL = os.environ.get(
+    "FIREBASE_DATABASE_URL", "https://agrivision-1e11f-default-rtdb.asia-southeast1.firebasedatabase.app")
+SERVICE_ACCOUNT_KEY = os.environ.get("SERVICE_ACCOUNT_KEY", "serviceAccountKey.json")
+
+RTDB_BACKENDS = ("firebase", "local", "sqlite")
+FIRESTORE_BACKENDS = ("firebase", "local", "none")
+
+# One client per (backend, process)
+_rtdb_clients = {}
+
+
+class TemplateCredentialsError(ValueError):
+    """The service account key is still the template from the repository"""
+
+
+def firebase_app():
+    """
+    Initialize firebase_admin once per process (credentials and RTDB URL)
+
+    Raises:
+        FileNotFoundError: If the service account key is missing
+        TemplateCredentialsError: If the key is the unfilled template
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        with open(SERVICE_ACCOUNT_KEY) as f:
+            key_data = json.load(f)
+        if "REPLACE" in key_data.get("private_key", ""):
+            raise TemplateCredentialsError(f"{SERVICE_ACCOUNT_KEY} is the template")
+        # Build the credential from the parsed key instead of reading the file again
+        firebase_admin.initialize_app(credentials.Certificate(key_data), {"databaseURL": FIREBASE_DATABASE_URL})
+    return firebase_admin.get_app()
+
+
+def realtime_database(backend=None):
+    """
+    Realtime Database client of this process
+
+    Args:
+        backend: "firebase", "local" or "sqlite" (default: RTDB_BACKEND)
+
+    Returns:
+        Object with reference(path): firebase_admin.db or a local_rtdb stand-in
+
+    Raises:
+        ValueError: If the backend is unknown or the credentials are the template
+        OSError: If the service account key cannot be read
+    """
+    backend = backend or RTDB_BACKEND
+    key = (backend, os.getpid())
+    if key not in _rtdb_clients:
+        if backend == "firebase":
+            firebase_app()
+            from firebase_admin import db
+            client = db
+        elif backend == "local":
+            from local_rtdb import LocalRealtimeDatabase
+            client = LocalRealtimeDatabase()
+        elif backend == "sqlite":
+            from local_rtdb import SqliteRealtimeDatabase
+            client = SqliteRealtimeDatabase(RTDB_SQLITE_PATH)
+        else:
+            raise ValueError(f"Unknown RTDB_BACKEND {backend!r} (use one of {', '.join(RTDB_BACKENDS)})")
+        _rtdb_clients[key] = client
+    return _rtdb_clients[key]
+
+
+def firestore_client(backend):
+    """
+    Firestore client for a backend, or None when predictions are not stored
+
+    Firebase is optional: when the credentials are missing or unusable a
+    warning is printed and None is returned, so callers keep working in
+    standalone mode.
+
+    Args:
+        backend: "firebase", "local" or "none"
+    """
+    if backend == "none":
+        print("ℹ Firestore disabled (FIRESTORE_BACKEND=none)")
+        return None
+    if backend == "local":
+        from local_firestore import LocalFirestore
+        print("✓ Using local in-memory Firestore backend")
+        return LocalFirestore()
+    if not os.path.exists(SERVICE_ACCOUNT_KEY):
+        print(f"⚠ {SERVICE_ACCOUNT_KEY} not found - Firebase features disabled")
+        return None
+    try:
+        firebase_app()
+        from firebase_admin import firestore
+        client = firestore.client()
+    except TemplateCredentialsError:
+        print(f"⚠ Using template {SERVICE_ACCOUNT_KEY} - Firebase features disabled")
+        print("  Download real credentials from Firebase Console to enable cloud features")
+        return None
+    except Exception as e:
+        print(f"⚠ Firebase initialization skipped: {e}")
+        print("  Working in standalone mode without cloud storage")
+        return None
+    print("✓ Firebase initialized successfully!")
+    return client
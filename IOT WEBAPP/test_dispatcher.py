@@ -0,0 +1,113 @@
+"""
+Tests for the prediction dispatcher against a fake API session.
+
+Run from this directory:
+    python3 -m pytest -q test_dispatcher.py
+"""
+
+import math
+import threading
+import time
+
+import pytest
+
+from dispatcher import PredictionDispatcher
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    """Records the requests and scores every reading; optionally without a batch endpoint"""
+
+    def __init__(self, batch=True, delay=0.0):
+        self.batch = batch
+        self.delay = delay
+        self.requests = []
+        self.received = []
+        self.in_flight = {}
+        self.overlaps = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, json, timeout):
+        if url.endswith("/batch") and not self.batch:
+            return FakeResponse(404)
+        payloads = json if url.endswith("/batch") else [json]
+        nodes = {payload["node_id"] for payload in payloads}
+        with self._lock:
+            self.requests.append(url)
+            self.overlaps += any(self.in_flight.get(node) for node in nodes)
+            for node in nodes:
+                self.in_flight[node] = self.in_flight.get(node, 0) + 1
+            self.received.extend(payloads)
+        time.sleep(self.delay)
+        with self._lock:
+            for node in nodes:
+                self.in_flight[node] -= 1
+        if url.endswith("/batch"):
+            return FakeResponse(200, {"results": [{"index": i, "seq": p["seq"]} for i, p in enumerate(payloads)]})
+        return FakeResponse(200, {"seq": json["seq"]})
+
+    def close(self):
+        pass
+
+
+def make_dispatcher(session, **kwargs):
+    dispatcher = PredictionDispatcher("http://api/predict", max_retries=0, **kwargs)
+    dispatcher.session = session
+    return dispatcher
+
+
+def page(nodes, per_node):
+    """Readings of `nodes` nodes interleaved, `per_node` each"""
+    return [{"node_id": f"node_{n}", "seq": i * nodes + n} for i in range(per_node) for n in range(nodes)]
+
+
+def node_orders(payloads):
+    orders = {}
+    for payload in payloads:
+        orders.setdefault(payload["node_id"], []).append(payload["seq"])
+    return orders
+
+
+@pytest.mark.parametrize("nodes, batch_size", [(250, 100), (100, 100), (7, 3)])
+def test_multi_node_page_is_packed_into_full_batches(nodes, batch_size):
+    session = FakeSession()
+    dispatcher = make_dispatcher(session, use_batch=True, batch_size=batch_size)
+    payloads = page(nodes, 1)
+    results = dispatcher.dispatch(payloads)
+    assert len(session.requests) == math.ceil(nodes / batch_size)
+    assert [r["seq"] for r in results] == [p["seq"] for p in payloads]
+
+
+def test_node_spanning_batches_keeps_its_order():
+    session = FakeSession(delay=0.01)
+    dispatcher = make_dispatcher(session, use_batch=True, batch_size=4, concurrency=8)
+    payloads = page(3, 10)
+    results = dispatcher.dispatch(payloads)
+    assert len(session.requests) == math.ceil(len(payloads) / 4)
+    assert session.overlaps == 0
+    assert node_orders(session.received) == node_orders(payloads)
+    assert [r["seq"] for r in results] == [p["seq"] for p in payloads]
+
+
+def test_falls_back_to_single_requests_in_node_order():
+    session = FakeSession(batch=False, delay=0.005)
+    dispatcher = make_dispatcher(session, use_batch="auto", batch_size=4, concurrency=8)
+    payloads = page(5, 4)
+    results = dispatcher.dispatch(payloads)
+    assert dispatcher.report()["batch"] is False
+    assert session.overlaps == 0
+    assert node_orders(session.received) == node_orders(payloads)
+    assert [r["seq"] for r in results] == [p["seq"] for p in payloads]
+
+    # Later pages go one node per worker, as before
+    session.requests.clear()
+    dispatcher.dispatch(page(5, 2))
+    assert not any(url.endswith("/batch") for url in session.requests)
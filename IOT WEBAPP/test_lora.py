@@ -0,0 +1,88 @@
+"""
+Tests for LoRa payload decoding and the gateway's handling of malformed readings.
+
+Run from this directory:
+    python3 -m pytest -q test_lora.py
+"""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from lora_frame import FRAME_SIZE, decode_any, decode_frame, decode_frames, encode_frame
+from lora_payload import parse_many, parse_payload
+
+TEXT = "humidity:61.0,temperature:29.4,moisture:1843,pH:6.85,light:Sunny"
+FRAME = encode_frame(7, 42, 61.0, 29.4, 1843, 6.85, "Sunny")
+
+
+def corrupt(frame):
+    """The frame with one payload byte changed (CRC no longer matches)"""
+    return frame[:9] + bytes([frame[9] ^ 0xFF]) + frame[10:]
+
+
+def test_parses_the_firmware_payload():
+    assert parse_payload("Received: " + TEXT) == {
+        "humidity": 61.0, "temperature": 29.4, "soil": 1843, "pH": 6.85, "light": 800.0}
+    assert decode_frame(FRAME)["node_id"] == 7
+    assert decode_any(FRAME.hex()) == decode_frame(FRAME)
+
+
+@pytest.mark.parametrize("payload", [
+    TEXT.replace("29.4", "nan"),
+    TEXT.replace("61.0", "inf"),
+    TEXT.replace("light:Sunny", "light:Cloudy"),
+    "humidity:61.0,temperat",           # truncated in the middle of a key
+    "humidity:61.0,temperature:",       # truncated after the colon
+    "humidity=61.0",
+])
+def test_rejects_malformed_text(payload):
+    with pytest.raises(ValueError):
+        parse_payload(payload)
+
+
+@pytest.mark.parametrize("payload", [corrupt(FRAME), corrupt(FRAME).hex(), b"\xa2" + FRAME[1:], FRAME[:-1]])
+def test_rejects_malformed_frames(payload):
+    with pytest.raises(ValueError):
+        decode_any(payload)
+
+
+def test_batch_decoders_mark_bad_rows_invalid():
+    X, valid = parse_many([TEXT, TEXT.replace("29.4", "nan"), "moisture:900", "garbage"])
+    assert valid.tolist() == [True, False, True, False]
+    assert X[2, 0] == 900 and np.isnan(X[2, 1])
+
+    _, valid, _, _ = decode_frames(FRAME + corrupt(FRAME) + FRAME)
+    assert valid.tolist() == [True, False, True]
+    with pytest.raises(ValueError):
+        decode_frames(FRAME[:FRAME_SIZE - 1])
+
+
+@pytest.mark.skipif(not os.path.exists("irrigation_model.pkl"), reason="needs irrigation_model.pkl")
+def test_gateway_skips_and_counts_malformed_readings():
+    from gateway import Gateway
+    from scoring import Scorer
+
+    decisions = []
+    gateway = Gateway(Scorer.from_file(), on_decision=decisions.append)
+    runner = threading.Thread(target=gateway.run, daemon=True)
+    runner.start()
+    try:
+        # Serial lines from the ground node, then binary frames as UDP datagrams
+        for line in (b"Received: " + TEXT.encode(),
+                     b"Received: " + TEXT.replace("29.4", "nan").encode(),
+                     b"Received: humidity:61.0,temperat",
+                     b"Received: " + corrupt(FRAME).hex().encode(),
+                     b"LoRa initialized."):
+            gateway.submit(line, require_prefix=True)
+        for datagram in (FRAME, corrupt(FRAME)):
+            gateway.submit(datagram)
+        assert gateway.drain()
+    finally:
+        gateway.stop()
+        runner.join()
+    stats = gateway.report()
+    assert (stats["received"], stats["ignored"], stats["invalid"], stats["scored"]) == (6, 1, 4, 2)
+    assert sorted(d["seq"] is not None for d in decisions) == [False, True]
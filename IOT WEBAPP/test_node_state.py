@@ -0,0 +1,264 @@
+"""
+Tests for the per-node state process shared by the serve.py workers.
+
+Run from this directory:
+    python3 -m pytest -q test_node_state.py
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+import requests
+
+import node_state
+from feature_store import FeatureStore
+from scheduler import DEFAULT_PUMP, IrrigationScheduler
+from serve import _wait_ready
+
+BASE_MS = 1_760_000_000_000
+READING = {"soil": 300, "light": 300, "temperature": 25, "humidity": 50, "pH": 6.5, "rainfall": 5}
+
+
+def run_in_child(target):
+    """Run target() in a forked process (as gunicorn forks a worker); returns its exit status"""
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            target()
+            status = 0
+        finally:
+            os._exit(status)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / "features.npz")
+
+
+def test_forked_processes_update_one_shared_store(snapshot_path):
+    state = node_state.start({"feature_store": FeatureStore(), "scheduler": None}, snapshot_path)
+    assert state.names == ("feature_store",)
+
+    def worker(first):
+        def run():
+            store = state.connect()["feature_store"]
+            for i in range(first, first + 20):
+                store.update("field_1", "node_1", READING, timestamp_ms=BASE_MS + i * 15000)
+        return run
+
+    try:
+        # One node's readings reach two workers in turn
+        assert run_in_child(worker(0)) == 0
+        assert run_in_child(worker(20)) == 0
+        store = state.connect()["feature_store"]
+        assert store.features("field_1", "node_1")["readings_24h"] == 40
+        assert store.update_many([("field_1", "node_1"), ("field_2", None)], [READING, READING],
+                                 [BASE_MS + 40 * 15000, None])[0]["readings_24h"] == 41
+        assert store.stats()["nodes"] == 2
+    finally:
+        assert state.stop()
+
+    # The state process wrote the final snapshot on its way out
+    restored = FeatureStore()
+    assert restored.restore(snapshot_path) == 42
+    assert restored.features("field_1", "node_1")["readings_24h"] == 41
+    assert not os.path.exists(state.address)
+
+
+def test_state_process_exits_when_its_parent_dies(snapshot_path):
+    read, write = os.pipe()
+
+    def parent():
+        state = node_state.start({"feature_store": FeatureStore()}, snapshot_path)
+        os.write(write, str(state.pid).encode())
+
+    assert run_in_child(parent) == 0
+    pid = int(os.read(read, 32))
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and os.path.exists(f"/proc/{pid}"):
+        time.sleep(0.1)
+    assert not os.path.exists(f"/proc/{pid}")
+    assert os.path.exists(snapshot_path)
+
+
+def test_only_the_starting_process_stops_it(snapshot_path):
+    state = node_state.start({"feature_store": FeatureStore()}, snapshot_path)
+    try:
+        # A gunicorn worker exiting unwinds through serve()'s cleanup
+        assert run_in_child(lambda: os._exit(0 if state.stop() is False else 1)) == 0
+        assert state.connect()["feature_store"].stats()["nodes"] == 0
+    finally:
+        assert state.stop()
+    assert not os.path.exists(os.path.dirname(state.address))
+
+
+def test_workers_share_one_pump_budget():
+    # Room for one pump: two workers each seeing a dry field must not start both
+    scheduler = IrrigationScheduler(pumps={"default": dict(DEFAULT_PUMP), "fields": {}},
+                                    max_watts=DEFAULT_PUMP["watts"])
+    state = node_state.start({"scheduler": scheduler}, "")
+    read, write = os.pipe()
+
+    def worker(field_id):
+        def run():
+            proxy = state.connect()["scheduler"]
+            for i in range(5):
+                proxy.observe(field_id, "node_1", 1, 0.95, now_ms=BASE_MS + i * 15000)
+            os.write(write, json.dumps(proxy.command(field_id, now_ms=BASE_MS + 60000)).encode() + b"\n")
+        return run
+
+    try:
+        assert run_in_child(worker("field_1")) == 0
+        assert run_in_child(worker("field_2")) == 0
+        os.close(write)
+        commands = [json.loads(line) for line in os.fdopen(read).read().splitlines()]
+        proxy = state.connect()["scheduler"]
+        plan = proxy.plan(now_ms=BASE_MS + 60000)
+        assert (plan["running"], plan["watts"]) == (1, DEFAULT_PUMP["watts"])
+        assert [entry["on"] for entry in commands] == [True, False]
+        assert commands[1]["reason"] == "waiting: power budget"
+        assert proxy.command("field_2", now_ms=BASE_MS + 60000) == commands[1]
+    finally:
+        state.stop()
+
+
+def test_unknown_objects_are_rejected():
+    with pytest.raises(ValueError):
+        node_state.start({"cache": object()}, "")
+
+
+def start_server(bind, snapshot_path):
+    env = dict(os.environ, FEATURE_STORE_PATH=snapshot_path, FIRESTORE_BACKEND="none", LOG_SAMPLE_RATE="0",
+               PYTHONWARNINGS="ignore")
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", "2", "--bind", bind], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    if not _wait_ready(f"http://{bind}/"):
+        server.kill()
+        pytest.fail("serve.py did not start")
+    return server
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    assert server.wait(timeout=30) == 0
+
+
+@pytest.mark.skipif(not os.path.exists("irrigation_model.pkl"), reason="needs irrigation_model.pkl")
+def test_feature_store_survives_a_restart_with_two_workers(snapshot_path):
+    bind = f"127.0.0.1:{free_port()}"
+    server = start_server(bind, snapshot_path)
+    try:
+        for i in range(30):
+            reading = dict(READING, field_id="field_1", node_id="node_1", timestamp=BASE_MS + i * 15000)
+            assert requests.post(f"http://{bind}/predict", json=reading, timeout=10).status_code == 200
+        batch = [dict(READING, field_id="field_1", node_id="node_1", timestamp=BASE_MS + i * 15000)
+                 for i in range(30, 40)]
+        assert requests.post(f"http://{bind}/predict/batch", json=batch, timeout=10).status_code == 200
+    finally:
+        stop_server(server)
+    with np.load(snapshot_path) as snap:
+        assert snap["counts"].tolist() == [40]
+
+    # Every worker of the restarted server sees all 40 readings
+    server = start_server(bind, snapshot_path)
+    try:
+        for _ in range(6):
+            features = requests.get(f"http://{bind}/features/field_1/node_1", timeout=10).json()["features"]
+            assert features["readings_24h"] == 40
+    finally:
+        stop_server(server)
+
+
+def batch(start, count, **overrides):
+    return [dict(READING, field_id="field_1", node_id="node_1", timestamp=BASE_MS + i * 15000,
+                 soil=300 + i % 7, **overrides) for i in range(start, start + count)]
+
+
+@pytest.mark.skipif(not os.path.exists("irrigation_model.pkl"), reason="needs irrigation_model.pkl")
+def test_batch_imputation_through_a_proxied_detector(monkeypatch):
+    for name, value in (("FIRESTORE_BACKEND", "none"), ("FEATURE_STORE_PATH", ""), ("LOG_SAMPLE_RATE", "0"),
+                        ("MODEL_LOAD", "sync"), ("ANOMALY_DETECTION", "1")):
+        monkeypatch.setenv(name, value)
+    import app as api
+    from anomaly import AnomalyDetector
+
+    client = api.app.test_client()
+    requests_ = [batch(0, 20), batch(20, 3, temperature=0, humidity=0)]
+
+    def run():
+        return [client.post("/predict/batch", json=readings).get_json()["results"] for readings in requests_]
+
+    monkeypatch.setattr(api, "feature_store", FeatureStore())
+    monkeypatch.setattr(api, "anomaly_detector", AnomalyDetector())
+    monkeypatch.setattr(api, "scheduler", None)
+    local = run()
+
+    state = node_state.start({"feature_store": FeatureStore(), "anomaly_detector": AnomalyDetector()}, "")
+    try:
+        api.use_node_state(state)
+        proxied = run()
+        assert api.anomaly_detector.stats()["anomalies"]["temperature.sensor_fault.impute"] == 3
+    finally:
+        monkeypatch.setattr(api, "node_state", None)
+        state.stop()
+    faults = proxied[1]
+    assert all(a["action"] == "impute" for result in faults for a in result["anomalies"])
+    assert proxied == local
+
+
+def test_invalid_timestamps_use_the_arrival_time():
+    store = FeatureStore()
+    store.update("field_1", "node_1", READING, timestamp_ms=time.time() * 1000 - 60000)
+    for timestamp in ("abc", [1], True, 1e16):
+        store.update("field_1", "node_1", READING, timestamp_ms=timestamp)
+    # The far-future reading did not become the node's last time
+    store.update("field_1", "node_1", READING, timestamp_ms=time.time() * 1000 + 1000)
+    assert store.rejected == 0
+    assert store.features("field_1", "node_1")["readings_24h"] == 6
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for name, value in (("FIRESTORE_BACKEND", "none"), ("FEATURE_STORE_PATH", ""), ("LOG_SAMPLE_RATE", "0"),
+                        ("MODEL_LOAD", "sync")):
+        monkeypatch.setenv(name, value)
+    import app as api
+
+    monkeypatch.setattr(api, "feature_store", FeatureStore())
+    monkeypatch.setattr(api, "scheduler", None)
+    return api.app.test_client()
+
+
+@pytest.mark.skipif(not os.path.exists("irrigation_model.pkl"), reason="needs irrigation_model.pkl")
+@pytest.mark.parametrize("timestamp", ["abc", [1], 1e16])
+def test_predict_accepts_a_bad_timestamp(client, timestamp):
+    reading = dict(READING, field_id="field_1", node_id="node_1", timestamp=timestamp)
+    assert client.post("/predict", json=reading).status_code == 200
+    later = dict(reading, timestamp=time.time() * 1000 + 1000)
+    features = client.post("/predict", json=later).get_json()["features"]
+    assert features["readings_24h"] == 2
+
+
+@pytest.mark.skipif(not os.path.exists("irrigation_model.pkl"), reason="needs irrigation_model.pkl")
+def test_batch_with_a_bad_timestamp_scores_every_row(client):
+    readings = batch(0, 3)
+    readings[1]["timestamp"] = "abc"
+    response = client.post("/predict/batch", json=readings)
+    assert response.status_code == 200
+    assert [result["index"] for result in response.get_json()["results"]] == [0, 1, 2]
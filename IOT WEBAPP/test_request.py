@@ -1,7 +1,7 @@
 import requests
 
 # URL of your running Flask API
-url = "http://127.0.0.1:5000/predict"
+url = "http://127.0.0.1:5001/predict"
 
 # Sample sensor data
 data = {
@@ -0,0 +1,184 @@
+"""
+Tests for the Firestore write-behind queue against the in-memory Firestore.
+
+Run from this directory:
+    python3 -m pytest -q test_write_behind.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from local_firestore import LocalFirestore
+from write_behind import WriteBehindQueue
+
+
+class FlakyFirestore(LocalFirestore):
+    """LocalFirestore whose first `failures` commits raise"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def _commit(self, writes):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("unavailable")
+        super()._commit(writes)
+
+
+class GatedFirestore(LocalFirestore):
+    """LocalFirestore whose commits wait until the gate is opened"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def _commit(self, writes):
+        self.gate.wait(5)
+        super()._commit(writes)
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def db():
+    return LocalFirestore()
+
+
+def test_writes_to_a_document_coalesce_last_write_wins(db):
+    queue = WriteBehindQueue(db, flush_size=100, flush_interval=60)
+    queue.put("fields/field_1", {"soil": 300, "irrigation_needed": 1})
+    queue.put("fields/field_1", {"soil": 250, "reason": "dry"})
+    queue.put("fields/field_2", {"soil": 900})
+    assert queue.flush(timeout=3)
+
+    assert db.to_dict() == {"fields/field_1": {"soil": 250, "irrigation_needed": 1, "reason": "dry"},
+                            "fields/field_2": {"soil": 900}}
+    stats = queue.stats()
+    assert (stats["enqueued"], stats["coalesced"], stats["written"]) == (3, 1, 2)
+    assert db.stats["commits"] == 1
+    queue.close()
+
+
+def test_flushes_when_flush_size_documents_are_pending(db):
+    queue = WriteBehindQueue(db, flush_size=3, flush_interval=60)
+    queue.put("a/1", {"x": 1})
+    queue.put("a/2", {"x": 2})
+    time.sleep(0.1)
+    assert db.stats["writes"] == 0
+    queue.put("a/3", {"x": 3})
+    assert wait_for(lambda: db.stats["writes"] == 3)
+    queue.close()
+
+
+def test_flushes_when_the_oldest_write_reaches_the_interval(db):
+    queue = WriteBehindQueue(db, flush_size=100, flush_interval=0.2)
+    queue.put("a/1", {"x": 1})
+    time.sleep(0.05)
+    assert db.stats["writes"] == 0
+    assert wait_for(lambda: db.stats["writes"] == 1)
+    queue.close()
+
+
+def test_failed_batches_are_retried():
+    db = FlakyFirestore(failures=2)
+    queue = WriteBehindQueue(db, flush_size=1, flush_interval=0.01, max_retries=3)
+    queue.put("a/1", {"x": 1})
+    assert wait_for(lambda: queue.stats()["written"] == 1)
+    assert db.to_dict() == {"a/1": {"x": 1}}
+    stats = queue.stats()
+    assert (stats["errors"], stats["failed"]) == (2, 0)
+    queue.close()
+
+
+def test_writes_are_dropped_after_max_retries():
+    db = FlakyFirestore(failures=100)
+    queue = WriteBehindQueue(db, flush_size=1, flush_interval=0.01, max_retries=3)
+    queue.put("a/1", {"x": 1})
+    assert wait_for(lambda: queue.stats()["failed"] == 1)
+    stats = queue.stats()
+    assert (stats["errors"], stats["written"], stats["depth"]) == (3, 0, 0)
+    assert db.to_dict() == {}
+    queue.close()
+
+
+def test_retried_write_merges_with_newer_pending_write():
+    db = FlakyFirestore(failures=1)
+    queue = WriteBehindQueue(db, flush_size=1, flush_interval=0.05, max_retries=3)
+    queue.put("a/1", {"x": 1, "y": 1})
+    assert wait_for(lambda: queue.stats()["errors"] == 1)
+    queue.put("a/1", {"y": 2})
+    assert queue.flush(timeout=3)
+    assert db.to_dict() == {"a/1": {"x": 1, "y": 2}}
+    queue.close()
+
+
+def test_full_queue_drops_new_documents_but_coalesces_pending_ones(db):
+    queue = WriteBehindQueue(db, max_pending=2, flush_size=100, flush_interval=60, put_timeout=0.0)
+    assert queue.put("a/1", {"x": 1})
+    assert queue.put("a/2", {"x": 2})
+    assert not queue.put("a/3", {"x": 3})
+    assert queue.put("a/1", {"x": 10})
+    stats = queue.stats()
+    assert (stats["dropped"], stats["blocked_puts"], stats["depth"], stats["max_depth"]) == (1, 1, 2, 2)
+    queue.close()
+    assert db.to_dict() == {"a/1": {"x": 10}, "a/2": {"x": 2}}
+
+
+def test_full_queue_blocks_for_put_timeout_before_dropping():
+    db = GatedFirestore()
+    queue = WriteBehindQueue(db, max_pending=1, flush_size=100, flush_interval=60, put_timeout=0.2)
+    queue.put("a/1", {"x": 1})
+    started = time.monotonic()
+    assert not queue.put("a/2", {"x": 2})
+    assert time.monotonic() - started >= 0.2
+    assert queue.stats()["blocked_seconds"] >= 0.2
+    db.gate.set()
+    queue.close()
+
+
+def test_blocked_put_succeeds_once_the_worker_takes_a_batch():
+    db = GatedFirestore()
+    queue = WriteBehindQueue(db, max_pending=1, flush_size=1, flush_interval=60, put_timeout=2.0)
+    queue.put("a/1", {"x": 1})      # taken by the worker, which then waits on the gate
+    assert wait_for(lambda: queue.stats()["in_flight"] == 1)
+    queue.put("a/2", {"x": 2})      # pending: the queue is full again
+    threading.Timer(0.2, db.gate.set).start()
+    assert queue.put("a/3", {"x": 3})
+    assert queue.stats()["dropped"] == 0
+    queue.close()
+    assert set(db.to_dict()) == {"a/1", "a/2", "a/3"}
+
+
+def test_close_drains_pending_writes_and_rejects_new_ones(db):
+    queue = WriteBehindQueue(db, flush_size=100, flush_interval=60)
+    for i in range(250):
+        queue.put(f"fields/field_{i % 50}/readings/{i}", {"i": i})
+    assert queue.close(timeout=5)
+    assert len(db.to_dict()) == 250
+    assert not queue.put("a/1", {"x": 1})
+    stats = queue.stats()
+    assert (stats["written"], stats["dropped"], stats["depth"], stats["in_flight"]) == (250, 1, 0, 0)
+
+
+def test_min_doc_interval_holds_back_hot_documents(db):
+    queue = WriteBehindQueue(db, flush_size=1, flush_interval=0.01, min_doc_interval=0.3)
+    queue.put("fields/field_1", {"soil": 1})
+    assert wait_for(lambda: db.stats["writes"] == 1)
+    written_at = time.monotonic()
+    queue.put("fields/field_1", {"soil": 2})
+    queue.put("fields/field_1", {"soil": 3})
+    assert wait_for(lambda: db.stats["writes"] == 2)
+    assert time.monotonic() - written_at >= 0.25
+    assert db.to_dict() == {"fields/field_1": {"soil": 3}}
+    assert queue.stats()["deferred"] >= 1
+    queue.close()
@@ -0,0 +1,290 @@
+"""
+Write-behind queue for Firestore.
+
+Prediction results are handed to a bounded in-process queue and written by a
+background worker, so Firestore round trips stay out of the request path.
+Writes to the same document are coalesced (last write wins per field) and
+flushed as Firestore batched writes when enough documents are pending or the
+oldest pending write reaches the flush interval. A minimum interval between
+writes to the same document keeps hot documents under Firestore's sustained
+per-document write rate (about one per second).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+
+
+class WriteBehindQueue:
+    """
+    Bounded, coalescing, batched Firestore writer
+
+    Every put() is a `set(..., merge=True)` on a document path. Pending writes
+    for the same document are merged into one (top-level fields, last write
+    wins), so a document receives at most one write per flush.
+    """
+
+    def __init__(self, db, max_pending=10000, flush_size=200, flush_interval=1.0,
+                 put_timeout=0.0, max_retries=3, min_doc_interval=0.0):
+        """
+        Args:
+            db: Firestore client (or local_firestore.LocalFirestore)
+            max_pending: Maximum number of distinct documents waiting to be written
+            flush_size: Flush as soon as this many documents are pending
+            flush_interval: Flush when the oldest pending write is this old (seconds)
+            put_timeout: How long put() waits for space when the queue is full
+                before dropping the write (0 = drop immediately)
+            max_retries: Attempts per document before a failing write is dropped
+            min_doc_interval: Minimum seconds between two writes to the same
+                document; newer writes keep coalescing until it has passed
+        """
+        self.db = db
+        self.max_pending = max_pending
+        self.flush_size = min(flush_size, MAX_BATCH_WRITES)
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.min_doc_interval = min_doc_interval
+
+        self._pending = OrderedDict()   # document path -> merged fields
+        self._attempts = {}             # document path -> failed attempts so far
+        self._last_write = {}           # document path -> monotonic time of last commit
+        self._oldest = None             # monotonic time of the oldest pending write
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._worker = None
+        self._pid = None
+
+        self._stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "blocked_puts": 0,
+            "blocked_seconds": 0.0,
+            "written": 0,
+            "batches": 0,
+            "errors": 0,
+            "failed": 0,
+            "deferred": 0,
+            "max_depth": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    def _ensure_worker(self):
+        """Start the worker thread on first use (and again in a forked child)"""
+        if self._worker is not None and self._pid == os.getpid() and self._worker.is_alive():
+            return
+        self._pid = os.getpid()
+        self._worker = threading.Thread(target=self._run, name="firestore-write-behind", daemon=True)
+        self._worker.start()
+
+    def put(self, path, data):
+        """
+        Queue a merge-write of `data` into the document at `path`
+
+        Args:
+            path: Document path, e.g. "fields/field_1"
+            data: Dictionary of fields to merge into the document
+
+        Returns:
+            True if the write was queued, False if it was dropped (queue full or closed)
+        """
+        with self._cond:
+            if self._closing:
+                self._stats["dropped"] += 1
+                return False
+            self._ensure_worker()
+
+            pending = self._pending.get(path)
+            if pending is not None:
+                pending.update(data)
+                self._stats["enqueued"] += 1
+                self._stats["coalesced"] += 1
+                return True
+
+            if len(self._pending) >= self.max_pending:
+                self._stats["blocked_puts"] += 1
+                start = time.monotonic()
+                deadline = start + self.put_timeout
+                while len(self._pending) >= self.max_pending and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._stats["blocked_seconds"] += time.monotonic() - start
+                if len(self._pending) >= self.max_pending or self._closing:
+                    self._stats["dropped"] += 1
+                    return False
+
+            self._pending[path] = dict(data)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._stats["enqueued"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], len(self._pending))
+            if len(self._pending) >= self.flush_size:
+                self._cond.notify_all()
+            return True
+
+    def _take(self, now):
+        """
+        Pop up to one batch of pending writes (caller holds the lock)
+
+        Returns:
+            Tuple of (writes, retry_in): retry_in is the number of seconds until
+            a document held back by min_doc_interval becomes writable, or None
+        """
+        retry_in = None
+        if not self.min_doc_interval:
+            count = min(len(self._pending), MAX_BATCH_WRITES)
+            writes = [self._pending.popitem(last=False) for _ in range(count)]
+        else:
+            cutoff = now - self.min_doc_interval
+            self._last_write = {p: t for p, t in self._last_write.items() if t > cutoff}
+            writes = []
+            for path in list(self._pending):
+                if len(writes) >= MAX_BATCH_WRITES:
+                    break
+                last = self._last_write.get(path)
+                if last is not None:
+                    wait = last - cutoff
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                writes.append((path, self._pending.pop(path)))
+            if not writes:
+                self._stats["deferred"] += 1
+                return writes, retry_in
+        self._oldest = now if self._pending else None
+        self._in_flight += len(writes)
+        self._cond.notify_all()  # wake producers waiting for space
+        return writes, retry_in
+
+    def _commit(self, writes):
+        """Write one batch to Firestore; failed documents are re-queued"""
+        start = time.perf_counter()
+        try:
+            batch = self.db.batch()
+            for path, data in writes:
+                batch.set(self.db.document(path), data, merge=True)
+            batch.commit()
+            error = None
+        except Exception as e:
+            error = e
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._cond:
+            self._in_flight -= len(writes)
+            self._stats["last_flush_ms"] = elapsed_ms
+            if error is None:
+                self._stats["written"] += len(writes)
+                self._stats["batches"] += 1
+                now = time.monotonic()
+                for path, _ in writes:
+                    self._attempts.pop(path, None)
+                    if self.min_doc_interval:
+                        self._last_write[path] = now
+            else:
+                print("⚠ Firestore Error:", error)
+                self._stats["errors"] += 1
+                for path, data in writes:
+                    attempts = self._attempts.get(path, 0) + 1
+                    if attempts >= self.max_retries:
+                        self._attempts.pop(path, None)
+                        self._stats["failed"] += 1
+                        continue
+                    self._attempts[path] = attempts
+                    # Newer writes queued meanwhile win over the failed ones
+                    newer = self._pending.pop(path, None)
+                    if newer is not None:
+                        data.update(newer)
+                    self._pending[path] = data
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+            self._cond.notify_all()
+        return error is None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending:
+                        now = time.monotonic()
+                        age = now - self._oldest
+                        if self._closing or len(self._pending) >= self.flush_size or age >= self.flush_interval:
+                            writes, retry_in = self._take(now)
+                            if writes:
+                                break
+                            self._cond.wait(retry_in)
+                        else:
+                            self._cond.wait(self.flush_interval - age)
+                    elif self._closing:
+                        return
+                    else:
+                        self._cond.wait()
+            if not self._commit(writes) and not self._closing:
+                time.sleep(min(self.flush_interval, 1.0))  # back off before retrying
+
+    def flush(self, timeout=None):
+        """
+        Write everything currently pending and wait for it to finish
+
+        Args:
+            timeout: Maximum seconds to wait (None = wait indefinitely)
+
+        Returns:
+            True if the queue was drained within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._pending:
+                self._ensure_worker()
+                self._oldest = time.monotonic() - self.flush_interval  # due now
+                self._cond.notify_all()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=10.0):
+        """
+        Drain-on-shutdown hook: stop accepting writes, flush and stop the worker
+
+        Args:
+            timeout: Maximum seconds to spend draining
+
+        Returns:
+            True if nothing was left pending (failed writes are counted in stats)
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            worker = self._worker if self._pid == os.getpid() else None
+        if worker is not None:
+            worker.join(timeout)
+        with self._cond:
+            drained = not self._pending and not self._in_flight
+            if not drained:
+                print(f"⚠ Write-behind queue closed with {len(self._pending)} unwritten documents")
+            return drained
+
+    def stats(self):
+        """
+        Queue and backpressure metrics
+
+        Returns:
+            Dictionary with counters plus the current depth, in-flight writes and
+            the age of the oldest pending write in seconds
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats["depth"] = len(self._pending)
+            stats["in_flight"] = self._in_flight
+            stats["capacity"] = self.max_pending
+            stats["oldest_age_s"] = round(time.monotonic() - self._oldest, 3) if self._oldest else 0.0
+            return stats